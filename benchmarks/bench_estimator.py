@@ -0,0 +1,42 @@
+"""
+Benchmark KalmanEstimator.update and compare its slope noise with a finite difference
+Run from the repository root: python -m benchmarks.bench_estimator
+"""
+import math
+import random
+import time
+
+from library.control.estimator import KalmanEstimator
+
+SAMPLES = 100000
+PERIOD = 0.1
+
+
+def main():
+	rng = random.Random(0)
+	measurements = [
+		math.floor((25.0 + 1.0 * i * PERIOD + rng.gauss(0.0, 0.2)) / 0.25) * 0.25 for i in range(SAMPLES)
+	]
+	times = [i * PERIOD for i in range(SAMPLES)]
+
+	estimator = KalmanEstimator()
+	slopes = []
+	start = time.perf_counter()
+	for t, measurement in zip(times, measurements):
+		slopes.append(estimator.update(t, measurement)[1])
+	elapsed = time.perf_counter() - start
+
+	differences = [(b - a) / PERIOD for a, b in zip(measurements, measurements[1:])]
+
+	def spread(values):
+		values = values[len(values) // 2:]
+		mean = sum(values) / len(values)
+		return math.sqrt(sum((value - mean) ** 2 for value in values) / len(values))
+
+	print("Kalman update:            {:.2f} us/sample".format(elapsed / SAMPLES * 1e6))
+	print("Slope std, finite diff:   {:.3f} C/s".format(spread(differences)))
+	print("Slope std, Kalman:        {:.3f} C/s".format(spread(slopes)))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,57 @@
+"""
+Benchmark ModelPredictiveController.compute per control step over a simulated reflow, and compare it with the PID
+Run from the repository root: python -m benchmarks.bench_mpc
+The control loop runs at 1Hz, so a solve must stay well under 1000ms - allow roughly 10x these times on a Pi 3
+"""
+import logging
+import time
+
+from library.control.mpc import ModelPredictiveController
+from library.control.stateMachine import ToastStateMachine
+from library.simulation.oven import OvenSimulator, SimulateRun
+from definitions import GetBaseConfigurationFilePath
+
+HORIZONS = [30.0, 60.0, 120.0]
+
+
+class TimedController(ModelPredictiveController):
+	"""
+	MPC recording how long each compute takes
+	"""
+	def __init__(self, *args, **kwargs):
+		super(TimedController, self).__init__(*args, **kwargs)
+		self.solveTimes = []
+
+	def compute(self, *args, **kwargs):
+		start = time.perf_counter()
+		output = super(TimedController, self).compute(*args, **kwargs)
+		self.solveTimes.append(time.perf_counter() - start)
+		return output
+
+
+def Run(sm):
+	data = SimulateRun(sm, OvenSimulator(noise=0.25, seed=1))
+	soakPeak = max(record['Temperature'] for record in data if record['State'] == 'soak')
+	absoluteError = sum(abs(record['PID Error']) for record in data if record['State'] in ['soak', 'reflow'])
+	return soakPeak, absoluteError
+
+
+def main():
+	sm = ToastStateMachine(GetBaseConfigurationFilePath(), debugLevel=logging.WARNING)
+	try:
+		soakPeak, absoluteError = Run(sm)
+		print("PID:           soak peak {:6.2f}C, soak/reflow abs error {:6.1f}C*s".format(soakPeak, absoluteError))
+
+		for horizon in HORIZONS:
+			sm.mpc = TimedController.FromConfig({'horizon': horizon})
+			soakPeak, absoluteError = Run(sm)
+			solveTimes = sorted(sm.mpc.solveTimes)
+			print("MPC {:3.0f}s:      soak peak {:6.2f}C, soak/reflow abs error {:6.1f}C*s, solve mean {:6.2f}ms, max {:6.2f}ms".format(
+				horizon, soakPeak, absoluteError, sum(solveTimes) / len(solveTimes) * 1e3, solveTimes[-1] * 1e3
+			))
+	finally:
+		sm.cleanup()
+
+
+if __name__ == '__main__':
+	main()
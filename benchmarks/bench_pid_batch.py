@@ -0,0 +1,59 @@
+"""
+Benchmark BatchPID against looping over PID objects, and a full profile sweep with SimulateBatch
+Run from the repository root: python -m benchmarks.bench_pid_batch [candidates]
+"""
+import sys
+import time
+
+import numpy as np
+
+from library.control.pid import PID
+from library.control.pid_batch import BatchPID
+from library.other.config import ToasterConfig
+from library.simulation.batch import SimulateBatch
+from definitions import GetBaseConfigurationFilePath
+
+TRACE_LENGTH = 1000
+
+
+def main(candidates=1000):
+	rng = np.random.default_rng(0)
+	batch = BatchPID(
+		rng.uniform(0.1, 2.0, candidates),
+		rng.uniform(0.0, 0.02, candidates),
+		rng.uniform(0.0, 20.0, candidates),
+		windupGuard=20.0
+	)
+	times = np.arange(1.0, TRACE_LENGTH + 1.0)
+	states = np.linspace(25.0, 235.0, TRACE_LENGTH)
+	targets = np.where(states < 150.0, 150.0, 235.0)
+
+	# Scalar PIDs on a subset - the full set takes too long to be worth waiting for
+	scalarCount = min(candidates, 50)
+	pids = [batch.getPID(i) for i in range(scalarCount)]
+	start = time.perf_counter()
+	for pid in pids:
+		for t, state, target in zip(times, states, targets):
+			pid.target = target
+			pid.compute(t, state)
+	scalar = (time.perf_counter() - start) / scalarCount
+
+	start = time.perf_counter()
+	batch.run(times, states, targets)
+	batched = (time.perf_counter() - start) / candidates
+
+	print("{} candidates x {} samples".format(candidates, TRACE_LENGTH))
+	print("PID.compute loop:   {:8.1f} us/candidate".format(scalar * 1e6))
+	print("BatchPID.run:       {:8.1f} us/candidate ({:.0f}x)".format(batched * 1e6, scalar / batched))
+
+	config = ToasterConfig(GetBaseConfigurationFilePath())
+	start = time.perf_counter()
+	result = SimulateBatch(batch, config.states, timerPeriod=config.clockPeriod)
+	elapsed = time.perf_counter() - start
+	best = int(np.argmin(result.cost()))
+	print("SimulateBatch:      {:8.3f} s for the full profile ({} completed)".format(elapsed, result.completed.sum()))
+	print("Best candidate:     {}".format(dict(batch.getConfig(best))))
+
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,59 @@
+"""
+Benchmark scanning many saved runs - data CSVs vs run archives - for their peak temperature
+Run from the repository root: python -m benchmarks.bench_run_archive
+"""
+import os
+import csv
+import time
+import tempfile
+
+import numpy as np
+
+from library.other.run_archive import RunArchive, CsvToArchive
+from library.simulation.oven import SimulateProfile, OvenModel, OvenSimulator
+from definitions import GetBaseConfigurationFilePath
+
+RUNS = 500
+
+
+def main():
+	status, data = SimulateProfile(GetBaseConfigurationFilePath(), OvenSimulator(OvenModel(gain=300.0), noise=0.25, seed=1))
+	with tempfile.TemporaryDirectory() as directory:
+		csvPaths = []
+		archivePaths = []
+		for i in range(RUNS):
+			csvPath = os.path.join(directory, "run{}.csv".format(i))
+			with open(csvPath, 'w', newline="") as ouf:
+				writer = csv.writer(ouf)
+				writer.writerow(data.fields)
+				writer.writerows(data.rows())
+			archivePath = os.path.join(directory, "run{}.toast".format(i))
+			CsvToArchive(csvPath, archivePath)
+			csvPaths.append(csvPath)
+			archivePaths.append(archivePath)
+
+		start = time.perf_counter()
+		csvPeaks = []
+		for csvPath in csvPaths:
+			with open(csvPath, 'r', newline="") as inf:
+				csvPeaks.append(max(float(row['Temperature']) for row in csv.DictReader(inf) if row['Temperature']))
+		csvElapsed = time.perf_counter() - start
+
+		start = time.perf_counter()
+		archivePeaks = []
+		for archivePath in archivePaths:
+			with RunArchive(archivePath) as archive:
+				archivePeaks.append(float(np.nanmax(archive.column('Temperature'))))
+		archiveElapsed = time.perf_counter() - start
+
+		assert archivePeaks == csvPeaks
+		csvBytes = sum(os.path.getsize(path) for path in csvPaths) / RUNS
+		archiveBytes = sum(os.path.getsize(path) for path in archivePaths) / RUNS
+
+	print("{} runs of {} records".format(RUNS, len(data)))
+	print("CSV:      {:.2f} ms/run, {:.0f} kB/run".format(csvElapsed / RUNS * 1e3, csvBytes / 1e3))
+	print("Archive:  {:.2f} ms/run, {:.0f} kB/run".format(archiveElapsed / RUNS * 1e3, archiveBytes / 1e3))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,46 @@
+"""
+Compare the scalar Thermocouple decode path against the vectorized batch decoder
+Run from the repository root: python -m benchmarks.bench_thermocouple_decode
+"""
+import random
+import timeit
+
+import numpy as np
+
+from library.sensors.sensor_thermocouple import Thermocouple
+from library.sensors.thermocouple_decoder import DecodeFrames, FramesToBytes
+
+FRAME_COUNT = 10000
+REPEATS = 5
+
+
+def ScalarDecode(byteLists):
+	"""
+	Decode frames the way Thermocouple.read() does, one at a time
+	"""
+	for byteList in byteLists:
+		frame = Thermocouple.ByteListToInteger(byteList)
+		try:
+			Thermocouple.CheckSPIReadForErrors(frame)
+		except Exception:
+			pass
+		Thermocouple.CalculateReferenceTemperature(frame)
+		Thermocouple.CalculateThermocoupleTemperature(frame)
+
+
+def main():
+	frames = np.array([random.getrandbits(32) for _ in range(FRAME_COUNT)], dtype=np.uint32)
+	raw = FramesToBytes(frames)
+	byteLists = [list(raw[i:i + 4]) for i in range(0, len(raw), 4)]
+
+	scalar = min(timeit.repeat(lambda: ScalarDecode(byteLists), number=1, repeat=REPEATS))
+	batch = min(timeit.repeat(lambda: DecodeFrames(raw), number=1, repeat=REPEATS))
+
+	print("{} frames".format(FRAME_COUNT))
+	print("scalar: {:9.3f} ms ({:7.3f} us/frame)".format(scalar * 1e3, scalar * 1e6 / FRAME_COUNT))
+	print("batch:  {:9.3f} ms ({:7.3f} us/frame)".format(batch * 1e3, batch * 1e6 / FRAME_COUNT))
+	print("speedup: {:.1f}x".format(scalar / batch))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,175 @@
+"""
+Benchmark ToastStateMachine.tick against a replayed thermocouple capture
+Run from the repository root: python -m benchmarks.bench_tick [capture.spi]
+Without a capture file, a synthetic heat-up/cool-down capture is generated
+"""
+import os
+import sys
+import logging
+import tempfile
+import time
+
+from library.control.stateMachine import ToastStateMachine, STATES
+from library.control.events import EVENTS
+from library.sensors.sensor_thermocouple import Thermocouple
+from library.sensors.spi_capture import SpiCaptureWriter, ReplaySpiFactory
+from definitions import CONFIG_KEY_TARGET, CONFIG_KEY_DURATION, GetBaseConfigurationFilePath
+
+TICKS = 5000
+# Passes through the whole profile when timing the state logic alone
+PROFILE_PASSES = 2000
+
+
+def WriteSyntheticCapture(path, frameCount=TICKS):
+	"""
+	Write a capture that heats at 0.5C per frame to 240C and then cools
+	"""
+	from library.sensors.thermocouple_decoder import EncodeFrames, FramesToBytes
+
+	temperatures = []
+	temperature = 25.0
+	for i in range(frameCount):
+		temperatures.append(temperature)
+		temperature = temperature + 0.5 if i < 430 else max(25.0, temperature - 0.25)
+
+	raw = FramesToBytes(EncodeFrames(temperatures, 25.0))
+	with SpiCaptureWriter(path) as writer:
+		for i in range(frameCount):
+			writer.write(0, raw[i * 4:(i + 1) * 4], timestamp=i * 0.1)
+
+
+class BaselineStateMachine(ToastStateMachine):
+	"""
+	The state logic as it was before the states were compiled into a ProfilePlan - the state list is rebuilt and the
+	config dicts re-read & re-cast on every state change, and the target buffer & direction worked out on every check.
+	Only here to time against
+	"""
+	@property
+	def states(self):
+		if self.stateConfiguration:
+			return list(self.stateConfiguration.keys())
+		else:
+			return []
+
+	def checkStateAgainstTarget(self):
+		celsiusBuffer = 3.0
+		fahrenheitBuffer = Thermocouple.ConvertCelsiusToFahrenheit(celsiusBuffer)
+		buffer = celsiusBuffer if self.units == 'celsius' else fahrenheitBuffer
+		if self.targetState > self.lastTarget:
+			return self.temperature >= self.targetState - buffer
+		else:
+			return self.temperature <= self.targetState + buffer
+
+	def nextState(self):
+		self.logger.debug("{} - moving to next state".format(self.timestamp))
+		self.stateIndex += 1
+
+		if self.stateIndex == len(self.states):
+			self.running = STATES.COMPLETE
+			self.restoreGains()
+			self.events.publish(EVENTS.COMPLETED, self.timestamp, {'states': len(self.states)})
+			if self.stateMachineCompleteCallback:
+				self.stateMachineCompleteCallback()
+
+		if self.running == STATES.RUNNING:
+			self.updateStateVariables()
+
+	def updateStateVariables(self):
+		self.currentState = self.states[self.stateIndex]
+
+		self.lastTarget = self.targetState
+		self.targetState = float(self.stateConfiguration[self.currentState][CONFIG_KEY_TARGET])
+		self.currentStateDuration = float(self.stateConfiguration[self.currentState][CONFIG_KEY_DURATION])
+
+		self.soaking = self.targetState == self.lastTarget
+		self.currentStateStart = self.timestamp
+		self.currentStateEnd = self.timestamp + self.currentStateDuration
+
+		if self.running == STATES.RUNNING:
+			self.scheduleGains()
+		else:
+			self.restoreGains()
+
+		self.pid.zeroierror()
+		self.stateChanged = True
+
+		if self.running not in [STATES.STOPPED, STATES.PAUSED]:
+			if self.events.subscribed(EVENTS.STATE_CHANGED):
+				self.events.publish(EVENTS.STATE_CHANGED, self.timestamp, {
+					'state': self.currentState,
+					'index': self.stateIndex,
+					'target': self.targetState,
+					'soaking': self.soaking,
+				})
+			self.logger.debug(
+				"New state, target, end timestamp: {}, {:7.2f}, {}".format(
+					self.currentState,
+					self.targetState,
+					"{:7.2f}".format(self.currentStateEnd) if self.soaking else "    n/a"
+				)
+			)
+
+
+def BenchStateLogic(sm):
+	"""
+	Time the per-tick state logic on its own - the end-of-state check & stepping through every state
+	@return: seconds per state
+	@rtype: float
+	"""
+	sm.start()
+	stateCount = len(sm.states)
+	start = time.perf_counter()
+	for i in range(PROFILE_PASSES):
+		sm.stateIndex = 0
+		sm.updateStateVariables()
+		for j in range(stateCount):
+			sm.readyForNextState()
+			sm.nextState()
+	elapsed = time.perf_counter() - start
+	sm.stop()
+	return elapsed / (PROFILE_PASSES * stateCount)
+
+
+def main(capturePath=None):
+	tmpDir = None
+	if not capturePath:
+		tmpDir = tempfile.TemporaryDirectory()
+		capturePath = os.path.join(tmpDir.name, "synthetic.spi")
+		WriteSyntheticCapture(capturePath)
+
+	factory = ReplaySpiFactory(capturePath, loop=True)
+	try:
+		sm = ToastStateMachine(GetBaseConfigurationFilePath(), spiFactory=factory, debugLevel=logging.WARNING)
+		try:
+			sm.start()
+			start = time.perf_counter()
+			ticks = 0
+			while ticks < TICKS:
+				if sm.running != STATES.RUNNING:
+					sm.start()
+				sm.tick()
+				ticks += 1
+			elapsed = time.perf_counter() - start
+			stateElapsed = BenchStateLogic(sm)
+		finally:
+			sm.cleanup()
+
+		baseline = BaselineStateMachine(GetBaseConfigurationFilePath(), spiFactory=factory, debugLevel=logging.WARNING)
+		try:
+			baselineElapsed = BenchStateLogic(baseline)
+		finally:
+			baseline.cleanup()
+	finally:
+		factory.close()
+		if tmpDir:
+			tmpDir.cleanup()
+
+	print("capture: {}".format(capturePath))
+	print("{} ticks in {:.3f} s - {:.2f} us/tick".format(TICKS, elapsed, elapsed * 1e6 / TICKS))
+	print("state logic: {:.2f} us/state, {:.2f} us/state with the baseline's dict & list lookups".format(
+		stateElapsed * 1e6, baselineElapsed * 1e6
+	))
+
+
+if __name__ == "__main__":
+	main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -5,6 +5,7 @@ MODEL_NAME = "Toasting"
 
 CONFIG_KEY_TARGET = "target"
 CONFIG_KEY_DURATION = "duration"
+CONFIG_KEY_PID = "pid"
 DEBUG_LEVEL = logging.INFO
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
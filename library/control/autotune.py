@@ -0,0 +1,269 @@
+import math
+from collections import OrderedDict
+
+
+class RelayAutoTuner(object):
+	"""
+	Åström-Hägglund relay feedback experiment
+	Switches the heater fully on below (setpoint - hysteresis) and fully off above (setpoint + hysteresis), which makes
+	the oven oscillate around the setpoint at its ultimate period. The ultimate gain follows from the relay amplitude d
+	and the measured oscillation amplitude a:
+		Ku = 4 * d / (pi * sqrt(a^2 - hysteresis^2))
+	and the PID gains from Ku & the period with one of TUNING_RULES.
+	Gains are in units of heater power (0.0 - 1.0) per degree.
+	"""
+	# Kp / Ku, Ti / Pu, Td / Pu
+	TUNING_RULES = OrderedDict([
+		('ziegler-nichols', (0.6, 0.5, 0.125)),
+		('pessen', (0.7, 0.4, 0.15)),
+		('some-overshoot', (0.33, 0.5, 0.33)),
+		('no-overshoot', (0.2, 0.5, 0.33)),
+	])
+
+	BASE_CONFIG = OrderedDict([
+		("setpoint", 150.0),
+		("hysteresis", 1.0),
+		# Oscillation cycles to measure, after the first one is discarded
+		("cycles", 3),
+		("maxDuration", 1800.0),
+		("rule", "ziegler-nichols"),
+	])
+
+	def __init__(self, setpoint, hysteresis=1.0, cycles=3, maxDuration=1800.0, outputHigh=1.0, outputLow=0.0):
+		"""
+		Constructor
+		@param setpoint: temperature to oscillate around
+		@type setpoint: float
+		@param hysteresis: relay switches at setpoint +/- hysteresis. Keep it above the thermocouple noise
+		@type hysteresis: float
+		@param cycles: number of oscillation cycles to measure. The first cycle after heat-up is discarded on top of these
+		@type cycles: int
+		@param maxDuration: give up if the experiment takes longer than this (s)
+		@type maxDuration: float
+		@param outputHigh: heater power with the relay on
+		@type outputHigh: float
+		@param outputLow: heater power with the relay off
+		@type outputLow: float
+		"""
+		super(RelayAutoTuner, self).__init__()
+		self.setpoint = float(setpoint)
+		self.hysteresis = abs(float(hysteresis))
+		self.cycles = int(cycles)
+		self.maxDuration = float(maxDuration)
+		self.outputHigh = float(outputHigh)
+		self.outputLow = float(outputLow)
+		assert self.cycles >= 1, "Auto-tune needs at least 1 cycle"
+		assert self.outputHigh > self.outputLow, "Auto-tune relay high output must be greater than the low output"
+
+		self.reset()
+
+	@classmethod
+	def FromConfig(cls, configDict, setpoint=None, outputHigh=1.0, outputLow=0.0):
+		"""
+		Create an auto-tuner from an autotune config dict
+		@param configDict: dict with any of BASE_CONFIG's keys
+		@type configDict: dict
+		@param setpoint: (Optional) override the configured setpoint
+		@type setpoint: float
+		@param outputHigh: controller output that turns the heater fully on - the gains are scaled to it
+		@type outputHigh: float
+		@param outputLow: controller output that turns the heater off
+		@type outputLow: float
+		@rtype: RelayAutoTuner
+		"""
+		config = OrderedDict(cls.BASE_CONFIG)
+		config.update(configDict or {})
+		return cls(
+			setpoint=config['setpoint'] if setpoint is None else setpoint,
+			hysteresis=config['hysteresis'],
+			cycles=config['cycles'],
+			maxDuration=config['maxDuration'],
+			outputHigh=outputHigh,
+			outputLow=outputLow
+		)
+
+	def reset(self):
+		"""
+		Forget all measurements and start the experiment over
+		"""
+		self._startTime = None
+		self._relayState = False
+		self._complete = False
+		self._failed = False
+
+		# Times the relay switched off, and the extremes between switches
+		self._switchOffTimes = []
+		self._peaks = []
+		self._troughs = []
+		self._extreme = None
+
+	# region Properties
+
+	@property
+	def relayState(self):
+		"""
+		Relay state requested by the last update
+		@rtype: bool
+		"""
+		return self._relayState
+
+	@property
+	def complete(self):
+		"""
+		Whether enough cycles have been measured to propose gains
+		@rtype: bool
+		"""
+		return self._complete
+
+	@property
+	def failed(self):
+		"""
+		Whether the experiment ran out of time before completing
+		@rtype: bool
+		"""
+		return self._failed
+
+	@property
+	def running(self):
+		"""
+		@rtype: bool
+		"""
+		return not (self._complete or self._failed)
+
+	@property
+	def cyclesMeasured(self):
+		"""
+		Number of full cycles measured so far, not counting the discarded first cycle
+		@rtype: int
+		"""
+		return max(0, len(self._switchOffTimes) - 2)
+
+	@property
+	def period(self):
+		"""
+		Ultimate period - mean time between relay switch-offs over the measured cycles
+		@return: period (s), None until a cycle has been measured
+		@rtype: float
+		"""
+		cycles = min(self.cyclesMeasured, self.cycles)
+		if not cycles:
+			return None
+		times = self._switchOffTimes[-(cycles + 1):]
+		return (times[-1] - times[0]) / cycles
+
+	@property
+	def amplitude(self):
+		"""
+		Oscillation amplitude - half the mean peak-to-trough swing over the measured cycles
+		@return: amplitude, None until a cycle has been measured
+		@rtype: float
+		"""
+		cycles = min(self.cyclesMeasured, self.cycles)
+		if not cycles:
+			return None
+		peaks = self._peaks[-cycles:]
+		troughs = self._troughs[-cycles:]
+		return (sum(peaks) / len(peaks) - sum(troughs) / len(troughs)) / 2.0
+
+	@property
+	def ultimateGain(self):
+		"""
+		Ultimate gain from the describing function of a relay with hysteresis
+		@return: ultimate gain, None until a cycle has been measured
+		@rtype: float
+		"""
+		amplitude = self.amplitude
+		if amplitude is None:
+			return None
+		relayAmplitude = (self.outputHigh - self.outputLow) / 2.0
+		# Hysteresis larger than the swing means noise dominated the experiment - fall back to the plain relay formula
+		effectiveAmplitude = math.sqrt(amplitude ** 2 - self.hysteresis ** 2) if amplitude > self.hysteresis else amplitude
+		return 4.0 * relayAmplitude / (math.pi * effectiveAmplitude)
+
+	# endregion Properties
+	# region Experiment
+
+	def update(self, currentTime, temperature):
+		"""
+		Add a temperature sample and get the relay state to apply
+		@param currentTime: time of the sample (s)
+		@type currentTime: float
+		@param temperature: measured temperature
+		@type temperature: float
+		@return: True to turn the relay on, False to turn it off
+		@rtype: bool
+		"""
+		if not self.running:
+			self._relayState = False
+			return False
+
+		if self._startTime is None:
+			self._startTime = currentTime
+			self._relayState = temperature < self.setpoint
+		elif currentTime - self._startTime > self.maxDuration:
+			self._failed = True
+			self._relayState = False
+			return False
+
+		if self._relayState:
+			# Heating - track the trough until we pass the upper switching point
+			self._extreme = temperature if self._extreme is None else min(self._extreme, temperature)
+			if temperature > self.setpoint + self.hysteresis:
+				# The trough of the initial heat-up is just the starting temperature - don't keep it
+				if self._switchOffTimes:
+					self._troughs.append(self._extreme)
+				self._switchOffTimes.append(currentTime)
+				self._relayState = False
+				self._extreme = temperature
+		else:
+			# Cooling - track the peak until we pass the lower switching point
+			self._extreme = temperature if self._extreme is None else max(self._extreme, temperature)
+			if temperature < self.setpoint - self.hysteresis:
+				if self._switchOffTimes:
+					self._peaks.append(self._extreme)
+				self._relayState = True
+				self._extreme = temperature
+
+		if self.cyclesMeasured >= self.cycles:
+			self._complete = True
+			self._relayState = False
+
+		return self._relayState
+
+	# endregion Experiment
+	# region Results
+
+	def getGains(self, rule='ziegler-nichols'):
+		"""
+		Get PID gains from the measured ultimate gain & period
+		@param rule: tuning rule - see TUNING_RULES
+		@type rule: str
+		@return: tuple of kP, kI, kD
+		@rtype: tuple[float, float, float]
+		"""
+		assert rule in self.TUNING_RULES, "Tuning rule must be one of the following: {}".format(
+			", ".join(self.TUNING_RULES)
+		)
+		if not self.complete:
+			raise Exception("Auto-tune experiment hasn't completed, cannot compute PID gains")
+
+		proportional, integral, derivative = self.TUNING_RULES[rule]
+		kP = proportional * self.ultimateGain
+		integralTime = integral * self.period
+		derivativeTime = derivative * self.period
+		return kP, kP / integralTime, kP * derivativeTime
+
+	def getPIDConfig(self, rule='ziegler-nichols', baseConfig=None):
+		"""
+		Get a PID config dict with the proposed gains
+		@param rule: tuning rule - see TUNING_RULES
+		@type rule: str
+		@param baseConfig: (Optional) PID config to take the limits & windup guard from
+		@type baseConfig: dict
+		@rtype: OrderedDict
+		"""
+		config = OrderedDict(baseConfig or {})
+		config['kP'], config['kI'], config['kD'] = self.getGains(rule)
+		return config
+
+	# endregion Results
@@ -0,0 +1,137 @@
+from collections import OrderedDict
+
+
+class KalmanEstimator(object):
+	"""
+	Two-state (temperature, rate of change) Kalman filter with a constant-velocity model
+	Smooths the 0.25C quantised thermocouple readings and estimates the slope directly, so the PID derivative
+	doesn't have to be a finite difference of noisy samples.
+	Written out in scalars - no matrix library - so an update is a few dozen float operations.
+	With a background sampler, updates run on its thread - read the temperature & slope together from estimate, which
+	is swapped in whole at the end of each update
+	"""
+	BASE_CONFIG = OrderedDict([
+		("enabled", False),
+		# Variance of the change in slope per second ((C/s)^2/s) - higher tracks ramps faster, smooths less
+		("processNoise", 0.01),
+		# Variance of a single reading (C^2). Quantisation alone is 0.25^2/12
+		("measurementNoise", 0.1),
+	])
+
+	def __init__(self, processNoise=0.01, measurementNoise=0.1):
+		"""
+		Constructor
+		@param processNoise: process noise spectral density ((C/s)^2/s)
+		@type processNoise: float
+		@param measurementNoise: measurement variance (C^2)
+		@type measurementNoise: float
+		"""
+		super(KalmanEstimator, self).__init__()
+		self.processNoise = float(processNoise)
+		self.measurementNoise = float(measurementNoise)
+		assert self.processNoise > 0, "Estimator process noise must be > 0"
+		assert self.measurementNoise > 0, "Estimator measurement noise must be > 0"
+
+		# (temperature, slope) - replaced, never changed in place
+		self._estimate = (0.0, 0.0)
+		self._p00 = 0.0
+		self._p01 = 0.0
+		self._p11 = 0.0
+		self._lastTime = None
+
+	@classmethod
+	def FromConfig(cls, configDict):
+		"""
+		Create an estimator from an estimator config dict
+		@param configDict: dict with processNoise & measurementNoise
+		@type configDict: dict
+		@rtype: KalmanEstimator
+		"""
+		return cls(
+			processNoise=configDict.get('processNoise', cls.BASE_CONFIG['processNoise']),
+			measurementNoise=configDict.get('measurementNoise', cls.BASE_CONFIG['measurementNoise'])
+		)
+
+	@property
+	def estimate(self):
+		"""
+		Smoothed temperature & estimated rate of change (units per second), from the same update
+		@rtype: tuple[float, float]
+		"""
+		return self._estimate
+
+	@property
+	def temperature(self):
+		"""
+		Smoothed temperature
+		@rtype: float
+		"""
+		return self._estimate[0]
+
+	@property
+	def slope(self):
+		"""
+		Estimated rate of change (units per second)
+		@rtype: float
+		"""
+		return self._estimate[1]
+
+	@property
+	def initialized(self):
+		"""
+		Whether a measurement has been received since the last reset
+		@rtype: bool
+		"""
+		return self._lastTime is not None
+
+	def reset(self):
+		"""
+		Forget all history. The next measurement re-initializes the filter
+		"""
+		self._lastTime = None
+
+	def update(self, currentTime, measurement):
+		"""
+		Add a measurement
+		@param currentTime: time the measurement was taken (s)
+		@type currentTime: float
+		@param measurement: measured temperature
+		@type measurement: float
+		@return: tuple of smoothed temperature, slope
+		@rtype: tuple[float, float]
+		"""
+		if self._lastTime is None:
+			# First sample - trust it for temperature, know nothing about the slope
+			self._estimate = (float(measurement), 0.0)
+			self._p00 = self.measurementNoise
+			self._p01 = 0.0
+			self._p11 = 1.0
+			self._lastTime = currentTime
+			return self._estimate
+
+		temperature, slope = self._estimate
+
+		# Predict
+		dt = currentTime - self._lastTime
+		if dt > 0:
+			q = self.processNoise
+			dt2 = dt * dt
+			temperature += slope * dt
+			self._p00 += dt * (2.0 * self._p01 + dt * self._p11) + q * dt2 * dt / 3.0
+			self._p01 += dt * self._p11 + q * dt2 / 2.0
+			self._p11 += q * dt
+			self._lastTime = currentTime
+
+		# Correct
+		p00 = self._p00
+		p01 = self._p01
+		s = p00 + self.measurementNoise
+		k0 = p00 / s
+		k1 = p01 / s
+		innovation = measurement - temperature
+		self._p00 = p00 - k0 * p00
+		self._p01 = p01 - k0 * p01
+		self._p11 -= k1 * p01
+
+		self._estimate = (temperature + k0 * innovation, slope + k1 * innovation)
+		return self._estimate
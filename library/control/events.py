@@ -0,0 +1,226 @@
+"""
+Publish/subscribe hooks for watching the state machine without slowing down its control loop
+"""
+import logging
+from collections import OrderedDict, deque, namedtuple
+from threading import Thread, Event
+
+from library.other.setupLogging import getLogger
+
+
+class EVENTS:
+	# Every tick of the state machine
+	TICK = 'tick'
+	# Data record added - data holds the record
+	SAMPLE = 'sample'
+	# New state of the profile started
+	STATE_CHANGED = 'stateChanged'
+	# Thermocouple read failed
+	FAULT = 'fault'
+	PAUSED = 'paused'
+	RESUMED = 'resumed'
+	STOPPED = 'stopped'
+	# Profile ran to the end
+	COMPLETED = 'completed'
+
+	ALL = [TICK, SAMPLE, STATE_CHANGED, FAULT, PAUSED, RESUMED, STOPPED, COMPLETED]
+
+
+# An event as delivered to subscribers. timestamp is the state machine's, data a dict specific to the event
+Message = namedtuple('Message', ['event', 'timestamp', 'data'])
+
+
+class Subscription(Thread):
+	"""
+	One subscriber's queue & the worker thread calling it. The queue is bounded - when the subscriber falls behind,
+	the oldest queued messages are dropped & counted, so the publisher never waits
+	"""
+	def __init__(self, callback, events=None, queueSize=100, name=None, debugLevel=logging.INFO):
+		"""
+		Constructor
+		@param callback: called with each Message, on the subscription's thread
+		@type callback: func
+		@param events: (Optional) events to receive - see EVENTS. Default: all
+		@type events: list[str]
+		@param queueSize: messages to queue before dropping the oldest
+		@type queueSize: int
+		@param name: (Optional) name for logs & stats. Default: the callback's name
+		@type name: str
+		@param debugLevel: logging level
+		@type debugLevel: int
+		"""
+		name = name or getattr(callback, '__name__', repr(callback))
+		super(Subscription, self).__init__(name='Subscription-{}'.format(name))
+		self.daemon = True
+
+		self.logger = getLogger('Subscription', debugLevel)
+
+		assert queueSize > 0, "Subscription queue size must be > 0"
+		for event in events or []:
+			assert event in EVENTS.ALL, "Unknown event: {}".format(event)
+		self.subscriberName = name
+		self.callback = callback
+		self.events = frozenset(events or EVENTS.ALL)
+		self.queueSize = int(queueSize)
+
+		# deque appends & pops are atomic - a full deque drops its oldest item on append
+		self._queue = deque(maxlen=self.queueSize)
+		self._wakeEvent = Event()
+		self._stopEvent = Event()
+		self.delivered = 0
+		self.dropped = 0
+		self.errors = 0
+
+	def put(self, message):
+		"""
+		Queue a message for the subscriber. Never blocks
+		@param message: message to deliver
+		@type message: Message
+		"""
+		if len(self._queue) == self.queueSize:
+			self.dropped += 1
+		self._queue.append(message)
+		self._wakeEvent.set()
+
+	@property
+	def pending(self):
+		"""
+		@return: messages queued, not yet delivered
+		@rtype: int
+		"""
+		return len(self._queue)
+
+	def run(self):
+		queue = self._queue
+		while not self._stopEvent.is_set():
+			self._wakeEvent.wait()
+			self._wakeEvent.clear()
+			while queue and not self._stopEvent.is_set():
+				message = queue.popleft()
+				try:
+					self.callback(message)
+				except Exception:
+					self.errors += 1
+					self.logger.exception("Subscriber {} failed on {}".format(self.subscriberName, message.event))
+				self.delivered += 1
+
+	def stop(self, timeout=1.0):
+		"""
+		Stop delivering - messages still queued are dropped
+		@param timeout: seconds to wait for the callback in progress, if any
+		@type timeout: float
+		"""
+		self._stopEvent.set()
+		self._wakeEvent.set()
+		if self.is_alive():
+			self.join(timeout)
+
+
+class EventBus(object):
+	"""
+	Fans events out to subscribers, each served from its own bounded queue on its own thread, so a slow subscriber (UI,
+	network, disk) can never delay the publisher. Publishing copies no state & takes no locks beyond waking the
+	subscribers' threads
+	"""
+	def __init__(self, debugLevel=logging.INFO):
+		"""
+		Constructor
+		@param debugLevel: logging level
+		@type debugLevel: int
+		"""
+		super(EventBus, self).__init__()
+		self.debugLevel = debugLevel
+		# Replaced, never changed in place, so publish can iterate without a lock
+		self._subscriptions = ()
+		self._byEvent = {}
+
+	def subscribe(self, callback, events=None, queueSize=100, name=None):
+		"""
+		Start delivering events to a callback
+		@param callback: called with each Message, on a thread of its own
+		@type callback: func
+		@param events: (Optional) events to receive - see EVENTS. Default: all
+		@type events: list[str]
+		@param queueSize: messages to queue before dropping the oldest
+		@type queueSize: int
+		@param name: (Optional) name for logs & stats. Default: the callback's name
+		@type name: str
+		@return: the subscription - pass it to unsubscribe
+		@rtype: Subscription
+		"""
+		subscription = Subscription(callback, events, queueSize=queueSize, name=name, debugLevel=self.debugLevel)
+		subscription.start()
+		self._setSubscriptions(self._subscriptions + (subscription,))
+		return subscription
+
+	def unsubscribe(self, subscription):
+		"""
+		Stop delivering events to a subscription
+		@param subscription: subscription from subscribe
+		@type subscription: Subscription
+		"""
+		self._setSubscriptions(tuple(sub for sub in self._subscriptions if sub is not subscription))
+		subscription.stop()
+
+	def _setSubscriptions(self, subscriptions):
+		self._byEvent = {
+			event: tuple(sub for sub in subscriptions if event in sub.events)
+			for event in EVENTS.ALL
+		}
+		self._subscriptions = subscriptions
+
+	def subscribed(self, event):
+		"""
+		Check whether anyone receives an event - lets publishers skip building messages nobody reads
+		@param event: event name
+		@type event: str
+		@rtype: bool
+		"""
+		return bool(self._byEvent.get(event))
+
+	def publish(self, event, timestamp, data=None):
+		"""
+		Queue an event for every subscriber to it. Never blocks
+		@param event: event name - see EVENTS
+		@type event: str
+		@param timestamp: state machine timestamp
+		@type timestamp: float
+		@param data: (Optional) event details
+		@type data: dict
+		"""
+		subscriptions = self._byEvent.get(event)
+		if subscriptions:
+			message = Message(event, timestamp, data or {})
+			for subscription in subscriptions:
+				subscription.put(message)
+
+	@property
+	def subscriptions(self):
+		"""
+		@rtype: tuple[Subscription]
+		"""
+		return self._subscriptions
+
+	@property
+	def stats(self):
+		"""
+		Backpressure of each subscriber
+		@return: subscriber name to dict of delivered, dropped, pending & errors counts
+		@rtype: OrderedDict
+		"""
+		return OrderedDict(
+			(
+				sub.subscriberName,
+				OrderedDict([('delivered', sub.delivered), ('dropped', sub.dropped), ('pending', sub.pending), ('errors', sub.errors)])
+			)
+			for sub in self._subscriptions
+		)
+
+	def close(self):
+		"""
+		Stop every subscription
+		"""
+		subscriptions = self._subscriptions
+		self._setSubscriptions(())
+		for subscription in subscriptions:
+			subscription.stop()
@@ -0,0 +1,122 @@
+from collections import OrderedDict
+
+from definitions import CONFIG_KEY_TARGET, CONFIG_KEY_DURATION
+
+
+class FeedForward(object):
+	"""
+	Heater power each profile state needs, added to the PID output so the PID only has to correct what's left
+	From a first-order oven model, following a target that moves at `slope` takes
+		power = (timeConstant * slope + (temperature - ambient)) / gain
+	of full power, evaluated at the middle of each state. The terms are planned once per run from the profile.
+	"""
+	BASE_CONFIG = OrderedDict([
+		("enabled", False),
+		# Steady-state rise above ambient at full power (C) - e.g. from library.simulation.identification.FitOvenModel
+		("gain", 350.0),
+		# Thermal time constant (s)
+		("timeConstant", 300.0),
+		("ambient", 25.0),
+		# PID output per unit of heater power. Match output.outputMax - output.outputMin when time-proportioning
+		("outputScale", 10.0),
+	])
+
+	def __init__(self, gain=350.0, timeConstant=300.0, ambient=25.0, outputScale=10.0):
+		"""
+		Constructor
+		@param gain: steady-state temperature rise above ambient at full power (C)
+		@type gain: float
+		@param timeConstant: thermal time constant (s)
+		@type timeConstant: float
+		@param ambient: ambient temperature (C)
+		@type ambient: float
+		@param outputScale: PID output per unit of heater power
+		@type outputScale: float
+		"""
+		super(FeedForward, self).__init__()
+		self.gain = float(gain)
+		self.timeConstant = float(timeConstant)
+		self.ambient = float(ambient)
+		self.outputScale = float(outputScale)
+		assert self.gain > 0, "Feed-forward plant gain must be > 0"
+		assert self.timeConstant > 0, "Feed-forward time constant must be > 0"
+
+		self._terms = []
+
+	@classmethod
+	def FromConfig(cls, configDict):
+		"""
+		Create a feed-forward stage from a feedForward config dict
+		@param configDict: dict with any of BASE_CONFIG's keys
+		@type configDict: dict
+		@rtype: FeedForward
+		"""
+		config = OrderedDict(cls.BASE_CONFIG)
+		config.update(configDict or {})
+		return cls(
+			gain=config['gain'],
+			timeConstant=config['timeConstant'],
+			ambient=config['ambient'],
+			outputScale=config['outputScale']
+		)
+
+	@property
+	def terms(self):
+		"""
+		Planned feed-forward term of each state, in PID output units
+		@rtype: list[float]
+		"""
+		return self._terms
+
+	def power(self, startTemperature, endTemperature, duration):
+		"""
+		Heater power needed to move linearly between two temperatures
+		@param startTemperature: temperature at the start (C)
+		@type startTemperature: float
+		@param endTemperature: temperature at the end (C)
+		@type endTemperature: float
+		@param duration: time to get there (s). 0 means as fast as possible
+		@type duration: float
+		@return: heater power, 0.0 - 1.0
+		@rtype: float
+		"""
+		if duration <= 0:
+			return 1.0 if endTemperature > startTemperature else 0.0
+		slope = (endTemperature - startTemperature) / duration
+		middle = (startTemperature + endTemperature) / 2.0
+		power = (self.timeConstant * slope + middle - self.ambient) / self.gain
+		return min(1.0, max(0.0, power))
+
+	def plan(self, stateConfiguration, units='celsius'):
+		"""
+		Work out the feed-forward term of every state. The first state starts from ambient, the last (cooling) state
+		always gets 0
+		@param stateConfiguration: ordered dict of state name to {'target', 'duration'}
+		@type stateConfiguration: OrderedDict
+		@param units: temperature units of the state configuration - 'celsius' or 'fahrenheit'
+		@type units: str
+		@return: term of each state, in PID output units
+		@rtype: list[float]
+		"""
+		toCelsius = (lambda temperature: temperature) if units == 'celsius' else (lambda temperature: (temperature - 32.0) * 5.0 / 9.0)
+		states = list(stateConfiguration.values())
+
+		self._terms = []
+		lastTarget = self.ambient
+		for state in states[:-1]:
+			target = toCelsius(float(state[CONFIG_KEY_TARGET]))
+			self._terms.append(self.outputScale * self.power(lastTarget, target, float(state[CONFIG_KEY_DURATION])))
+			lastTarget = target
+		if states:
+			self._terms.append(0.0)
+		return self._terms
+
+	def term(self, stateIndex):
+		"""
+		Planned feed-forward term of a state
+		@param stateIndex: index of the state in the profile
+		@type stateIndex: int
+		@return: term in PID output units, 0.0 if nothing is planned for the state
+		@rtype: float
+		"""
+		return self._terms[stateIndex] if 0 <= stateIndex < len(self._terms) else 0.0
@@ -0,0 +1,114 @@
+"""
+Headless reflow runs - drives ToastStateMachine from the control loop thread without importing wx or matplotlib
+
+Usage, from the repository root:
+	python3 toasting.py --headless --config config/myConfig.json --profile config/myProfile.json
+"""
+import os
+import time
+import json
+import logging
+from collections import OrderedDict
+from threading import Event
+
+from library.other.setupLogging import getLogger
+from library.control.stateMachine import ToastStateMachine, STATES
+from library.control.loop import ControlLoopRunner
+from library.control.events import EVENTS
+from library.other.run_archive import EXTENSION as ARCHIVE_EXTENSION
+from definitions import GetBaseConfigurationFilePath, GetDataFilePath
+
+
+def LoadProfile(profilePath):
+	"""
+	Read a reflow profile - either a bare dict of states or a full config, in which case its 'states' are used
+	@param profilePath: path to JSON profile
+	@type profilePath: str
+	@return: ordered dict of state name to {'target', 'duration'}
+	@rtype: OrderedDict
+	"""
+	with open(profilePath, "r") as inf:
+		profile = json.load(inf, object_pairs_hook=OrderedDict)
+	states = profile.get('states', profile)
+	if not states or not all(isinstance(state, dict) for state in states.values()):
+		raise Exception("No reflow states found in profile {}".format(profilePath))
+	return states
+
+
+def GetDefaultDataPath():
+	"""
+	@return: path for the data CSV of a run starting now
+	@rtype: str
+	"""
+	return GetDataFilePath(time.strftime("toast_data_%Y%m%d_%H%M%S.csv"))
+
+
+def RunHeadless(configPath=GetBaseConfigurationFilePath(), profilePath=None, dataPath=None, spiFactory=None, debugLevel=logging.INFO):
+	"""
+	Run one reflow profile to completion with no GUI, then save the data & config like the GUI does.
+	Ctrl+C stops the run with the heater off
+	@param configPath: path to JSON config
+	@type configPath: str
+	@param profilePath: (Optional) path to a JSON profile replacing the config's states
+	@type profilePath: str
+	@param dataPath: (Optional) path to write the data CSV to - the config is written next to it. Default: data dir
+	@type dataPath: str
+	@param spiFactory: (Optional) thermocouple SPI device factory, e.g. for capturing frames
+	@type spiFactory: func
+	@param debugLevel: logging level
+	@type debugLevel: int
+	@return: final state machine status - STATES.COMPLETE if the profile finished
+	@rtype: str
+	"""
+	logger = getLogger('Headless', debugLevel)
+
+	complete = Event()
+	toaster = ToastStateMachine(
+		jsonConfigPath=configPath,
+		stateMachineCompleteCallback=complete.set,
+		spiFactory=spiFactory,
+		debugLevel=debugLevel
+	)
+	controlLoop = ControlLoopRunner(toaster, debugLevel=debugLevel)
+	try:
+		if profilePath:
+			toaster.stateConfiguration = LoadProfile(profilePath)
+
+		# The run log keeps the data if the run dies before the CSV is written
+		dataPath = dataPath or GetDefaultDataPath()
+		runLogPath = os.path.splitext(dataPath)[0] + ".log"
+
+		# Progress is logged from the event bus, off the control loop thread
+		toaster.events.subscribe(
+			lambda message: logger.info("{:7.1f}s - {}, target {}".format(message.timestamp, message.data['state'], message.data['target'])),
+			events=[EVENTS.STATE_CHANGED],
+			name='headlessProgress'
+		)
+
+		controlLoop.start()
+		toaster.start(runLogPath=runLogPath)
+		logger.info("Reflow started: {} - logging to {}".format(", ".join(toaster.states), runLogPath))
+
+		try:
+			# The state machine stops itself, heater off, if the thermocouple turns unhealthy
+			while not complete.wait(1.0):
+				if toaster.running != STATES.RUNNING:
+					break
+		except KeyboardInterrupt:
+			logger.warning("Interrupted - stopping reflow")
+
+		status = toaster.running
+		if status != STATES.COMPLETE:
+			toaster.stop()
+		if toaster.health.tripped:
+			logger.error("Reflow stopped: {}. Check the thermocouple connection".format(toaster.health.tripped))
+		logger.info("Reflow {} - control loop: {}".format(status.lower(), controlLoop.statsToString()))
+
+		if toaster.dumpDataToCsv(dataPath):
+			toaster.dumpConfig(os.path.splitext(dataPath)[0] + ".json")
+			toaster.dumpDataToArchive(os.path.splitext(dataPath)[0] + ARCHIVE_EXTENSION)
+			logger.info("Data & config stored @ {}".format(dataPath))
+		return status
+	finally:
+		controlLoop.stop()
+		toaster.cleanup()
@@ -0,0 +1,250 @@
+"""
+Thermocouple health watchdog - decides when the sensor readings can no longer be trusted to run the heater on
+"""
+from collections import OrderedDict
+
+from library.sensors.sensor_thermocouple import TCNoTCError, TCGndShortError, TCVccShortError, TCError
+
+
+class SensorHealthMonitor(object):
+	"""
+	Rolling window over the last reads of the thermocouple, counted per fault type. Each read updates the counts in O(1)
+	- the outgoing read's count drops as the new one's rises. Unhealthy when:
+		maxErrors - this many of the window's reads failed, of any type
+		faultLimits - this many of the window's reads failed with one fault type, e.g. {"TCNoTCError": 2}
+		staleTimeout - the newest good reading is older than this (s), e.g. the background sampler stopped or every
+			read is failing
+	A limit of 0 disables it. The state machine checks every tick, and stops the run with the heater off when unhealthy
+	"""
+	# Fault types, by exception class. Anything else the read raises, e.g. an SPI IOError, is 'other'
+	FAULT_TYPES = ['TCNoTCError', 'TCGndShortError', 'TCVccShortError', 'TCError', 'other']
+	FAULT_CLASSES = [
+		(TCNoTCError, 'TCNoTCError'),
+		(TCGndShortError, 'TCGndShortError'),
+		(TCVccShortError, 'TCVccShortError'),
+		(TCError, 'TCError'),
+	]
+
+	BASE_CONFIG = OrderedDict([
+		# Reads in the rolling window
+		("window", 10),
+		("maxErrors", 5),
+		("faultLimits", OrderedDict((faultType, 0) for faultType in FAULT_TYPES)),
+		("staleTimeout", 5.0),
+	])
+
+	def __init__(self, window=10, maxErrors=5, faultLimits=None, staleTimeout=5.0):
+		"""
+		Constructor
+		@param window: number of recent reads to count faults over
+		@type window: int
+		@param maxErrors: failed reads in the window to be unhealthy. 0 disables
+		@type maxErrors: int
+		@param faultLimits: (Optional) fault type to failed reads of that type in the window to be unhealthy. 0 disables
+		@type faultLimits: dict
+		@param staleTimeout: age of the newest good reading to be unhealthy (s). 0 disables
+		@type staleTimeout: float
+		"""
+		super(SensorHealthMonitor, self).__init__()
+		self.window = int(window)
+		assert 0 < self.window, "Sensor health window must be > 0"
+		assert 0 <= maxErrors <= self.window, "maxErrors must be between 0 and the window size"
+		for faultType in faultLimits or {}:
+			assert faultType in self.FAULT_TYPES, "Unknown fault type: {}".format(faultType)
+		self.maxErrors = int(maxErrors)
+		self.faultLimits = OrderedDict((faultType, int((faultLimits or {}).get(faultType) or 0)) for faultType in self.FAULT_TYPES)
+		self.staleTimeout = float(staleTimeout)
+
+		# Limits & counts indexed by fault code - 0 is a good read, then FAULT_TYPES in order
+		self._limits = [0] + list(self.faultLimits.values())
+		self.reset()
+
+	@classmethod
+	def FromConfig(cls, configDict):
+		"""
+		Create a monitor from a health config dict
+		@param configDict: dict with any of BASE_CONFIG's keys
+		@type configDict: dict
+		@rtype: SensorHealthMonitor
+		"""
+		config = OrderedDict(cls.BASE_CONFIG)
+		config.update(configDict or {})
+		return cls(
+			window=config['window'],
+			maxErrors=config['maxErrors'],
+			faultLimits=config['faultLimits'],
+			staleTimeout=config['staleTimeout']
+		)
+
+	@classmethod
+	def FaultType(cls, error):
+		"""
+		Classify a read error
+		@param error: exception raised by the read
+		@type error: Exception
+		@return: one of FAULT_TYPES
+		@rtype: str
+		"""
+		for errorClass, faultType in cls.FAULT_CLASSES:
+			if isinstance(error, errorClass):
+				return faultType
+		return 'other'
+
+	def reset(self):
+		"""
+		Forget every read & trip
+		"""
+		# Fault code of each read in the window - a ring, overwritten oldest first
+		self._ring = bytearray(self.window)
+		self._position = 0
+		self._filled = 0
+		self._windowCounts = [0] * (len(self.FAULT_TYPES) + 1)
+		self._totalCounts = [0] * (len(self.FAULT_TYPES) + 1)
+		self.consecutiveErrors = 0
+		self.maxConsecutiveErrors = 0
+		self.lastReadingTime = None
+		self._firstReadTime = None
+		# Reason for the last shutdown, None once a run starts again
+		self.tripped = None
+		self.trips = 0
+
+	# region Update
+
+	def update(self, now, error=None, readingTime=None):
+		"""
+		Count a read of the thermocouple & check the sensor's health
+		@param now: current time (s), on the same clock as readingTime
+		@type now: float
+		@param error: (Optional) exception the read raised, None if it succeeded
+		@type error: Exception
+		@param readingTime: (Optional) when a good reading was taken, if earlier than now - e.g. a background sample
+		@type readingTime: float
+		@return: reason the sensor is unhealthy, None if healthy
+		@rtype: str
+		"""
+		code = self.FAULT_TYPES.index(self.FaultType(error)) + 1 if error is not None else 0
+
+		position = self._position
+		if self._filled == self.window:
+			self._windowCounts[self._ring[position]] -= 1
+		else:
+			self._filled += 1
+		self._ring[position] = code
+		self._windowCounts[code] += 1
+		self._totalCounts[code] += 1
+		self._position = (position + 1) % self.window
+
+		if self._firstReadTime is None:
+			self._firstReadTime = now
+		if code:
+			self.consecutiveErrors += 1
+			self.maxConsecutiveErrors = max(self.maxConsecutiveErrors, self.consecutiveErrors)
+		else:
+			self.consecutiveErrors = 0
+			self.lastReadingTime = now if readingTime is None else readingTime
+		return self.check(now)
+
+	def check(self, now):
+		"""
+		Check the sensor's health without counting a read
+		@param now: current time (s)
+		@type now: float
+		@return: reason the sensor is unhealthy, None if healthy
+		@rtype: str
+		"""
+		recentErrors = self.recentErrors
+		if self.maxErrors and recentErrors >= self.maxErrors:
+			return "{} of the last {} thermocouple reads failed".format(recentErrors, self._filled)
+		for code, limit in enumerate(self._limits):
+			if limit and self._windowCounts[code] >= limit:
+				return "{} {} errors in the last {} thermocouple reads".format(
+					self._windowCounts[code], self.FAULT_TYPES[code - 1], self._filled
+				)
+		if self.staleTimeout and self.readingAge(now) > self.staleTimeout:
+			return "no fresh thermocouple reading for {:.1f}s".format(self.readingAge(now))
+		return None
+
+	def trip(self, reason):
+		"""
+		Record a shutdown
+		@param reason: why the sensor is unhealthy, from check
+		@type reason: str
+		"""
+		self.tripped = reason
+		self.trips += 1
+
+	# endregion Update
+	# region Metrics
+
+	@property
+	def reads(self):
+		"""
+		@return: reads counted since the last reset
+		@rtype: int
+		"""
+		return sum(self._totalCounts)
+
+	@property
+	def errors(self):
+		"""
+		@return: failed reads since the last reset
+		@rtype: int
+		"""
+		return self.reads - self._totalCounts[0]
+
+	@property
+	def recentErrors(self):
+		"""
+		@return: failed reads in the window
+		@rtype: int
+		"""
+		return self._filled - self._windowCounts[0]
+
+	def recentErrorCount(self, faultType):
+		"""
+		Get the failed reads of one fault type in the window
+		@param faultType: one of FAULT_TYPES
+		@type faultType: str
+		@rtype: int
+		"""
+		return self._windowCounts[self.FAULT_TYPES.index(faultType) + 1]
+
+	@property
+	def errorRate(self):
+		"""
+		@return: fraction of the window's reads that failed
+		@rtype: float
+		"""
+		return self.recentErrors / float(self._filled) if self._filled else 0.0
+
+	def readingAge(self, now):
+		"""
+		Get the age of the newest good reading - counted from the first read while there's been none
+		@param now: current time (s)
+		@type now: float
+		@rtype: float
+		"""
+		reference = self.lastReadingTime if self.lastReadingTime is not None else self._firstReadTime
+		return max(0.0, now - reference) if reference is not None else 0.0
+
+	@property
+	def stats(self):
+		"""
+		Error counts & rates, e.g. to log after a run
+		@rtype: OrderedDict
+		"""
+		reads = self.reads
+		return OrderedDict([
+			('reads', reads),
+			('errors', self.errors),
+			('errorRate', self.errors / float(reads) if reads else 0.0),
+			('recentErrors', self.recentErrors),
+			('recentErrorRate', self.errorRate),
+			('maxConsecutiveErrors', self.maxConsecutiveErrors),
+			('faults', OrderedDict(
+				(faultType, self._totalCounts[code + 1]) for code, faultType in enumerate(self.FAULT_TYPES)
+			)),
+			('trips', self.trips),
+		])
+
+	# endregion Metrics
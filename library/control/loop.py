@@ -0,0 +1,137 @@
+import time
+import logging
+from collections import OrderedDict
+from threading import Thread, Event
+
+from library.other.setupLogging import getLogger
+
+
+class ControlLoopRunner(Thread):
+	"""
+	Ticks a state machine on its own thread against monotonic deadlines, so the control loop keeps time while the UI
+	thread is busy (e.g. redrawing the live graph on a Pi Zero)
+	Deadlines are fixed multiples of the timer period from the start - a late tick doesn't push the next one back.
+	Each tick is passed the time actually elapsed since the last one, so the state machine's timestamp, the PID's dt and
+	the soak durations follow the clock instead of counting ticks. Ticks that can't start before their deadline has
+	passed are skipped and counted as overruns.
+	"""
+	def __init__(self, stateMachine, clock=time.monotonic, debugLevel=logging.INFO):
+		"""
+		Constructor
+		@param stateMachine: state machine to tick. Its timer period is read every tick, so changes take effect live
+		@type stateMachine: library.control.stateMachine.ToastStateMachine
+		@param clock: monotonic clock returning seconds
+		@type clock: func
+		@param debugLevel: logging level
+		@type debugLevel: int
+		"""
+		super(ControlLoopRunner, self).__init__(name='ControlLoopRunner')
+		self.daemon = True
+
+		self.logger = getLogger('ControlLoopRunner', debugLevel)
+
+		self.stateMachine = stateMachine
+		self.clock = clock
+		# Passed through to tick() - leaves the relay alone while the GUI tests it
+		self.testing = False
+
+		self._stopEvent = Event()
+		self.resetStats()
+
+	# region Stats
+
+	def resetStats(self):
+		"""
+		Start counting ticks, overruns & jitter again, e.g. at the start of a run
+		"""
+		self._ticks = 0
+		self._overruns = 0
+		self._skippedTicks = 0
+		self._jitterSum = 0.0
+		self._maxJitter = 0.0
+		self._lastElapsed = 0.0
+
+	@property
+	def stats(self):
+		"""
+		Loop timing since the last resetStats
+			ticks - ticks run
+			overruns - ticks that ran past the next deadline
+			skippedTicks - deadlines skipped because of overruns
+			meanJitter/maxJitter - how late ticks started after their deadline (s)
+			lastElapsed - time between the last two ticks (s)
+		@rtype: OrderedDict
+		"""
+		stats = OrderedDict()
+		stats['ticks'] = self._ticks
+		stats['overruns'] = self._overruns
+		stats['skippedTicks'] = self._skippedTicks
+		stats['meanJitter'] = self._jitterSum / self._ticks if self._ticks else 0.0
+		stats['maxJitter'] = self._maxJitter
+		stats['lastElapsed'] = self._lastElapsed
+		return stats
+
+	def statsToString(self):
+		"""
+		@return: one-line summary of the loop timing
+		@rtype: str
+		"""
+		stats = self.stats
+		return "{} ticks, {} overruns ({} skipped), jitter mean {:.1f} ms, max {:.1f} ms".format(
+			stats['ticks'],
+			stats['overruns'],
+			stats['skippedTicks'],
+			stats['meanJitter'] * 1000.0,
+			stats['maxJitter'] * 1000.0
+		)
+
+	# endregion Stats
+	# region Thread
+
+	def run(self):
+		"""
+		Tick the state machine at every deadline until stopped
+		"""
+		nextTick = self.clock()
+		lastTick = None
+		while not self._stopEvent.is_set():
+			now = self.clock()
+			period = self.stateMachine.timerPeriod
+			elapsed = period if lastTick is None else now - lastTick
+			lastTick = now
+
+			jitter = max(0.0, now - nextTick)
+			self._ticks += 1
+			self._jitterSum += jitter
+			self._maxJitter = max(self._maxJitter, jitter)
+			self._lastElapsed = elapsed
+
+			try:
+				self.stateMachine.tick(self.testing, elapsed=elapsed)
+			except Exception:
+				# A bad tick mustn't stop the loop - it's what turns the heater off
+				self.logger.exception("Control loop tick failed")
+
+			nextTick += period
+			now = self.clock()
+			if now >= nextTick:
+				# Ran past the next deadline - skip to the first one still ahead rather than bursting to catch up
+				skipped = int((now - nextTick) // period) + 1
+				self._overruns += 1
+				self._skippedTicks += skipped
+				nextTick += skipped * period
+				self.logger.debug("Control loop overrun - skipped {} tick(s)".format(skipped))
+			self._stopEvent.wait(nextTick - now)
+
+	def stop(self, timeout=2.0):
+		"""
+		Stop the loop thread
+		@param timeout: max seconds to wait for the thread
+		@type timeout: float
+		"""
+		self._stopEvent.set()
+		if self.is_alive():
+			self.join(timeout)
+		self.logger.debug("Control loop stopped: {}".format(self.statsToString()))
+
+	# endregion Thread
@@ -0,0 +1,328 @@
+import math
+from collections import OrderedDict, deque
+
+
+class ModelPredictiveController(object):
+	"""
+	Receding-horizon relay controller on a first-order-plus-dead-time model of the oven
+		T[k + 1] = a * T[k] + b * relay[k - delay] + c
+	Every control period it predicts the temperature over the horizon for each candidate plan - relay on or off for the
+	first s periods, then off, fully on, or at the power that holds the target - and applies the first period of the
+	cheapest plan. Plans are scored on squared error from the target, with error above the target weighted up so the
+	oven coasts into it instead of overshooting. Relay decisions still travelling through the dead time are replayed
+	from history.
+	The model is linear, so predictions are sums of the precomputed step response and a solve is at most
+	6 * horizon^2 float operations - most plans are abandoned early once they cost more than the best so far.
+	Drop-in for PID in the state machine: compute() sets output to outputScale with the relay on, 0.0 with it off.
+	"""
+	BASE_CONFIG = OrderedDict([
+		("enabled", False),
+		# Oven model - e.g. from library.simulation.identification.FitOvenModel
+		("gain", 350.0),
+		("timeConstant", 300.0),
+		("deadTime", 8.0),
+		("ambient", 25.0),
+		# Prediction horizon after the dead time (s)
+		("horizon", 60.0),
+		# Weight of squared error above the target, relative to error below it
+		("overshootWeight", 10.0),
+		# Cost of switching the relay (C^2 s)
+		("switchPenalty", 0.0),
+		# Output with the relay on. Match output.outputMax when time-proportioning
+		("outputScale", 10.0),
+	])
+
+	def __init__(self, gain=350.0, timeConstant=300.0, deadTime=8.0, ambient=25.0, horizon=60.0, overshootWeight=10.0, switchPenalty=0.0, outputScale=10.0, controlPeriod=1.0, units='celsius'):
+		"""
+		Constructor
+		@param gain: steady-state temperature rise above ambient at full power (C)
+		@type gain: float
+		@param timeConstant: thermal time constant (s)
+		@type timeConstant: float
+		@param deadTime: lag between switching the relay and the thermocouple seeing it (s)
+		@type deadTime: float
+		@param ambient: ambient temperature (C)
+		@type ambient: float
+		@param horizon: prediction horizon after the dead time (s)
+		@type horizon: float
+		@param overshootWeight: weight of squared error above the target
+		@type overshootWeight: float
+		@param switchPenalty: cost of switching the relay
+		@type switchPenalty: float
+		@param outputScale: output with the relay on
+		@type outputScale: float
+		@param controlPeriod: time between compute() calls (s)
+		@type controlPeriod: float
+		@param units: temperature units of states & targets - 'celsius' or 'fahrenheit'
+		@type units: str
+		"""
+		super(ModelPredictiveController, self).__init__()
+		assert gain > 0, "MPC model gain must be > 0"
+		assert timeConstant > 0, "MPC model time constant must be > 0"
+		assert deadTime >= 0, "MPC model dead time must be >= 0"
+		assert horizon >= controlPeriod > 0, "MPC horizon must be at least one control period"
+
+		self.gain = float(gain)
+		self.timeConstant = float(timeConstant)
+		self.deadTime = float(deadTime)
+		self.ambient = float(ambient)
+		self.horizon = float(horizon)
+		self.overshootWeight = float(overshootWeight)
+		self.switchPenalty = float(switchPenalty)
+		self.outputScale = float(outputScale)
+		self.controlPeriod = float(controlPeriod)
+		self.units = units
+
+		# Discretised model
+		self._decay = math.exp(-self.controlPeriod / self.timeConstant)
+		self._delaySteps = int(round(self.deadTime / self.controlPeriod))
+		self._horizonSteps = int(round(self.horizon / self.controlPeriod))
+		# Rise above the free response j periods after switching on (j = 0 .. horizon)
+		self._stepResponse = [self.gain * (1.0 - self._decay ** j) for j in range(self._horizonSteps + 1)]
+
+		self._targetState = 0.0
+		self._currentState = 0.0
+		self._output = 0.0
+		self._error = 0.0
+		self._dError = 0.0
+		self._lastTime = 0.0
+		self._history = deque(maxlen=self._delaySteps)
+		self._prediction = []
+		self.reset()
+
+	@classmethod
+	def FromConfig(cls, configDict, controlPeriod=1.0, units='celsius'):
+		"""
+		Create a controller from an mpc config dict
+		@param configDict: dict with any of BASE_CONFIG's keys
+		@type configDict: dict
+		@param controlPeriod: time between compute() calls (s)
+		@type controlPeriod: float
+		@param units: temperature units of states & targets
+		@type units: str
+		@rtype: ModelPredictiveController
+		"""
+		config = OrderedDict(cls.BASE_CONFIG)
+		config.update(configDict or {})
+		return cls(
+			gain=config['gain'],
+			timeConstant=config['timeConstant'],
+			deadTime=config['deadTime'],
+			ambient=config['ambient'],
+			horizon=config['horizon'],
+			overshootWeight=config['overshootWeight'],
+			switchPenalty=config['switchPenalty'],
+			outputScale=config['outputScale'],
+			controlPeriod=controlPeriod,
+			units=units
+		)
+
+	def getConfig(self):
+		"""
+		@return: config dict of this controller
+		@rtype: OrderedDict
+		"""
+		config = OrderedDict([("enabled", True)])
+		for key in list(self.BASE_CONFIG)[1:]:
+			config[key] = getattr(self, key)
+		return config
+
+	def reset(self):
+		"""
+		Forget the relay history - the oven is assumed to have had the relay off for the last dead time
+		"""
+		self._history.clear()
+		self._history.extend([0.0] * self._delaySteps)
+		self._prediction = []
+
+	# region States
+
+	@property
+	def state(self):
+		"""
+		@rtype: float
+		"""
+		return self._currentState
+
+	@property
+	def target(self):
+		"""
+		@rtype: float
+		"""
+		return self._targetState
+
+	@target.setter
+	def target(self, target):
+		"""
+		Set a new target state
+		@param target: new target state
+		@type target: str or int or float
+		"""
+		self._targetState = float(target)
+
+	@property
+	def output(self):
+		"""
+		@rtype: float
+		"""
+		return self._output
+
+	@property
+	def relayState(self):
+		"""
+		Relay state chosen by the last compute
+		@rtype: bool
+		"""
+		return self._output > 0.0
+
+	@property
+	def error(self):
+		"""
+		@rtype: float
+		"""
+		return self._error
+
+	@property
+	def ierror(self):
+		"""
+		No integral term - the model's steady state takes its place
+		@rtype: float
+		"""
+		return 0.0
+
+	@property
+	def derror(self):
+		"""
+		@rtype: float
+		"""
+		return self._dError
+
+	@property
+	def prediction(self):
+		"""
+		Predicted temperature (C) each control period for the chosen plan, starting from the last compute
+		@rtype: list[float]
+		"""
+		return self._prediction
+
+	# endregion States
+	# region Execution
+
+	def _toCelsius(self, temperature):
+		return temperature if self.units == 'celsius' else (temperature - 32.0) * 5.0 / 9.0
+
+	def solve(self, temperature, target, lastRelay=False):
+		"""
+		Find the cheapest relay plan over the horizon
+		@param temperature: current temperature (C)
+		@type temperature: float
+		@param target: target temperature (C)
+		@type target: float
+		@param lastRelay: relay state currently applied
+		@type lastRelay: bool
+		@return: tuple of relay state to apply now, predicted temperatures of the plan
+		@rtype: tuple[bool, list[float]]
+		"""
+		a = self._decay
+		b = self.gain * (1.0 - a)
+		c = self.ambient * (1.0 - a)
+
+		# Decisions already made play out over the dead time
+		predicted = []
+		current = temperature
+		for relay in self._history:
+			current = a * current + b * relay + c
+			predicted.append(current)
+
+		# Free response with the relay off from now on, as error from the target
+		steps = self._horizonSteps
+		response = self._stepResponse
+		freeError = []
+		offset = current - self.ambient
+		for j in range(1, steps + 1):
+			offset *= a
+			freeError.append(self.ambient + offset - target)
+
+		# Power that holds the target once it's reached
+		holdPower = min(1.0, max(0.0, (target - self.ambient) / self.gain))
+		tailPowers = [0.0, holdPower, 1.0]
+
+		def Rise(first, switchStep, tail, j):
+			# Linear model - the first power from the start plus the change to the tail power from switchStep
+			return first * response[j] + (tail - first) * response[j - switchStep] if j > switchStep else first * response[j]
+
+		overshootWeight = self.overshootWeight
+		best = None
+		# Candidates holding the current relay state first, so ties don't switch
+		for firstOn in ([True, False] if lastRelay else [False, True]):
+			first = 1.0 if firstOn else 0.0
+			for tail in tailPowers:
+				for switchStep in range(1, steps + 1):
+					cost = 0.0 if firstOn == lastRelay else self.switchPenalty
+					for j in range(1, steps + 1):
+						error = freeError[j - 1] + Rise(first, switchStep, tail, j)
+						cost += error * error * (overshootWeight if error > 0.0 else 1.0)
+						if best is not None and cost >= best[0]:
+							break
+					if best is None or cost < best[0]:
+						best = (cost, first, switchStep, tail)
+
+		_, first, switchStep, tail = best
+		for j in range(1, steps + 1):
+			predicted.append(freeError[j - 1] + target + Rise(first, switchStep, tail, j))
+		return first > 0.0, predicted
+
+	def compute(self, currenttime, currentstate=None, newState=False, slope=None, targetSlope=0.0):
+		"""
+		Pick the relay state for the next control period
+		Same signature as PID.compute
+		@param currenttime: the time at which the latest input was sampled
+		@type currenttime: float
+		@param currentstate: (Optional) current temperature. Otherwise uses the last one
+		@type currentstate: float
+		@param newState: flag to indicate we're moving to a new state - unused, the plan is rebuilt every period
+		@type newState: bool
+		@param slope: (Optional) measured rate of change of the temperature, reported as the derivative error
+		@type slope: float
+		@param targetSlope: rate of change of the target - only reported in the derivative error
+		@type targetSlope: float
+		@return: outputScale with the relay on, 0.0 with it off
+		@rtype: float
+		"""
+		if not self.target:
+			raise Exception("No target state set, cannot compute MPC output")
+
+		if currentstate is not None:
+			self._currentState = float(currentstate)
+		self._error = self.target - self.state
+		self._dError = targetSlope - slope if slope is not None else 0.0
+
+		relay, self._prediction = self.solve(self._toCelsius(self.state), self._toCelsius(self.target), self.relayState)
+		if self._delaySteps:
+			self._history.append(1.0 if relay else 0.0)
+		self._output = self.outputScale if relay else 0.0
+		self._lastTime = currenttime
+		return self._output
+
+	def zeroierror(self):
+		"""
+		No integral term to zero - kept so the state machine can treat this like a PID
+		"""
+		return
+
+	def currentStateToString(self):
+		"""
+		Return the current state as a string
+		@return: string with current state, target state, errors, and current output
+		@rtype: str
+		"""
+		return "{:7.2f}, {:7.2f}, {:7.2f}, {:7.2f}, {:7.2f}, {:7.2f}".format(
+			self.state,
+			self.target,
+			self.error,
+			self.ierror,
+			self.derror,
+			self.output
+		)
+
+	# endregion Execution
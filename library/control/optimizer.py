@@ -0,0 +1,360 @@
+"""
+Offline PID gain optimizer
+
+Searches kP/kI/kD/windupGuard against an oven model fitted from logged runs, scoring every candidate on a full
+simulated reflow of the configured profile, and writes the best gains back to the config's tuning.pid block.
+
+Usage, from the repository root:
+	python -m library.control.optimizer config/myConfig.json --log data/run1.csv --log data/run2.csv
+"""
+import sys
+import time
+import logging
+import argparse
+import multiprocessing
+from collections import OrderedDict
+
+import numpy as np
+
+from library.other.setupLogging import getLogger
+from library.other.config import ToasterConfig
+from library.control.pid_batch import BatchPID
+from library.sensors.sensor_thermocouple import Thermocouple
+from library.simulation.oven import OvenModel
+from library.simulation.batch import SimulateBatch
+from library.simulation.identification import RunLog, FitOvenModel
+from definitions import GetBaseConfigurationFilePath
+
+# Metrics reported for every candidate, as BatchResult attributes
+METRICS = ['completed', 'duration', 'overshoot', 'timeAboveLiquidus', 'settlingTime', 'switchCount']
+
+
+def _EvaluateChunk(arguments):
+	"""
+	Process pool worker - simulate one chunk of candidates
+	@param arguments: tuple of gain arrays, fixed PID config, simulation keyword arguments, cost keyword arguments
+	@type arguments: tuple
+	@return: dict of metric name to array, plus 'cost'
+	@rtype: dict[str, numpy.ndarray]
+	"""
+	gains, pidConfig, simulationArguments, costArguments = arguments
+	batchPid = BatchPID(
+		gains['kP'],
+		gains['kI'],
+		gains['kD'],
+		windupGuard=gains['windupGuard'],
+		min=pidConfig.get('min'),
+		max=pidConfig.get('max')
+	)
+	result = SimulateBatch(batchPid, **simulationArguments)
+	metrics = {metric: getattr(result, metric) for metric in METRICS}
+	metrics['cost'] = result.cost(**costArguments)
+	return metrics
+
+
+class GainOptimizer(object):
+	"""
+	Random search with iterative refinement: sample the whole gain space log-uniformly, then repeatedly
+	resample around the best candidates with a shrinking spread. Each round is split across a process pool,
+	and each process simulates its whole share of candidates at once with BatchPID.
+	"""
+	# Search ranges - every gain is searched on a log scale
+	BASE_RANGES = OrderedDict([
+		("kP", (0.01, 10.0)),
+		("kI", (1e-5, 0.1)),
+		("kD", (0.1, 100.0)),
+		("windupGuard", (1.0, 200.0)),
+	])
+
+	# Default scoring - overshoot, time above liquidus, soak settling & relay wear, with a little weight on tracking
+	BASE_WEIGHTS = OrderedDict([
+		("absoluteError", 0.01),
+		("duration", 0.01),
+		("overshoot", 20.0),
+		("timeAboveLiquidus", 2.0),
+		("settlingTime", 1.0),
+		("switchCount", 0.5),
+		("incomplete", 1e9),
+	])
+
+	def __init__(self, stateConfiguration, model=None, pidConfig=None, ranges=None, weights=None, timerPeriod=0.5, units='celsius', liquidus=217.0, liquidusWindow=(60.0, 90.0), processes=None, seed=None, debugLevel=logging.INFO):
+		"""
+		Constructor
+		@param stateConfiguration: reflow profile - ordered dict of state name to {'target', 'duration'}
+		@type stateConfiguration: OrderedDict
+		@param model: (Optional) oven model to tune against. Default: OvenModel()
+		@type model: OvenModel
+		@param pidConfig: (Optional) PID config to take the output limits from
+		@type pidConfig: dict
+		@param ranges: (Optional) search ranges - see BASE_RANGES. Missing keys use the defaults
+		@type ranges: dict[str, tuple[float, float]]
+		@param weights: (Optional) cost weights - see BASE_WEIGHTS & BatchResult.COST_WEIGHTS
+		@type weights: dict[str, float]
+		@param timerPeriod: state machine tick period (s)
+		@type timerPeriod: float
+		@param units: temperature units of the state configuration
+		@type units: str
+		@param liquidus: solder liquidus temperature, in units
+		@type liquidus: float
+		@param liquidusWindow: acceptable range of time above liquidus (s)
+		@type liquidusWindow: tuple[float, float]
+		@param processes: (Optional) number of worker processes. Default: one per core
+		@type processes: int
+		@param seed: (Optional) random seed
+		@type seed: int
+		@param debugLevel: logging level
+		@type debugLevel: int
+		"""
+		super(GainOptimizer, self).__init__()
+		self.logger = getLogger('GainOptimizer', debugLevel)
+
+		self.stateConfiguration = stateConfiguration
+		self.model = model or OvenModel()
+		self.pidConfig = OrderedDict(pidConfig or {})
+
+		self.ranges = OrderedDict(self.BASE_RANGES)
+		self.ranges.update(ranges or {})
+		for name, (low, high) in self.ranges.items():
+			assert 0 < low <= high, "{} search range must be positive & increasing: {}".format(name, (low, high))
+
+		self.weights = OrderedDict(self.BASE_WEIGHTS)
+		self.weights.update(weights or {})
+
+		self.timerPeriod = float(timerPeriod)
+		self.units = units
+		self.liquidus = float(liquidus)
+		self.liquidusWindow = tuple(liquidusWindow)
+		self.processes = processes or multiprocessing.cpu_count()
+		self.random = np.random.default_rng(seed)
+
+	# region Sampling
+
+	def sample(self, count):
+		"""
+		Sample candidates log-uniformly over the search ranges
+		@param count: number of candidates
+		@type count: int
+		@return: dict of gain name to array of candidates
+		@rtype: OrderedDict
+		"""
+		return OrderedDict(
+			(name, np.exp(self.random.uniform(np.log(low), np.log(high), count)))
+			for name, (low, high) in self.ranges.items()
+		)
+
+	def refine(self, elites, count, spread):
+		"""
+		Sample candidates around the best ones so far, staying within the search ranges
+		@param elites: dict of gain name to array of the best candidates
+		@type elites: dict[str, numpy.ndarray]
+		@param count: number of candidates
+		@type count: int
+		@param spread: standard deviation of the log-normal perturbation
+		@type spread: float
+		@return: dict of gain name to array of candidates
+		@rtype: OrderedDict
+		"""
+		parents = self.random.integers(0, len(elites['kP']), count)
+		return OrderedDict(
+			(name, np.clip(elites[name][parents] * np.exp(self.random.normal(0.0, spread, count)), low, high))
+			for name, (low, high) in self.ranges.items()
+		)
+
+	# endregion Sampling
+	# region Evaluation
+
+	def evaluate(self, candidates, pool=None):
+		"""
+		Score candidates on a full simulated reflow
+		@param candidates: dict of gain name to array of candidates
+		@type candidates: dict[str, numpy.ndarray]
+		@param pool: (Optional) process pool to spread the work over. Default: evaluate in this process
+		@type pool: multiprocessing.pool.Pool
+		@return: dict of metric name to array, plus 'cost'
+		@rtype: dict[str, numpy.ndarray]
+		"""
+		simulationArguments = {
+			'stateConfiguration': self.stateConfiguration,
+			'model': self.model,
+			'timerPeriod': self.timerPeriod,
+			'units': self.units,
+			'liquidus': self.liquidus,
+		}
+		costArguments = {'weights': self.weights, 'liquidusWindow': self.liquidusWindow}
+
+		candidates = OrderedDict((name, np.asarray(values, dtype=float)) for name, values in candidates.items())
+		count = len(candidates['kP'])
+		chunkCount = min(count, self.processes if pool else 1)
+		chunks = [
+			(OrderedDict((name, values[indices]) for name, values in candidates.items()), self.pidConfig, simulationArguments, costArguments)
+			for indices in np.array_split(np.arange(count), chunkCount)
+		]
+		results = pool.map(_EvaluateChunk, chunks) if pool else [_EvaluateChunk(chunk) for chunk in chunks]
+		return {key: np.concatenate([result[key] for result in results]) for key in results[0]}
+
+	def optimize(self, candidates=4096, rounds=4, eliteCount=32):
+		"""
+		Run the search
+		@param candidates: candidates per round
+		@type candidates: int
+		@param rounds: number of rounds. The first samples the whole space, the rest refine
+		@type rounds: int
+		@param eliteCount: number of best candidates kept between rounds
+		@type eliteCount: int
+		@return: tuple of best PID config, its metrics
+		@rtype: tuple[OrderedDict, dict[str, float]]
+		"""
+		best = None
+		bestMetrics = None
+		pool = multiprocessing.Pool(self.processes) if self.processes > 1 else None
+		try:
+			elites = None
+			spread = 1.0
+			for roundIndex in range(rounds):
+				start = time.perf_counter()
+				population = self.sample(candidates) if elites is None else self.refine(elites, candidates, spread)
+				if elites is not None:
+					# Keep the elites so a round can never lose the best candidate
+					population = OrderedDict((name, np.concatenate([elites[name], population[name]])) for name in population)
+				metrics = self.evaluate(population, pool)
+
+				# Stable, so ties keep the earlier candidate - previous elites come first
+				order = np.argsort(metrics['cost'], kind='stable')[:eliteCount]
+				elites = OrderedDict((name, values[order]) for name, values in population.items())
+				best = OrderedDict((name, float(values[0])) for name, values in elites.items())
+				bestMetrics = {key: values[order[0]].item() for key, values in metrics.items()}
+				spread /= 2.0
+
+				self.logger.info("Round {}/{}: {} candidates in {:.1f}s, best cost {:.2f} - {}".format(
+					roundIndex + 1, rounds, len(population['kP']), time.perf_counter() - start, bestMetrics['cost'],
+					", ".join("{}={:.5g}".format(name, value) for name, value in best.items())
+				))
+		finally:
+			if pool:
+				pool.close()
+				pool.join()
+
+		pidConfig = OrderedDict(self.pidConfig)
+		pidConfig.update(best)
+		return pidConfig, bestMetrics
+
+	# endregion Evaluation
+
+
+def LoadRunLogs(csvPaths, units='celsius'):
+	"""
+	Read logged runs, converting to celsius for the oven model
+	@param csvPaths: data CSV paths
+	@type csvPaths: list[str]
+	@param units: temperature units the runs were logged in
+	@type units: str
+	@rtype: list[RunLog]
+	"""
+	runLogs = [RunLog.FromCsv(csvPath) for csvPath in csvPaths]
+	if units == 'fahrenheit':
+		for runLog in runLogs:
+			runLog.temperatures = (runLog.temperatures - 32.0) * 5.0 / 9.0
+	return runLogs
+
+
+def WriteOvenModel(config, model):
+	"""
+	Store a fitted oven model in the model-based blocks of a config - mpc & feedForward - keeping their other settings
+	@param config: config to update
+	@type config: ToasterConfig
+	@param model: fitted oven model
+	@type model: OvenModel
+	"""
+	modelConfig = model.getConfig()
+	config.mpc = dict(config.mpc, **modelConfig)
+	config.feedForward = dict(config.feedForward, **{key: modelConfig[key] for key in ['gain', 'timeConstant', 'ambient']})
+
+
+def parseArgs(argv=None):
+	parser = argparse.ArgumentParser(description="Optimize PID gains offline against an oven model fitted from logged runs")
+	parser.add_argument(
+		"config",
+		nargs="?",
+		default=GetBaseConfigurationFilePath(),
+		help="config JSON with the reflow profile to tune for. Default: base config"
+	)
+	parser.add_argument(
+		"--log",
+		metavar="CSV",
+		action="append",
+		default=[],
+		help="data CSV of a logged run to fit the oven model to. May be given several times"
+	)
+	parser.add_argument("--output", metavar="PATH", help="config JSON to write the best gains to. Default: the input config")
+	parser.add_argument("--candidates", type=int, default=4096, help="candidates per round. Default: %(default)s")
+	parser.add_argument("--rounds", type=int, default=4, help="search rounds. Default: %(default)s")
+	parser.add_argument("--processes", type=int, default=None, help="worker processes. Default: one per core")
+	parser.add_argument("--liquidus", type=float, default=217.0, help="solder liquidus temperature in celsius. Default: %(default)s")
+	parser.add_argument("--seed", type=int, default=None, help="random seed")
+	parser.add_argument(
+		"--model-only",
+		action="store_true",
+		help="only fit the oven model to the logs and write it to the mpc & feedForward blocks - no gain search"
+	)
+	parser.add_argument("--dry-run", action="store_true", help="report the best gains without writing them")
+	return parser.parse_args(argv)
+
+
+def main(argv=None):
+	args = parseArgs(argv)
+
+	config = ToasterConfig(args.config)
+
+	liquidus = args.liquidus
+	if config.units == 'fahrenheit':
+		liquidus = Thermocouple.ConvertCelsiusToFahrenheit(liquidus)
+
+	optimizer = GainOptimizer(
+		config.states,
+		pidConfig=config.pids.getConfig(),
+		timerPeriod=config.clockPeriod,
+		units=config.units,
+		liquidus=liquidus,
+		processes=args.processes,
+		seed=args.seed
+	)
+	logger = optimizer.logger
+
+	if args.log:
+		optimizer.model, rmsError = FitOvenModel(LoadRunLogs(args.log, config.units))
+		logger.info("Fitted oven model to {} run(s), RMS error {:.2f}C: {}".format(
+			len(args.log), rmsError, ", ".join("{}={:.4g}".format(key, value) for key, value in optimizer.model.getConfig().items())
+		))
+	else:
+		logger.warning("No run logs given - tuning against the default oven model")
+
+	outputPath = args.output or args.config
+	if args.model_only:
+		if not args.log:
+			logger.error("--model-only needs at least one --log to fit")
+			return 1
+		if not args.dry_run:
+			WriteOvenModel(config, optimizer.model)
+			config.dumpConfig(outputPath)
+			logger.info("Oven model written to {}".format(outputPath))
+		return 0
+
+	pidConfig, metrics = optimizer.optimize(candidates=args.candidates, rounds=args.rounds)
+
+	logger.info("Best gains: {}".format(", ".join("{}={}".format(key, value) for key, value in pidConfig.items())))
+	logger.info("Simulated: {}".format(", ".join("{}={:.4g}".format(key, float(metrics[key])) for key in METRICS)))
+	if not metrics['completed']:
+		logger.error("No candidate completed the profile - gains not written")
+		return 1
+
+	if not args.dry_run:
+		config.pids = pidConfig
+		if args.log:
+			WriteOvenModel(config, optimizer.model)
+		config.dumpConfig(outputPath)
+		logger.info("Gains written to {}".format(outputPath))
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
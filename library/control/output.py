@@ -0,0 +1,206 @@
+import time
+import logging
+from collections import OrderedDict
+from threading import Thread, Event, Lock
+
+from library.other.setupLogging import getLogger
+
+
+class TimeProportionalOutput(Thread):
+	"""
+	Time-proportioning relay driver
+	Each window of `window` seconds the relay is on for duty * window and off for the rest, so an on/off relay delivers
+	fractional heater power. Switching runs on its own thread against monotonic deadlines, so the pulse widths don't
+	depend on when the GUI timer happens to fire. The relay is only written when the scheduled state changes,
+	leaving it alone while the duty is 0 so other code (relay test, auto-tune) can drive it directly.
+	"""
+	MODES = ['relay', 'timeProportional']
+
+	BASE_CONFIG = OrderedDict([
+		# 'relay' = bang-bang on PID output sign, 'timeProportional' = duty cycle within a window
+		("mode", "relay"),
+		("window", 2.0),
+		# Pulses shorter than this are dropped, and gaps shorter than this are filled - spares the relay
+		("minimumPulse", 0.1),
+		# PID outputs mapped to 0% and 100% duty
+		("outputMin", 0.0),
+		("outputMax", 10.0),
+	])
+
+	def __init__(self, relay, window=2.0, minimumPulse=0.1, outputMin=0.0, outputMax=10.0, clock=time.monotonic, debugLevel=logging.INFO):
+		"""
+		Constructor
+		@param relay: relay to drive
+		@type relay: library.sensors.sensor_relay.Relay
+		@param window: time-proportioning window (s)
+		@type window: float
+		@param minimumPulse: shortest on or off pulse (s)
+		@type minimumPulse: float
+		@param outputMin: PID output mapped to 0% duty
+		@type outputMin: float
+		@param outputMax: PID output mapped to 100% duty
+		@type outputMax: float
+		@param clock: monotonic clock returning seconds
+		@type clock: func
+		@param debugLevel: logging level
+		@type debugLevel: int
+		"""
+		super(TimeProportionalOutput, self).__init__(name='TimeProportionalOutput')
+		self.daemon = True
+
+		self.logger = getLogger('TimeProportionalOutput', debugLevel)
+
+		self.relay = relay
+		self.window = float(window)
+		self.minimumPulse = float(minimumPulse)
+		self.outputMin = float(outputMin)
+		self.outputMax = float(outputMax)
+		self.clock = clock
+		assert self.window > 0, "Time-proportioning window must be > 0"
+		assert 0 <= self.minimumPulse < self.window / 2.0, "Minimum pulse must be >= 0 and under half the window"
+		assert self.outputMin < self.outputMax, "Output min must be lower than output max"
+
+		self._duty = 0.0
+		self._windowStart = None
+		self._relayState = False
+		self._lock = Lock()
+		self._wakeEvent = Event()
+		self._stopEvent = Event()
+
+	@classmethod
+	def FromConfig(cls, relay, configDict, clock=time.monotonic, debugLevel=logging.INFO):
+		"""
+		Create a time-proportioning output from an output config dict
+		@param relay: relay to drive
+		@type relay: library.sensors.sensor_relay.Relay
+		@param configDict: dict with any of BASE_CONFIG's keys
+		@type configDict: dict
+		@param clock: monotonic clock returning seconds
+		@type clock: func
+		@param debugLevel: logging level
+		@type debugLevel: int
+		@rtype: TimeProportionalOutput
+		"""
+		config = OrderedDict(cls.BASE_CONFIG)
+		config.update(configDict or {})
+		return cls(
+			relay,
+			window=config['window'],
+			minimumPulse=config['minimumPulse'],
+			outputMin=config['outputMin'],
+			outputMax=config['outputMax'],
+			clock=clock,
+			debugLevel=debugLevel
+		)
+
+	# region Duty
+
+	@property
+	def duty(self):
+		"""
+		Fraction of each window the relay is on
+		@rtype: float
+		"""
+		return self._duty
+
+	@duty.setter
+	def duty(self, duty):
+		"""
+		Set a new duty cycle. Takes effect immediately - an on pulse already longer than the new duty ends now
+		@param duty: 0.0 - 1.0, clipped
+		@type duty: float
+		"""
+		with self._lock:
+			self._duty = min(1.0, max(0.0, float(duty)))
+		self._wakeEvent.set()
+
+	def setOutput(self, output):
+		"""
+		Set the duty cycle from a PID output
+		@param output: PID output, mapped linearly from outputMin/outputMax to 0%/100%
+		@type output: float
+		"""
+		self.duty = (output - self.outputMin) / (self.outputMax - self.outputMin)
+
+	def onTime(self, duty=None):
+		"""
+		Relay on time per window, after applying the minimum pulse
+		@param duty: (Optional) duty cycle. Default: current duty
+		@type duty: float
+		@rtype: float
+		"""
+		onTime = (self._duty if duty is None else duty) * self.window
+		if onTime < self.minimumPulse:
+			return 0.0
+		if onTime > self.window - self.minimumPulse:
+			return self.window
+		return onTime
+
+	# endregion Duty
+	# region Scheduling
+
+	def step(self, now=None):
+		"""
+		Switch the relay to its scheduled state for the given time
+		@param now: (Optional) current time. Default: read the clock
+		@type now: float
+		@return: time of the next scheduled switch
+		@rtype: float
+		"""
+		if now is None:
+			now = self.clock()
+
+		with self._lock:
+			if self._windowStart is None or now < self._windowStart:
+				# First step, or a different clock - start the windows from now
+				self._windowStart = now
+			elif now >= self._windowStart + self.window:
+				# Start a new window - skip whole windows if we were held up
+				self._windowStart += self.window * int((now - self._windowStart) // self.window)
+			onTime = self.onTime()
+			offTime = self._windowStart + onTime
+			state = now < offTime
+
+			# Switched under the lock so off() can't be undone by a stale decision
+			if state != self._relayState:
+				self._relayState = state
+				if state:
+					self.relay.enable()
+				else:
+					self.relay.disable()
+
+			return offTime if state else self._windowStart + self.window
+
+	def run(self):
+		"""
+		Switch the relay at each scheduled time until stopped
+		"""
+		while not self._stopEvent.is_set():
+			# Clear before stepping so a duty change made during the step still wakes the next wait
+			self._wakeEvent.clear()
+			nextSwitch = self.step()
+			self._wakeEvent.wait(max(0.0, nextSwitch - self.clock()))
+
+	def stop(self, timeout=1.0):
+		"""
+		Stop the scheduler thread and turn the relay off
+		@param timeout: max seconds to wait for the thread
+		@type timeout: float
+		"""
+		self._stopEvent.set()
+		self._wakeEvent.set()
+		if self.is_alive():
+			self.join(timeout)
+		self.off()
+
+	def off(self):
+		"""
+		Zero the duty cycle and turn the relay off now
+		"""
+		with self._lock:
+			self._duty = 0.0
+			self._relayState = False
+			self.relay.disable()
+		self._wakeEvent.set()
+
+	# endregion Scheduling
@@ -1,4 +1,5 @@
 from collections import OrderedDict
+from threading import Lock
 
 
 class PID(object):
@@ -35,6 +36,10 @@ class PID(object):
 		# Time
 		self._lastTime = 0.0
 
+		# Gains waiting to take over at the next compute - see updateGains
+		self._pendingGains = None
+		self._pendingLock = Lock()
+
 		# Load the config
 		if configDict:
 			self.setConfig(configDict)
@@ -193,7 +198,7 @@ class PID(object):
 		@param windupGuard: new windup guard
 		@type windupGuard: str or int or float
 		"""
-		if windupGuard is not None:
+		if windupGuard not in ['', None]:
 			try:
 				self._windupGuard = abs(float(windupGuard))
 			except ValueError:
@@ -283,6 +288,8 @@ class PID(object):
 		self.max = configDict.get('max', self.max)
 		self.windupGuard = configDict.get('windupGuard', self.windupGuard)
 		self.zeroierror()
+		with self._pendingLock:
+			self._pendingGains = None
 
 	def getConfig(self):
 		"""
@@ -297,10 +304,113 @@ class PID(object):
 		config['windupGuard'] = "" if self.windupGuard is None else self.windupGuard
 		return config
 
+	@property
+	def gains(self):
+		"""
+		Gains & limits as a tuple, for swapping in with applyGains
+		@return: tuple of kP, kI, kD, min, max, windup guard
+		@rtype: tuple
+		"""
+		return self._kP, self._kI, self._kD, self._min, self._max, self._windupGuard
+
+	def applyGains(self, gains):
+		"""
+		Swap in gains & limits from gains/CompileGains - no parsing or validation. The integrated error is kept,
+		clamped to the new windup guard
+		@param gains: tuple of kP, kI, kD, min, max, windup guard
+		@type gains: tuple
+		"""
+		self._kP, self._kI, self._kD, self._min, self._max, self._windupGuard = gains
+		self.applyWindup()
+
+	@staticmethod
+	def GetGainsConfig(gains):
+		"""
+		Convert a gains tuple back to a config dict, as returned by getConfig
+		@param gains: tuple of kP, kI, kD, min, max, windup guard
+		@type gains: tuple
+		@rtype: OrderedDict
+		"""
+		kP, kI, kD, minLimit, maxLimit, windupGuard = gains
+		config = OrderedDict()
+		config['kP'] = kP
+		config['kI'] = kI
+		config['kD'] = kD
+		config['min'] = "" if minLimit is None else minLimit
+		config['max'] = "" if maxLimit is None else maxLimit
+		config['windupGuard'] = "" if windupGuard is None else windupGuard
+		return config
+
+	@classmethod
+	def CompileGains(cls, configDict, baseConfig=None):
+		"""
+		Parse & validate a PID config into a gains tuple for applyGains
+		@param configDict: dict of PID parameters
+		@type configDict: dict
+		@param baseConfig: (Optional) dict of PID parameters to take missing keys from
+		@type baseConfig: dict
+		@return: tuple of kP, kI, kD, min, max, windup guard
+		@rtype: tuple
+		"""
+		config = dict(baseConfig or {})
+		config.update(configDict)
+		return cls(config).gains
+
+	def updateGains(self, configDict):
+		"""
+		Change gains & limits on a running controller. They're validated now and take over at the start of the next
+		compute, with the integrated error rescaled so the output doesn't jump - see transferGains.
+		Safe to call from any thread
+		@param configDict: dict of PID parameters to change. Missing keys keep their current (or pending) values
+		@type configDict: dict
+		@return: config that will be in effect from the next compute
+		@rtype: OrderedDict
+		"""
+		with self._pendingLock:
+			current = self._pendingGains if self._pendingGains is not None else self.gains
+			self._pendingGains = self.CompileGains(configDict, self.GetGainsConfig(current))
+			return self.GetGainsConfig(self._pendingGains)
+
+	@property
+	def pendingGains(self):
+		"""
+		Gains queued by updateGains, None if there are none
+		@rtype: tuple or None
+		"""
+		return self._pendingGains
+
+	def transferGains(self, gains):
+		"""
+		Swap in new gains bumplessly - the integrated error is rescaled so the last errors give the same output under the
+		new gains as they did under the old, as far as the windup guard allows. With no integral gain there is nothing
+		to rescale
+		@param gains: tuple of kP, kI, kD, min, max, windup guard
+		@type gains: tuple
+		"""
+		output = self.kP * self.error + self.kI * self.ierror + self.kD * self.derror
+		self._kP, self._kI, self._kD, self._min, self._max, self._windupGuard = gains
+		if self.kI:
+			self._iError = (output - self.kP * self.error - self.kD * self.derror) / self.kI
+		self.applyWindup()
+
+	def applyPendingGains(self):
+		"""
+		Transfer to the gains queued by updateGains, if any
+		@return: whether there were gains to apply
+		@rtype: bool
+		"""
+		with self._pendingLock:
+			gains = self._pendingGains
+			self._pendingGains = None
+		if gains is None:
+			return False
+		self.transferGains(gains)
+		return True
+
 	# endregion Config
 	# region Execution
 
-	def compute(self, currenttime, currentstate=None, newState=False):
+	def compute(self, currenttime, currentstate=None, newState=False, slope=None, targetSlope=0.0):
 		"""
 		Compute the output of the PID controller based on the elapsed time and the current target
 		@param currenttime: the time at which the latest input was sampled
@@ -309,12 +419,21 @@ class PID(object):
 		@type currentstate: float
 		@param newState: flag to indicate we're moving to a new state (resets derivative error)
 		@type newState: bool
+		@param slope: (Optional) measured rate of change of the state, e.g. from an estimator.
+			If given, the derivative term uses it instead of a finite difference of the error
+		@type slope: float
+		@param targetSlope: rate of change of the target, e.g. along a setpoint trajectory - used with slope
+		@type targetSlope: float
 		@return: output of PID computation
 		@rtype: float
 		"""
 		if not self.target:
 			raise Exception("No target state set, cannot compute PID output")
 
+		# Live gain changes take over between steps
+		if self._pendingGains is not None:
+			self.applyPendingGains()
+
 		# update state if available
 		if currentstate is not None:
 			self._currentState = currentstate
@@ -328,7 +447,10 @@ class PID(object):
 		self.ierror += self.error * deltaTime
 
 		# derivative of error from target
-		if newState or deltaTime == 0:
+		if slope is not None:
+			# d(error)/dt = d(target)/dt - d(state)/dt
+			self._dError = targetSlope - slope
+		elif newState or deltaTime == 0:
 			# force derivative to 0 if we just changed states
 			self._dError = 0.0
 		else:
@@ -0,0 +1,257 @@
+import itertools
+from collections import OrderedDict
+
+import numpy as np
+
+from library.control.pid import PID
+
+
+class BatchPID(object):
+	"""
+	K independent PID controllers evaluated in lockstep with numpy arrays
+	Each candidate has its own gains, windup guard & output limits. compute() follows PID.compute
+	operation for operation, so candidate i gives bit-for-bit the same results as a PID with the same config.
+	Unset windup guards are stored as 0.0 and unset limits as -inf/+inf - both are no-ops, exactly like None in PID
+	"""
+	def __init__(self, kP, kI, kD, windupGuard=None, min=None, max=None):
+		"""
+		Constructor. Every argument is a scalar (shared by all candidates) or a sequence of K values
+		@param kP: proportional gain(s)
+		@type kP: float or list[float] or numpy.ndarray
+		@param kI: integral gain(s)
+		@type kI: float or list[float] or numpy.ndarray
+		@param kD: derivative gain(s)
+		@type kD: float or list[float] or numpy.ndarray
+		@param windupGuard: (Optional) integral windup guard(s). None/0 = no guard
+		@type windupGuard: float or list[float] or numpy.ndarray
+		@param min: (Optional) minimum output(s). None = no limit
+		@type min: float or list[float] or numpy.ndarray
+		@param max: (Optional) maximum output(s). None = no limit
+		@type max: float or list[float] or numpy.ndarray
+		"""
+		super(BatchPID, self).__init__()
+
+		kP, kI, kD, windupGuard, minLimit, maxLimit = np.broadcast_arrays(
+			self._ToArray(kP, 0.0),
+			self._ToArray(kI, 0.0),
+			self._ToArray(kD, 0.0),
+			np.abs(self._ToArray(windupGuard, 0.0)),
+			self._ToArray(min, -np.inf),
+			self._ToArray(max, np.inf),
+		)
+		assert kP.ndim == 1, "Batch PID parameters must be scalars or 1D sequences"
+		assert np.all(minLimit < maxLimit), "Min limits must be lower than max limits"
+
+		# Gains & limits - copied so candidates don't share memory with the inputs or each other
+		self.kP = kP.copy()
+		self.kI = kI.copy()
+		self.kD = kD.copy()
+		self.windupGuard = windupGuard.copy()
+		self.min = minLimit.copy()
+		self.max = maxLimit.copy()
+
+		size = len(self.kP)
+
+		# State
+		self.state = np.zeros(size)
+		self.target = np.zeros(size)
+		self.output = np.zeros(size)
+
+		# Error variables
+		self.error = np.zeros(size)
+		self.lastError = np.zeros(size)
+		self.ierror = np.zeros(size)
+		self.derror = np.zeros(size)
+
+		# Time
+		self.lastTime = np.zeros(size)
+
+	def __len__(self):
+		return len(self.kP)
+
+	@staticmethod
+	def _ToArray(values, default):
+		"""
+		Convert PID config values to a float array, replacing None/'' with a default
+		"""
+		if values is None or (isinstance(values, str) and values == ''):
+			return np.array(default, dtype=float)
+		if np.ndim(values) == 0:
+			return np.array(float(values))
+		return np.array([default if value is None or value == '' else float(value) for value in values], dtype=float)
+
+	# region Construction
+
+	@classmethod
+	def FromConfigs(cls, configDicts):
+		"""
+		Create a batch from PID config dicts (as used by PID.setConfig / the 'pid' tuning block)
+		@param configDicts: one config dict per candidate
+		@type configDicts: list[dict]
+		@rtype: BatchPID
+		"""
+		configDicts = list(configDicts)
+		assert configDicts, "At least one PID config is required"
+		return cls(**{
+			key: [configDict.get(key) for configDict in configDicts]
+			for key in ['kP', 'kI', 'kD', 'windupGuard', 'min', 'max']
+		})
+
+	@classmethod
+	def FromPIDs(cls, pids):
+		"""
+		Create a batch from PID objects. Only the configs are copied, not the controller states
+		@param pids: PID controllers
+		@type pids: list[PID]
+		@rtype: BatchPID
+		"""
+		return cls.FromConfigs([pid.getConfig() for pid in pids])
+
+	@classmethod
+	def Grid(cls, kP, kI, kD, windupGuard=None, min=None, max=None):
+		"""
+		Create a batch with every combination of the given gains - candidate order is kP-major
+		@param kP: proportional gains to try
+		@type kP: list[float]
+		@param kI: integral gains to try
+		@type kI: list[float]
+		@param kD: derivative gains to try
+		@type kD: list[float]
+		@param windupGuard: (Optional) windup guard shared by every candidate
+		@type windupGuard: float
+		@param min: (Optional) min output shared by every candidate
+		@type min: float
+		@param max: (Optional) max output shared by every candidate
+		@type max: float
+		@rtype: BatchPID
+		"""
+		gains = list(itertools.product(np.atleast_1d(kP), np.atleast_1d(kI), np.atleast_1d(kD)))
+		kPs, kIs, kDs = zip(*gains)
+		return cls(kPs, kIs, kDs, windupGuard=windupGuard, min=min, max=max)
+
+	def getConfig(self, index):
+		"""
+		Get one candidate's settings as a PID config dict
+		@param index: candidate index
+		@type index: int
+		@rtype: OrderedDict
+		"""
+		config = OrderedDict()
+		config['kP'] = float(self.kP[index])
+		config['kI'] = float(self.kI[index])
+		config['kD'] = float(self.kD[index])
+		config['min'] = "" if np.isneginf(self.min[index]) else float(self.min[index])
+		config['max'] = "" if np.isposinf(self.max[index]) else float(self.max[index])
+		config['windupGuard'] = float(self.windupGuard[index])
+		return config
+
+	def getPID(self, index):
+		"""
+		Get one candidate as a stand-alone PID
+		@param index: candidate index
+		@type index: int
+		@rtype: PID
+		"""
+		return PID(self.getConfig(index))
+
+	# endregion Construction
+	# region Execution
+
+	def compute(self, currenttime, currentstate=None, newState=False, slope=None, targetSlope=0.0):
+		"""
+		Compute every candidate's output. Mirrors PID.compute - every argument may be a scalar or a K array
+		@param currenttime: the time at which the latest input was sampled
+		@type currenttime: float or numpy.ndarray
+		@param currentstate: (Optional) current state(s) of the device. otherwise uses the stored states
+		@type currentstate: float or numpy.ndarray
+		@param newState: flag(s) to indicate we're moving to a new state (resets derivative error)
+		@type newState: bool or numpy.ndarray
+		@param slope: (Optional) measured rate(s) of change of the state, used instead of a finite difference
+		@type slope: float or numpy.ndarray
+		@param targetSlope: rate(s) of change of the target - used with slope
+		@type targetSlope: float or numpy.ndarray
+		@return: output of every candidate
+		@rtype: numpy.ndarray
+		"""
+		if not np.all(self.target):
+			raise Exception("No target state set, cannot compute PID output")
+
+		# update state if available
+		if currentstate is not None:
+			self.state[:] = currentstate
+
+		# calculate change in time
+		deltaTime = currenttime - self.lastTime
+
+		# proportional error from target
+		self.error = self.target - self.state
+		# integral of error from target, with the windup guard wherever one is set
+		ierror = self.ierror + self.error * deltaTime
+		guarded = self.windupGuard != 0.0
+		self.ierror = np.where(guarded, np.clip(ierror, -self.windupGuard, self.windupGuard), ierror)
+
+		# derivative of error from target
+		if slope is not None:
+			self.derror = np.broadcast_to(np.asarray(targetSlope, dtype=float) - np.asarray(slope, dtype=float), self.error.shape).copy()
+		else:
+			with np.errstate(divide='ignore', invalid='ignore'):
+				derivative = (self.error - self.lastError) / deltaTime
+			self.derror = np.where(np.logical_or(newState, deltaTime == 0), 0.0, derivative)
+
+		# apply gains to error values, then limits - max is checked first, like PID.output
+		output = self.kP * self.error + self.kI * self.ierror + self.kD * self.derror
+		self.output = np.where(output > self.max, self.max, np.where(output < self.min, self.min, output))
+
+		self.lastTime = np.broadcast_to(np.asarray(currenttime, dtype=float), self.error.shape).copy()
+		self.lastError = self.error
+
+		return self.output
+
+	def run(self, times, states, targets, newStates=None, slopes=None):
+		"""
+		Run every candidate over the same recorded trace
+		@param times: sample times, length N
+		@type times: list[float] or numpy.ndarray
+		@param states: measured states, length N
+		@type states: list[float] or numpy.ndarray
+		@param targets: target state at each sample, length N
+		@type targets: list[float] or numpy.ndarray
+		@param newStates: (Optional) new state flags at each sample, length N
+		@type newStates: list[bool] or numpy.ndarray
+		@param slopes: (Optional) measured slopes at each sample, length N
+		@type slopes: list[float] or numpy.ndarray
+		@return: outputs, shape (N, K)
+		@rtype: numpy.ndarray
+		"""
+		count = len(times)
+		outputs = np.empty((count, len(self)))
+		for i in range(count):
+			self.target[:] = targets[i]
+			outputs[i] = self.compute(
+				times[i],
+				states[i],
+				bool(newStates[i]) if newStates is not None else False,
+				None if slopes is None else slopes[i]
+			)
+		return outputs
+
+	def resetClock(self, targetTime=0.0):
+		"""
+		Reset the time of every candidate
+		@param targetTime: new time to set (default 0.0)
+		@type targetTime: float
+		"""
+		self.lastTime[:] = float(targetTime)
+
+	def zeroierror(self, mask=None):
+		"""
+		Zero out the integrated error
+		@param mask: (Optional) boolean array of candidates to zero. Default: all
+		@type mask: numpy.ndarray
+		"""
+		if mask is None:
+			self.ierror[:] = 0.0
+		else:
+			self.ierror[mask] = 0.0
+
+	# endregion Execution
@@ -0,0 +1,67 @@
+"""
+Reflow profile compiled once, when the states are loaded or set, so the control loop only indexes tuples
+"""
+from collections import namedtuple
+
+from definitions import CONFIG_KEY_TARGET, CONFIG_KEY_DURATION
+
+_ProfilePlan = namedtuple('ProfilePlan', [
+	'names',
+	'targets',
+	'durations',
+	'soaks',
+	'ramps',
+	'cools',
+	'starts',
+	'lastIndex',
+])
+
+
+class ProfilePlan(_ProfilePlan):
+	"""
+	Immutable, compiled reflow profile. All per-state fields are tuples in state order:
+		names - state names
+		targets - target temperatures
+		durations - state durations (s) - how long soaks hold, the nominal time ramps take
+		soaks/ramps/cools - whether a state holds, raises or lowers the previous state's target. The first state is a
+			ramp from ambient
+		starts - nominal start time of each state (s), i.e. the sum of the durations before it
+		lastIndex - index of the last (cooling) state, -1 for an empty profile
+	"""
+	__slots__ = ()
+
+	@classmethod
+	def Compile(cls, states):
+		"""
+		Compile a state configuration
+		@param states: ordered state name to {'target', 'duration'}
+		@type states: OrderedDict
+		@rtype: ProfilePlan
+		"""
+		names = tuple(states.keys())
+		targets = tuple(float(states[name][CONFIG_KEY_TARGET]) for name in names)
+		durations = tuple(float(states[name][CONFIG_KEY_DURATION]) for name in names)
+		previousTargets = (None,) + targets[:-1]
+		starts = []
+		start = 0.0
+		for duration in durations:
+			starts.append(start)
+			start += duration
+		return cls(
+			names=names,
+			targets=targets,
+			durations=durations,
+			soaks=tuple(target == previous for target, previous in zip(targets, previousTargets)),
+			ramps=tuple(previous is None or target > previous for target, previous in zip(targets, previousTargets)),
+			cools=tuple(previous is not None and target < previous for target, previous in zip(targets, previousTargets)),
+			starts=tuple(starts),
+			lastIndex=len(names) - 1,
+		)
+
+	@property
+	def totalDuration(self):
+		"""
+		Nominal duration of the whole profile (s)
+		@rtype: float
+		"""
+		return self.starts[-1] + self.durations[-1] if self.names else 0.0
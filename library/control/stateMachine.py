@@ -1,13 +1,27 @@
 import csv
+import time
 import logging
 from collections import OrderedDict
+from threading import RLock
 
 from library.other.setupLogging import getLogger
 from library.other.config import ToasterConfig
 from library.sensors.sensor_relay import Relay
 from library.sensors.sensor_thermocouple import Thermocouple
+from library.sensors.sensor_thermocouple_array import ThermocoupleArray
+from library.sensors.thermocouple_sampler import ThermocoupleSampler
 from library.control.pid import PID
-from library.ui.visualizer_configuration import CONFIG_KEY_TARGET, CONFIG_KEY_DURATION
+from library.control.estimator import KalmanEstimator
+from library.control.autotune import RelayAutoTuner
+from library.control.output import TimeProportionalOutput
+from library.control.feedforward import FeedForward
+from library.control.mpc import ModelPredictiveController
+from library.control.trajectory import SetpointTrajectory
+from library.control.events import EventBus, EVENTS
+from library.control.health import SensorHealthMonitor
+from library.other.run_store import RunStore
+from library.other.run_logger import RunLogWriter
+from library.other.run_archive import WriteRunArchive
 from definitions import GetBaseConfigurationFilePath
 
 
@@ -16,6 +30,7 @@ class STATES:
 	STOPPED = 'Stopped'
 	PAUSED = 'Paused'
 	TESTING = 'Testing'
+	TUNING = 'Tuning'
 	COMPLETE = 'Complete'
 
 
@@ -27,49 +42,88 @@ class ToastStateMachine(object):
 	2. Soaking - state is complete when duration expires, regardless of target temperature
 		Soaking states hold the same temperature reached at the end of the previous state
 	"""
-	def __init__(self, jsonConfigPath=GetBaseConfigurationFilePath(), stateMachineCompleteCallback=None, debugLevel=logging.INFO):
+	# currentState while a relay auto-tune experiment runs
+	AUTOTUNE_STATE = 'autotune'
+	# States the heater may be driven in - an unhealthy sensor stops these
+	ACTIVE_STATES = [STATES.RUNNING, STATES.PAUSED, STATES.TUNING]
+
+	def __init__(self, jsonConfigPath=GetBaseConfigurationFilePath(), stateMachineCompleteCallback=None, spiFactory=None, relay=None, clock=None, debugLevel=logging.INFO):
 		"""
 		ToastStateMachine Constructor
 		@param jsonConfigPath: path to JSON configuration file
 		@type jsonConfigPath: str
 		@param stateMachineCompleteCallback: callback to use for UI update on reflow completion
 		@type stateMachineCompleteCallback: func
+		@param spiFactory: (Optional) thermocouple SPI device factory - the temperature source, e.g. for capturing or
+			replaying frames or reading a simulated oven
+		@type spiFactory: func
+		@param relay: (Optional) heater relay to drive instead of one on the configured pin, e.g. a simulated oven's
+		@type relay: Relay
+		@param clock: (Optional) monotonic clock for the output scheduler. A virtual clock (with advance()) runs
+			nothing on threads, for simulate(). Default: time.monotonic
+		@type clock: func
 		@param debugLevel: logging level
 		@type debugLevel: int
 		"""
 		super(ToastStateMachine, self).__init__()
 
 		self.debugLevel = debugLevel
+		self.spiFactory = spiFactory
+		self.clock = clock or time.monotonic
 		self.logger = getLogger('ToastStateMachine', self.debugLevel)
 
 		# Config
 		self._config = None
 		self.pins = None
-		self.relay = None
+		self.relay = relay
 		""" @type: Relay """
 		self.thermocouple = None
-		""" @type: Thermocouple """
+		""" @type: Thermocouple or ThermocoupleArray """
+		self.sampler = None
+		""" @type: ThermocoupleSampler """
+		self.estimator = None
+		""" @type: KalmanEstimator """
+		self.autoTuner = None
+		""" @type: RelayAutoTuner """
+		self.output = None
+		""" @type: TimeProportionalOutput """
+		self.feedForward = None
+		""" @type: FeedForward """
+		self.mpc = None
+		""" @type: ModelPredictiveController """
+		self.health = None
+		""" @type: SensorHealthMonitor """
+
+		# Global PID gains, saved while a state runs its own
+		self._baseGains = None
 
 		# Basics of state machine
 		self.stateIndex = 0
 		self.currentState = None
 		self.lastTarget = 0.0
 		self.currentStateDuration = 0.0
+		self.currentStateStart = 0.0
 		self.currentStateEnd = 0.0
+		# Target of the current state - the PID follows the trajectory's setpoint instead, if enabled
+		self._targetState = 0.0
+		# How close a ramp or cool has to get to its target to be done, in the current units - see updateTargetBuffer
+		self.targetBuffer = 3.0
+		self.trajectory = None
+		""" @type: SetpointTrajectory """
 		self.stateChanged = False
 		self.soaking = False
 		self.running = STATES.STOPPED
 
 		# Callback
 		self.stateMachineCompleteCallback = stateMachineCompleteCallback
+		# Lifecycle hooks - subscribers run on their own threads, see EVENTS
+		self.events = EventBus(debugLevel=self.debugLevel)
 
 		# Control loop
 		self.timestamp = 0.0
 		self.lastControlLoopTimestamp = 0.0
-
-		# Sensors
-		self.maxTCErrorHistory = 10
-		self.recentTCErrors = [None] * self.maxTCErrorHistory
+		# Held while ticking - lets start/stop/pause come from another thread than the one ticking
+		self.lock = RLock()
 
 		# PID Controller
 		# self.pid = PID(configDict=self.config['tuning']['pid'])
@@ -77,7 +131,9 @@ class ToastStateMachine(object):
 		self.config = jsonConfigPath
 
 		# Data tracking
-		self.data = []
+		self.data = self.createDataStore()
+		# Streams the data records to disk during a run - see start
+		self.runLog = None
 
 	def __repr__(self):
 		return "{}:{}".format(self.running, self.currentState)
@@ -100,7 +156,8 @@ class ToastStateMachine(object):
 		@param configDict: new state configuration
 		@type configDict: OrderedDict
 		"""
-		self.config.states = configDict
+		with self.lock:
+			self.config.states = configDict
 
 	@property
 	def states(self):
@@ -109,10 +166,15 @@ class ToastStateMachine(object):
 		@return: List of state names
 		@rtype: list[str]
 		"""
-		if self.stateConfiguration:
-			return list(self.stateConfiguration.keys())
-		else:
-			return []
+		return list(self.config.plan.names)
+
+	@property
+	def plan(self):
+		"""
+		Get the compiled reflow profile the control loop runs
+		@rtype: library.control.plan.ProfilePlan
+		"""
+		return self.config.plan
 
 	@property
 	def pid(self):
@@ -123,6 +185,31 @@ class ToastStateMachine(object):
 		"""
 		return self.config.pids
 
+	@property
+	def pidConfig(self):
+		"""
+		Get the global PID config, including gains waiting to take over at the next control step
+		@rtype: OrderedDict
+		"""
+		pidConfig = self.config.config.get('tuning', {}).get('pid')
+		return OrderedDict(pidConfig) if pidConfig else self.pid.getConfig()
+
+	@property
+	def controller(self):
+		"""
+		Get the controller the control loop runs - the MPC if enabled, otherwise the PID
+		@rtype: PID or ModelPredictiveController
+		"""
+		return self.mpc if self.mpc else self.pid
+
+	@property
+	def virtualClock(self):
+		"""
+		Whether the clock is advanced by hand - threads are then left stopped and simulate() steps everything
+		@rtype: bool
+		"""
+		return hasattr(self.clock, 'advance')
+
 	@property
 	def timerPeriod(self):
 		"""
@@ -139,7 +226,8 @@ class ToastStateMachine(object):
 		@param period: new timer clock period
 		@type period: str or int or float
 		"""
-		self.config.clockPeriod = float(period)
+		with self.lock:
+			self.config.clockPeriod = float(period)
 
 	@property
 	def targetState(self):
@@ -148,7 +236,7 @@ class ToastStateMachine(object):
 		@return: current target state
 		@rtype: float
 		"""
-		return self.config.pids.target
+		return self._targetState
 
 	@targetState.setter
 	def targetState(self, newTarget):
@@ -157,7 +245,38 @@ class ToastStateMachine(object):
 		@param newTarget: new target state
 		@type newTarget: str or int or float
 		"""
-		self.config.pids.target = newTarget
+		self._targetState = float(newTarget)
+		self.config.pids.target = self._targetState
+
+	@property
+	def setpoint(self):
+		"""
+		Get the temperature the control loop drives towards right now - the trajectory's setpoint if enabled, otherwise
+		the current state's target
+		@rtype: float
+		"""
+		if self.trajectory:
+			return self.trajectory.setpoint(self.stateIndex, self.timestamp - self.currentStateStart)
+		return self._targetState
+
+	@property
+	def setpointSlope(self):
+		"""
+		Get the rate the setpoint moves at right now - 0 unless following a trajectory
+		@rtype: float
+		"""
+		if self.trajectory:
+			return self.trajectory.slope(self.stateIndex, self.timestamp - self.currentStateStart)
+		return 0.0
+
+	@property
+	def sensor(self):
+		"""
+		Get the temperature source the control loop reads from - the background sampler if enabled,
+		otherwise the thermocouple itself
+		@rtype: Thermocouple or ThermocoupleSampler
+		"""
+		return self.sampler if self.sampler else self.thermocouple
 
 	@property
 	def temperature(self):
@@ -166,7 +285,7 @@ class ToastStateMachine(object):
 		@return: current thermocouple temperature
 		@rtype: float
 		"""
-		return self.thermocouple.temperature
+		return self.sensor.temperature
 
 	@property
 	def refTemperature(self):
@@ -175,7 +294,18 @@ class ToastStateMachine(object):
 		@return: current reference temperature
 		@rtype: float
 		"""
-		return self.thermocouple.refTemperature
+		return self.sensor.refTemperature
+
+	@property
+	def probeTemperatures(self):
+		"""
+		Get the latest per-probe temperatures when reading multiple thermocouples
+		@return: dict of data column name to temperature (None if the probe faulted). Empty for a single thermocouple
+		@rtype: dict[str, float]
+		"""
+		if isinstance(self.thermocouple, ThermocoupleArray):
+			return self.thermocouple.getProbeData()
+		return {}
 
 	@property
 	def relayState(self):
@@ -202,8 +332,14 @@ class ToastStateMachine(object):
 		@param units: new units
 		@type units: str
 		"""
-		self.thermocouple.units = units
-		self.config.units = units
+		with self.lock:
+			self.sensor.units = units
+			if self.estimator:
+				self.estimator.reset()
+			if self.mpc:
+				self.mpc.units = units
+			self.config.units = units
+			self.updateTargetBuffer()
 
 	# endregion Properties
 	# region Configuration
@@ -232,29 +368,144 @@ class ToastStateMachine(object):
 		@param configPath: path to new config file
 		@type configPath: str
 		"""
-		# First attempt to clean up
-		try:
-			self.cleanup()
-		except:
-			pass
+		# Hardware is torn down & rebuilt - keep ticks from another thread out until it's done
+		with self.lock:
+			# First attempt to clean up - event subscribers stay subscribed
+			try:
+				self.cleanupHardware()
+			except:
+				pass
 
-		# Load in the config file. Most stuff is accessed directly from the configuration
-		self._config = ToasterConfig(configPath)
+			# Load in the config file. Most stuff is accessed directly from the configuration
+			self._config = ToasterConfig(configPath)
+			self._baseGains = None
 
-		# Pins
-		self.pins = self.config.pins
+			# Pins
+			self.pins = self.config.pins
 
-		# Relay
-		if not self.relay:
-			self.relay = Relay(self.pins['relay'], debugLevel=self.debugLevel)
-		else:
-			self.relay.pin = self.config.relayPin
+			# Relay
+			if not self.relay:
+				self.relay = Relay(self.pins['relay'], debugLevel=self.debugLevel)
+			else:
+				self.relay.pin = self.config.relayPin
 
-		# Thermocouple
-		if not self.thermocouple:
-			self.thermocouple = Thermocouple(self.pins['SPI_CS'], debugLevel=self.debugLevel)
-		else:
-			self.thermocouple.csPin = self.config.spiCsPin
+			# Thermocouple(s) - more than one CS pin means an array of probes
+			csPins = self.config.spiCsPins
+			if len(csPins) > 1:
+				if isinstance(self.thermocouple, ThermocoupleArray):
+					self.thermocouple.csPins = csPins
+				else:
+					self.thermocouple = ThermocoupleArray(csPins, spiFactory=self.spiFactory, debugLevel=self.debugLevel)
+				self.thermocouple.fusion = self.config.fusion
+			else:
+				if not self.thermocouple or isinstance(self.thermocouple, ThermocoupleArray):
+					self.thermocouple = Thermocouple(csPins[0], spiFactory=self.spiFactory, debugLevel=self.debugLevel)
+				else:
+					self.thermocouple.csPin = csPins[0]
+
+			# Thermocouple health watchdog
+			self.setupHealth()
+
+			# Temperature/slope estimator & background sampler
+			self.setupEstimator()
+			self.setupFeedForward()
+			self.setupController()
+			self.setupSampler()
+
+			# Heater output
+			self.setupOutput()
+
+			self.updateTargetBuffer()
+
+	def setupHealth(self):
+		"""
+		Create the thermocouple health watchdog - always on, its limits come from the config
+		"""
+		self.health = SensorHealthMonitor.FromConfig(self.config.health)
+
+	def setupEstimator(self):
+		"""
+		Create the temperature/slope estimator if the config enables it
+		"""
+		estimatorConfig = self.config.estimator
+		self.estimator = KalmanEstimator.FromConfig(estimatorConfig) if estimatorConfig.get('enabled') else None
+
+	def setupFeedForward(self):
+		"""
+		Create the feed-forward stage if the config enables it. Its terms are planned when a run starts
+		"""
+		feedForwardConfig = self.config.feedForward
+		self.feedForward = FeedForward.FromConfig(feedForwardConfig) if feedForwardConfig.get('enabled') else None
+
+	def createTrajectory(self):
+		"""
+		Create the setpoint trajectory of the current states, shaped as configured - whether or not it's enabled, e.g.
+		for the profile graphs to draw
+		@rtype: SetpointTrajectory
+		"""
+		return SetpointTrajectory.FromConfig(self.config.trajectory, self.config.plan, self.units)
+
+	def setupController(self):
+		"""
+		Create the model-predictive controller if the config enables it. Otherwise the PID runs the control loop
+		"""
+		mpcConfig = self.config.mpc
+		self.mpc = ModelPredictiveController.FromConfig(mpcConfig, units=self.units) if mpcConfig.get('enabled') else None
+
+	def setupSampler(self):
+		"""
+		Start the background thermocouple sampler if the config enables it
+		"""
+		self.stopSampler()
+
+		samplerConfig = self.config.sampler
+		if not samplerConfig.get('enabled'):
+			return
+		if self.virtualClock:
+			# Samples on real time - read the thermocouple directly instead
+			self.logger.debug("Sampler disabled on a virtual clock")
+			return
+
+		self.sampler = ThermocoupleSampler(
+			self.thermocouple,
+			period=samplerConfig['period'],
+			historyLength=samplerConfig['historyLength'],
+			filterLength=samplerConfig['filterLength'],
+			filterMethod=samplerConfig['filterMethod'],
+			estimator=self.estimator,
+			debugLevel=self.debugLevel
+		)
+		self.sampler.start()
+
+	def stopSampler(self):
+		"""
+		Stop the background thermocouple sampler if it is running
+		"""
+		if self.sampler:
+			self.sampler.stop()
+			self.sampler = None
+
+	def setupOutput(self):
+		"""
+		Start the time-proportioning output thread if the config selects it. Otherwise the relay is switched bang-bang
+		"""
+		self.stopOutput()
+
+		outputConfig = self.config.output
+		if outputConfig.get('mode') != 'timeProportional':
+			return
+
+		self.output = TimeProportionalOutput.FromConfig(self.relay, outputConfig, clock=self.clock, debugLevel=self.debugLevel)
+		if not self.virtualClock:
+			self.output.start()
+
+	def stopOutput(self):
+		"""
+		Stop the time-proportioning output thread if it is running
+		"""
+		if self.output:
+			self.output.stop()
+			self.output = None
 
 	def dumpConfig(self, filePath):
 		"""
@@ -268,71 +519,140 @@ class ToastStateMachine(object):
 	# region StateMachine
 		# region Control
 
-	def start(self):
+	def start(self, runLogPath=None):
 		"""
 		Begin the state machine
+		@param runLogPath: (Optional) stream the data records of the run to this log as they happen, so a crash doesn't
+			lose them. See library.other.run_logger
+		@type runLogPath: str
 		"""
 		self.logger.debug("Beginning state machine")
-		self.running = STATES.RUNNING
-		# reset all the state variables
-		self.pid.zeroierror()
-		self.timestamp = 0.0
-		self.lastControlLoopTimestamp = 0.0
-		self.stateIndex = 0
-		self.lastTarget = 0.0
-		self.updateStateVariables()
-		self.data = []
-		self.soaking = False
+		with self.lock:
+			self.closeRunLog()
+			self.runLog = None
+			self.running = STATES.RUNNING
+			# reset all the state variables
+			self.health.tripped = None
+			self.pid.zeroierror()
+			if self.mpc:
+				self.mpc.reset()
+			self.timestamp = 0.0
+			self.lastControlLoopTimestamp = 0.0
+			self.stateIndex = 0
+			# Picks up any in-place edits of the states
+			self.config.compilePlan()
+			self.trajectory = self.createTrajectory() if self.config.trajectory.get('enabled') else None
+			self.updateStateVariables()
+			self.data = self.createDataStore()
+			if self.estimator and not self.sampler:
+				# Fed from tick() timestamps, which restart at 0
+				self.estimator.reset()
+			if self.feedForward:
+				self.feedForward.plan(self.stateConfiguration, self.units)
+			if runLogPath:
+				self.runLog = RunLogWriter(runLogPath, self.dataHeader, self.config.config, debugLevel=self.debugLevel)
+				self.runLog.start()
 
 	def stop(self):
 		"""
 		Stop the state machine
 		"""
-		self.running = STATES.STOPPED
-		self.stateIndex = 0
-		self.timestamp = 0.0
-		self.lastControlLoopTimestamp = 0.0
-		self.lastTarget = 0.0
-		self.updateStateVariables()
+		with self.lock:
+			self.closeRunLog()
+			if self.running in [STATES.RUNNING, STATES.PAUSED, STATES.TUNING]:
+				self.events.publish(EVENTS.STOPPED, self.timestamp, {'state': self.currentState})
+			self.running = STATES.STOPPED
+			self.stateIndex = 0
+			self.timestamp = 0.0
+			self.lastControlLoopTimestamp = 0.0
+			self.updateStateVariables()
 
 	def resume(self):
 		"""
 		Resume a paused state machine
 		"""
-		self.running = STATES.RUNNING
+		with self.lock:
+			self.running = STATES.RUNNING
+			self.events.publish(EVENTS.RESUMED, self.timestamp, {'state': self.currentState})
 
 	def pause(self):
 		"""
 		Pause a currently running state machine
 		"""
-		self.running = STATES.PAUSED
+		with self.lock:
+			self.running = STATES.PAUSED
+			self.events.publish(EVENTS.PAUSED, self.timestamp, {'state': self.currentState})
 
 		# endregion Control
 		# region Loop
 
-	def tick(self, testing=False):
+	def tick(self, testing=False, elapsed=None):
 		"""
 		Call every tick of clock/timer to increment timestamp
 		@param testing: flag to disable relay control
 		@type testing: bool (default = False)
+		@param elapsed: (Optional) seconds since the last tick, e.g. measured by ControlLoopRunner. Default: timer period
+		@type elapsed: float
+		"""
+		with self.lock:
+			self._tick(testing, self.timerPeriod if elapsed is None else elapsed)
+			if self.events.subscribed(EVENTS.TICK):
+				self.events.publish(EVENTS.TICK, self.timestamp, {
+					'running': self.running,
+					'state': self.currentState,
+					'temperature': self.temperature,
+					'setpoint': self.setpoint,
+					'relay': self.relay.state,
+				})
+
+	def _tick(self, testing, elapsed):
+		"""
+		One tick of the state machine - see tick
+		@param testing: flag to disable relay control
+		@type testing: bool
+		@param elapsed: seconds since the last tick
+		@type elapsed: float
 		"""
 		# read the thermocouple
+		temp = None
+		error = None
 		try:
-			self.recentTCErrors.pop(0)
-			temp = self.thermocouple.read()
-			self.recentTCErrors.append(None)
+			temp = self.sensor.read()
 		except Exception as e:
-			self.recentTCErrors.append(e)
+			error = e
 			self.logger.exception("Thermocouple read error")
 
+		# Stop with the heater off if the readings can't be trusted
+		now = self.clock()
+		unhealthy = self.health.update(now, error, readingTime=self.sampler.latest.timestamp if self.sampler and error is None else None)
+		shutdown = unhealthy if unhealthy and self.running in self.ACTIVE_STATES else None
+		if error is not None or shutdown:
+			self.events.publish(EVENTS.FAULT, self.timestamp, {
+				'error': error,
+				'faultType': SensorHealthMonitor.FaultType(error) if error is not None else None,
+				'recentErrors': self.health.recentErrors,
+				'shutdown': shutdown,
+			})
+		if shutdown:
+			self.healthShutdown(shutdown)
+
+		# Relay auto-tune experiment runs instead of the profile
+		if self.running == STATES.TUNING:
+			self.autoTuneTick(temp, elapsed)
+			return
+
 		# Don't do anything if we're not running
 		if self.running not in [STATES.RUNNING, STATES.TESTING]:
 			if not testing:
-				self.relay.disable()
+				self.heaterOff()
 			return
 
 		# Increment timestamp
-		self.timestamp += self.timerPeriod
+		self.timestamp += elapsed
+
+		# Without a sampler, the estimator runs at the tick rate
+		if self.estimator and not self.sampler and temp is not None:
+			self.estimator.update(self.timestamp, temp)
 
 		# Ready to move to next state?
 		if self.readyForNextState():
@@ -344,23 +664,95 @@ class ToastStateMachine(object):
 			self.lastControlLoopTimestamp = self.timestamp
 
 			# Calculate PID output
-			self.pid.compute(self.timestamp, self.temperature, self.stateChanged)
+			controller = self.controller
+			controller.target = self.setpoint
+			if self.estimator and self.estimator.initialized:
+				# Smoothed temperature, with the estimated slope as the derivative - read as one pair, the sampler
+				# thread may be updating the estimator
+				temperature, slope = self.estimator.estimate
+				controller.compute(self.timestamp, temperature, self.stateChanged, slope=slope, targetSlope=self.setpointSlope)
+			else:
+				controller.compute(self.timestamp, self.temperature, self.stateChanged)
 			self.stateChanged = False
 
-			if self.stateIndex == len(self.states) - 1:
+			if self.stateIndex == self.config.plan.lastIndex:
 				# Last state is always a cooling state - force relay off
-				self.relay.disable()
+				self.heaterOff()
 			else:
 				# Not last state = check PID output
-				if self.pid.output > 0.0:
-					self.relay.enable()
-				else:
-					self.relay.disable()
+				self.setHeater(controller.output + self.feedForwardTerm)
 
 			# only print/update data when the control loop updates
 			self.debugPrint()
 			self.updateData()
 
+		if self.running == STATES.COMPLETE:
+			# Final record logged
+			self.closeRunLog()
+
+	def healthShutdown(self, reason):
+		"""
+		Stop the run with the heater off because the thermocouple is unhealthy
+		@param reason: why, from SensorHealthMonitor.check
+		@type reason: str
+		"""
+		self.logger.error("Thermocouple unhealthy - {}. Stopping with the heater off".format(reason))
+		self.health.trip(reason)
+		self.stop()
+		self.heaterOff()
+
+	def setHeater(self, output):
+		"""
+		Drive the heater from a PID output - as a duty cycle in time-proportioning mode, otherwise on for positive output
+		@param output: PID output
+		@type output: float
+		"""
+		if self.output:
+			self.output.setOutput(output)
+		elif output > 0.0:
+			self.relay.enable()
+		else:
+			self.relay.disable()
+
+	def heaterOff(self):
+		"""
+		Turn the heater off now
+		"""
+		if self.output:
+			self.output.off()
+		else:
+			self.relay.disable()
+
+	@property
+	def feedForwardTerm(self):
+		"""
+		Feed-forward term planned for the current state, added to the PID output. The MPC has its own model, so gets none
+		@rtype: float
+		"""
+		return self.feedForward.term(self.stateIndex) if self.feedForward and not self.mpc else 0.0
+
+	@property
+	def heaterOutputRange(self):
+		"""
+		Controller output from heater off to fully on - the time-proportioning output's span, the feed-forward's output
+		scale, or 0..1 for a bare relay
+		@return: tuple of off, fully on outputs
+		@rtype: tuple[float, float]
+		"""
+		if self.output:
+			return self.output.outputMin, self.output.outputMax
+		if self.feedForward:
+			return 0.0, self.feedForward.outputScale
+		return 0.0, 1.0
+
+	@property
+	def heaterDuty(self):
+		"""
+		Fraction of heater power currently requested
+		@rtype: float
+		"""
+		return self.output.duty if self.output else float(self.relay.state)
+
 	def readyForNextState(self):
 		"""
 		Check if we're ready to move to the next state
@@ -379,14 +771,19 @@ class ToastStateMachine(object):
 		@return: whether or not the temperature has reached the target state
 		@rtype: bool
 		"""
-		# +/- 3.0 as a buffer
-		celsiusBuffer = 3.0
-		fahrenheitBuffer = self.thermocouple.ConvertCelsiusToFahrenheit(celsiusBuffer)
-		buffer = celsiusBuffer if self.units == 'celsius' else fahrenheitBuffer
-		if self.targetState > self.lastTarget:
-			return self.temperature >= self.targetState - buffer
+		if self.config.plan.ramps[self.stateIndex]:
+			return self.temperature >= self.targetState - self.targetBuffer
 		else:
-			return self.temperature <= self.targetState + buffer
+			return self.temperature <= self.targetState + self.targetBuffer
+
+	def updateTargetBuffer(self):
+		"""
+		Convert the +/- 3.0C buffer of checkStateAgainstTarget to the current units - done when the units change, not
+		every tick
+		"""
+		celsiusBuffer = 3.0
+		fahrenheitBuffer = Thermocouple.ConvertCelsiusToFahrenheit(celsiusBuffer)
+		self.targetBuffer = celsiusBuffer if self.units == 'celsius' else fahrenheitBuffer
 
 	def nextState(self):
 		"""
@@ -397,8 +794,10 @@ class ToastStateMachine(object):
 		self.stateIndex += 1
 
 		# Check if state machine has reached the end
-		if self.stateIndex == len(self.states):
+		if self.stateIndex > self.config.plan.lastIndex:
 			self.running = STATES.COMPLETE
+			self.restoreGains()
+			self.events.publish(EVENTS.COMPLETED, self.timestamp, {'states': len(self.config.plan.names)})
 			if self.stateMachineCompleteCallback:
 				self.stateMachineCompleteCallback()
 
@@ -410,23 +809,39 @@ class ToastStateMachine(object):
 		"""
 		Update the current state variables
 		"""
-		self.currentState = self.states[self.stateIndex]
+		plan = self.config.plan
+		index = self.stateIndex
+		self.currentState = plan.names[index]
 
-		# Get next state info
-		self.lastTarget = self.targetState
-		self.targetState = float(self.stateConfiguration[self.currentState][CONFIG_KEY_TARGET])
-		self.currentStateDuration = float(self.stateConfiguration[self.currentState][CONFIG_KEY_DURATION])
+		# Get next state info. The first state ramps from ambient, whatever the last run ended on
+		self.lastTarget = plan.targets[index - 1] if index else 0.0
+		self.targetState = plan.targets[index]
+		self.currentStateDuration = plan.durations[index]
 
 		# Soaking stages simply maintain a steady temperature for a certain duration
 		# Heating/Cooling stages have no duration
-		self.soaking = self.targetState == self.lastTarget
+		self.soaking = plan.soaks[index]
+		self.currentStateStart = self.timestamp
 		self.currentStateEnd = self.timestamp + self.currentStateDuration
 
+		# Swap in this state's gains, if it has its own
+		if self.running == STATES.RUNNING:
+			self.scheduleGains()
+		else:
+			self.restoreGains()
+
 		# Zero out the integrated error so it can build up again for this state
 		self.pid.zeroierror()
 		self.stateChanged = True
 
 		if self.running not in [STATES.STOPPED, STATES.PAUSED]:
+			if self.events.subscribed(EVENTS.STATE_CHANGED):
+				self.events.publish(EVENTS.STATE_CHANGED, self.timestamp, {
+					'state': self.currentState,
+					'index': index,
+					'target': self.targetState,
+					'soaking': self.soaking,
+				})
 			self.logger.debug(
 				"New state, target, end timestamp: {}, {:7.2f}, {}".format(
 					self.currentState,
@@ -435,17 +850,172 @@ class ToastStateMachine(object):
 				)
 			)
 
+	def updateGains(self, configDict):
+		"""
+		Change the global PID gains & limits - safe mid-run and from any thread.
+		While a run is in progress the new gains take over between control steps without an output jump - see
+		PID.updateGains. If the current state has its own gains, the new global gains take over when it ends.
+		Otherwise they're applied straight away. Either way they're written to the config
+		@param configDict: dict of PID parameters to change. Missing keys are kept
+		@type configDict: dict
+		@return: new global PID config
+		@rtype: OrderedDict
+		"""
+		# The tick swaps _baseGains in & out on the control loop thread
+		with self.lock:
+			if self.running in [STATES.RUNNING, STATES.PAUSED]:
+				if self._baseGains is not None:
+					self._baseGains = PID.CompileGains(configDict, PID.GetGainsConfig(self._baseGains))
+					pidConfig = PID.GetGainsConfig(self._baseGains)
+				else:
+					pidConfig = self.pid.updateGains(configDict)
+			else:
+				self.pid.setConfig(configDict)
+				pidConfig = self.pid.getConfig()
+
+			if 'tuning' not in self.config.config:
+				self.config.config['tuning'] = {'pid': pidConfig}
+			else:
+				self.config.config['tuning']['pid'] = pidConfig
+			self.config.compileStateGains(pidConfig)
+			self.logger.debug("PID gains updated: {}".format(", ".join("{}={}".format(key, value) for key, value in pidConfig.items())))
+			return pidConfig
+
+	def scheduleGains(self):
+		"""
+		Swap in the current state's own PID gains, or back to the global gains if it has none.
+		O(1) - the gain schedule is compiled when the config loads
+		"""
+		stateGains = self.config.stateGains
+		gains = stateGains[self.stateIndex] if self.stateIndex < len(stateGains) else None
+		if gains is None:
+			self.restoreGains()
+			return
+
+		if self._baseGains is None:
+			# Live changes still queued belong to the global gains
+			self.pid.applyPendingGains()
+			self._baseGains = self.pid.gains
+		self.pid.applyGains(gains)
+
+	def restoreGains(self):
+		"""
+		Put the global PID gains back if a state's own gains are in use
+		"""
+		if self._baseGains is not None:
+			self.pid.applyGains(self._baseGains)
+			self._baseGains = None
+
+	def simulate(self, maxDuration=3600.0, runLogPath=None):
+		"""
+		Run the whole profile on the virtual clock as fast as the CPU allows - the same tick() as a real run, with the
+		clock advanced a timer period per tick and the time-proportioning output stepped at its exact switch times.
+		See library.simulation.oven.SimulateProfile
+		@param maxDuration: give up after this much simulated time (s)
+		@type maxDuration: float
+		@param runLogPath: (Optional) stream the data records to this run log, as in start
+		@type runLogPath: str
+		@return: data records, as from a real run
+		@rtype: RunStore
+		"""
+		assert self.virtualClock, "Simulation needs a virtual clock - see library.simulation.oven.VirtualClock"
+		clock = self.clock
+
+		self.start(runLogPath=runLogPath)
+		end = clock() + maxDuration
+		while self.running == STATES.RUNNING and clock() < end:
+			tickEnd = clock() + self.timerPeriod
+			if self.output:
+				nextSwitch = self.output.step()
+				while nextSwitch < tickEnd:
+					clock.advance(nextSwitch - clock())
+					nextSwitch = self.output.step()
+			clock.advance(tickEnd - clock())
+			self.tick()
+		self.heaterOff()
+		return self.data
+
 		# endregion Loop
+		# region AutoTune
+
+	def startAutoTune(self, setpoint=None):
+		"""
+		Start a relay auto-tune experiment using the autotune config
+		@param setpoint: (Optional) temperature to oscillate around. Default: configured setpoint
+		@type setpoint: float
+		"""
+		self.logger.debug("Beginning auto-tune")
+		with self.lock:
+			outputLow, outputHigh = self.heaterOutputRange
+			self.autoTuner = RelayAutoTuner.FromConfig(self.config.autotune, setpoint, outputHigh=outputHigh, outputLow=outputLow)
+			self.running = STATES.TUNING
+			self.timestamp = 0.0
+			self.lastControlLoopTimestamp = 0.0
+			self.currentState = self.AUTOTUNE_STATE
+			self.data = self.createDataStore()
+
+	def autoTuneTick(self, temp, elapsed=None):
+		"""
+		Run one tick of the auto-tune experiment
+		@param temp: latest temperature, None if the read failed
+		@type temp: float
+		@param elapsed: (Optional) seconds since the last tick. Default: timer period
+		@type elapsed: float
+		"""
+		self.timestamp += self.timerPeriod if elapsed is None else elapsed
+
+		if temp is None:
+			# Never leave the heater on blind
+			self.heaterOff()
+			return
+
+		# Full heater power or none - through the time-proportioning output if there is one, which maps the same span
+		if self.autoTuner.update(self.timestamp, temp):
+			self.setHeater(self.autoTuner.outputHigh)
+		else:
+			self.setHeater(self.autoTuner.outputLow)
+
+		if not self.autoTuner.running:
+			self.running = STATES.STOPPED
+			if self.autoTuner.complete:
+				self.logger.info("Auto-tune complete - ultimate gain {:.4f}, period {:.1f}s".format(
+					self.autoTuner.ultimateGain, self.autoTuner.period
+				))
+			else:
+				self.logger.warning("Auto-tune failed to complete within {}s".format(self.autoTuner.maxDuration))
+
+		# Record data @ 1Hz, like the control loop
+		if (self.timestamp - self.lastControlLoopTimestamp) >= 1.0 or not self.autoTuner.running:
+			self.lastControlLoopTimestamp = self.timestamp
+			self.updateData()
+
+	def applyAutoTune(self, rule=None):
+		"""
+		Load the gains proposed by the last auto-tune experiment into the PID config
+		Limits & windup guard are kept
+		@param rule: (Optional) tuning rule - see RelayAutoTuner.TUNING_RULES. Default: configured rule
+		@type rule: str
+		@return: the new PID config
+		@rtype: OrderedDict
+		"""
+		with self.lock:
+			if not self.autoTuner or not self.autoTuner.complete:
+				raise Exception("No completed auto-tune experiment, cannot apply PID gains")
+			pidConfig = self.autoTuner.getPIDConfig(rule or self.config.autotune['rule'], self.pid.getConfig())
+			self.config.pids = pidConfig
+			return pidConfig
+
+		# endregion AutoTune
 	# endregion StateMachine
 	# region Data
 
 	def getRecentErrorCount(self):
 		"""
 		Get the number of recent errors
-		@return: number of recent errors
+		@return: number of failed reads in the health watchdog's window
 		@rtype: int
 		"""
-		return len([error for error in self.recentTCErrors if error is not None])
+		return self.health.recentErrors
 
 	def debugPrint(self):
 		"""
@@ -455,7 +1025,7 @@ class ToastStateMachine(object):
 			"{:7.2f}, {}, {}".format(
 				self.timestamp,
 				"{:7.2f}".format(self.currentStateEnd) if self.soaking else "    n/a",
-				self.pid.currentStateToString()
+				self.controller.currentStateToString()
 			)
 		)
 
@@ -463,58 +1033,124 @@ class ToastStateMachine(object):
 		"""
 		Update data tracking
 		"""
-		# Build data dict
-		data = {
-			'Timestamp': self.timestamp,
-			'Temperature': self.temperature,
-			'Target Temperature': self.targetState,
-			'State': self.currentState,
-			'Relay State': self.relay.state,
-			'PID Output': self.pid.output,
-			'PID Error': self.pid.error,
-			'PID IError': self.pid.ierror,
-			'PID DError': self.pid.derror,
-		}
-		self.data.append(data)
+		# Values in dataHeader order
+		values = [
+			self.timestamp,
+			self.temperature,
+			self.autoTuner.setpoint if self.currentState == self.AUTOTUNE_STATE else self.targetState,
+			self.currentState,
+			self.relay.state,
+			self.heaterDuty,
+			self.controller.output,
+			self.controller.error,
+			self.controller.ierror,
+			self.controller.derror,
+			self.feedForwardTerm,
+		]
+		if isinstance(self.thermocouple, ThermocoupleArray):
+			probeTemperatures = self.probeTemperatures
+			values += [probeTemperatures.get(ThermocoupleArray.GetProbeKey(pin)) for pin in self.thermocouple.csPins]
+		self.data.append(values)
+		if self.runLog:
+			self.runLog.log(values)
+		if self.events.subscribed(EVENTS.SAMPLE):
+			self.events.publish(EVENTS.SAMPLE, self.timestamp, dict(zip(self.data.fields, values)))
 
-	def dumpDataToCsv(self, csvPath):
+	def closeRunLog(self):
 		"""
-		Dump data to a CSV file
-		@param csvPath: path to CSV file to dump data to
-		@type csvPath: str
-		@return: True if successful, False otherwise
-		@rtype: bool
+		Finish streaming the run log, if any. Doesn't wait for the writer - the last records reach the disk within a
+		flush interval. The closed writer stays in runLog until the next run
+		@return: the closed log writer - join() it to wait for the file to be complete
+		@rtype: RunLogWriter
 		"""
-		if not self.data:
-			return False
+		if self.runLog:
+			self.runLog.close()
+		return self.runLog
 
-		# write to file
+	def createDataStore(self):
+		"""
+		Create an empty store for the data records of a run, with a column per dataHeader entry
+		@rtype: RunStore
+		"""
+		return RunStore.FromHeader(self.dataHeader)
+
+	@property
+	def dataHeader(self):
+		"""
+		Get the data record keys, in CSV column order
+		@return: list of column names
+		@rtype: list[str]
+		"""
 		header = [
 			'Timestamp',
 			'Temperature',
 			'Target Temperature',
 			'State',
 			'Relay State',
+			'Heater Duty',
 			'PID Output',
 			'PID Error',
 			'PID IError',
 			'PID DError',
+			'Feed Forward',
 		]
+		if isinstance(self.thermocouple, ThermocoupleArray):
+			header += [ThermocoupleArray.GetProbeKey(pin) for pin in self.thermocouple.csPins]
+		return header
+
+	def dumpDataToCsv(self, csvPath):
+		"""
+		Dump data to a CSV file
+		@param csvPath: path to CSV file to dump data to
+		@type csvPath: str
+		@return: True if successful, False otherwise
+		@rtype: bool
+		"""
+		if not self.data:
+			return False
+
+		# write to file
 		with open(csvPath, 'w', newline="") as ouf:
-			writer = csv.DictWriter(ouf, fieldnames=header)
-			writer.writeheader()
-			writer.writerows(self.data)
+			writer = csv.writer(ouf)
+			writer.writerow(self.data.fields)
+			writer.writerows(self.data.rows())
 
 		return True
 
+	def dumpDataToArchive(self, archivePath):
+		"""
+		Dump data & config to a single binary run archive - see library.other.run_archive
+		@param archivePath: path to archive file to write
+		@type archivePath: str
+		@return: True if successful, False otherwise
+		@rtype: bool
+		"""
+		if not self.data:
+			return False
+
+		WriteRunArchive(archivePath, self.data, self.config.config)
+		return True
+
 	# endregion Data
 	# region GPIO
 
 	def cleanup(self):
 		"""
-		Clean up all GPIO
+		Clean up all GPIO & stop delivering events - for shutting down
+		"""
+		self.cleanupHardware()
+		self.events.close()
+
+	def cleanupHardware(self):
+		"""
+		Clean up all GPIO, the sampler & output threads and the run log, e.g. before loading a new config
 		"""
+		runLog = self.closeRunLog()
+		if runLog:
+			runLog.join(5.0)
+		self.stopOutput()
 		self.relay.disable()
+		self.stopSampler()
 		self.thermocouple.cleanup()
 		self.relay.cleanup()
 
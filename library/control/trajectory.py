@@ -0,0 +1,153 @@
+"""
+Setpoint trajectory - the target temperature as a continuous function of time through the profile, instead of a step to
+each state's target as the state starts
+"""
+from bisect import bisect_right
+from collections import OrderedDict
+
+from library.sensors.sensor_thermocouple import Thermocouple
+
+
+class SetpointTrajectory(object):
+	"""
+	Precomputed setpoint timeline of a profile. Each state is a segment from the previous state's target to its own,
+	spread over its duration, then held at the target:
+		linear - straight ramps, as the profile graph has always been drawn
+		spline - cubic ramps leaving & arriving flat, so the setpoint has no slope jumps & never overshoots a target
+	The knot times are the nominal state start times (ProfilePlan.starts), so any time can be looked up with a binary
+	search (at). The control loop knows which state it's in, so it samples its segment directly (setpoint) - O(1).
+	The profile graphs draw the same segments
+	"""
+	LINEAR = 'linear'
+	SPLINE = 'spline'
+	METHODS = [LINEAR, SPLINE]
+
+	# Points per segment when drawing a spline
+	CURVE_POINTS = 20
+
+	BASE_CONFIG = OrderedDict([
+		("enabled", False),
+		("method", LINEAR),
+		# Temperature the first state ramps from (C)
+		("ambient", 25.0),
+	])
+
+	def __init__(self, plan, startTemperature=0.0, method=LINEAR):
+		"""
+		Constructor
+		@param plan: compiled profile
+		@type plan: library.control.plan.ProfilePlan
+		@param startTemperature: temperature the first state ramps from, in the profile's units
+		@type startTemperature: float
+		@param method: segment shape - one of METHODS
+		@type method: str
+		"""
+		super(SetpointTrajectory, self).__init__()
+		assert method in self.METHODS, "Trajectory method must be one of the following: {}".format(", ".join(self.METHODS))
+		self.method = method
+		self.plan = plan
+		# Segment i runs from values[i] at times[i] to values[i + 1] at times[i + 1]
+		self.times = tuple(plan.starts) + (plan.totalDuration,)
+		self.values = (float(startTemperature),) + tuple(plan.targets)
+
+	@classmethod
+	def FromConfig(cls, configDict, plan, units='celsius'):
+		"""
+		Create the trajectory of a profile from a trajectory config dict
+		@param configDict: dict with any of BASE_CONFIG's keys
+		@type configDict: dict
+		@param plan: compiled profile
+		@type plan: library.control.plan.ProfilePlan
+		@param units: temperature units of the profile - the config's ambient is celsius
+		@type units: str
+		@rtype: SetpointTrajectory
+		"""
+		config = OrderedDict(cls.BASE_CONFIG)
+		config.update(configDict or {})
+		ambient = float(config['ambient'])
+		if units == 'fahrenheit':
+			ambient = Thermocouple.ConvertCelsiusToFahrenheit(ambient)
+		return cls(plan, startTemperature=ambient, method=config['method'])
+
+	def setpoint(self, stateIndex, timeInState):
+		"""
+		Setpoint a given time into a state - O(1)
+		@param stateIndex: index of the state in the profile
+		@type stateIndex: int
+		@param timeInState: time since the state started (s). Past the state's duration, its target is held
+		@type timeInState: float
+		@rtype: float
+		"""
+		if stateIndex > self.plan.lastIndex:
+			# Profile complete - hold the last target
+			return self.values[-1]
+		start = self.values[stateIndex]
+		end = self.values[stateIndex + 1]
+		duration = self.plan.durations[stateIndex]
+		if timeInState >= duration:
+			return end
+		if timeInState <= 0.0:
+			return start
+		fraction = timeInState / duration
+		if self.method == self.SPLINE:
+			fraction = fraction * fraction * (3.0 - 2.0 * fraction)
+		return start + (end - start) * fraction
+
+	def slope(self, stateIndex, timeInState):
+		"""
+		Rate of change of the setpoint a given time into a state - O(1)
+		@param stateIndex: index of the state in the profile
+		@type stateIndex: int
+		@param timeInState: time since the state started (s)
+		@type timeInState: float
+		@return: setpoint slope (degrees/s)
+		@rtype: float
+		"""
+		if stateIndex > self.plan.lastIndex:
+			return 0.0
+		duration = self.plan.durations[stateIndex]
+		if not 0.0 <= timeInState < duration:
+			return 0.0
+		rate = (self.values[stateIndex + 1] - self.values[stateIndex]) / duration
+		if self.method == self.SPLINE:
+			fraction = timeInState / duration
+			rate *= 6.0 * fraction * (1.0 - fraction)
+		return rate
+
+	def segmentIndex(self, timestamp):
+		"""
+		Find the state a time into the profile falls in, if every state took its nominal duration
+		@param timestamp: time since the profile started (s)
+		@type timestamp: float
+		@return: state index, clamped to the profile
+		@rtype: int
+		"""
+		return min(max(bisect_right(self.times, timestamp) - 1, 0), self.plan.lastIndex)
+
+	def at(self, timestamp):
+		"""
+		Setpoint a time into the profile, if every state took its nominal duration - O(log states)
+		@param timestamp: time since the profile started (s)
+		@type timestamp: float
+		@rtype: float
+		"""
+		if not self.plan.names:
+			return self.values[0]
+		index = self.segmentIndex(timestamp)
+		return self.setpoint(index, timestamp - self.times[index])
+
+	def segment(self, stateIndex):
+		"""
+		Points to draw a state's segment with
+		@param stateIndex: index of the state in the profile
+		@type stateIndex: int
+		@return: tuple of timestamps, setpoints
+		@rtype: tuple[list[float], list[float]]
+		"""
+		start = self.times[stateIndex]
+		duration = self.plan.durations[stateIndex]
+		count = self.CURVE_POINTS if self.method == self.SPLINE and duration > 0 else 1
+		offsets = [duration * i / count for i in range(count + 1)]
+		# Ends pinned to the knots, so a state with no duration draws as a step
+		setpoints = [self.values[stateIndex]] + [self.setpoint(stateIndex, offset) for offset in offsets[1:-1]] + [self.values[stateIndex + 1]]
+		return [start + offset for offset in offsets], setpoints
@@ -2,7 +2,17 @@ import json
 from collections import OrderedDict
 
 from library.control.pid import PID
+from library.control.estimator import KalmanEstimator
+from library.control.autotune import RelayAutoTuner
+from library.control.output import TimeProportionalOutput
+from library.control.feedforward import FeedForward
+from library.control.mpc import ModelPredictiveController
+from library.control.plan import ProfilePlan
+from library.control.trajectory import SetpointTrajectory
+from library.control.health import SensorHealthMonitor
 from library.sensors.sensor_thermocouple import Thermocouple
+from library.sensors.sensor_thermocouple_array import ThermocoupleArray
+from definitions import CONFIG_KEY_PID
 
 
 class ToasterConfig(object):
@@ -15,6 +25,8 @@ class ToasterConfig(object):
 
 	BASE_CLOCK_PERIOD = 0.5
 
+	BASE_FUSION = "average"
+
 	BASE_PID = PID({
 		"kP": 0.6,
 		"kI": 0.005,
@@ -24,6 +36,28 @@ class ToasterConfig(object):
 		"windupGuard": 20.0,
 	})
 
+	BASE_SAMPLER = OrderedDict([
+		("enabled", False),
+		("period", 0.1),
+		("historyLength", 600),
+		("filterLength", 5),
+		("filterMethod", "median"),
+	])
+
+	BASE_ESTIMATOR = KalmanEstimator.BASE_CONFIG
+
+	BASE_AUTOTUNE = RelayAutoTuner.BASE_CONFIG
+
+	BASE_OUTPUT = TimeProportionalOutput.BASE_CONFIG
+
+	BASE_FEED_FORWARD = FeedForward.BASE_CONFIG
+
+	BASE_MPC = ModelPredictiveController.BASE_CONFIG
+
+	BASE_TRAJECTORY = SetpointTrajectory.BASE_CONFIG
+
+	BASE_HEALTH = SensorHealthMonitor.BASE_CONFIG
+
 	BASE_STATES = OrderedDict()
 
 	def __init__(self, configPath):
@@ -36,7 +70,18 @@ class ToasterConfig(object):
 		self._pins = self.BASE_PINS
 		self._pids = self.BASE_PID
 		self._clockPeriod = self.BASE_CLOCK_PERIOD
+		self._fusion = self.BASE_FUSION
+		self._sampler = OrderedDict(self.BASE_SAMPLER)
+		self._estimator = OrderedDict(self.BASE_ESTIMATOR)
+		self._autotune = OrderedDict(self.BASE_AUTOTUNE)
+		self._output = OrderedDict(self.BASE_OUTPUT)
+		self._feedForward = OrderedDict(self.BASE_FEED_FORWARD)
+		self._mpc = OrderedDict(self.BASE_MPC)
+		self._trajectory = OrderedDict(self.BASE_TRAJECTORY)
+		self._health = OrderedDict(self.BASE_HEALTH)
 		self._states = self.BASE_STATES
+		self._plan = ProfilePlan.Compile(self._states)
+		self._stateGains = []
 
 		self._config = OrderedDict()
 		if configPath:
@@ -74,6 +119,50 @@ class ToasterConfig(object):
 			if clockPeriod:
 				self._clockPeriod = clockPeriod
 
+			fusion = tuning.get("fusion")
+			if fusion:
+				self._fusion = fusion
+
+			sampler = tuning.get("sampler")
+			if sampler:
+				self._sampler = OrderedDict(self.BASE_SAMPLER)
+				self._sampler.update(sampler)
+
+			estimator = tuning.get("estimator")
+			if estimator:
+				self._estimator = OrderedDict(self.BASE_ESTIMATOR)
+				self._estimator.update(estimator)
+
+			autotune = tuning.get("autotune")
+			if autotune:
+				self._autotune = OrderedDict(self.BASE_AUTOTUNE)
+				self._autotune.update(autotune)
+
+			output = tuning.get("output")
+			if output:
+				self._output = OrderedDict(self.BASE_OUTPUT)
+				self._output.update(output)
+
+			feedForward = tuning.get("feedForward")
+			if feedForward:
+				self._feedForward = OrderedDict(self.BASE_FEED_FORWARD)
+				self._feedForward.update(feedForward)
+
+			mpc = tuning.get("mpc")
+			if mpc:
+				self._mpc = OrderedDict(self.BASE_MPC)
+				self._mpc.update(mpc)
+
+			trajectory = tuning.get("trajectory")
+			if trajectory:
+				self._trajectory = OrderedDict(self.BASE_TRAJECTORY)
+				self._trajectory.update(trajectory)
+
+			health = tuning.get("health")
+			if health:
+				self._health = OrderedDict(self.BASE_HEALTH)
+				self._health.update(health)
+
 		self.states = self.config.get("states", self.BASE_STATES)
 
 	@property
@@ -108,6 +197,22 @@ class ToasterConfig(object):
 		pin = Thermocouple.CheckSPICSPin(pin)
 		self.pins['SPI_CS'] = pin
 
+	@property
+	def spiCsPins(self):
+		"""
+		SPI CS pins as a list - 'SPI_CS' may be a single pin or a list of pins for multiple thermocouples
+		@rtype: list[int]
+		"""
+		pins = self.spiCsPin
+		if isinstance(pins, (list, tuple)):
+			return [Thermocouple.CheckSPICSPin(pin) for pin in pins]
+		return [Thermocouple.CheckSPICSPin(pins)]
+
+	@spiCsPins.setter
+	def spiCsPins(self, pins):
+		pins = [Thermocouple.CheckSPICSPin(pin) for pin in pins]
+		self.pins['SPI_CS'] = pins if len(pins) > 1 else pins[0]
+
 	@property
 	def relayPin(self):
 		return self.pins['relay']
@@ -130,6 +235,8 @@ class ToasterConfig(object):
 			self.config['tuning'] = {'pid': self.pids.getConfig()}
 		else:
 			self.config['tuning']['pid'] = self.pids.getConfig()
+		# Per-state gains inherit missing keys from these
+		self.compileStateGains()
 
 	@property
 	def clockPeriod(self):
@@ -143,6 +250,205 @@ class ToasterConfig(object):
 		else:
 			self.config['tuning']['timerPeriod'] = self.clockPeriod
 
+	@property
+	def fusion(self):
+		"""
+		How readings from multiple thermocouples are combined - see ThermocoupleArray.FUSION_METHODS
+		@rtype: str
+		"""
+		return self._fusion
+
+	@fusion.setter
+	def fusion(self, fusion):
+		assert fusion in ThermocoupleArray.FUSION_METHODS, "Thermocouple fusion must be one of the following: {}".format(
+			", ".join(ThermocoupleArray.FUSION_METHODS)
+		)
+		self._fusion = fusion
+		if 'tuning' not in self.config:
+			self.config['tuning'] = {'fusion': self.fusion}
+		else:
+			self.config['tuning']['fusion'] = self.fusion
+
+	@property
+	def sampler(self):
+		"""
+		Background thermocouple sampler settings
+		@rtype: OrderedDict
+		"""
+		return self._sampler
+
+	@sampler.setter
+	def sampler(self, sampler):
+		"""
+		Set the background thermocouple sampler settings
+		@param sampler: dict of sampler settings. Missing keys use the defaults
+		@type sampler: dict
+		"""
+		self._sampler = OrderedDict(self.BASE_SAMPLER)
+		self._sampler.update(sampler)
+		if 'tuning' not in self.config:
+			self.config['tuning'] = {'sampler': self.sampler}
+		else:
+			self.config['tuning']['sampler'] = self.sampler
+
+	@property
+	def estimator(self):
+		"""
+		Temperature/slope estimator settings
+		@rtype: OrderedDict
+		"""
+		return self._estimator
+
+	@estimator.setter
+	def estimator(self, estimator):
+		"""
+		Set the temperature/slope estimator settings
+		@param estimator: dict of estimator settings. Missing keys use the defaults
+		@type estimator: dict
+		"""
+		self._estimator = OrderedDict(self.BASE_ESTIMATOR)
+		self._estimator.update(estimator)
+		if 'tuning' not in self.config:
+			self.config['tuning'] = {'estimator': self.estimator}
+		else:
+			self.config['tuning']['estimator'] = self.estimator
+
+	@property
+	def autotune(self):
+		"""
+		Relay auto-tune experiment settings
+		@rtype: OrderedDict
+		"""
+		return self._autotune
+
+	@autotune.setter
+	def autotune(self, autotune):
+		"""
+		Set the relay auto-tune experiment settings
+		@param autotune: dict of auto-tune settings. Missing keys use the defaults
+		@type autotune: dict
+		"""
+		assert autotune.get('rule', self.BASE_AUTOTUNE['rule']) in RelayAutoTuner.TUNING_RULES, \
+			"Auto-tune rule must be one of the following: {}".format(", ".join(RelayAutoTuner.TUNING_RULES))
+		self._autotune = OrderedDict(self.BASE_AUTOTUNE)
+		self._autotune.update(autotune)
+		if 'tuning' not in self.config:
+			self.config['tuning'] = {'autotune': self.autotune}
+		else:
+			self.config['tuning']['autotune'] = self.autotune
+
+	@property
+	def output(self):
+		"""
+		Heater output settings - bang-bang relay or time-proportioning
+		@rtype: OrderedDict
+		"""
+		return self._output
+
+	@output.setter
+	def output(self, output):
+		"""
+		Set the heater output settings
+		@param output: dict of output settings. Missing keys use the defaults
+		@type output: dict
+		"""
+		assert output.get('mode', self.BASE_OUTPUT['mode']) in TimeProportionalOutput.MODES, \
+			"Output mode must be one of the following: {}".format(", ".join(TimeProportionalOutput.MODES))
+		self._output = OrderedDict(self.BASE_OUTPUT)
+		self._output.update(output)
+		if 'tuning' not in self.config:
+			self.config['tuning'] = {'output': self.output}
+		else:
+			self.config['tuning']['output'] = self.output
+
+	@property
+	def feedForward(self):
+		"""
+		Feed-forward settings - oven model used to plan the heater power of each state
+		@rtype: OrderedDict
+		"""
+		return self._feedForward
+
+	@feedForward.setter
+	def feedForward(self, feedForward):
+		"""
+		Set the feed-forward settings
+		@param feedForward: dict of feed-forward settings. Missing keys use the defaults
+		@type feedForward: dict
+		"""
+		self._feedForward = OrderedDict(self.BASE_FEED_FORWARD)
+		self._feedForward.update(feedForward)
+		if 'tuning' not in self.config:
+			self.config['tuning'] = {'feedForward': self.feedForward}
+		else:
+			self.config['tuning']['feedForward'] = self.feedForward
+
+	@property
+	def mpc(self):
+		"""
+		Model-predictive controller settings. When enabled it replaces the PID in the control loop
+		@rtype: OrderedDict
+		"""
+		return self._mpc
+
+	@mpc.setter
+	def mpc(self, mpc):
+		"""
+		Set the model-predictive controller settings
+		@param mpc: dict of MPC settings. Missing keys use the defaults
+		@type mpc: dict
+		"""
+		self._mpc = OrderedDict(self.BASE_MPC)
+		self._mpc.update(mpc)
+		if 'tuning' not in self.config:
+			self.config['tuning'] = {'mpc': self.mpc}
+		else:
+			self.config['tuning']['mpc'] = self.mpc
+
+	@property
+	def trajectory(self):
+		"""
+		Setpoint trajectory settings. When enabled the control loop follows each state's ramp instead of its target
+		@rtype: OrderedDict
+		"""
+		return self._trajectory
+
+	@trajectory.setter
+	def trajectory(self, trajectory):
+		"""
+		Set the setpoint trajectory settings
+		@param trajectory: dict of trajectory settings. Missing keys use the defaults
+		@type trajectory: dict
+		"""
+		self._trajectory = OrderedDict(self.BASE_TRAJECTORY)
+		self._trajectory.update(trajectory)
+		if 'tuning' not in self.config:
+			self.config['tuning'] = {'trajectory': self.trajectory}
+		else:
+			self.config['tuning']['trajectory'] = self.trajectory
+
+	@property
+	def health(self):
+		"""
+		Thermocouple health watchdog settings - fault limits that stop a run with the heater off
+		@rtype: OrderedDict
+		"""
+		return self._health
+
+	@health.setter
+	def health(self, health):
+		"""
+		Set the thermocouple health watchdog settings
+		@param health: dict of health settings. Missing keys use the defaults
+		@type health: dict
+		"""
+		self._health = OrderedDict(self.BASE_HEALTH)
+		self._health.update(health)
+		if 'tuning' not in self.config:
+			self.config['tuning'] = {'health': self.health}
+		else:
+			self.config['tuning']['health'] = self.health
+
 	@property
 	def states(self):
 		return self._states
@@ -158,6 +464,45 @@ class ToasterConfig(object):
 			raise TypeError("Incorrect type for states - must be OrderedDict")
 		self._states = states
 		self.config['states'] = states
+		self.compilePlan()
+		self.compileStateGains()
+
+	@property
+	def plan(self):
+		"""
+		The states compiled for the control loop - see compilePlan
+		@rtype: ProfilePlan
+		"""
+		return self._plan
+
+	def compilePlan(self):
+		"""
+		Compile the states into the plan the control loop indexes. Done whenever the states are set - call it again
+		after editing them in place
+		"""
+		self._plan = ProfilePlan.Compile(self.states)
+
+	@property
+	def stateGains(self):
+		"""
+		Gain schedule - each state's own PID gains as a PID.gains tuple, None for states using the global gains.
+		In state order
+		@rtype: list[tuple or None]
+		"""
+		return self._stateGains
+
+	def compileStateGains(self, baseConfig=None):
+		"""
+		Compile the optional 'pid' block of each state into the gain schedule, so switching states doesn't parse config.
+		Keys missing from a state's block are taken from the global PID config
+		@param baseConfig: (Optional) global PID config. Default: the PID's current config
+		@type baseConfig: dict
+		"""
+		baseConfig = baseConfig or self.pids.getConfig()
+		self._stateGains = [
+			PID.CompileGains(state[CONFIG_KEY_PID], baseConfig) if state.get(CONFIG_KEY_PID) else None
+			for state in self.states.values()
+		]
 
 	def dumpConfig(self, filePath):
 		"""
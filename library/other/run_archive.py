@@ -0,0 +1,335 @@
+"""
+Single-file binary archive of a run - config snapshot, state-name table & fixed-width sample records
+
+Archive layout (little-endian):
+	header:  8s magic, uint16 version, uint16 field count, uint16 state count, uint16 record size,
+	         uint32 config length, uint32 data offset
+	fields:  per field - uint8 kind, uint8 name length, name (utf-8)
+	states:  per state - uint8 name length, name (utf-8)
+	config:  config JSON (utf-8)
+	records: from data offset (8-byte aligned), packed fields in order - float64 for floats, uint8 for the relay state &
+	         the index of the state name
+Missing floats (e.g. failed thermocouple reads) are stored as NaN.
+
+Convert to & from the data CSV + config JSON saved after a run with
+	python -m library.other.run_archive data/toast_data.toast
+	python -m library.other.run_archive data/toast_data.csv
+"""
+import os
+import sys
+import csv
+import json
+import mmap
+import struct
+import argparse
+from collections import OrderedDict
+
+from library.other.run_store import RunStore, FLOAT, BOOL, STATE, DTYPES
+
+MAGIC = b'TOASTRUN'
+VERSION = 1
+EXTENSION = ".toast"
+
+HEADER = struct.Struct('<8sHHHHII')
+FIELD = struct.Struct('<BB')
+STATE_NAME = struct.Struct('<B')
+
+KIND_CODES = {FLOAT: 0, BOOL: 1, STATE: 2}
+KINDS = {code: kind for kind, code in KIND_CODES.items()}
+KIND_SIZES = {FLOAT: 8, BOOL: 1, STATE: 1}
+
+
+class RunArchiveError(Exception):
+	pass
+
+
+def GetRecordDtype(fields):
+	"""
+	Get the numpy dtype of an archive record
+	@param fields: ordered field name to kind
+	@type fields: OrderedDict
+	@rtype: list[tuple[str, str]]
+	"""
+	return [(name, DTYPES[kind]) for name, kind in fields.items()]
+
+
+def PackString(text, maxLength=255):
+	data = text.encode('utf-8')
+	assert len(data) <= maxLength, "Name too long for a run archive: {}".format(text)
+	return data
+
+
+def WriteRunArchive(archivePath, store, config=None):
+	"""
+	Write run data to an archive
+	@param archivePath: path to write to
+	@type archivePath: str
+	@param store: run data
+	@type store: RunStore
+	@param config: (Optional) config of the run
+	@type config: dict
+	"""
+	# Imported here - numpy stays off the control loop's import path
+	import numpy as np
+
+	fields = store.fields
+	states = store.states
+	configJson = json.dumps(config).encode('utf-8') if config is not None else b''
+	recordSize = sum(KIND_SIZES[kind] for kind in fields.values())
+
+	tables = bytearray()
+	for name, kind in fields.items():
+		nameBytes = PackString(name)
+		tables += FIELD.pack(KIND_CODES[kind], len(nameBytes)) + nameBytes
+	for state in states:
+		nameBytes = PackString(state)
+		tables += STATE_NAME.pack(len(nameBytes)) + nameBytes
+	tables += configJson
+	dataOffset = HEADER.size + len(tables)
+	padding = -dataOffset % 8
+	dataOffset += padding
+
+	records = np.empty(len(store), dtype=np.dtype(GetRecordDtype(fields)))
+	for name in fields:
+		records[name] = store.column(name)
+
+	with open(archivePath, 'wb') as ouf:
+		ouf.write(HEADER.pack(MAGIC, VERSION, len(fields), len(states), recordSize, len(configJson), dataOffset))
+		ouf.write(tables)
+		ouf.write(b'\0' * padding)
+		ouf.write(records.tobytes())
+
+
+class RunArchive(object):
+	"""
+	Memory-mapped reader for run archives. Opening one only parses the small header & tables - records are read
+	straight out of the page cache, as numpy views, when asked for
+	"""
+	def __init__(self, archivePath):
+		"""
+		Constructor
+		@param archivePath: archive path
+		@type archivePath: str
+		"""
+		super(RunArchive, self).__init__()
+		self.path = archivePath
+		self._file = open(archivePath, 'rb')
+		size = os.fstat(self._file.fileno()).st_size
+		if size < HEADER.size:
+			self._file.close()
+			raise RunArchiveError("{} is too small to be a run archive".format(archivePath))
+
+		self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+		try:
+			self._readHeader(size)
+		except (struct.error, KeyError, UnicodeDecodeError):
+			self.close()
+			raise RunArchiveError("{} is a corrupt run archive".format(archivePath))
+
+	def _readHeader(self, size):
+		magic, version, fieldCount, stateCount, recordSize, configLength, dataOffset = HEADER.unpack_from(self._mmap, 0)
+		if magic != MAGIC or version != VERSION:
+			self.close()
+			raise RunArchiveError("{} is not a version {} run archive".format(self.path, VERSION))
+
+		offset = HEADER.size
+		self.fields = OrderedDict()
+		for i in range(fieldCount):
+			code, length = FIELD.unpack_from(self._mmap, offset)
+			offset += FIELD.size
+			self.fields[self._mmap[offset:offset + length].decode('utf-8')] = KINDS[code]
+			offset += length
+		self.states = []
+		for i in range(stateCount):
+			length, = STATE_NAME.unpack_from(self._mmap, offset)
+			offset += STATE_NAME.size
+			self.states.append(self._mmap[offset:offset + length].decode('utf-8'))
+			offset += length
+		self._configSlice = (offset, offset + configLength)
+
+		if recordSize != sum(KIND_SIZES[kind] for kind in self.fields.values()) or dataOffset > size:
+			self.close()
+			raise RunArchiveError("{} is a corrupt run archive".format(self.path))
+		self._recordSize = recordSize
+		self._dataOffset = dataOffset
+		# Ignore a partially written trailing record
+		self._count = (size - dataOffset) // recordSize if recordSize else 0
+
+	def __len__(self):
+		return self._count
+
+	@property
+	def header(self):
+		"""
+		@return: field names, in CSV column order
+		@rtype: list[str]
+		"""
+		return list(self.fields)
+
+	@property
+	def config(self):
+		"""
+		Config snapshot of the run - parsed on demand, so scanning many archives for their data stays cheap
+		@return: config dict, None if the archive has none
+		@rtype: OrderedDict
+		"""
+		start, end = self._configSlice
+		if start == end:
+			return None
+		return json.loads(self._mmap[start:end].decode('utf-8'), object_pairs_hook=OrderedDict)
+
+	def records(self):
+		"""
+		Get every record as a zero-copy numpy structured array, with a field per column
+		@rtype: numpy.ndarray
+		"""
+		import numpy as np
+		return np.frombuffer(self._mmap, dtype=np.dtype(GetRecordDtype(self.fields)), count=self._count, offset=self._dataOffset)
+
+	def column(self, name):
+		"""
+		Get one column as a zero-copy numpy view. State columns hold indices into states
+		@param name: column name
+		@type name: str
+		@rtype: numpy.ndarray
+		"""
+		return self.records()[name]
+
+	def toStore(self):
+		"""
+		Copy the records into a run store, e.g. to compare with a run's ToastStateMachine.data
+		@rtype: RunStore
+		"""
+		store = RunStore(self.fields, capacity=self._count)
+		for state in self.states:
+			store.stateIndex(state)
+		for row in self.rows(convert=False):
+			store.append(row)
+		return store
+
+	def rows(self, convert=True):
+		"""
+		Get every record as a tuple of values in field order, as RunStore.rows
+		@param convert: give state names, bools & None for missing floats. Otherwise the stored values
+		@type convert: bool
+		@rtype: generator
+		"""
+		records = self.records()
+		columns = []
+		for name, kind in self.fields.items():
+			values = records[name].tolist()
+			if convert and kind == FLOAT:
+				values = [None if value != value else value for value in values]
+			elif convert and kind == BOOL:
+				values = [bool(value) for value in values]
+			elif kind == STATE:
+				values = [self.states[value] for value in values]
+			columns.append(values)
+		return zip(*columns)
+
+	def close(self):
+		try:
+			self._mmap.close()
+		except (AttributeError, BufferError):
+			# Not mapped yet, or numpy views still reference the map - let it close on garbage collection
+			pass
+		self._file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		self.close()
+
+
+def ArchiveToCsv(archivePath, csvPath=None):
+	"""
+	Convert an archive to the data CSV & config JSON saved after a run
+	@param archivePath: run archive path
+	@type archivePath: str
+	@param csvPath: (Optional) data CSV to write. The config is written next to it. Default: the archive path, as .csv
+	@type csvPath: str
+	@return: number of records converted
+	@rtype: int
+	"""
+	csvPath = csvPath or os.path.splitext(archivePath)[0] + ".csv"
+	with RunArchive(archivePath) as archive:
+		with open(csvPath, 'w', newline="") as ouf:
+			writer = csv.writer(ouf)
+			writer.writerow(archive.header)
+			writer.writerows(archive.rows())
+		config = archive.config
+		count = len(archive)
+	if config is not None:
+		with open(os.path.splitext(csvPath)[0] + ".json", 'w') as oup:
+			json.dump(config, oup, indent=2)
+	return count
+
+
+def ReadDataCsv(csvPath):
+	"""
+	Read a data CSV saved after a run
+	@param csvPath: data CSV path
+	@type csvPath: str
+	@rtype: RunStore
+	"""
+	with open(csvPath, 'r', newline="") as inf:
+		reader = csv.reader(inf)
+		store = RunStore.FromHeader(next(reader))
+		converters = [
+			{
+				FLOAT: lambda value: float(value) if value != '' else None,
+				BOOL: lambda value: value in ['True', '1', '1.0'],
+				STATE: str,
+			}[kind]
+			for kind in store.fields.values()
+		]
+		for row in reader:
+			store.append([converter(value) for converter, value in zip(converters, row)])
+	return store
+
+
+def CsvToArchive(csvPath, archivePath=None, configPath=None):
+	"""
+	Convert a data CSV & its config JSON to an archive
+	@param csvPath: data CSV path
+	@type csvPath: str
+	@param archivePath: (Optional) archive to write. Default: the CSV path, with the archive extension
+	@type archivePath: str
+	@param configPath: (Optional) config JSON of the run. Default: the JSON next to the CSV, if any
+	@type configPath: str
+	@return: number of records converted
+	@rtype: int
+	"""
+	archivePath = archivePath or os.path.splitext(csvPath)[0] + EXTENSION
+	configPath = configPath or os.path.splitext(csvPath)[0] + ".json"
+	config = None
+	if os.path.exists(configPath):
+		with open(configPath, 'r') as inf:
+			config = json.load(inf, object_pairs_hook=OrderedDict)
+	store = ReadDataCsv(csvPath)
+	WriteRunArchive(archivePath, store, config)
+	return len(store)
+
+
+def parseArgs(argv=None):
+	parser = argparse.ArgumentParser(description="Convert run archives to data CSV & config JSON, or back")
+	parser.add_argument("path", help="run archive to convert to CSV, or data CSV (with its JSON alongside) to archive")
+	parser.add_argument("--output", metavar="PATH", help="file to write. Default: next to the input")
+	return parser.parse_args(argv)
+
+
+def main(argv=None):
+	args = parseArgs(argv)
+	if args.path.lower().endswith(".csv"):
+		outputPath = args.output or os.path.splitext(args.path)[0] + EXTENSION
+		count = CsvToArchive(args.path, outputPath)
+	else:
+		outputPath = args.output or os.path.splitext(args.path)[0] + ".csv"
+		count = ArchiveToCsv(args.path, outputPath)
+	print("Converted {} records to {}".format(count, outputPath))
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
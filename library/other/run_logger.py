@@ -0,0 +1,204 @@
+"""
+Crash-safe streaming log of a run - every data record is appended to disk while the run goes on, so a crash or power
+cut mid-reflow keeps the trace up to the last flush
+
+A run log is a data CSV preceded by comment lines holding a snapshot of the config:
+	# Toasting run log
+	# config: {...}
+	Timestamp,Temperature,...
+Recover a log that was cut short into the usual data CSV & config JSON with
+	python -m library.other.run_logger data/toast_run_20240101_120000.log
+"""
+import os
+import sys
+import csv
+import json
+import time
+import logging
+import argparse
+from collections import deque, OrderedDict
+from threading import Thread, Event
+
+from library.other.setupLogging import getLogger
+from definitions import GetDataFilePath
+
+LOG_TITLE = "# Toasting run log\n"
+CONFIG_PREFIX = "# config: "
+
+
+def GetDefaultRunLogPath():
+	"""
+	@return: path for the log of a run starting now
+	@rtype: str
+	"""
+	return GetDataFilePath(time.strftime("toast_run_%Y%m%d_%H%M%S.log"))
+
+
+class RunLogWriter(Thread):
+	"""
+	Appends data records to a run log from its own thread. log() only queues the record - no file I/O or locking - so
+	it is safe to call from the control loop. The writer wakes every flush interval, writes all queued records and
+	flushes them through to the disk
+	"""
+	def __init__(self, logPath, header, config=None, flushInterval=1.0, debugLevel=logging.INFO):
+		"""
+		Constructor
+		@param logPath: path to write the log to - overwritten if it exists
+		@type logPath: str
+		@param header: data column names
+		@type header: list[str]
+		@param config: (Optional) config to snapshot in the log header
+		@type config: dict
+		@param flushInterval: seconds between writes to disk - at most this much of the run is lost in a crash
+		@type flushInterval: float
+		@param debugLevel: logging level
+		@type debugLevel: int
+		"""
+		super(RunLogWriter, self).__init__(name='RunLogWriter')
+		self.daemon = True
+
+		self.logger = getLogger('RunLogWriter', debugLevel)
+
+		self.logPath = logPath
+		self.header = list(header)
+		# Serialized now - the config may be edited while the run goes on
+		self.configJson = json.dumps(config)
+		self.flushInterval = flushInterval
+
+		# deque appends & pops are atomic, so the control loop never waits on the writer
+		self._pending = deque()
+		self._closeEvent = Event()
+		self.recordsWritten = 0
+		self.error = None
+
+	def log(self, values):
+		"""
+		Queue a data record for writing. Never blocks. Records logged after close are dropped
+		@param values: record values in header order
+		@type values: list or tuple
+		"""
+		if self.error is None and not self._closeEvent.is_set():
+			self._pending.append(tuple(values))
+
+	def close(self):
+		"""
+		Ask the writer to write what's queued & close the log. Returns straight away - join() to wait for it
+		"""
+		self._closeEvent.set()
+
+	@property
+	def closed(self):
+		"""
+		@return: True once close has been called
+		@rtype: bool
+		"""
+		return self._closeEvent.is_set()
+
+	def run(self):
+		try:
+			with open(self.logPath, 'w', newline="") as ouf:
+				writer = csv.writer(ouf, lineterminator="\n")
+				ouf.write(LOG_TITLE)
+				ouf.write(CONFIG_PREFIX + self.configJson + "\n")
+				writer.writerow(self.header)
+				self.sync(ouf)
+
+				closing = False
+				while not closing:
+					closing = self._closeEvent.wait(self.flushInterval)
+					self.writePending(writer)
+					self.sync(ouf)
+		except Exception as e:
+			self.error = e
+			self._pending.clear()
+			self.logger.exception("Failed to write run log {} - logging stopped".format(self.logPath))
+
+	def writePending(self, writer):
+		"""
+		Write every queued record
+		@param writer: CSV writer of the log
+		@type writer: csv.writer
+		"""
+		pending = self._pending
+		rows = []
+		while pending:
+			rows.append(pending.popleft())
+		if rows:
+			writer.writerows(rows)
+			self.recordsWritten += len(rows)
+
+	@staticmethod
+	def sync(ouf):
+		"""
+		Push everything written so far through to the disk
+		@param ouf: open log file
+		"""
+		ouf.flush()
+		os.fsync(ouf.fileno())
+
+
+def ReadRunLog(logPath):
+	"""
+	Read a run log, dropping a last record that was cut off mid-line
+	@param logPath: path to run log
+	@type logPath: str
+	@return: tuple of config snapshot (None if missing), column names, records as lists of strings
+	@rtype: tuple[OrderedDict, list[str], list[list[str]]]
+	"""
+	with open(logPath, 'r', newline="") as inf:
+		lines = inf.read().split("\n")
+	# Everything after the last newline is a partial line (or nothing)
+	lines.pop()
+
+	config = None
+	while lines and lines[0].startswith("#"):
+		line = lines.pop(0)
+		if line.startswith(CONFIG_PREFIX):
+			config = json.loads(line[len(CONFIG_PREFIX):], object_pairs_hook=OrderedDict)
+	if not lines:
+		raise Exception("No data header in run log {}".format(logPath))
+
+	rows = list(csv.reader(lines))
+	header = rows.pop(0)
+	return config, header, [row for row in rows if len(row) == len(header)]
+
+
+def RecoverRunLog(logPath, csvPath=None):
+	"""
+	Turn a run log - complete or cut short - into a data CSV & config JSON, as saved after a run
+	@param logPath: path to run log
+	@type logPath: str
+	@param csvPath: (Optional) data CSV to write. The config is written next to it. Default: the log path, as .csv
+	@type csvPath: str
+	@return: number of records recovered
+	@rtype: int
+	"""
+	config, header, rows = ReadRunLog(logPath)
+	csvPath = csvPath or os.path.splitext(logPath)[0] + ".csv"
+	with open(csvPath, 'w', newline="") as ouf:
+		writer = csv.writer(ouf)
+		writer.writerow(header)
+		writer.writerows(rows)
+	if config is not None:
+		with open(os.path.splitext(csvPath)[0] + ".json", 'w') as oup:
+			json.dump(config, oup, indent=2)
+	return len(rows)
+
+
+def parseArgs(argv=None):
+	parser = argparse.ArgumentParser(description="Recover the data CSV & config of a run from its run log")
+	parser.add_argument("log", help="run log to recover")
+	parser.add_argument("--output", metavar="CSV", help="data CSV to write - the config goes next to it. Default: next to the log")
+	return parser.parse_args(argv)
+
+
+def main(argv=None):
+	args = parseArgs(argv)
+	csvPath = args.output or os.path.splitext(args.log)[0] + ".csv"
+	count = RecoverRunLog(args.log, csvPath)
+	print("Recovered {} records to {}".format(count, csvPath))
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
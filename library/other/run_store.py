@@ -0,0 +1,215 @@
+"""
+Columnar store for the data records of a run
+
+Each field is a typed array - float64, or uint8 for flags & the index of the state name in a small table - so a record
+costs a few bytes per field instead of a dict. Arrays are preallocated and grow in chunks, doubling, so appends are
+O(1) amortized. Reads as a list of dict records for compatibility, or as zero-copy numpy arrays per field.
+"""
+from array import array
+from collections import OrderedDict
+
+# Field kinds
+FLOAT = 'float'
+BOOL = 'bool'
+STATE = 'state'
+
+# array typecode & numpy dtype of each kind
+TYPECODES = {FLOAT: 'd', BOOL: 'B', STATE: 'B'}
+DTYPES = {FLOAT: '<f8', BOOL: 'u1', STATE: 'u1'}
+
+# Kinds of the run data columns that aren't floats - see ToastStateMachine.dataHeader
+DATA_KINDS = {'State': STATE, 'Relay State': BOOL}
+
+NAN = float('nan')
+
+
+class RunStore(object):
+	"""
+	Append-only columnar run data. Behaves like the list of dict records it replaces - len(), indexing, slicing,
+	iteration & comparison give dicts with the same keys & values (None for missing floats).
+	For analysis, column() returns a numpy view of a field without copying
+	"""
+	def __init__(self, fields, capacity=1024):
+		"""
+		Constructor
+		@param fields: ordered field name to kind - FLOAT, BOOL or STATE
+		@type fields: OrderedDict
+		@param capacity: records to preallocate
+		@type capacity: int
+		"""
+		super(RunStore, self).__init__()
+		for name, kind in fields.items():
+			assert kind in TYPECODES, "Unknown kind of field {}: {}".format(name, kind)
+		self.fields = OrderedDict(fields)
+		self._capacity = max(1, int(capacity))
+		self._count = 0
+		self._columns = OrderedDict(
+			(name, array(TYPECODES[kind], bytes(self._capacity * array(TYPECODES[kind]).itemsize)))
+			for name, kind in self.fields.items()
+		)
+		# State names, indexed by the STATE fields
+		self._states = []
+		self._stateIndices = {}
+
+	@classmethod
+	def FromHeader(cls, header, capacity=1024):
+		"""
+		Create an empty store for run data columns - floats, apart from the state & relay state
+		@param header: column names, e.g. ToastStateMachine.dataHeader
+		@type header: list[str]
+		@param capacity: records to preallocate
+		@type capacity: int
+		@rtype: RunStore
+		"""
+		return cls(OrderedDict((name, DATA_KINDS.get(name, FLOAT)) for name in header), capacity=capacity)
+
+	# region Append
+
+	def _grow(self):
+		"""
+		Double the capacity. Fresh arrays are allocated rather than resized, so numpy views already handed out stay valid
+		(without the records appended from now on)
+		"""
+		capacity = self._capacity * 2
+		for name, column in self._columns.items():
+			grown = array(column.typecode, bytes(capacity * column.itemsize))
+			grown[:self._count] = column[:self._count]
+			self._columns[name] = grown
+		self._capacity = capacity
+
+	def stateIndex(self, state):
+		"""
+		Index of a state name in the state table, adding it if it's new
+		@param state: state name
+		@type state: str
+		@rtype: int
+		"""
+		index = self._stateIndices.get(state)
+		if index is None:
+			assert len(self._states) < 256, "Run store holds at most 256 state names"
+			index = len(self._states)
+			self._states.append(state)
+			self._stateIndices[state] = index
+		return index
+
+	def append(self, values):
+		"""
+		Add a record
+		@param values: values in field order, or a dict of field name to value. Missing floats can be None
+		@type values: list or tuple or dict
+		"""
+		if isinstance(values, dict):
+			values = [values.get(name) for name in self.fields]
+		if self._count == self._capacity:
+			self._grow()
+
+		index = self._count
+		for (name, kind), column, value in zip(self.fields.items(), self._columns.values(), values):
+			if kind == FLOAT:
+				column[index] = NAN if value is None else value
+			elif kind == BOOL:
+				column[index] = 1 if value else 0
+			else:
+				column[index] = self.stateIndex(value)
+		self._count = index + 1
+
+	def clear(self):
+		"""
+		Drop all records, keeping the allocated capacity
+		"""
+		self._count = 0
+
+	# endregion Append
+	# region Records
+
+	def __len__(self):
+		return self._count
+
+	def __bool__(self):
+		return self._count > 0
+
+	def _value(self, kind, value):
+		if kind == FLOAT:
+			return None if value != value else value
+		if kind == BOOL:
+			return bool(value)
+		return self._states[value]
+
+	def record(self, index):
+		"""
+		Get a record as a dict, like the state machine used to store
+		@param index: record index - negative counts from the end
+		@type index: int
+		@rtype: dict
+		"""
+		if index < 0:
+			index += self._count
+		if not 0 <= index < self._count:
+			raise IndexError("Run store index out of range")
+		return {
+			name: self._value(kind, column[index])
+			for (name, kind), column in zip(self.fields.items(), self._columns.values())
+		}
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return [self.record(i) for i in range(*index.indices(self._count))]
+		return self.record(index)
+
+	def __iter__(self):
+		for index in range(self._count):
+			yield self.record(index)
+
+	def __eq__(self, other):
+		if isinstance(other, (RunStore, list)):
+			return len(self) == len(other) and all(mine == theirs for mine, theirs in zip(self, other))
+		return NotImplemented
+
+	def rows(self):
+		"""
+		Get every record as a tuple of values in field order - cheaper than dicts, e.g. for writing CSV
+		@rtype: generator
+		"""
+		fields = list(zip(self.fields.values(), self._columns.values()))
+		for index in range(self._count):
+			yield tuple(self._value(kind, column[index]) for kind, column in fields)
+
+	# endregion Records
+	# region Columns
+
+	@property
+	def states(self):
+		"""
+		State name table - STATE fields hold indices into it
+		@rtype: list[str]
+		"""
+		return list(self._states)
+
+	def column(self, name):
+		"""
+		Get a field as a numpy array sharing the store's memory - no copy. STATE fields are indices into states.
+		Views don't see records appended after the store next grows
+		@param name: field name
+		@type name: str
+		@rtype: numpy.ndarray
+		"""
+		# Imported here - numpy stays off the control loop's import path
+		import numpy as np
+		return np.frombuffer(self._columns[name], dtype=DTYPES[self.fields[name]], count=self._count)
+
+	def columns(self):
+		"""
+		Get every field as a numpy view
+		@rtype: OrderedDict
+		"""
+		return OrderedDict((name, self.column(name)) for name in self.fields)
+
+	@property
+	def nbytes(self):
+		"""
+		Memory allocated for the records
+		@rtype: int
+		"""
+		return sum(column.itemsize * len(column) for column in self._columns.values())
+
+	# endregion Columns
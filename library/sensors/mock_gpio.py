@@ -7,6 +7,9 @@ BCM = 'bcm'
 
 global STATE
 
+# Callbacks fired on every output() call - used by library.simulation to watch the relay
+OUTPUT_LISTENERS = []
+
 
 def setmode(mode):
 	pass
@@ -21,6 +24,28 @@ def setup(pin, type, initial=LOW):
 def output(pin, direction):
 	global STATE
 	STATE = direction
+	for listener in list(OUTPUT_LISTENERS):
+		listener(pin, direction)
+
+
+def addOutputListener(listener):
+	"""
+	Register a callback for output() calls
+	@param listener: callable taking (pin, value)
+	@type listener: func
+	"""
+	if listener not in OUTPUT_LISTENERS:
+		OUTPUT_LISTENERS.append(listener)
+
+
+def removeOutputListener(listener):
+	"""
+	Unregister an output() callback
+	@param listener: previously registered callable
+	@type listener: func
+	"""
+	if listener in OUTPUT_LISTENERS:
+		OUTPUT_LISTENERS.remove(listener)
 
 
 def cleanup(pin):
@@ -1,5 +1,19 @@
 from random import randint
 
+# Optional callable taking the CS pin (device) and returning the frame bytes xfer should produce
+# Used by library.simulation to feed simulated temperatures to the thermocouple
+FRAME_SOURCE = None
+
+
+def setFrameSource(frameSource):
+	"""
+	Set (or clear with None) the source of frames returned by SpiDev.xfer
+	@param frameSource: callable taking the CS pin and returning a list of 4 byte values
+	@type frameSource: func
+	"""
+	global FRAME_SOURCE
+	FRAME_SOURCE = frameSource
+
 
 class SpiDev(object):
 	def __init__(self):
@@ -10,9 +24,12 @@ class SpiDev(object):
 		self.bits_per_word = 8
 		self.lsbfirst = False
 		self.mode = 0
+		self.bus = None
+		self.device = None
 
 	def open(self, bus, device):
-		pass
+		self.bus = bus
+		self.device = device
 
 	def close(self):
 		pass
@@ -20,4 +37,50 @@ class SpiDev(object):
 	def xfer(self, bytes):
 		# for x in range(0, len(bytes)):
 		# 	bytes[x] = randint(0, 255)
+		if FRAME_SOURCE:
+			return FRAME_SOURCE(self.device)
 		return [0] * len(bytes)
+
+
+class ReplaySpiDev(SpiDev):
+	"""
+	SpiDev that streams frames from a capture file (see library.sensors.spi_capture), one frame per xfer
+	"""
+	def __init__(self, reader, csPin=0, loop=False):
+		"""
+		Constructor
+		@param reader: open capture file
+		@type reader: library.sensors.spi_capture.SpiCaptureReader
+		@param csPin: chip select whose frames are replayed
+		@type csPin: int
+		@param loop: start over at the end of the capture instead of holding the last frame
+		@type loop: bool
+		"""
+		super(ReplaySpiDev, self).__init__()
+		self.reader = reader
+		self.loop = loop
+		self.indices = reader.indicesForPin(csPin)
+		self.position = 0
+
+	@property
+	def exhausted(self):
+		"""
+		Whether every captured frame has been replayed
+		@rtype: bool
+		"""
+		return self.position >= len(self.indices)
+
+	def xfer(self, bytes):
+		if not self.indices:
+			return [0] * len(bytes)
+
+		if self.exhausted:
+			if self.loop:
+				self.position = 0
+			else:
+				# Hold the last frame
+				return self.reader.frameBytes(self.indices[-1])
+
+		frame = self.reader.frameBytes(self.indices[self.position])
+		self.position += 1
+		return frame
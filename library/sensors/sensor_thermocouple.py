@@ -1,3 +1,4 @@
+import math
 import logging
 
 from library.other.setupLogging import getLogger
@@ -55,7 +56,19 @@ class Thermocouple(object):
 	# set MSB first (only way RPi can transfer)
 	SPI_LSB_FIRST = False
 
-	def __init__(self, csPin=0, units='celsius', debugLevel=logging.INFO):
+	def __init__(self, csPin=0, units='celsius', spiFactory=None, debugLevel=logging.INFO):
+		"""
+		Constructor
+		@param csPin: SPI chip select pin
+		@type csPin: int or str
+		@param units: temperature units
+		@type units: str
+		@param spiFactory: (Optional) callable taking the CS pin and returning an SpiDev-like object.
+			Default: spidev.SpiDev. See library.sensors.spi_capture for capture/replay devices
+		@type spiFactory: func
+		@param debugLevel: logging level
+		@type debugLevel: int
+		"""
 		super(Thermocouple, self).__init__()
 
 		self.logger = getLogger('Thermocouple', debugLevel)
@@ -68,6 +81,7 @@ class Thermocouple(object):
 
 		self.spi = None
 		self._csPin = -1
+		self._spiFactory = spiFactory or self.DefaultSpiFactory
 
 		# Use setter for csPin to set new pin & call init
 		self.csPin = csPin
@@ -80,6 +94,14 @@ class Thermocouple(object):
 	def refTemperature(self):
 		return self._refTemp if self.units == 'celsius' else self.ConvertCelsiusToFahrenheit(self._refTemp)
 
+	@property
+	def temperatureCelsius(self):
+		return self._temp
+
+	@property
+	def refTemperatureCelsius(self):
+		return self._refTemp
+
 	@property
 	def units(self):
 		return self._units
@@ -113,6 +135,31 @@ class Thermocouple(object):
 		self._csPin = pin
 		self.init()
 
+	@property
+	def spiFactory(self):
+		return self._spiFactory
+
+	@spiFactory.setter
+	def spiFactory(self, spiFactory):
+		"""
+		Swap the SPI device factory, e.g. to start capturing or replaying frames. Re-initializes SPI
+		@param spiFactory: callable taking the CS pin and returning an SpiDev-like object. None for the default
+		@type spiFactory: func
+		"""
+		self.cleanup()
+		self._spiFactory = spiFactory or self.DefaultSpiFactory
+		self.init()
+
+	@staticmethod
+	def DefaultSpiFactory(csPin):
+		"""
+		Create a standard SpiDev (or the mock if spidev isn't available)
+		@param csPin: SPI chip select pin (unused - the pin is selected in init())
+		@type csPin: int
+		@rtype: spidev.SpiDev
+		"""
+		return spidev.SpiDev()
+
 	@staticmethod
 	def CheckSPICSPin(pin):
 		"""
@@ -132,7 +179,7 @@ class Thermocouple(object):
 		"""
 		Initialize SPI interface
 		"""
-		self.spi = spidev.SpiDev()
+		self.spi = self.spiFactory(self.csPin)
 		self.spi.open(bus=self.SPI_BUS, device=self.csPin)
 		self.spi.max_speed_hz = self.SPI_CLK_FREQ
 		self.spi.cshigh = self.SPI_CS_LOGIC_HIGH
@@ -246,6 +293,51 @@ class Thermocouple(object):
 		# Scale value: LSB = 2^(-4) (0.0625 degrees Celsius)
 		return refTemp * 0.0625
 
+	# Frame bits set by each fault code of library.sensors.thermocouple_decoder - the fault flag plus the fault's bit
+	FRAME_FAULT_BITS = {
+		0: 0x00000,		# FAULT_NONE
+		1: 0x10001,		# FAULT_NO_TC
+		2: 0x10002,		# FAULT_GND_SHORT
+		3: 0x10004,		# FAULT_VCC_SHORT
+		4: 0x00008,		# FAULT_DUMMY_BITS
+	}
+
+	@staticmethod
+	def EncodeFrame(celsius, refCelsius=25.0, fault=0):
+		"""
+		Build the 4 bytes a MAX31855 would shift out for the given temperatures - the inverse of read()
+		Values are truncated to the resolution of the device (0.25C thermocouple, 0.0625C reference).
+		Plain Python, so encoding one frame per simulated read stays cheap - thermocouple_decoder.EncodeFrames runs
+		it over arrays
+		@param celsius: thermocouple temperature in Celsius
+		@type celsius: float
+		@param refCelsius: reference temperature in Celsius
+		@type refCelsius: float
+		@param fault: fault code to encode - see library.sensors.thermocouple_decoder
+		@type fault: int
+		@return: list of four byte values, MSB first
+		@rtype: list[int]
+		"""
+		# 14 bit and 12 bit two's complement, clamped to the device range
+		tc = min(max(int(math.floor(celsius / 0.25)), -0x2000), 0x1FFF) & 0x3FFF
+		ref = min(max(int(math.floor(refCelsius / 0.0625)), -0x800), 0x7FF) & 0xFFF
+		frame = (tc << 18) | (ref << 4) | Thermocouple.FRAME_FAULT_BITS[int(fault)]
+		return [(frame >> 24) & 0xFF, (frame >> 16) & 0xFF, (frame >> 8) & 0xFF, frame & 0xFF]
+
+	@staticmethod
+	def DecodeFrames(frames):
+		"""
+		Decode many raw SPI frames at once. Vectorized equivalent of read() without the SPI transfer
+		See library.sensors.thermocouple_decoder for details
+		@param frames: raw frames - uint32 array, or uint8 array/bytes with 4 bytes per frame
+		@type frames: bytes or numpy.ndarray
+		@return: tuple of thermocouple temperatures (C), reference temperatures (C), and fault codes
+		@rtype: tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+		"""
+		# Imported here so the single-read path doesn't pay for numpy
+		from library.sensors.thermocouple_decoder import DecodeFrames
+		return DecodeFrames(frames)
+
 	@staticmethod
 	def CalculateThermocoupleTemperature(spiReadResult):
 		"""
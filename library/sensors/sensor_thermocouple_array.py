@@ -0,0 +1,221 @@
+import logging
+
+from library.other.setupLogging import getLogger
+from library.sensors.sensor_thermocouple import Thermocouple
+
+
+class ThermocoupleArray(object):
+	"""
+	Several MAX31855 thermocouples, one per SPI chip select, read together and fused into one temperature
+	Exposes the same read()/temperature/refTemperature/units interface as Thermocouple
+
+	Fusion methods:
+	- average: mean of all probes that read successfully
+	- max: hottest probe that read successfully
+	- board: board-vs-air - the first probe is on the board and drives the control loop, the others measure
+		air temperature and are only logged. Falls back to the air probes if the board probe faults
+	"""
+	FUSION_METHODS = ['average', 'max', 'board']
+
+	def __init__(self, csPins=(0, 1), fusion='average', units='celsius', spiFactory=None, debugLevel=logging.INFO):
+		"""
+		Constructor
+		@param csPins: SPI chip select pins, one per probe. The first is the primary (board) probe
+		@type csPins: list[int or str]
+		@param fusion: how to combine probe readings - see FUSION_METHODS
+		@type fusion: str
+		@param units: temperature units
+		@type units: str
+		@param spiFactory: (Optional) SPI device factory passed to every probe - see Thermocouple
+		@type spiFactory: func
+		@param debugLevel: logging level
+		@type debugLevel: int
+		"""
+		super(ThermocoupleArray, self).__init__()
+
+		self.logger = getLogger('ThermocoupleArray', debugLevel)
+		self.debugLevel = debugLevel
+		self.spiFactory = spiFactory
+
+		self._fusion = None
+		self.fusion = fusion
+
+		self._units = Thermocouple.CheckUnits(units)
+
+		self.thermocouples = []
+		""" @type: list[Thermocouple] """
+
+		# Latest results, one per probe. Temperatures are None for probes that failed the last read
+		self.probeTemperatures = []
+		self.probeErrors = []
+
+		# Fused values
+		self._temp = 0.0
+		self._refTemp = 0.0
+
+		self.csPins = csPins
+
+	# region Properties
+
+	@property
+	def csPins(self):
+		"""
+		@rtype: list[int]
+		"""
+		return [thermocouple.csPin for thermocouple in self.thermocouples]
+
+	@csPins.setter
+	def csPins(self, csPins):
+		"""
+		Set new chip select pins. Probes are only re-created if the pins changed
+		@param csPins: SPI chip select pins, one per probe
+		@type csPins: list[int or str]
+		"""
+		csPins = [Thermocouple.CheckSPICSPin(pin) for pin in csPins]
+		assert csPins, "At least one SPI CS pin is required"
+		assert len(set(csPins)) == len(csPins), "SPI CS pins must be unique: {}".format(csPins)
+
+		if csPins == self.csPins:
+			return
+
+		self.cleanup()
+		self.thermocouples = [
+			Thermocouple(pin, units=self.units, spiFactory=self.spiFactory, debugLevel=self.debugLevel) for pin in csPins
+		]
+		self.probeTemperatures = [None] * len(csPins)
+		self.probeErrors = [None] * len(csPins)
+
+	@property
+	def csPin(self):
+		"""
+		Chip select pin of the primary probe
+		@rtype: int
+		"""
+		return self.thermocouples[0].csPin
+
+	@csPin.setter
+	def csPin(self, pin):
+		"""
+		Make the given pin the primary probe, keeping the other probes
+		@param pin: SPI chip select pin
+		@type pin: int or str
+		"""
+		pin = Thermocouple.CheckSPICSPin(pin)
+		others = [otherPin for otherPin in self.csPins if otherPin != pin]
+		self.csPins = [pin] + others
+
+	@property
+	def fusion(self):
+		"""
+		@rtype: str
+		"""
+		return self._fusion
+
+	@fusion.setter
+	def fusion(self, fusion):
+		assert fusion in self.FUSION_METHODS, "Thermocouple fusion must be one of the following: {}".format(
+			", ".join(self.FUSION_METHODS)
+		)
+		self._fusion = fusion
+
+	@property
+	def units(self):
+		return self._units
+
+	@units.setter
+	def units(self, units):
+		self._units = Thermocouple.CheckUnits(units)
+		for thermocouple in self.thermocouples:
+			thermocouple.units = self._units
+
+	@property
+	def temperature(self):
+		return self._temp if self.units == 'celsius' else Thermocouple.ConvertCelsiusToFahrenheit(self._temp)
+
+	@property
+	def refTemperature(self):
+		return self._refTemp if self.units == 'celsius' else Thermocouple.ConvertCelsiusToFahrenheit(self._refTemp)
+
+	# endregion Properties
+	# region Reading
+
+	def read(self):
+		"""
+		Read every probe in one pass and fuse the results
+		A probe fault only raises if no probe could be read
+		@return: fused temperature in currently configured units
+		@rtype: float
+		"""
+		temperatures = []
+		refTemperatures = []
+		for i, thermocouple in enumerate(self.thermocouples):
+			try:
+				thermocouple.read()
+				# Fuse in celsius so a units change doesn't leave stale fused values
+				temperatures.append(thermocouple.temperatureCelsius)
+				refTemperatures.append(thermocouple.refTemperatureCelsius)
+				self.probeTemperatures[i] = thermocouple.temperature
+				self.probeErrors[i] = None
+			except Exception as e:
+				temperatures.append(None)
+				self.probeTemperatures[i] = None
+				self.probeErrors[i] = e
+				self.logger.debug("CS{} read error: {}".format(thermocouple.csPin, e))
+
+		valid = [temperature for temperature in temperatures if temperature is not None]
+		if not valid:
+			# Every probe faulted - report the primary probe's fault
+			raise self.probeErrors[0]
+
+		self._temp = self.Fuse(temperatures, self.fusion)
+		self._refTemp = sum(refTemperatures) / len(refTemperatures)
+		return self.temperature
+
+	@staticmethod
+	def Fuse(temperatures, fusion):
+		"""
+		Combine probe temperatures. None entries (failed reads) are ignored
+		@param temperatures: temperature per probe, primary probe first
+		@type temperatures: list[float or None]
+		@param fusion: fusion method - see FUSION_METHODS
+		@type fusion: str
+		@return: fused temperature
+		@rtype: float
+		"""
+		valid = [temperature for temperature in temperatures if temperature is not None]
+		if fusion == 'max':
+			return max(valid)
+		if fusion == 'board' and temperatures[0] is not None:
+			return temperatures[0]
+		# 'average', or 'board' with a faulted board probe
+		return sum(valid) / len(valid)
+
+	def getProbeData(self):
+		"""
+		Get the latest per-probe temperatures keyed for data logging
+		@return: dict of column name to temperature (None if the probe faulted)
+		@rtype: dict[str, float]
+		"""
+		return {
+			self.GetProbeKey(thermocouple.csPin): temperature
+			for thermocouple, temperature in zip(self.thermocouples, self.probeTemperatures)
+		}
+
+	@staticmethod
+	def GetProbeKey(csPin):
+		"""
+		Data column name for a probe
+		@param csPin: probe SPI CS pin
+		@type csPin: int
+		@rtype: str
+		"""
+		return 'Temperature CS{}'.format(csPin)
+
+	# endregion Reading
+
+	def cleanup(self):
+		"""
+		Close every probe's SPI interface
+		"""
+		for thermocouple in self.thermocouples:
+			thermocouple.cleanup()
@@ -0,0 +1,249 @@
+"""
+Record raw SPI frames from real hardware and stream them back later
+
+Capture file layout (little-endian):
+	header:  8s magic, uint16 version, uint16 record size, uint32 reserved
+	records: float64 seconds since capture start, uint8 CS pin, 3 pad bytes, 4 raw frame bytes (as shifted, MSB first)
+"""
+import os
+import mmap
+import time
+import struct
+from threading import Lock
+
+MAGIC = b'TOASTSPI'
+VERSION = 1
+
+HEADER = struct.Struct('<8sHHI')
+RECORD = struct.Struct('<dB3x4s')
+
+# numpy equivalent of RECORD - frames stay big-endian so they match Thermocouple.ByteListToInteger
+RECORD_DTYPE = [('timestamp', '<f8'), ('csPin', 'u1'), ('pad', 'V3'), ('frame', '>u4')]
+
+
+class SpiCaptureError(Exception):
+	pass
+
+
+class SpiCaptureWriter(object):
+	"""
+	Append-only writer for SPI capture files. Safe to share between devices/threads
+	"""
+	def __init__(self, path):
+		"""
+		Constructor - creates (or truncates) the capture file and writes the header
+		@param path: capture file path
+		@type path: str
+		"""
+		super(SpiCaptureWriter, self).__init__()
+		self.path = path
+		self._lock = Lock()
+		self._startTime = time.monotonic()
+		self._file = open(path, 'wb')
+		self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, 0))
+
+	def write(self, csPin, frameBytes, timestamp=None):
+		"""
+		Append one frame
+		@param csPin: SPI chip select the frame was read from
+		@type csPin: int
+		@param frameBytes: the 4 bytes returned by SpiDev.xfer
+		@type frameBytes: list[int] or bytes
+		@param timestamp: (Optional) seconds since capture start. Default: measured now
+		@type timestamp: float
+		"""
+		if timestamp is None:
+			timestamp = time.monotonic() - self._startTime
+		record = RECORD.pack(timestamp, csPin, bytes(frameBytes))
+		with self._lock:
+			self._file.write(record)
+
+	def flush(self):
+		with self._lock:
+			self._file.flush()
+
+	def close(self):
+		with self._lock:
+			if not self._file.closed:
+				self._file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		self.close()
+
+
+class SpiCaptureReader(object):
+	"""
+	Memory-mapped reader for SPI capture files. Records are read straight out of the page cache
+	"""
+	def __init__(self, path):
+		"""
+		Constructor
+		@param path: capture file path
+		@type path: str
+		"""
+		super(SpiCaptureReader, self).__init__()
+		self.path = path
+		self._file = open(path, 'rb')
+		size = os.fstat(self._file.fileno()).st_size
+		if size < HEADER.size:
+			self._file.close()
+			raise SpiCaptureError("{} is too small to be an SPI capture".format(path))
+
+		self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, version, recordSize, _ = HEADER.unpack_from(self._mmap, 0)
+		if magic != MAGIC or version != VERSION or recordSize != RECORD.size:
+			self.close()
+			raise SpiCaptureError("{} is not a version {} SPI capture".format(path, VERSION))
+
+		# Ignore a partially written trailing record
+		self._count = (size - HEADER.size) // RECORD.size
+		self._indicesByPin = None
+
+	def __len__(self):
+		return self._count
+
+	def record(self, index):
+		"""
+		Get a single record
+		@param index: record index
+		@type index: int
+		@return: tuple of timestamp, CS pin, frame bytes
+		@rtype: tuple[float, int, bytes]
+		"""
+		if not 0 <= index < self._count:
+			raise IndexError("record index {} out of range".format(index))
+		return RECORD.unpack_from(self._mmap, HEADER.size + index * RECORD.size)
+
+	def frameBytes(self, index):
+		"""
+		Get the raw frame bytes of a record without unpacking the rest of it
+		@param index: record index
+		@type index: int
+		@rtype: list[int]
+		"""
+		offset = HEADER.size + index * RECORD.size + RECORD.size - 4
+		return list(self._mmap[offset:offset + 4])
+
+	def indicesForPin(self, csPin):
+		"""
+		Get the record indices captured from one chip select, in capture order
+		@param csPin: SPI chip select pin
+		@type csPin: int
+		@rtype: list[int]
+		"""
+		if self._indicesByPin is None:
+			self._indicesByPin = {}
+			for index, (_, pin, _) in enumerate(RECORD.iter_unpack(self._mmap[HEADER.size:HEADER.size + self._count * RECORD.size])):
+				self._indicesByPin.setdefault(pin, []).append(index)
+		return self._indicesByPin.get(csPin, [])
+
+	def records(self):
+		"""
+		Get every record as a zero-copy numpy structured array (fields: timestamp, csPin, frame)
+		@rtype: numpy.ndarray
+		"""
+		import numpy as np
+		return np.frombuffer(self._mmap, dtype=np.dtype(RECORD_DTYPE), count=self._count, offset=HEADER.size)
+
+	def close(self):
+		try:
+			self._mmap.close()
+		except (AttributeError, BufferError):
+			# Not mapped yet, or numpy views still reference the map - let it close on garbage collection
+			pass
+		self._file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		self.close()
+
+
+class CapturingSpiDev(object):
+	"""
+	Wraps a real SpiDev and records every frame it returns
+	All attributes (max_speed_hz, mode, etc.) pass through to the wrapped device
+	"""
+	def __init__(self, device, writer, csPin):
+		"""
+		Constructor
+		@param device: the SpiDev to wrap
+		@type device: spidev.SpiDev
+		@param writer: capture file writer
+		@type writer: SpiCaptureWriter
+		@param csPin: chip select the device is opened on
+		@type csPin: int
+		"""
+		object.__setattr__(self, 'device', device)
+		object.__setattr__(self, 'writer', writer)
+		object.__setattr__(self, 'csPin', csPin)
+
+	def __getattr__(self, name):
+		return getattr(self.device, name)
+
+	def __setattr__(self, name, value):
+		setattr(self.device, name, value)
+
+	def xfer(self, bytes):
+		result = self.device.xfer(bytes)
+		self.writer.write(self.csPin, result)
+		return result
+
+	def close(self):
+		self.device.close()
+		self.writer.flush()
+
+
+class CaptureSpiFactory(object):
+	"""
+	SPI device factory for Thermocouple that records everything read from real hardware into one capture file
+	"""
+	def __init__(self, path, deviceFactory=None):
+		"""
+		Constructor
+		@param path: capture file to write
+		@type path: str
+		@param deviceFactory: (Optional) factory for the real devices. Default: Thermocouple.DefaultSpiFactory
+		@type deviceFactory: func
+		"""
+		super(CaptureSpiFactory, self).__init__()
+		if deviceFactory is None:
+			from library.sensors.sensor_thermocouple import Thermocouple
+			deviceFactory = Thermocouple.DefaultSpiFactory
+		self.deviceFactory = deviceFactory
+		self.writer = SpiCaptureWriter(path)
+
+	def __call__(self, csPin):
+		return CapturingSpiDev(self.deviceFactory(csPin), self.writer, csPin)
+
+	def close(self):
+		self.writer.close()
+
+
+class ReplaySpiFactory(object):
+	"""
+	SPI device factory for Thermocouple that replays a capture file instead of touching hardware
+	"""
+	def __init__(self, path, loop=False):
+		"""
+		Constructor
+		@param path: capture file to replay
+		@type path: str
+		@param loop: start over at the end of the capture instead of holding the last frame
+		@type loop: bool
+		"""
+		super(ReplaySpiFactory, self).__init__()
+		self.reader = SpiCaptureReader(path)
+		self.loop = loop
+
+	def __call__(self, csPin):
+		# Imported here - mock_spidev is only the fallback spidev module on non-Pi systems
+		from library.sensors.mock_spidev import ReplaySpiDev
+		return ReplaySpiDev(self.reader, csPin, loop=self.loop)
+
+	def close(self):
+		self.reader.close()
@@ -0,0 +1,162 @@
+import numpy as np
+
+# Fault codes returned by DecodeFrames - one per Thermocouple exception type
+FAULT_NONE = 0
+FAULT_NO_TC = 1			# TCNoTCError
+FAULT_GND_SHORT = 2		# TCGndShortError
+FAULT_VCC_SHORT = 3		# TCVccShortError
+FAULT_DUMMY_BITS = 4	# TCError
+
+FAULT_NAMES = {
+	FAULT_NONE: None,
+	FAULT_NO_TC: 'TCNoTCError',
+	FAULT_GND_SHORT: 'TCGndShortError',
+	FAULT_VCC_SHORT: 'TCVccShortError',
+	FAULT_DUMMY_BITS: 'TCError',
+}
+
+# Frame layout (see doc/MAX31855.pdf)
+TC_SHIFT = 18
+TC_LSB = 0.25
+REF_SHIFT = 4
+REF_MASK = 0xFFF
+REF_SIGN = 0x800
+REF_LSB = 0.0625
+
+
+def FramesFromBytes(buffer):
+	"""
+	Convert raw SPI bytes (4 per frame, MSB first) into an array of 32-bit frames
+	@param buffer: raw bytes, uint8 array of shape (N, 4) or (N * 4,), or an array of uint32 frames
+	@type buffer: bytes or bytearray or memoryview or numpy.ndarray
+	@return: one uint32 per frame
+	@rtype: numpy.ndarray
+	"""
+	if isinstance(buffer, (bytes, bytearray, memoryview)):
+		buffer = np.frombuffer(buffer, dtype=np.uint8)
+	else:
+		buffer = np.asarray(buffer)
+
+	if buffer.dtype == np.uint32:
+		return buffer.ravel()
+
+	if buffer.dtype != np.uint8:
+		raise TypeError("Frame buffer must be uint8 or uint32, got {}".format(buffer.dtype))
+
+	buffer = np.ascontiguousarray(buffer).ravel()
+	if buffer.size % 4:
+		raise ValueError("Frame buffer length must be a multiple of 4 bytes, got {}".format(buffer.size))
+
+	# MAX31855 shifts MSB first - reinterpret as big-endian words, then convert to native order
+	return buffer.view('>u4').astype(np.uint32)
+
+
+def DecodeFaults(frames):
+	"""
+	Vectorized equivalent of Thermocouple.CheckSPIReadForErrors
+	@param frames: uint32 frames
+	@type frames: numpy.ndarray
+	@return: fault code per frame (FAULT_*)
+	@rtype: numpy.ndarray
+	"""
+	frames = np.asarray(frames, dtype=np.uint32)
+	faults = np.zeros(frames.shape, dtype=np.uint8)
+
+	# Fault bit (D16) set - priority order matches the scalar reference
+	faultBit = (frames & 0x10000) != 0
+	noTC = faultBit & ((frames & 0x0001) != 0)
+	gndShort = faultBit & ~noTC & ((frames & 0x0002) != 0)
+	vccShort = faultBit & ~noTC & ~gndShort & ((frames & 0x0004) != 0)
+
+	# Reserved bits (D17, D3) are only checked when the fault bit is clear
+	dummyBits = ~faultBit & ((frames & 0x20008) != 0)
+
+	faults[noTC] = FAULT_NO_TC
+	faults[gndShort] = FAULT_GND_SHORT
+	faults[vccShort] = FAULT_VCC_SHORT
+	faults[dummyBits] = FAULT_DUMMY_BITS
+	return faults
+
+
+def DecodeThermocoupleTemperatures(frames):
+	"""
+	Vectorized equivalent of Thermocouple.CalculateThermocoupleTemperature
+	@param frames: uint32 frames
+	@type frames: numpy.ndarray
+	@return: thermocouple temperatures in Celsius
+	@rtype: numpy.ndarray
+	"""
+	# Arithmetic shift of the signed view sign-extends the 14 bit value for free
+	signed = np.asarray(frames, dtype=np.uint32).view(np.int32)
+	return (signed >> TC_SHIFT) * TC_LSB
+
+
+def DecodeReferenceTemperatures(frames):
+	"""
+	Vectorized equivalent of Thermocouple.CalculateReferenceTemperature
+	@param frames: uint32 frames
+	@type frames: numpy.ndarray
+	@return: reference (cold-junction) temperatures in Celsius
+	@rtype: numpy.ndarray
+	"""
+	raw = (np.asarray(frames, dtype=np.uint32) >> REF_SHIFT) & REF_MASK
+	# Sign extend 12 bit two's complement
+	signed = (raw.astype(np.int32) ^ REF_SIGN) - REF_SIGN
+	return signed * REF_LSB
+
+
+def DecodeFrames(buffer):
+	"""
+	Decode many raw MAX31855 frames in one call
+	Temperatures are decoded for every frame, including faulted ones - mask with faults == FAULT_NONE as needed
+	@param buffer: raw frames - see FramesFromBytes for accepted formats
+	@type buffer: bytes or numpy.ndarray
+	@return: tuple of thermocouple temperatures (C), reference temperatures (C), and fault codes
+	@rtype: tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+	"""
+	frames = FramesFromBytes(buffer)
+	return (
+		DecodeThermocoupleTemperatures(frames),
+		DecodeReferenceTemperatures(frames),
+		DecodeFaults(frames)
+	)
+
+
+def EncodeFrames(temperatures, refTemperatures=25.0, faults=FAULT_NONE):
+	"""
+	Build MAX31855 frames from temperatures - the inverse of DecodeFrames
+	Values are truncated to the resolution of the device (0.25C TC, 0.0625C reference).
+	Frame by frame with Thermocouple.EncodeFrame, so there's one encoder to keep in step with the decoders
+	@param temperatures: thermocouple temperatures in Celsius
+	@type temperatures: float or numpy.ndarray
+	@param refTemperatures: reference temperatures in Celsius
+	@type refTemperatures: float or numpy.ndarray
+	@param faults: fault code(s) to encode
+	@type faults: int or numpy.ndarray
+	@return: uint32 frames
+	@rtype: numpy.ndarray
+	"""
+	# Imported here - the thermocouple module imports this one for its vectorized decoding
+	from library.sensors.sensor_thermocouple import Thermocouple
+
+	temperatures, refTemperatures, faults = np.broadcast_arrays(
+		np.atleast_1d(np.asarray(temperatures, dtype=np.float64)),
+		np.asarray(refTemperatures, dtype=np.float64),
+		np.asarray(faults, dtype=np.uint8)
+	)
+	raw = [
+		Thermocouple.EncodeFrame(temperature, refTemperature, fault)
+		for temperature, refTemperature, fault in zip(temperatures.tolist(), refTemperatures.tolist(), faults.tolist())
+	]
+	return FramesFromBytes(np.array(raw, dtype=np.uint8).reshape(-1, 4))
+
+
+def FramesToBytes(frames):
+	"""
+	Convert 32-bit frames into the raw byte stream the MAX31855 would shift out
+	@param frames: uint32 frames
+	@type frames: numpy.ndarray
+	@return: big-endian bytes, 4 per frame
+	@rtype: bytes
+	"""
+	return np.asarray(frames, dtype=np.uint32).astype('>u4').tobytes()
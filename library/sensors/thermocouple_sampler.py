@@ -0,0 +1,302 @@
+import time
+import logging
+from collections import namedtuple
+from threading import Thread, Event
+
+from library.other.setupLogging import getLogger
+
+# A single thermocouple reading. temperature/refTemperature are None if the read raised
+Sample = namedtuple('Sample', ['timestamp', 'temperature', 'refTemperature', 'error'])
+
+
+class RingBuffer(object):
+	"""
+	Fixed-size ring buffer for a single writer thread and any number of readers
+	The writer stores the item before publishing the new count, so readers never need a lock.
+	Readers asking for more items than (size - items written during the read) may see a newer item
+	in place of an older one - keep the buffer comfortably larger than the windows read from it.
+	"""
+	def __init__(self, size):
+		"""
+		Constructor
+		@param size: number of items to keep
+		@type size: int
+		"""
+		super(RingBuffer, self).__init__()
+		size = int(size)
+		assert size > 0, "Ring buffer size must be > 0"
+		self.size = size
+		self._items = [None] * size
+		self._count = 0
+
+	def __len__(self):
+		return min(self._count, self.size)
+
+	@property
+	def count(self):
+		"""
+		Total number of items ever appended
+		@rtype: int
+		"""
+		return self._count
+
+	@property
+	def latest(self):
+		"""
+		Get the most recently appended item
+		@return: latest item or None if empty
+		"""
+		count = self._count
+		if not count:
+			return None
+		return self._items[(count - 1) % self.size]
+
+	def append(self, item):
+		"""
+		Add an item, overwriting the oldest one if full
+		@param item: item to add
+		"""
+		count = self._count
+		self._items[count % self.size] = item
+		# Publish only after the slot has been written
+		self._count = count + 1
+
+	def last(self, n):
+		"""
+		Get the last n items, oldest first
+		@param n: number of items
+		@type n: int
+		@rtype: list
+		"""
+		count = self._count
+		n = min(int(n), count, self.size)
+		return [self._items[i % self.size] for i in range(count - n, count)]
+
+	def history(self):
+		"""
+		Get every item still in the buffer, oldest first
+		@rtype: list
+		"""
+		return self.last(self.size)
+
+	def clear(self):
+		"""
+		Drop all items
+		"""
+		self._count = 0
+
+
+class ThermocoupleSampler(Thread):
+	"""
+	Reads a thermocouple on a background thread at a fixed rate and caches the results in a ring buffer
+	Exposes the same read()/temperature/refTemperature/units interface as Thermocouple,
+	so it can stand in for one anywhere the control loop reads temperatures.
+	Once started, only the sampling thread writes the buffer - unit changes are handed to it to apply
+	"""
+	FILTER_METHODS = ['mean', 'median']
+
+	# Longest read() waits for the sampling thread's first sample (or first after a unit change), in periods & seconds
+	FIRST_SAMPLE_PERIODS = 5
+	FIRST_SAMPLE_TIMEOUT = 1.0
+
+	def __init__(self, thermocouple, period=0.1, historyLength=600, filterLength=1, filterMethod='median', estimator=None, debugLevel=logging.INFO):
+		"""
+		Constructor
+		@param thermocouple: thermocouple to sample
+		@type thermocouple: library.sensors.sensor_thermocouple.Thermocouple
+		@param period: sampling period in seconds. MAX31855 converts roughly every 100 ms
+		@type period: float
+		@param historyLength: number of samples to keep
+		@type historyLength: int
+		@param filterLength: number of recent samples used for the filtered temperature (1 = no filtering)
+		@type filterLength: int
+		@param filterMethod: 'mean' or 'median'
+		@type filterMethod: str
+		@param estimator: (Optional) estimator updated with every valid sample, at the full sampling rate
+		@type estimator: library.control.estimator.KalmanEstimator
+		@param debugLevel: logging level
+		@type debugLevel: int
+		"""
+		super(ThermocoupleSampler, self).__init__(name='ThermocoupleSampler')
+		self.daemon = True
+
+		self.logger = getLogger('ThermocoupleSampler', debugLevel)
+
+		self.thermocouple = thermocouple
+		self.period = float(period)
+		assert self.period > 0, "Sampling period must be > 0"
+		self.filterLength = max(1, int(filterLength))
+		assert filterMethod in self.FILTER_METHODS, "Filter method must be one of: {}".format(
+			", ".join(self.FILTER_METHODS)
+		)
+		self.filterMethod = filterMethod
+		self.estimator = estimator
+
+		self.buffer = RingBuffer(max(int(historyLength), self.filterLength))
+		self._stopEvent = Event()
+		# Units to switch to, applied by the sampling thread before its next sample
+		self._pendingUnits = None
+
+	# region Thread
+
+	def run(self):
+		"""
+		Sample at a fixed rate until stopped. Deadlines don't accumulate drift - late samples are skipped
+		"""
+		nextSample = time.monotonic()
+		while not self._stopEvent.is_set():
+			self.sample()
+
+			nextSample += self.period
+			wait = nextSample - time.monotonic()
+			if wait < 0:
+				# Fell behind (e.g. slow SPI) - resynchronize rather than bursting to catch up
+				nextSample = time.monotonic()
+				wait = 0
+			self._stopEvent.wait(wait)
+
+	def stop(self, timeout=1.0):
+		"""
+		Stop the sampling thread and wait for it to finish
+		@param timeout: max seconds to wait for the thread
+		@type timeout: float
+		"""
+		self._stopEvent.set()
+		if self.is_alive():
+			self.join(timeout)
+
+	def sample(self):
+		"""
+		Take a single reading and store it
+		@return: the new sample
+		@rtype: Sample
+		"""
+		if self._pendingUnits is not None:
+			self.applyUnits(self._pendingUnits)
+		timestamp = time.monotonic()
+		try:
+			temperature = self.thermocouple.read()
+			sample = Sample(timestamp, temperature, self.thermocouple.refTemperature, None)
+			if self.estimator:
+				self.estimator.update(timestamp, temperature)
+		except Exception as e:
+			self.logger.debug("Thermocouple read error: {}".format(e))
+			sample = Sample(timestamp, None, None, e)
+		self.buffer.append(sample)
+		return sample
+
+	# endregion Thread
+	# region Readings
+
+	@property
+	def latest(self):
+		"""
+		Get the latest sample
+		@return: latest sample, None if nothing sampled yet
+		@rtype: Sample
+		"""
+		return self.buffer.latest
+
+	def history(self):
+		"""
+		Get the raw sample history, oldest first
+		@rtype: list[Sample]
+		"""
+		return self.buffer.history()
+
+	def filtered(self, n=None, method=None):
+		"""
+		Get a filtered temperature from the most recent valid samples
+		@param n: number of samples to filter over. Default: filterLength
+		@type n: int
+		@param method: 'mean' or 'median'. Default: filterMethod
+		@type method: str
+		@return: filtered temperature, None if there are no valid samples
+		@rtype: float
+		"""
+		n = n or self.filterLength
+		method = method or self.filterMethod
+
+		temperatures = [sample.temperature for sample in self.buffer.last(n) if sample.error is None]
+		if not temperatures:
+			return None
+
+		if method == 'mean':
+			return sum(temperatures) / len(temperatures)
+
+		temperatures.sort()
+		middle = len(temperatures) // 2
+		if len(temperatures) % 2:
+			return temperatures[middle]
+		return (temperatures[middle - 1] + temperatures[middle]) / 2.0
+
+	def read(self):
+		"""
+		Get the cached, filtered temperature. Never touches the SPI bus while the sampling thread runs - waits for its
+		first sample instead. Before the thread starts, reads the thermocouple directly, without caching the reading
+		Raises the latest sample's error if the latest read failed
+		@return: Thermocouple temperature in currently configured units
+		@rtype: float
+		"""
+		if self.is_alive():
+			deadline = time.monotonic() + max(self.FIRST_SAMPLE_TIMEOUT, self.FIRST_SAMPLE_PERIODS * self.period)
+			while self._pendingUnits is not None or self.buffer.latest is None:
+				if time.monotonic() > deadline or not self.is_alive():
+					raise Exception("No thermocouple sample from the sampling thread")
+				time.sleep(min(self.period, 0.01))
+		latest = self.buffer.latest
+		if latest is None:
+			return self.thermocouple.read()
+		if latest.error is not None:
+			raise latest.error
+		return self.temperature
+
+	@property
+	def temperature(self):
+		"""
+		Filtered temperature, or the thermocouple's last value if there are no valid samples
+		@rtype: float
+		"""
+		filtered = self.filtered()
+		return self.thermocouple.temperature if filtered is None else filtered
+
+	@property
+	def refTemperature(self):
+		return self.thermocouple.refTemperature
+
+	@property
+	def units(self):
+		return self._pendingUnits or self.thermocouple.units
+
+	@units.setter
+	def units(self, units):
+		"""
+		Change units - on the sampling thread, before its next sample, if it's running
+		@param units: new units
+		@type units: str
+		"""
+		if self.is_alive():
+			self._pendingUnits = units
+		else:
+			self.applyUnits(units)
+
+	def applyUnits(self, units):
+		"""
+		Switch the thermocouple's units - history is in the old units, so drop it. Only call from the buffer's writer
+		@param units: new units
+		@type units: str
+		"""
+		self.thermocouple.units = units
+		self.buffer.clear()
+		if self.estimator:
+			self.estimator.reset()
+		self._pendingUnits = None
+
+	# endregion Readings
+
+	def cleanup(self):
+		"""
+		Stop sampling and close the thermocouple
+		"""
+		self.stop()
+		self.thermocouple.cleanup()
@@ -0,0 +1,199 @@
+"""
+Run many PID candidates through a reflow profile against the oven model at once
+"""
+from collections import deque, OrderedDict
+
+import numpy as np
+
+from library.simulation.oven import OvenModel
+from definitions import CONFIG_KEY_TARGET, CONFIG_KEY_DURATION
+
+
+class BatchResult(object):
+	"""
+	Per-candidate results of SimulateBatch. Every attribute is a length K array unless noted
+	"""
+	# Cost per unit of each metric
+	COST_WEIGHTS = OrderedDict([
+		("absoluteError", 1.0),
+		("duration", 0.1),
+		("overshoot", 10.0),
+		# Per second outside the liquidusWindow
+		("timeAboveLiquidus", 0.0),
+		("settlingTime", 0.0),
+		("switchCount", 0.0),
+		("incomplete", 1e9),
+	])
+
+	def __init__(self, size, recordTraces):
+		super(BatchResult, self).__init__()
+		# Whether the profile finished within maxDuration
+		self.completed = np.zeros(size, dtype=bool)
+		# Simulated time the profile finished at (maxDuration if it didn't)
+		self.duration = np.zeros(size)
+		self.peakTemperature = np.zeros(size)
+		# Peak temperature above the hottest target
+		self.overshoot = np.zeros(size)
+		# Integral of the absolute tracking error while running (C*s)
+		self.absoluteError = np.zeros(size)
+		self.switchCount = np.zeros(size, dtype=int)
+		# Time spent above the liquidus temperature (s)
+		self.timeAboveLiquidus = np.zeros(size)
+		# Total time soak states took to settle within the settling band of their target (s)
+		self.settlingTime = np.zeros(size)
+		# Sample times & temperatures, shape (N, K) - only if recordTraces was set
+		self.times = [] if recordTraces else None
+		self.temperatures = [] if recordTraces else None
+
+	def __len__(self):
+		return len(self.completed)
+
+	def cost(self, weights=None, liquidusWindow=(60.0, 90.0)):
+		"""
+		Combine the results into a single cost per candidate - lower is better
+		@param weights: (Optional) cost weights - see COST_WEIGHTS. Missing keys use the defaults
+		@type weights: dict[str, float]
+		@param liquidusWindow: acceptable range of time above liquidus (s)
+		@type liquidusWindow: tuple[float, float]
+		@rtype: numpy.ndarray
+		"""
+		costWeights = OrderedDict(self.COST_WEIGHTS)
+		costWeights.update(weights or {})
+		shortestLiquidus, longestLiquidus = liquidusWindow
+		liquidusError = np.maximum(shortestLiquidus - self.timeAboveLiquidus, 0.0)
+		liquidusError += np.maximum(self.timeAboveLiquidus - longestLiquidus, 0.0)
+		return (
+			costWeights['absoluteError'] * self.absoluteError
+			+ costWeights['duration'] * self.duration
+			+ costWeights['overshoot'] * np.maximum(self.overshoot, 0.0)
+			+ costWeights['timeAboveLiquidus'] * liquidusError
+			+ costWeights['settlingTime'] * self.settlingTime
+			+ costWeights['switchCount'] * self.switchCount
+			+ np.where(self.completed, 0.0, costWeights['incomplete'])
+		)
+
+
+def SimulateBatch(batchPid, stateConfiguration, model=None, timerPeriod=0.5, controlPeriod=1.0, maxDuration=3600.0, units='celsius', liquidus=217.0, settlingBand=3.0, recordTraces=False):
+	"""
+	Run every candidate of a BatchPID through a reflow profile in lockstep, each against its own copy of the oven model
+	Follows ToastStateMachine.tick - state transitions, the 3 degree target buffer, zeroing the integral on state changes,
+	relay on for positive PID output and always off in the last (cooling) state - but reads the model directly,
+	with no thermocouple quantisation or noise.
+	@param batchPid: candidates to run. Their states are reset first
+	@type batchPid: library.control.pid_batch.BatchPID
+	@param stateConfiguration: ordered dict of state name to {'target', 'duration'}
+	@type stateConfiguration: OrderedDict
+	@param model: (Optional) oven model parameters to use. Default: OvenModel()
+	@type model: OvenModel
+	@param timerPeriod: tick period (s)
+	@type timerPeriod: float
+	@param controlPeriod: PID/relay update period (s)
+	@type controlPeriod: float
+	@param maxDuration: give up after this much simulated time (s)
+	@type maxDuration: float
+	@param units: temperature units of the state configuration - 'celsius' or 'fahrenheit'
+	@type units: str
+	@param liquidus: solder liquidus temperature, in units. Default: SAC305
+	@type liquidus: float
+	@param settlingBand: soak states are settled once the temperature stays within +/- this of the target
+	@type settlingBand: float
+	@param recordTraces: keep the temperature of every candidate at every tick
+	@type recordTraces: bool
+	@rtype: BatchResult
+	"""
+	model = model or OvenModel()
+	size = len(batchPid)
+	states = list(stateConfiguration.values())
+	stateTargets = np.array([float(state[CONFIG_KEY_TARGET]) for state in states])
+	stateDurations = np.array([float(state[CONFIG_KEY_DURATION]) for state in states])
+	lastStateIndex = len(states) - 1
+
+	# Same buffer as ToastStateMachine.checkStateAgainstTarget
+	buffer = 3.0 if units == 'celsius' else 3.0 * 9.0 / 5.0
+	toUnits = (lambda celsius: celsius) if units == 'celsius' else (lambda celsius: celsius * 9.0 / 5.0 + 32.0)
+
+	result = BatchResult(size, recordTraces)
+
+	# Oven - power changes take deadTime to reach the thermocouple
+	temperatures = np.full(size, model.ambient)
+	delayTicks = int(round(model.deadTime / timerPeriod))
+	powerPipeline = deque([np.zeros(size)] * delayTicks)
+	relay = np.zeros(size, dtype=bool)
+
+	# State machine, as in ToastStateMachine.start
+	batchPid.zeroierror()
+	batchPid.resetClock()
+	running = np.ones(size, dtype=bool)
+	stateIndex = np.zeros(size, dtype=int)
+	lastTarget = batchPid.target.copy()
+	batchPid.target[:] = stateTargets[0]
+	soaking = batchPid.target == lastTarget
+	stateEnd = np.full(size, stateDurations[0])
+	stateChanged = np.ones(size, dtype=bool)
+	# Soak settling - when the current soak began and when it was last outside the band
+	soakStart = np.zeros(size)
+	lastUnsettled = np.zeros(size)
+
+	timestamp = 0.0
+	lastControlTimestamp = 0.0
+	tickCount = 0
+	result.peakTemperature[:] = toUnits(model.ambient)
+	while running.any() and timestamp < maxDuration:
+		# Advance the oven to the next tick and read it
+		powerPipeline.append(relay.astype(float))
+		power = powerPipeline.popleft()
+		temperatures = OvenModel.Step(temperatures, power, timerPeriod, model.gain, model.timeConstant, model.ambient)
+		reading = toUnits(temperatures)
+
+		tickCount += 1
+		timestamp = tickCount * timerPeriod
+
+		np.maximum(result.peakTemperature, np.where(running, reading, result.peakTemperature), out=result.peakTemperature)
+		result.timeAboveLiquidus += (running & (reading > liquidus)) * timerPeriod
+		if recordTraces:
+			result.times.append(timestamp)
+			result.temperatures.append(reading.copy())
+
+		# Ready to move to next state?
+		target = batchPid.target
+		reachedTarget = np.where(target > lastTarget, reading >= target - buffer, reading <= target + buffer)
+		ready = running & np.where(soaking, timestamp >= stateEnd, reachedTarget)
+		lastUnsettled = np.where(soaking & (np.abs(reading - target) > settlingBand), timestamp, lastUnsettled)
+		if ready.any():
+			# Soaks that just ended - settled at the last time they were out of the band
+			result.settlingTime += np.where(ready & soaking, lastUnsettled - soakStart, 0.0)
+
+			stateIndex = stateIndex + ready
+			finished = ready & (stateIndex > lastStateIndex)
+			result.completed |= finished
+			result.duration[finished] = timestamp
+			running &= ~finished
+
+			advanced = ready & running
+			nextIndex = np.minimum(stateIndex, lastStateIndex)
+			lastTarget = np.where(advanced, target, lastTarget)
+			batchPid.target[:] = np.where(advanced, stateTargets[nextIndex], target)
+			soaking = np.where(advanced, batchPid.target == lastTarget, soaking)
+			stateEnd = np.where(advanced, timestamp + stateDurations[nextIndex], stateEnd)
+			soakStart = np.where(advanced, timestamp, soakStart)
+			lastUnsettled = np.where(advanced, timestamp, lastUnsettled)
+			batchPid.zeroierror(advanced)
+			stateChanged |= advanced
+
+		# Control loop
+		if timestamp - lastControlTimestamp >= controlPeriod:
+			lastControlTimestamp = timestamp
+			output = batchPid.compute(timestamp, reading, stateChanged)
+			stateChanged[:] = False
+
+			result.absoluteError += np.where(running, np.abs(batchPid.error), 0.0) * controlPeriod
+			newRelay = running & (stateIndex != lastStateIndex) & (output > 0.0)
+			result.switchCount += newRelay != relay
+			relay = newRelay
+
+	result.duration[~result.completed] = timestamp
+	result.overshoot = result.peakTemperature - stateTargets.max()
+	if recordTraces:
+		result.times = np.array(result.times)
+		result.temperatures = np.array(result.temperatures).reshape(-1, size)
+	return result
@@ -0,0 +1,346 @@
+"""
+Simulation farm - run every combination of reflow profiles & tuning sets through ToastStateMachine against the oven
+model, spread over all CPU cores, and summarize each run
+
+Profiles are JSON files of states (or whole configs, whose states are used). Tuning sets are JSON files of tuning blocks
+(or whole configs, whose tuning is used) - each block given replaces the keys it sets in the base config's block.
+
+Usage, from the repository root:
+	python -m library.simulation.farm config/myConfig.json --profile paste1.json --profile paste2.json --tuning soft.json --tuning hard.json
+"""
+import os
+import sys
+import csv
+import copy
+import json
+import logging
+import argparse
+import tempfile
+import itertools
+import multiprocessing
+from collections import OrderedDict
+
+from library.other.setupLogging import getLogger
+from library.other.config import ToasterConfig
+from library.control.headless import LoadProfile
+from library.control.stateMachine import STATES
+from library.sensors.sensor_thermocouple import Thermocouple
+from library.simulation.oven import OvenModel, OvenSimulator, SimulateProfile
+from definitions import CONFIG_KEY_TARGET, GetBaseConfigurationFilePath
+
+# Summary columns of every run, followed by one overshoot column per profile state
+SUMMARY_COLUMNS = ['profile', 'tuning', 'completed', 'duration', 'peakTemperature', 'timeAboveLiquidus', 'maxRampRate', 'switchCount']
+OVERSHOOT_PREFIX = 'overshoot '
+
+
+def LoadTuning(tuningPath):
+	"""
+	Read a tuning set - either a dict of tuning blocks or a full config, in which case its 'tuning' is used
+	@param tuningPath: path to JSON tuning set
+	@type tuningPath: str
+	@rtype: OrderedDict
+	"""
+	tuning = ToasterConfig.ReadConfig(tuningPath)
+	return tuning.get('tuning', tuning)
+
+
+def MergeTuning(config, tuning):
+	"""
+	Apply a tuning set to a config dict - blocks replace the keys they set, other values replace the whole entry
+	@param config: config dict, updated in place
+	@type config: dict
+	@param tuning: tuning set
+	@type tuning: dict
+	@return: the config
+	@rtype: dict
+	"""
+	baseTuning = config.setdefault('tuning', OrderedDict())
+	for key, value in tuning.items():
+		if isinstance(value, dict) and isinstance(baseTuning.get(key), dict):
+			baseTuning[key] = OrderedDict(baseTuning[key], **value)
+		else:
+			baseTuning[key] = value
+	return config
+
+
+def SummarizeRun(data, stateConfiguration, liquidus=217.0):
+	"""
+	Summarize the data records of a run
+	@param data: data records, as ToastStateMachine.data
+	@type data: list[dict] or library.other.run_store.RunStore
+	@param stateConfiguration: the run's states
+	@type stateConfiguration: OrderedDict
+	@param liquidus: solder liquidus temperature, in the run's units
+	@type liquidus: float
+	@return: dict of duration, peakTemperature, timeAboveLiquidus, maxRampRate (degrees/s) and an overshoot above the
+		target for every state but the last (cooling) one - None for states the run never reached. Records of failed
+		thermocouple reads (no temperature) are skipped
+	@rtype: OrderedDict
+	"""
+	summary = OrderedDict()
+	summary['duration'] = data[-1]['Timestamp'] if data else 0.0
+	readings = [record for record in data if record['Temperature'] is not None]
+	summary['peakTemperature'] = max(record['Temperature'] for record in readings) if readings else None
+
+	timeAboveLiquidus = 0.0
+	maxRampRate = 0.0
+	for record, nextRecord in zip(readings, readings[1:]):
+		dt = nextRecord['Timestamp'] - record['Timestamp']
+		if dt <= 0:
+			continue
+		if record['Temperature'] > liquidus:
+			timeAboveLiquidus += dt
+		maxRampRate = max(maxRampRate, (nextRecord['Temperature'] - record['Temperature']) / dt)
+	summary['timeAboveLiquidus'] = timeAboveLiquidus
+	summary['maxRampRate'] = maxRampRate
+
+	peaks = {}
+	for record in readings:
+		state = record['State']
+		peaks[state] = max(peaks.get(state, record['Temperature']), record['Temperature'])
+	for state in list(stateConfiguration)[:-1]:
+		target = float(stateConfiguration[state][CONFIG_KEY_TARGET])
+		summary[OVERSHOOT_PREFIX + state] = max(0.0, peaks[state] - target) if state in peaks else None
+	return summary
+
+
+def _SimulateJob(arguments):
+	"""
+	Process pool worker - simulate one profile & tuning combination
+	@param arguments: tuple of profile name, tuning name, config dict, oven model config, noise, seed, liquidus (C),
+		max duration
+	@type arguments: tuple
+	@return: summary row
+	@rtype: OrderedDict
+	"""
+	profileName, tuningName, config, modelConfig, noise, seed, liquidus, maxDuration = arguments
+	if config.get('units') == 'fahrenheit':
+		liquidus = Thermocouple.ConvertCelsiusToFahrenheit(liquidus)
+
+	simulator = OvenSimulator(OvenModel.FromConfig(modelConfig), noise=noise, seed=seed)
+	with tempfile.TemporaryDirectory() as directory:
+		# The state machine loads its config from a file
+		configPath = os.path.join(directory, "config.json")
+		with open(configPath, "w") as ouf:
+			json.dump(config, ouf)
+		status, data = SimulateProfile(configPath, simulator, maxDuration=maxDuration)
+
+	row = OrderedDict()
+	row['profile'] = profileName
+	row['tuning'] = tuningName
+	row['completed'] = status == STATES.COMPLETE
+	summary = SummarizeRun(data, config['states'], liquidus)
+	row['duration'] = summary.pop('duration')
+	row['peakTemperature'] = summary.pop('peakTemperature')
+	row['timeAboveLiquidus'] = summary.pop('timeAboveLiquidus')
+	row['maxRampRate'] = summary.pop('maxRampRate')
+	row['switchCount'] = simulator.switchCount
+	row.update(summary)
+	return row
+
+
+class SimulationFarm(object):
+	"""
+	Runs the cross product of reflow profiles & tuning sets against the oven model, one process per core.
+	Every run goes through ToastStateMachine.simulate, so it uses the same control code as the oven.
+	"""
+	def __init__(self, baseConfigPath=GetBaseConfigurationFilePath(), model=None, noise=0.0, seed=None, liquidus=217.0, maxDuration=3600.0, processes=None, debugLevel=logging.INFO):
+		"""
+		Constructor
+		@param baseConfigPath: config the profiles & tuning sets are applied to
+		@type baseConfigPath: str
+		@param model: (Optional) oven model. Default: OvenModel()
+		@type model: OvenModel
+		@param noise: standard deviation of the simulated thermocouple noise (C)
+		@type noise: float
+		@param seed: (Optional) random seed for the noise - the same for every run, so runs differ only by their inputs
+		@type seed: int
+		@param liquidus: solder liquidus temperature in celsius
+		@type liquidus: float
+		@param maxDuration: give up on a run after this much simulated time (s)
+		@type maxDuration: float
+		@param processes: worker processes. Default: one per core
+		@type processes: int
+		@param debugLevel: logging level
+		@type debugLevel: int
+		"""
+		super(SimulationFarm, self).__init__()
+		self.logger = getLogger('SimulationFarm', debugLevel)
+
+		self.baseConfig = ToasterConfig.ReadConfig(baseConfigPath)
+		self.model = model or OvenModel()
+		self.noise = float(noise)
+		self.seed = seed
+		self.liquidus = float(liquidus)
+		self.maxDuration = float(maxDuration)
+		self.processes = processes or multiprocessing.cpu_count()
+
+		self.profiles = OrderedDict()
+		self.tunings = OrderedDict()
+
+	def addProfile(self, name, states):
+		"""
+		@param name: name of the profile in the summary
+		@type name: str
+		@param states: ordered dict of state name to {'target', 'duration'}
+		@type states: OrderedDict
+		"""
+		self.profiles[name] = states
+
+	def addTuning(self, name, tuning):
+		"""
+		@param name: name of the tuning set in the summary
+		@type name: str
+		@param tuning: dict of tuning blocks, applied over the base config's
+		@type tuning: dict
+		"""
+		self.tunings[name] = tuning
+
+	def jobs(self):
+		"""
+		Build the config of every run
+		@return: list of _SimulateJob arguments, profiles outermost
+		@rtype: list[tuple]
+		"""
+		profiles = self.profiles or OrderedDict([("base", self.baseConfig['states'])])
+		tunings = self.tunings or OrderedDict([("base", OrderedDict())])
+		jobs = []
+		for (profileName, states), (tuningName, tuning) in itertools.product(profiles.items(), tunings.items()):
+			config = MergeTuning(copy.deepcopy(self.baseConfig), tuning)
+			config['states'] = states
+			jobs.append((
+				profileName, tuningName, config, self.model.getConfig(), self.noise, self.seed, self.liquidus, self.maxDuration
+			))
+		return jobs
+
+	def run(self):
+		"""
+		Simulate every combination
+		@return: summary row of every run, in jobs() order
+		@rtype: list[OrderedDict]
+		"""
+		jobs = self.jobs()
+		self.logger.info("Simulating {} run(s) on {} process(es)".format(len(jobs), min(self.processes, len(jobs))))
+		if self.processes > 1 and len(jobs) > 1:
+			with multiprocessing.Pool(min(self.processes, len(jobs))) as pool:
+				return pool.map(_SimulateJob, jobs)
+		return [_SimulateJob(job) for job in jobs]
+
+
+def GetColumns(rows):
+	"""
+	@return: summary columns followed by the overshoot columns of every profile, in first-seen order
+	@rtype: list[str]
+	"""
+	columns = list(SUMMARY_COLUMNS)
+	for row in rows:
+		columns += [column for column in row if column not in columns]
+	return columns
+
+
+def FormatTable(rows):
+	"""
+	Format summary rows as an aligned text table
+	@param rows: summary rows from SimulationFarm.run
+	@type rows: list[OrderedDict]
+	@rtype: str
+	"""
+	def Format(value):
+		if value is None:
+			return "-"
+		if isinstance(value, float):
+			return "{:.1f}".format(value)
+		return str(value)
+
+	columns = GetColumns(rows)
+	cells = [columns] + [[Format(row.get(column)) for column in columns] for row in rows]
+	widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+	return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(line, widths)) for line in cells)
+
+
+def WriteSummaryCsv(rows, csvPath):
+	"""
+	Write summary rows to a CSV file
+	@param rows: summary rows from SimulationFarm.run
+	@type rows: list[OrderedDict]
+	@param csvPath: path to write to
+	@type csvPath: str
+	"""
+	with open(csvPath, 'w', newline="") as ouf:
+		writer = csv.DictWriter(ouf, fieldnames=GetColumns(rows))
+		writer.writeheader()
+		writer.writerows(rows)
+
+
+def parseArgs(argv=None):
+	parser = argparse.ArgumentParser(description="Simulate every combination of reflow profiles & tuning sets against an oven model")
+	parser.add_argument(
+		"config",
+		nargs="?",
+		default=GetBaseConfigurationFilePath(),
+		help="base config the profiles & tuning sets are applied to. Default: base config"
+	)
+	parser.add_argument(
+		"--profile",
+		metavar="JSON",
+		action="append",
+		default=[],
+		help="reflow profile - states, or a config whose states are used. May be given several times. Default: the config's"
+	)
+	parser.add_argument(
+		"--tuning",
+		metavar="JSON",
+		action="append",
+		default=[],
+		help="tuning set - tuning blocks, or a config whose tuning is used. May be given several times. Default: the config's"
+	)
+	parser.add_argument(
+		"--log",
+		metavar="CSV",
+		action="append",
+		default=[],
+		help="data CSV of a logged run to fit the oven model to. May be given several times. Default: default oven model"
+	)
+	parser.add_argument("--noise", type=float, default=0.0, help="simulated thermocouple noise in celsius. Default: %(default)s")
+	parser.add_argument("--seed", type=int, default=None, help="random seed for the noise")
+	parser.add_argument("--liquidus", type=float, default=217.0, help="solder liquidus temperature in celsius. Default: %(default)s")
+	parser.add_argument("--processes", type=int, default=None, help="worker processes. Default: one per core")
+	parser.add_argument("--csv", metavar="PATH", help="also write the summary to this CSV")
+	return parser.parse_args(argv)
+
+
+def main(argv=None):
+	args = parseArgs(argv)
+
+	model = None
+	if args.log:
+		# Imported here - numpy is only needed for fitting
+		from library.control.optimizer import LoadRunLogs
+		from library.simulation.identification import FitOvenModel
+		model, rmsError = FitOvenModel(LoadRunLogs(args.log, ToasterConfig(args.config).units))
+
+	farm = SimulationFarm(
+		args.config,
+		model=model,
+		noise=args.noise,
+		seed=args.seed,
+		liquidus=args.liquidus,
+		processes=args.processes
+	)
+	if model:
+		farm.logger.info("Fitted oven model to {} run(s), RMS error {:.2f}C".format(len(args.log), rmsError))
+	for profilePath in args.profile:
+		farm.addProfile(os.path.splitext(os.path.basename(profilePath))[0], LoadProfile(profilePath))
+	for tuningPath in args.tuning:
+		farm.addTuning(os.path.splitext(os.path.basename(tuningPath))[0], LoadTuning(tuningPath))
+
+	rows = farm.run()
+	print(FormatTable(rows))
+	if args.csv:
+		WriteSummaryCsv(rows, args.csv)
+		farm.logger.info("Summary written to {}".format(args.csv))
+	return 0 if all(row['completed'] for row in rows) else 1
+
+
+if __name__ == '__main__':
+	sys.exit(main())
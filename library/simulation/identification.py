@@ -0,0 +1,153 @@
+"""
+Fit the oven model to logged reflow runs
+"""
+import csv
+
+import numpy as np
+
+from library.simulation.oven import OvenModel
+
+
+class RunLog(object):
+	"""
+	Temperature & relay state samples from a run, as written by ToastStateMachine.dumpDataToCsv
+	"""
+	def __init__(self, times, temperatures, relayStates):
+		"""
+		Constructor
+		@param times: sample times (s)
+		@type times: list[float] or numpy.ndarray
+		@param temperatures: measured temperatures at each sample
+		@type temperatures: list[float] or numpy.ndarray
+		@param relayStates: relay state (or heater duty) applied from each sample until the next one
+		@type relayStates: list[bool] or list[float] or numpy.ndarray
+		"""
+		super(RunLog, self).__init__()
+		self.times = np.asarray(times, dtype=float)
+		self.temperatures = np.asarray(temperatures, dtype=float)
+		self.relayStates = np.asarray(relayStates, dtype=float)
+		assert len(self.times) == len(self.temperatures) == len(self.relayStates), "Run log columns must be the same length"
+		assert len(self.times) >= 3, "Run log needs at least 3 samples"
+
+	def __len__(self):
+		return len(self.times)
+
+	@classmethod
+	def FromCsv(cls, csvPath):
+		"""
+		Read a data CSV. Samples with a failed temperature read are dropped
+		The heater duty is used as the relay state where logged, so time-proportioning runs fit with their mean power
+		@param csvPath: path to CSV file
+		@type csvPath: str
+		@rtype: RunLog
+		"""
+		times = []
+		temperatures = []
+		relayStates = []
+		with open(csvPath, 'r', newline="") as inf:
+			for row in csv.DictReader(inf):
+				try:
+					temperature = float(row['Temperature'])
+				except (TypeError, ValueError):
+					continue
+				times.append(float(row['Timestamp']))
+				temperatures.append(temperature)
+				if row.get('Heater Duty') not in [None, '']:
+					relayStates.append(float(row['Heater Duty']))
+				else:
+					relayStates.append(row['Relay State'] in ['True', '1', '1.0'])
+		return cls(times, temperatures, relayStates)
+
+	def resample(self, period):
+		"""
+		Resample onto a uniform time grid - temperatures are interpolated, relay states held
+		@param period: sample period (s)
+		@type period: float
+		@return: tuple of temperatures, relay states
+		@rtype: tuple[numpy.ndarray, numpy.ndarray]
+		"""
+		grid = np.arange(self.times[0], self.times[-1] + period / 2.0, period)
+		temperatures = np.interp(grid, self.times, self.temperatures)
+		held = np.searchsorted(self.times, grid, side='right') - 1
+		return temperatures, self.relayStates[held]
+
+
+def SimulateLog(model, temperatures, relayStates, period):
+	"""
+	Simulate a resampled log open-loop: start at its first temperature and replay its relay states
+	@param model: oven model parameters to simulate
+	@type model: OvenModel
+	@param temperatures: resampled temperatures (only the first is used)
+	@type temperatures: numpy.ndarray
+	@param relayStates: resampled relay states
+	@type relayStates: numpy.ndarray
+	@param period: sample period (s)
+	@type period: float
+	@return: simulated temperature at every sample
+	@rtype: numpy.ndarray
+	"""
+	delay = int(round(model.deadTime / period))
+	power = np.concatenate([np.zeros(delay), relayStates])[:len(relayStates)]
+	simulated = np.empty(len(temperatures))
+	simulated[0] = temperatures[0]
+	for k in range(len(temperatures) - 1):
+		simulated[k + 1] = OvenModel.Step(simulated[k], power[k], period, model.gain, model.timeConstant, model.ambient)
+	return simulated
+
+
+def FitOvenModel(runLogs, period=None, maxDeadTime=30.0):
+	"""
+	Fit gain, time constant, dead time & ambient to one or more logged runs
+	For each candidate dead time the discretised model
+		T[k + 1] = a * T[k] + b * relay[k - delay] + c
+	is linear in a, b & c, so it is solved by least squares. The dead time whose model best reproduces the logs
+	when simulated open-loop is kept.
+	@param runLogs: logged runs of the same oven
+	@type runLogs: list[RunLog]
+	@param period: (Optional) resampling period (s). Default: median sample spacing of the first log
+	@type period: float
+	@param maxDeadTime: longest dead time to try (s)
+	@type maxDeadTime: float
+	@return: tuple of fitted model, RMS error of the open-loop simulation
+	@rtype: tuple[OvenModel, float]
+	"""
+	assert runLogs, "At least one run log is required to fit the oven model"
+	if period is None:
+		period = float(np.median(np.diff(runLogs[0].times)))
+	resampled = [log.resample(period) for log in runLogs]
+
+	best = None
+	for delay in range(int(maxDeadTime / period) + 1):
+		rows = []
+		targets = []
+		for temperatures, relayStates in resampled:
+			if len(temperatures) <= delay + 1:
+				continue
+			current = temperatures[delay:-1]
+			rows.append(np.column_stack([current, relayStates[:len(relayStates) - delay - 1], np.ones(len(current))]))
+			targets.append(temperatures[delay + 1:])
+		if not rows:
+			break
+
+		(a, b, c), _, _, _ = np.linalg.lstsq(np.vstack(rows), np.concatenate(targets), rcond=None)
+		if not (0.0 < a < 1.0 and b > 0.0):
+			# Not a stable, heating first-order response - this dead time doesn't fit
+			continue
+
+		model = OvenModel(
+			gain=b / (1.0 - a),
+			timeConstant=-period / np.log(a),
+			deadTime=delay * period,
+			ambient=c / (1.0 - a)
+		)
+		errors = np.concatenate([
+			SimulateLog(model, temperatures, relayStates, period) - temperatures
+			for temperatures, relayStates in resampled
+		])
+		rmsError = float(np.sqrt(np.mean(errors ** 2)))
+		if best is None or rmsError < best[1]:
+			best = (model, rmsError)
+
+	if best is None:
+		raise Exception("Failed to fit the oven model - do the logs include heating with the relay on?")
+	return best
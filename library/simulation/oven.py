@@ -0,0 +1,403 @@
+import math
+import random
+import logging
+from collections import deque
+
+import library.sensors.mock_gpio as mock_gpio
+import library.sensors.mock_spidev as mock_spidev
+from library.sensors.sensor_thermocouple import Thermocouple
+from library.control.stateMachine import ToastStateMachine
+from definitions import GetBaseConfigurationFilePath
+
+
+class VirtualClock(object):
+	"""
+	Manually advanced clock. Call it like time.monotonic()
+	"""
+	def __init__(self, start=0.0):
+		"""
+		Constructor
+		@param start: starting time in seconds
+		@type start: float
+		"""
+		super(VirtualClock, self).__init__()
+		self._now = float(start)
+
+	def __call__(self):
+		return self._now
+
+	@property
+	def now(self):
+		"""
+		@rtype: float
+		"""
+		return self._now
+
+	def advance(self, seconds):
+		"""
+		Move the clock forward
+		@param seconds: time to advance by
+		@type seconds: float
+		"""
+		assert seconds >= 0, "Virtual clock can't go backwards"
+		self._now += seconds
+
+	def sleep(self, seconds):
+		"""
+		Drop-in for time.sleep - returns immediately after advancing the clock
+		@param seconds: time to sleep
+		@type seconds: float
+		"""
+		self.advance(max(0.0, seconds))
+
+
+class OvenModel(object):
+	"""
+	Lumped thermal model of a toaster oven - first order plus dead time:
+		timeConstant * dT/dt = gain * power(t - deadTime) - (T - ambient)
+	gain is the steady-state rise above ambient at full power, timeConstant sets both the heating rate and the losses,
+	and deadTime is the lag between switching the heating elements and the thermocouple seeing it.
+	Integrated exactly for piecewise-constant power, so the result doesn't depend on the step size.
+	"""
+	BASE_PARAMETERS = {
+		'gain': 350.0,
+		'timeConstant': 300.0,
+		'deadTime': 8.0,
+		'ambient': 25.0,
+	}
+
+	def __init__(self, gain=350.0, timeConstant=300.0, deadTime=8.0, ambient=25.0, temperature=None):
+		"""
+		Constructor
+		@param gain: steady-state temperature rise above ambient at full power (C)
+		@type gain: float
+		@param timeConstant: thermal time constant (s)
+		@type timeConstant: float
+		@param deadTime: delay between a power change and its effect on temperature (s)
+		@type deadTime: float
+		@param ambient: ambient temperature (C)
+		@type ambient: float
+		@param temperature: (Optional) starting oven temperature (C). Default: ambient
+		@type temperature: float
+		"""
+		super(OvenModel, self).__init__()
+		self.gain = float(gain)
+		self.timeConstant = float(timeConstant)
+		self.deadTime = float(deadTime)
+		self.ambient = float(ambient)
+		assert self.timeConstant > 0, "Oven time constant must be > 0"
+		assert self.deadTime >= 0, "Oven dead time must be >= 0"
+
+		self.time = 0.0
+		self.temperature = self.ambient if temperature is None else float(temperature)
+		# Power currently reaching the thermocouple, and (effective time, power) changes still in the dead time
+		self.power = 0.0
+		self._pending = deque()
+
+	@classmethod
+	def FromConfig(cls, configDict):
+		"""
+		Create a model from a dict of parameters. Missing keys use BASE_PARAMETERS
+		@param configDict: dict with any of gain, timeConstant, deadTime, ambient
+		@type configDict: dict
+		@rtype: OvenModel
+		"""
+		parameters = dict(cls.BASE_PARAMETERS)
+		parameters.update(configDict or {})
+		return cls(**{key: parameters[key] for key in cls.BASE_PARAMETERS})
+
+	def getConfig(self):
+		"""
+		@return: model parameters
+		@rtype: dict[str, float]
+		"""
+		return {key: getattr(self, key) for key in self.BASE_PARAMETERS}
+
+	@staticmethod
+	def Step(temperature, power, dt, gain, timeConstant, ambient):
+		"""
+		Advance temperature(s) by dt with constant power. Works on floats and numpy arrays alike
+		@param temperature: current temperature(s)
+		@type temperature: float or numpy.ndarray
+		@param power: heater power(s), 0.0 - 1.0
+		@type power: float or numpy.ndarray
+		@param dt: step length (s)
+		@type dt: float
+		@param gain: steady-state rise at full power
+		@type gain: float
+		@param timeConstant: thermal time constant
+		@type timeConstant: float
+		@param ambient: ambient temperature
+		@type ambient: float
+		@return: temperature(s) after dt
+		@rtype: float or numpy.ndarray
+		"""
+		decay = math.exp(-dt / timeConstant)
+		steadyState = ambient + gain * power
+		return steadyState + (temperature - steadyState) * decay
+
+	def setPower(self, power, time):
+		"""
+		Switch heater power. The thermocouple sees the change after the dead time
+		@param power: new heater power, 0.0 - 1.0 (relay off/on is 0.0/1.0)
+		@type power: float
+		@param time: time of the switch
+		@type time: float
+		"""
+		self._pending.append((time + self.deadTime, float(power)))
+
+	def advanceTo(self, time):
+		"""
+		Integrate the model up to the given time
+		@param time: target time (s)
+		@type time: float
+		@return: oven temperature at that time
+		@rtype: float
+		"""
+		while self._pending and self._pending[0][0] <= time:
+			effectiveTime, power = self._pending.popleft()
+			self._integrate(effectiveTime)
+			self.power = power
+		self._integrate(time)
+		return self.temperature
+
+	def _integrate(self, time):
+		dt = time - self.time
+		if dt > 0:
+			self.temperature = self.Step(self.temperature, self.power, dt, self.gain, self.timeConstant, self.ambient)
+			self.time = time
+
+
+class SimulatedSpiDev(mock_spidev.SpiDev):
+	"""
+	SpiDev that reads MAX31855 frames of a simulated oven's temperature
+	"""
+	def __init__(self, simulator, csPin=0):
+		"""
+		Constructor
+		@param simulator: oven simulator to read
+		@type simulator: OvenSimulator
+		@param csPin: chip select of this device
+		@type csPin: int
+		"""
+		super(SimulatedSpiDev, self).__init__()
+		self.simulator = simulator
+		self.csPin = csPin
+
+	def xfer(self, bytes):
+		return self.simulator.readFrame(self.csPin)
+
+
+class SimulatedRelay(object):
+	"""
+	Heater relay of a simulated oven - same interface as library.sensors.sensor_relay.Relay, without touching GPIO
+	"""
+	def __init__(self, simulator, pin=None):
+		"""
+		Constructor
+		@param simulator: oven simulator whose heater this switches
+		@type simulator: OvenSimulator
+		@param pin: (Optional) nominal pin - unused
+		@type pin: int
+		"""
+		super(SimulatedRelay, self).__init__()
+		self.simulator = simulator
+		self.pin = pin
+
+	@property
+	def state(self):
+		"""
+		@rtype: bool
+		"""
+		return self.simulator.relayState
+
+	def enable(self):
+		self.simulator.setHeater(True)
+
+	def disable(self):
+		self.simulator.setHeater(False)
+
+	def toggle(self):
+		self.simulator.setHeater(not self.state)
+
+	def cleanup(self):
+		self.disable()
+
+
+class OvenSimulator(object):
+	"""
+	Simulated oven hardware. Either:
+	- pass spiFactory & createRelay() to ToastStateMachine along with the virtual clock - see SimulateProfile. Touches
+	  no GPIO or SPI, so it also runs on a Pi
+	- or wire it into the mock GPIO/SPI libraries: the relay pin drives heater power and the thermocouple reads correctly
+	  encoded MAX31855 frames of the simulated temperature. Use as a context manager, or call attach()/detach()
+	"""
+	def __init__(self, model=None, clock=None, relayPin=None, activeHigh=True, noise=0.0, seed=None):
+		"""
+		Constructor
+		@param model: (Optional) oven model. Default: OvenModel()
+		@type model: OvenModel
+		@param clock: (Optional) clock to read simulation time from. Default: new VirtualClock
+		@type clock: VirtualClock
+		@param relayPin: (Optional) relay GPIO pin to watch. Default: any pin
+		@type relayPin: int
+		@param activeHigh: whether the relay turns the heater on with a high output
+		@type activeHigh: bool
+		@param noise: standard deviation of gaussian noise added to thermocouple readings (C)
+		@type noise: float
+		@param seed: (Optional) random seed for the noise
+		@type seed: int
+		"""
+		super(OvenSimulator, self).__init__()
+		self.model = model or OvenModel()
+		self.clock = clock or VirtualClock()
+		self.relayPin = relayPin
+		self.activeHigh = activeHigh
+		self.noise = float(noise)
+		self.random = random.Random(seed)
+		self.relayState = False
+		self.switchCount = 0
+
+	@staticmethod
+	def CheckMocksInUse():
+		"""
+		Raise if the real RPi.GPIO/spidev libraries are in use - never simulate on real hardware
+		"""
+		from library.sensors import sensor_relay, sensor_thermocouple
+		if sensor_relay.GPIO is not mock_gpio or sensor_thermocouple.spidev is not mock_spidev:
+			raise RuntimeError("Oven simulation requires the mock GPIO & SPI libraries")
+
+	# region Attach
+
+	def attach(self):
+		"""
+		Start intercepting the mock relay & SPI
+		"""
+		self.CheckMocksInUse()
+		self.model.time = self.clock()
+		mock_gpio.addOutputListener(self.onRelayOutput)
+		mock_spidev.setFrameSource(self.readFrame)
+
+	def detach(self):
+		"""
+		Stop intercepting the mock relay & SPI
+		"""
+		mock_gpio.removeOutputListener(self.onRelayOutput)
+		if mock_spidev.FRAME_SOURCE == self.readFrame:
+			mock_spidev.setFrameSource(None)
+
+	def __enter__(self):
+		self.attach()
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		self.detach()
+
+	# endregion Attach
+	# region Callbacks
+
+	def onRelayOutput(self, pin, value):
+		"""
+		mock_gpio output listener - switch the heater
+		"""
+		if self.relayPin is not None and pin != self.relayPin:
+			return
+		self.setHeater((value == mock_gpio.HIGH) == self.activeHigh)
+
+	def setHeater(self, state):
+		"""
+		Switch the heater now
+		@param state: heater on
+		@type state: bool
+		"""
+		if state != self.relayState:
+			self.relayState = state
+			self.switchCount += 1
+			self.model.setPower(1.0 if state else 0.0, self.clock())
+
+	def readFrame(self, csPin):
+		"""
+		mock_spidev frame source - encode the current simulated temperature
+		"""
+		temperature = self.model.advanceTo(self.clock())
+		if self.noise:
+			temperature += self.random.gauss(0.0, self.noise)
+		return Thermocouple.EncodeFrame(temperature, self.model.ambient)
+
+	# endregion Callbacks
+	# region Injection
+
+	def spiFactory(self, csPin):
+		"""
+		Thermocouple SPI device factory reading this oven
+		@param csPin: chip select pin
+		@type csPin: int
+		@rtype: SimulatedSpiDev
+		"""
+		return SimulatedSpiDev(self, csPin)
+
+	def createRelay(self, pin=None):
+		"""
+		Create a relay switching this oven's heater
+		@param pin: (Optional) nominal pin - unused
+		@type pin: int
+		@rtype: SimulatedRelay
+		"""
+		return SimulatedRelay(self, pin)
+
+	# endregion Injection
+
+
+def SimulateProfile(configPath=GetBaseConfigurationFilePath(), simulator=None, maxDuration=3600.0, debugLevel=logging.WARNING):
+	"""
+	Run a config's reflow profile against a simulated oven as fast as the CPU allows. Nothing touches GPIO or SPI
+	@param configPath: path to JSON config
+	@type configPath: str
+	@param simulator: (Optional) oven simulator to run against. Default: OvenSimulator()
+	@type simulator: OvenSimulator
+	@param maxDuration: give up after this much simulated time (s)
+	@type maxDuration: float
+	@param debugLevel: logging level of the state machine
+	@type debugLevel: int
+	@return: tuple of the finished state machine's status, data records
+	@rtype: tuple[str, library.other.run_store.RunStore]
+	"""
+	simulator = simulator or OvenSimulator()
+	stateMachine = ToastStateMachine(
+		configPath,
+		spiFactory=simulator.spiFactory,
+		relay=simulator.createRelay(),
+		clock=simulator.clock,
+		debugLevel=debugLevel
+	)
+	try:
+		simulator.model.time = simulator.clock()
+		data = stateMachine.simulate(maxDuration)
+		return stateMachine.running, data
+	finally:
+		stateMachine.cleanup()
+
+
+def SimulateRun(stateMachine, simulator, maxDuration=3600.0):
+	"""
+	Run a full reflow profile of an existing state machine against a simulated oven on the simulator's virtual clock
+	@param stateMachine: state machine to run. Its relay & thermocouple must use the mock libraries
+	@type stateMachine: library.control.stateMachine.ToastStateMachine
+	@param simulator: oven simulator to run against
+	@type simulator: OvenSimulator
+	@param maxDuration: give up after this much simulated time (s)
+	@type maxDuration: float
+	@return: the state machine's data records
+	@rtype: library.other.run_store.RunStore
+	"""
+	# Swap in the virtual clock - the time-proportioning output is then stepped instead of running its thread
+	clock = stateMachine.clock
+	stateMachine.clock = simulator.clock
+	try:
+		with simulator:
+			stateMachine.setupOutput()
+			return stateMachine.simulate(maxDuration)
+	finally:
+		# Hand the real clock back to a fresh output thread
+		stateMachine.clock = clock
+		stateMachine.setupOutput()
@@ -18,7 +18,10 @@ from library.ui.panels.StateConfigurationPanel import StateConfigurationPanel
 from library.ui.panels.TuningConfigurationPanel import TuningConfigurationPanel
 from library.ui.visualizer_liveGraph import LiveVisualizer
 from library.control.stateMachine import ToastStateMachine, STATES
+from library.control.loop import ControlLoopRunner
 from library.other import decorators
+from library.other.run_logger import GetDefaultRunLogPath
+from library.other.run_archive import EXTENSION as ARCHIVE_EXTENSION
 from library.other.setupLogging import getLogger
 from definitions import CONFIG_DIR, DATA_DIR, MODEL_NAME, DEBUG_LEVEL, CONFIG_KEY_DURATION, CONFIG_KEY_TARGET
 
@@ -29,11 +32,13 @@ class ToastingGUI(ToastingBase):
 
 	# region Init
 
-	def __init__(self, baseConfigurationPath):
+	def __init__(self, baseConfigurationPath, spiFactory=None):
 		"""
 		Constructor for ToastingGUI
 		@param baseConfigurationPath: path to base configuration file to use
 		@type baseConfigurationPath: str
+		@param spiFactory: (Optional) thermocouple SPI device factory, e.g. for capturing frames
+		@type spiFactory: func
 		"""
 		super(ToastingGUI, self).__init__(None)
 
@@ -53,10 +58,15 @@ class ToastingGUI(ToastingBase):
 		# Create the state machine
 		self.toaster = ToastStateMachine(
 			jsonConfigPath=baseConfigurationPath,
-			stateMachineCompleteCallback=self.toastingComplete,
+			# Called from the control loop thread - hand over to the UI thread
+			stateMachineCompleteCallback=lambda: wx.CallAfter(self.toastingComplete),
+			spiFactory=spiFactory,
 			debugLevel=DEBUG_LEVEL
 		)
 
+		# Control loop ticks the state machine on its own thread, the timer only refreshes the GUI
+		self.controlLoop = ControlLoopRunner(self.toaster, debugLevel=DEBUG_LEVEL)
+
 		# Notebook pages
 		self.stateConfigPanel = StateConfigurationPanel(
 			self.baseNotebook,
@@ -84,6 +94,9 @@ class ToastingGUI(ToastingBase):
 		# state machine update
 		self.testing = False
 		self.testTimer = 0.0
+		self.autoTuning = False
+		# Last sensor health shutdown reported - (monitor, trips)
+		self.healthTripReported = None
 
 		# status bar
 		self.statusGridItems = ['relay', 'temp', 'reftemp', 'status', 'state']
@@ -107,7 +120,8 @@ class ToastingGUI(ToastingBase):
 		# Status grid
 		self.setupStatusGrid()
 
-		# Start the timer (period stored in seconds, Start() takes period in mS)
+		# Start the control loop & the GUI refresh timer (period stored in seconds, Start() takes period in mS)
+		self.controlLoop.start()
 		self.timer.Start(self.timerPeriod * 1000)
 
 		for i, (panelName, panel) in enumerate(self.notebookPages.items()):
@@ -236,16 +250,16 @@ class ToastingGUI(ToastingBase):
 		@return: pid config dict
 		@rtype: dict[str, float]
 		"""
-		return self.toaster.pid.getConfig()
+		return self.toaster.pidConfig
 
 	@pidConfig.setter
 	def pidConfig(self, configDict):
 		"""
-		Set new PID config dict
+		Set new PID config dict - safe during a run
 		@param configDict: PID configuration dict
 		@type configDict: dict[str, float]
 		"""
-		self.toaster.pid.setConfig(configDict)
+		self.toaster.updateGains(configDict)
 
 	# endregion Properties
 	# region BusyReady
@@ -262,7 +276,7 @@ class ToastingGUI(ToastingBase):
 		"""
 		Ready signal handler
 		"""
-		if not self.testing:
+		if not self.testing and not self.autoTuning:
 			self.isBusy = False
 			self.Enable()
 			self.progressGauge.SetValue(100)
@@ -273,7 +287,9 @@ class ToastingGUI(ToastingBase):
 		@param enable: to enable or disable, that is the question
 		@type enable: bool
 		"""
-		super(ToastingGUI, self).Enable(enable)
+		# Disabling the frame disables every child - keep it enabled while auto-tuning, so the stop button works, and
+		# disable the controls one by one instead
+		super(ToastingGUI, self).Enable(enable or self.autoTuning)
 		for panel in self.notebookPages.values():
 			if panel:
 				panel.Enable(enable)
@@ -301,7 +317,7 @@ class ToastingGUI(ToastingBase):
 		"""
 		# Save button
 		try:
-			if self.toaster.running not in [STATES.STOPPED, STATES.COMPLETE] or self.toaster.data == []:
+			if self.toaster.running not in [STATES.STOPPED, STATES.COMPLETE] or not self.toaster.data:
 				self.saveDataButton.Enable(False)
 			else:
 				self.saveDataButton.Enable(enable)
@@ -309,20 +325,24 @@ class ToastingGUI(ToastingBase):
 			self.saveDataButton.Enable(False)
 
 		# Reflow/relay control buttons
-		if self.testing:
+		if self.testing or self.autoTuning:
 			self.enableStatusBarButtons(False)
 			self.testButton.Enable(False)
+			# Auto-tune can be stopped part way through
+			self.autoTuneButton.Enable(self.autoTuning)
 			self.pauseReflowButton.Enable(False)
 			self.startStopReflowButton.Enable(False)
 		else:
 			if self.toaster.running in [STATES.RUNNING, STATES.PAUSED]:
 				self.enableStatusBarButtons(False)
 				self.testButton.Enable(False)
+				self.autoTuneButton.Enable(False)
 				self.pauseReflowButton.Enable(True)
 				self.startStopReflowButton.Enable(True)
 			else:
 				self.enableStatusBarButtons(True)
 				self.testButton.Enable(enable)
+				self.autoTuneButton.Enable(enable)
 				self.pauseReflowButton.Enable(False)
 				self.startStopReflowButton.Enable(enable)
 
@@ -333,7 +353,7 @@ class ToastingGUI(ToastingBase):
 		@type enable: bool
 		"""
 		# Temperature units radio boxes
-		if self.toaster.running in [STATES.RUNNING, STATES.PAUSED] or self.testing:
+		if self.toaster.running in [STATES.RUNNING, STATES.PAUSED] or self.testing or self.autoTuning:
 			self.celsiusRadioButton.Enable(False)
 			self.fahrenheitRadioButton.Enable(False)
 		else:
@@ -367,8 +387,9 @@ class ToastingGUI(ToastingBase):
 		self.liveVisualizer.addDataPoint(
 			self.toaster.timestamp,
 			self.temperature,
-			self.toaster.targetState,
-			self.toaster.currentState
+			self.toaster.setpoint,
+			self.toaster.currentState,
+			self.toaster.probeTemperatures
 		)
 		
 		# Force visualizer to redraw itself with the new data
@@ -642,7 +663,7 @@ class ToastingGUI(ToastingBase):
 
 	def timerChangeCallback(self):
 		"""
-		Callback from tuning page for timer period changed
+		Callback from tuning page for timer period changed. The control loop picks up the new period by itself
 		"""
 		self.timer.Stop()
 		self.timer.Start(self.timerPeriod * 1000.0)
@@ -669,13 +690,15 @@ class ToastingGUI(ToastingBase):
 			self.startStopReflowButton.SetLabel('Stop Reflow')
 			self.pauseReflowButton.Enable(True)
 			# start reflowing
-			self.toaster.start()
-			self.updateStatus("Reflow process started")
+			self.controlLoop.resetStats()
+			runLogPath = GetDefaultRunLogPath()
+			self.toaster.start(runLogPath=runLogPath)
+			self.updateStatus("Reflow process started - logging to {}".format(runLogPath))
 		else:
 			self.toaster.stop()
 			self.startStopReflowButton.SetLabel('Start Reflow')
 			self.pauseReflowButton.Enable(False)
-			self.updateStatus("Reflow process stopped")
+			self.updateStatus("Reflow process stopped - control loop: {}".format(self.controlLoop.statsToString()))
 			self.writeDataAndConfigToDisk()
 		self.pauseReflowButton.SetLabel('Pause Reflow')
 
@@ -702,6 +725,59 @@ class ToastingGUI(ToastingBase):
 		self.updateStatus("Testing relay")
 		self.testTimer = 0.0
 		self.testing = True
+		self.controlLoop.testing = True
+
+	def autoTuneButtonOnButtonClick(self, event):
+		"""
+		Event handler for auto-tune button - start or stop the relay auto-tune experiment
+		"""
+		event.Skip()
+		if self.autoTuning:
+			self.toaster.stop()
+			self.autoTuneComplete()
+			return
+
+		setpoint = self.toaster.config.autotune['setpoint']
+		message = "The oven will cycle around {} {} for several minutes while the PID is tuned. Continue?".format(
+			setpoint, self.units
+		)
+		if not self.yesNoMessage(message, caption="Auto-Tune PID"):
+			return
+
+		self.toaster.startAutoTune()
+		self.autoTuning = True
+		self.autoTuneButton.SetLabel("Stop Auto-Tune")
+		self.updateStatus("Auto-tuning PID around {}".format(setpoint), logLevel=logging.INFO)
+		self.Enable(False)
+
+	def autoTuneComplete(self):
+		"""
+		Show the auto-tune results and offer to load the proposed gains
+		"""
+		self.autoTuning = False
+		self.autoTuneButton.SetLabel("Auto-Tune PID")
+		self.toaster.heaterOff()
+
+		tuner = self.toaster.autoTuner
+		if not tuner.complete:
+			status = "Auto-tune failed" if tuner.failed else "Auto-tune stopped"
+			self.updateStatus(status, logLevel=logging.WARN)
+			self.Enable(True)
+			return
+
+		rule = self.toaster.config.autotune['rule']
+		kP, kI, kD = tuner.getGains(rule)
+		message = "Ultimate gain: {:.4f}\nUltimate period: {:.1f}s\n\nProposed gains ({}):\nkP: {:.4f}\nkI: {:.5f}\nkD: {:.4f}".format(
+			tuner.ultimateGain, tuner.period, rule, kP, kI, kD
+		)
+		message += "\n\nLoad these gains?"
+		if self.yesNoMessage(message, caption="Auto-Tune Complete"):
+			self.toaster.applyAutoTune(rule)
+			self.tuningConfigPanel.initializeTuningPage()
+			self.updateStatus("Auto-tuned PID gains loaded", logLevel=logging.INFO)
+		else:
+			self.updateStatus("Auto-tuned PID gains discarded")
+		self.Enable(True)
 
 	@decorators.BusyReady(MODEL_NAME)
 	def toastingComplete(self):
@@ -709,6 +785,7 @@ class ToastingGUI(ToastingBase):
 		Do some stuff once reflow is complete
 		"""
 		self.startStopReflowButton.SetLabel("Start Reflow")
+		self.updateStatus("Reflow complete - control loop: {}".format(self.controlLoop.statsToString()))
 		self.writeDataAndConfigToDisk()
 
 	def writeDataAndConfigToDisk(self):
@@ -744,6 +821,11 @@ class ToastingGUI(ToastingBase):
 		status = "Config stored @ {}".format(configPath)
 		self.updateStatus(status, logLevel=logging.INFO)
 
+		# And both in a single archive, quick to load for comparing runs
+		archivePath = os.path.splitext(csvPath)[0] + ARCHIVE_EXTENSION
+		if self.toaster.dumpDataToArchive(archivePath):
+			self.updateStatus("Run archive stored @ {}".format(archivePath), logLevel=logging.INFO)
+
 	# endregion ToastingPage
 	# region Testing
 
@@ -766,6 +848,7 @@ class ToastingGUI(ToastingBase):
 		# Stop testing and ensure relay is off after 10 seconds
 		if self.testTimer >= self.RELAY_TEST_DURATION:
 			self.testing = False
+			self.controlLoop.testing = False
 			self.toaster.relay.disable()
 			self.updateStatus("Relay test complete")
 			self.Enable(True)
@@ -874,26 +957,23 @@ class ToastingGUI(ToastingBase):
 		event.Skip()
 
 		# handle progress gauge
-		if self.testing or self.toaster.running == STATES.RUNNING:
+		if self.testing or self.toaster.running in [STATES.RUNNING, STATES.TUNING]:
 			self.progressGauge.Pulse()
-			# disable other panels while running
+			# disable other panels while running - PID gains can still be tuned live
 			self.stateConfigPanel.Enable(False)
-			self.tuningConfigPanel.Enable(False)
+			self.tuningConfigPanel.lockRunSettings(True)
 		else:
 			self.progressGauge.SetValue(100)
 			self.stateConfigPanel.Enable(True)
-			self.tuningConfigPanel.Enable(True)
-
-		# tell control to read thermocouple, etc.
-		self.toaster.tick(self.testing)
+			self.tuningConfigPanel.lockRunSettings(False)
 
-		# check errors
-		recentErrorCount = self.toaster.getRecentErrorCount()
-		if recentErrorCount >= 5:
-			self.toaster.stop()
+		# check errors - the state machine has already stopped with the heater off
+		health = self.toaster.health
+		if health.tripped and self.healthTripReported != (health, health.trips):
+			self.healthTripReported = (health, health.trips)
 
-			caption = "Too Many Thermocouple Errors"
-			errorMessage = "There have been {} errors recently. Please check the Thermocouple connection"
+			caption = "Thermocouple Unhealthy"
+			errorMessage = "Reflow stopped: {}. Please check the Thermocouple connection".format(health.tripped)
 			errorMessage += "\n and the thermocouple itself for issues."
 			ErrorMessage(self, errorMessage, caption)
 
@@ -901,6 +981,14 @@ class ToastingGUI(ToastingBase):
 		if self.testing:
 			self.testTick()
 
+		# Report auto-tune progress, and the results once the experiment finishes
+		if self.autoTuning:
+			if self.toaster.running == STATES.TUNING:
+				tuner = self.toaster.autoTuner
+				self.updateStatus("Auto-tuning PID: {} of {} cycles measured".format(tuner.cyclesMeasured, tuner.cycles))
+			else:
+				self.autoTuneComplete()
+
 		# Update live visualization if we're running
 		if self.toaster.running == STATES.RUNNING:
 			self.updateLiveVisualization()
@@ -968,6 +1056,7 @@ class ToastingGUI(ToastingBase):
 		Event handler for exit
 		"""
 		event.Skip()
+		self.controlLoop.stop()
 		self.toaster.cleanup()
 		self.Destroy()
 		
@@ -149,6 +149,9 @@ class ToastingBase ( wx.Frame ):
 		self.testButton = wx.Button( sbSizer3.GetStaticBox(), wx.ID_ANY, u"Test Relay", wx.DefaultPosition, wx.DefaultSize, 0 )
 		sbSizer3.Add( self.testButton, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALL, 5 )
 
+		self.autoTuneButton = wx.Button( sbSizer3.GetStaticBox(), wx.ID_ANY, u"Auto-Tune PID", wx.DefaultPosition, wx.DefaultSize, 0 )
+		sbSizer3.Add( self.autoTuneButton, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALL, 5 )
+
 
 		sbSizer3.Add( ( 0, 0), 1, wx.EXPAND, 0 )
 
@@ -212,6 +215,7 @@ class ToastingBase ( wx.Frame ):
 		self.baseNotebook.Bind( wx.EVT_NOTEBOOK_PAGE_CHANGED, self.baseNotebookOnNotebookPageChanged )
 		self.saveDataButton.Bind( wx.EVT_BUTTON, self.saveDataButtonOnButtonClick )
 		self.testButton.Bind( wx.EVT_BUTTON, self.testButtonOnButtonClick )
+		self.autoTuneButton.Bind( wx.EVT_BUTTON, self.autoTuneButtonOnButtonClick )
 		self.startStopReflowButton.Bind( wx.EVT_BUTTON, self.startStopReflowButtonOnButtonClick )
 		self.pauseReflowButton.Bind( wx.EVT_BUTTON, self.pauseReflowButtonOnButtonClick )
 
@@ -254,6 +258,9 @@ class ToastingBase ( wx.Frame ):
 	def testButtonOnButtonClick( self, event ):
 		event.Skip()
 
+	def autoTuneButtonOnButtonClick( self, event ):
+		event.Skip()
+
 	def startStopReflowButtonOnButtonClick( self, event ):
 		event.Skip()
 
@@ -12,7 +12,7 @@ import wx.grid
 
 from library.other.decorators import BusyReady
 from library.ui.ToastingGUIBase import StateConfigurationPanelBase
-from definitions import CONFIG_KEY_DURATION, CONFIG_KEY_TARGET, DEBUG_LEVEL, MODEL_NAME
+from definitions import CONFIG_KEY_DURATION, CONFIG_KEY_TARGET, CONFIG_KEY_PID, DEBUG_LEVEL, MODEL_NAME
 from library.ui.visualizer_configuration import ConfigurationVisualizer
 
 
@@ -127,6 +127,11 @@ class StateConfigurationPanel(StateConfigurationPanelBase):
 				CONFIG_KEY_DURATION: int(stepDuration)
 			}
 
+			# The grid doesn't show per-state PID gains - carry them over from the current config
+			stepGains = self.stateConfiguration.get(stepName, {}).get(CONFIG_KEY_PID)
+			if stepGains:
+				configDict[stepName][CONFIG_KEY_PID] = stepGains
+
 		return configDict
 
 	# endregion Initialization
@@ -160,7 +165,8 @@ class StateConfigurationPanel(StateConfigurationPanelBase):
 		sizer.Layout()
 
 		# Create and add the configurationVisualizer canvas to the sizer
-		visualizer = ConfigurationVisualizer(self.stateConfiguration, units=self.units)
+		trajectory = self.toaster.createTrajectory() if self.toaster else None
+		visualizer = ConfigurationVisualizer(self.stateConfiguration, units=self.units, trajectory=trajectory)
 		canvas = FigureCanvas(self.configurationVisualizerPanel, -1, visualizer.fig)
 		sizer.Add(canvas, 1, wx.EXPAND)
 		self.configurationVisualizerPanel.Layout()
@@ -30,6 +30,9 @@ class TuningConfigurationPanel(ControlTuningPanelBase):
 
 		self.timerChangeCallback = timerChangeCallback
 
+		# Timer period & pins can't change mid-run
+		self.runSettingsLocked = False
+
 		# Map text ctrls to their update methods
 		self._pidTextCtrlToUpdateMethodMap = {
 			self.pidPTextCtrl: self.updateProportionalGain,
@@ -49,18 +52,17 @@ class TuningConfigurationPanel(ControlTuningPanelBase):
 		"""
 		Initialize PID page with values from PID controller
 		"""
-		#
-		pid = self.toaster.pid
+		pidConfig = self.pidConfig
 
 		# Gains
-		self.pidPTextCtrl.SetValue(str(pid.kP))
-		self.pidITextCtrl.SetValue(str(pid.kI))
-		self.pidDTextCtrl.SetValue(str(pid.kD))
+		self.pidPTextCtrl.SetValue(str(pidConfig['kP']))
+		self.pidITextCtrl.SetValue(str(pidConfig['kI']))
+		self.pidDTextCtrl.SetValue(str(pidConfig['kD']))
 
 		# Limits
-		self.pidMinOutLimitTextCtrl.SetValue(str(pid.min) if pid.min is not None else "")
-		self.pidMaxOutLimitTextCtrl.SetValue(str(pid.max) if pid.max is not None else "")
-		self.pidWindupGuardTextCtrl.SetValue(str(pid.windupGuard) if pid.windupGuard is not None else "")
+		self.pidMinOutLimitTextCtrl.SetValue(str(pidConfig['min']))
+		self.pidMaxOutLimitTextCtrl.SetValue(str(pidConfig['max']))
+		self.pidWindupGuardTextCtrl.SetValue(str(pidConfig['windupGuard']))
 
 		# Timer period & sensor pins
 		self.timerPeriodTextCtrl.SetValue(str(self.timerPeriod))
@@ -80,6 +82,17 @@ class TuningConfigurationPanel(ControlTuningPanelBase):
 		"""
 		self.parentFrame.updateStatus(text, logLevel)
 
+	def lockRunSettings(self, running):
+		"""
+		PID gains stay editable during a run - they're applied bumplessly between control steps. The timer period &
+		pins are locked
+		@param running: whether a run is in progress
+		@type running: bool
+		"""
+		self.runSettingsLocked = running
+		for textCtrl in self._otherTextCtrlToUpdateMethodMap:
+			textCtrl.Enable(not running)
+
 	# endregion ParentMethods
 	# region Configuration
 		# region Properties
@@ -115,16 +128,16 @@ class TuningConfigurationPanel(ControlTuningPanelBase):
 		@return: dict of PIDs
 		@rtype: dict[str, float]
 		"""
-		return self.toaster.pid.getConfig()
+		return self.toaster.pidConfig
 
 	@pidConfig.setter
 	def pidConfig(self, configDict):
 		"""
-		Set the PID config
+		Set the PID config - safe during a run
 		@param configDict: dict of PID values
 		@type configDict: dict[str, str]
 		"""
-		self.toaster.pid.setConfig(configDict)
+		self.toaster.updateGains(configDict)
 
 		# endregion Properties
 		# region PIDGains
@@ -135,7 +148,7 @@ class TuningConfigurationPanel(ControlTuningPanelBase):
 		"""
 		try:
 			self.pidConfig = {'kP': self.pidPTextCtrl.GetValue()}
-			self.updateStatus("kP updated to: {}".format(self.toaster.pid.kP))
+			self.updateStatus("kP updated to: {}".format(self.pidConfig['kP']))
 		except Exception as e:
 			ErrorMessage(self.parentFrame,  str(e), "Invalid P-Gain Value")
 
@@ -145,7 +158,7 @@ class TuningConfigurationPanel(ControlTuningPanelBase):
 		"""
 		try:
 			self.pidConfig = {'kI': self.pidITextCtrl.GetValue()}
-			self.updateStatus("kI updated to: {}".format(self.toaster.pid.kI))
+			self.updateStatus("kI updated to: {}".format(self.pidConfig['kI']))
 		except Exception as e:
 			ErrorMessage(self.parentFrame,  str(e), "Invalid I-Gain Value")
 
@@ -155,7 +168,7 @@ class TuningConfigurationPanel(ControlTuningPanelBase):
 		"""
 		try:
 			self.pidConfig = {'kD': self.pidDTextCtrl.GetValue()}
-			self.updateStatus("kD updated to: {}".format(self.toaster.pid.kD))
+			self.updateStatus("kD updated to: {}".format(self.pidConfig['kD']))
 		except Exception as e:
 			ErrorMessage(self.parentFrame,  str(e), "Invalid D-Gain Value")
 
@@ -168,7 +181,7 @@ class TuningConfigurationPanel(ControlTuningPanelBase):
 		"""
 		try:
 			self.pidConfig = {'min': self.pidMinOutLimitTextCtrl.GetValue()}
-			self.updateStatus("PID min output limit updated to: {}".format(self.toaster.pid.min))
+			self.updateStatus("PID min output limit updated to: {}".format(self.pidConfig['min']))
 		except Exception as e:
 			ErrorMessage(self.parentFrame,  str(e), "Invalid PID Min Output Limit Value")
 
@@ -178,7 +191,7 @@ class TuningConfigurationPanel(ControlTuningPanelBase):
 		"""
 		try:
 			self.pidConfig = {'max': self.pidMaxOutLimitTextCtrl.GetValue()}
-			self.updateStatus("PID max output limit updated to: {}".format(self.toaster.pid.max))
+			self.updateStatus("PID max output limit updated to: {}".format(self.pidConfig['max']))
 		except Exception as e:
 			ErrorMessage(self.parentFrame,  str(e), "Invalid PID Max Output Limit Value")
 
@@ -188,7 +201,7 @@ class TuningConfigurationPanel(ControlTuningPanelBase):
 		"""
 		try:
 			self.pidConfig = {'windupGuard': self.pidWindupGuardTextCtrl.GetValue()}
-			self.updateStatus("PID windup guard updated to: {}".format(self.toaster.pid.windupGuard))
+			self.updateStatus("PID windup guard updated to: {}".format(self.pidConfig['windupGuard']))
 		except Exception as e:
 			ErrorMessage(self.parentFrame,  str(e), "Invalid PID Windup Guard Value")
 
@@ -271,6 +284,9 @@ class TuningConfigurationPanel(ControlTuningPanelBase):
 			self.updatePIDsFromFields()
 		except:
 			return
+		if self.runSettingsLocked:
+			self.updateStatus("PID tuning updated - pin & timing settings are locked while running")
+			return
 		try:
 			self.updateOtherTuningFromFields()
 		except:
@@ -3,7 +3,9 @@ matplotlib.use("WXAgg")
 import matplotlib.lines as mlines
 from matplotlib.figure import Figure
 
-from definitions import CONFIG_KEY_TARGET, CONFIG_KEY_DURATION
+from library.control.plan import ProfilePlan
+from library.control.trajectory import SetpointTrajectory
+from definitions import CONFIG_KEY_TARGET
 
 COLORS = {
 	'+': 'red',
@@ -14,7 +16,7 @@ COLORS = {
 
 
 class ConfigurationVisualizer:
-	def __init__(self, stateConfiguration, doNotDrawLines=False, units='celsius'):
+	def __init__(self, stateConfiguration, doNotDrawLines=False, units='celsius', trajectory=None):
 		"""
 		Configuration visualizer (line graph) constructor
 		@param stateConfiguration: State config dict for reflow profile
@@ -23,9 +25,13 @@ class ConfigurationVisualizer:
 		@type doNotDrawLines: bool
 		@param units: Temperature units to display. Default: celsius
 		@type units: str
+		@param trajectory: (Optional) setpoint trajectory to draw, e.g. ToastStateMachine.createTrajectory().
+			Default: straight lines from 0
+		@type trajectory: SetpointTrajectory
 		"""
 		super().__init__()
 		self.stateConfiguration = stateConfiguration
+		self.trajectory = trajectory
 
 		if self.stateConfiguration:
 			# Get the maximum temps & timestamps from the config and increase them by 50 to use as axes limits
@@ -85,35 +91,24 @@ class ConfigurationVisualizer:
 			axis.set_ylim(0, maxTargetTemp)
 			axis.set_xlim(0, maxTimestamp)
 		else:
-			cumulativeTimestamp = 0
-			previousStateTargetTemperature = 0
+			# The same segments the control loop follows when the trajectory is enabled
+			trajectory = self.trajectory
+			if not trajectory or stateConfiguration is not self.stateConfiguration:
+				trajectory = SetpointTrajectory(ProfilePlan.Compile(stateConfiguration))
 
 			# Create a line graph for each stage in the desired reflow profile
-			for step, currentStateConfig in stateConfiguration.items():
-				currentStateTargetTemperature = currentStateConfig[CONFIG_KEY_TARGET]
-				currentStateDuration = currentStateConfig[CONFIG_KEY_DURATION]
-
-				# X-axis start/end values
-				currentStateStartTimestamp = cumulativeTimestamp
-				currentStateEndTimestamp = cumulativeTimestamp + currentStateDuration
-
-				# Y-axis start/end values
-				currentStateStartTemperature = previousStateTargetTemperature
-				currentStateEndTemperature = currentStateTargetTemperature
+			for stateIndex in range(len(trajectory.plan.names)):
+				timestamps, temperatures = trajectory.segment(stateIndex)
 
 				# Draw the line and add it to the graph
 				line = mlines.Line2D(
-					[currentStateStartTimestamp, currentStateEndTimestamp],
-					[currentStateStartTemperature, currentStateEndTemperature],
-					color=self.getColor(currentStateTargetTemperature, previousStateTargetTemperature),
+					timestamps,
+					temperatures,
+					color=self.getColor(temperatures[-1], temperatures[0]),
 					linewidth=1
 				)
 				axis.add_line(line)
 
-				# Track
-				cumulativeTimestamp = currentStateEndTimestamp
-				previousStateTargetTemperature = currentStateTargetTemperature
-
 			axis.autoscale(True)
 
 		# Set the timestamps
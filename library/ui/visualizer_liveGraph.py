@@ -36,11 +36,16 @@ class LiveVisualizer(ConfigurationVisualizer):
 		# dict[str, matplotlib.figure.Figure]
 		self.stateTargetPlots = {}
 		""" @type: dict[str, matplotlib.lines.Line2D] """
+		# Individual thermocouple probes when reading more than one
+		self.probePlots = {}
+		""" @type: dict[str, matplotlib.lines.Line2D] """
+		self.probeData = {}
+		""" @type: dict[str, tuple[list[float], list[float]]] """
 		
 		# Actual data storage
 		self.liveData = []
 
-	def addDataPoint(self, x, y, currentTarget, stateName):
+	def addDataPoint(self, x, y, currentTarget, stateName, probeTemperatures=None):
 		"""
 		Add an X/Y point to the graph
 		@param x: x value
@@ -51,6 +56,8 @@ class LiveVisualizer(ConfigurationVisualizer):
 		@type currentTarget: float
 		@param stateName: name of step this datapoint is associated with
 		@type stateName: str
+		@param probeTemperatures: (Optional) individual probe temperatures, keyed by probe name
+		@type probeTemperatures: dict[str, float]
 		"""
 		self.lastState = self.currentState
 		self.currentState = stateName
@@ -58,6 +65,35 @@ class LiveVisualizer(ConfigurationVisualizer):
 
 		self.updateGraph()
 
+		if probeTemperatures:
+			self.updateProbeGraphs(float(x), probeTemperatures)
+
+	def updateProbeGraphs(self, x, probeTemperatures):
+		"""
+		Append the latest individual probe temperatures to their plots. Faulted probes (None) are skipped
+		@param x: x value
+		@type x: float
+		@param probeTemperatures: probe temperatures keyed by probe name
+		@type probeTemperatures: dict[str, float]
+		"""
+		for probeName, temperature in probeTemperatures.items():
+			if temperature is None:
+				continue
+
+			if probeName not in self.probePlots:
+				self.probePlots[probeName], = self.axes.plot(
+					[],
+					linewidth=1,
+					linestyle=':',
+					label=probeName
+				)
+				self.probeData[probeName] = ([], [])
+
+			timestamps, temperatures = self.probeData[probeName]
+			timestamps.append(x)
+			temperatures.append(float(temperature))
+			self.probePlots[probeName].set_data(timestamps, temperatures)
+
 	def updateGraph(self):
 		"""
 		Update the x/y data of the plots to reflect new data
@@ -0,0 +1,127 @@
+import math
+
+import pytest
+
+from library.control.autotune import RelayAutoTuner
+from library.simulation.oven import OvenModel
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def RunExperiment(tuner, model, period=0.5):
+	"""
+	Drive an oven model directly with the auto-tuner's relay until it finishes
+	"""
+	t = 0.0
+	while tuner.running:
+		relayState = tuner.update(t, model.advanceTo(t))
+		model.setPower(1.0 if relayState else 0.0, t)
+		t += period
+	return t
+
+
+def test_RelayExperiment():
+	"""
+	Test the measured oscillation of a dead-time dominated oven against its analytic relay limit cycle
+	"""
+	model = OvenModel(gain=350.0, timeConstant=300.0, deadTime=8.0, ambient=25.0)
+	tuner = RelayAutoTuner(setpoint=150.0, hysteresis=0.5, cycles=3)
+	RunExperiment(tuner, model)
+
+	assert tuner.complete
+	assert not tuner.failed
+	assert not tuner.relayState
+	assert tuner.cyclesMeasured >= 3
+
+	# Near the setpoint the oven heats at ~(350 + 25 - 150) / 300 C/s and cools at ~(150 - 25) / 300 C/s,
+	# and keeps going for the dead time after each switch
+	heatRate = (350.0 + 25.0 - 150.0) / 300.0
+	coolRate = (150.0 - 25.0) / 300.0
+	expectedPeriod = (8.0 * heatRate + 8.0 * coolRate + 2 * 0.5) * (1.0 / heatRate + 1.0 / coolRate)
+	expectedAmplitude = (8.0 * heatRate + 8.0 * coolRate) / 2.0 + 0.5
+	assert tuner.period == pytest.approx(expectedPeriod, rel=0.1)
+	assert tuner.amplitude == pytest.approx(expectedAmplitude, rel=0.1)
+	assert tuner.ultimateGain == pytest.approx(
+		4.0 * 0.5 / (math.pi * math.sqrt(tuner.amplitude ** 2 - 0.5 ** 2))
+	)
+
+
+def test_Gains():
+	"""
+	Test the tuning rules and the proposed PID config
+	"""
+	tuner = RelayAutoTuner(setpoint=150.0, cycles=2)
+	with pytest.raises(Exception):
+		tuner.getGains()
+	RunExperiment(tuner, OvenModel())
+
+	ku = tuner.ultimateGain
+	pu = tuner.period
+	kP, kI, kD = tuner.getGains('ziegler-nichols')
+	assert kP == pytest.approx(0.6 * ku)
+	assert kI == pytest.approx(0.6 * ku / (0.5 * pu))
+	assert kD == pytest.approx(0.6 * ku * 0.125 * pu)
+
+	# Gentler rules give lower proportional gain
+	assert tuner.getGains('no-overshoot')[0] < tuner.getGains('some-overshoot')[0] < kP
+
+	config = tuner.getPIDConfig(baseConfig={'kP': 1.0, 'min': '', 'windupGuard': 20.0})
+	assert (config['kP'], config['kI'], config['kD']) == (kP, kI, kD)
+	assert config['windupGuard'] == 20.0
+
+	with pytest.raises(Exception):
+		tuner.getGains('guesswork')
+
+
+def test_Timeout():
+	"""
+	Test that an oven that can't reach the setpoint fails the experiment and turns the relay off
+	"""
+	tuner = RelayAutoTuner(setpoint=500.0, maxDuration=120.0)
+	RunExperiment(tuner, OvenModel())
+	assert tuner.failed
+	assert not tuner.complete
+	assert not tuner.relayState
+	assert tuner.period is None
+	assert tuner.update(1000.0, 25.0) is False
+
+
+def test_StartAboveSetpoint():
+	"""
+	Test that starting hot cools first and still measures the oscillation
+	"""
+	tuner = RelayAutoTuner.FromConfig({'cycles': 2}, setpoint=100.0)
+	assert tuner.setpoint == 100.0
+	assert tuner.cycles == 2
+	RunExperiment(tuner, OvenModel(temperature=200.0))
+	assert tuner.complete
+	assert tuner.period > 0
+
+
+def test_OutputSpan():
+	"""
+	Test that the gains scale with the controller output that turns the heater fully on, e.g. a 0..10 time-proportioning
+	span
+	"""
+	unit = RelayAutoTuner.FromConfig({'cycles': 2}, setpoint=100.0)
+	scaled = RelayAutoTuner.FromConfig({'cycles': 2}, setpoint=100.0, outputHigh=10.0)
+	assert scaled.outputHigh == 10.0 and scaled.outputLow == 0.0
+	RunExperiment(unit, OvenModel())
+	RunExperiment(scaled, OvenModel())
+	assert scaled.ultimateGain == pytest.approx(10.0 * unit.ultimateGain)
+	for gain, unitGain in zip(scaled.getGains(), unit.getGains()):
+		assert gain == pytest.approx(10.0 * unitGain)
@@ -0,0 +1,90 @@
+import math
+import random
+
+import pytest
+
+from library.control.estimator import KalmanEstimator
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def Quantise(temperature):
+	"""
+	Round down to the MAX31855's 0.25C resolution
+	"""
+	return math.floor(temperature / 0.25) * 0.25
+
+
+def test_FirstUpdate():
+	"""
+	Test that the first measurement initializes the filter
+	"""
+	estimator = KalmanEstimator()
+	assert not estimator.initialized
+	assert estimator.update(0.0, 42.0) == (42.0, 0.0)
+	assert estimator.initialized
+
+	estimator.reset()
+	assert not estimator.initialized
+	assert estimator.update(5.0, 10.0) == (10.0, 0.0)
+
+
+def test_RampSlope():
+	"""
+	Test that the slope of a quantised, noisy ramp is recovered, and is far smoother than a finite difference
+	"""
+	rng = random.Random(0)
+	estimator = KalmanEstimator()
+	dt = 0.1
+	trueSlope = 1.5
+
+	slopes = []
+	finiteDifferences = []
+	lastMeasurement = None
+	for i in range(1200):
+		t = i * dt
+		measurement = Quantise(25.0 + trueSlope * t + rng.gauss(0.0, 0.2))
+		temperature, slope = estimator.update(t, measurement)
+		if i >= 600:
+			slopes.append(slope)
+			finiteDifferences.append((measurement - lastMeasurement) / dt)
+		lastMeasurement = measurement
+
+	# The pair from the last update, together
+	assert estimator.estimate == (temperature, slope) == (estimator.temperature, estimator.slope)
+
+	meanSlope = sum(slopes) / len(slopes)
+	assert meanSlope == pytest.approx(trueSlope, abs=0.05)
+	assert temperature == pytest.approx(25.0 + trueSlope * t, abs=1.0)
+
+	def spread(values):
+		mean = sum(values) / len(values)
+		return math.sqrt(sum((value - mean) ** 2 for value in values) / len(values))
+
+	assert spread(slopes) < spread(finiteDifferences) / 20.0
+
+
+def test_FromConfig():
+	"""
+	Test building from a config dict, and rejecting invalid noise values
+	"""
+	estimator = KalmanEstimator.FromConfig({'processNoise': 0.5})
+	assert estimator.processNoise == 0.5
+	assert estimator.measurementNoise == KalmanEstimator.BASE_CONFIG['measurementNoise']
+
+	with pytest.raises(Exception):
+		KalmanEstimator(measurementNoise=0.0)
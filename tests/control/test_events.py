@@ -0,0 +1,157 @@
+import time
+from threading import Event
+
+import pytest
+
+from library.control.events import EventBus, EVENTS, Message
+from library.control.stateMachine import ToastStateMachine, STATES
+from library.simulation.oven import OvenModel, OvenSimulator
+from definitions import GetBaseConfigurationFilePath
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def WaitForDelivery(bus, timeout=5.0):
+	end = time.monotonic() + timeout
+	while any(subscription.pending for subscription in bus.subscriptions) and time.monotonic() < end:
+		time.sleep(0.001)
+	# Let the last callbacks return
+	time.sleep(0.01)
+
+
+def test_publish():
+	"""
+	Test that subscribers get the events they asked for, in order, and a failing subscriber keeps going
+	"""
+	bus = EventBus()
+	try:
+		everything = []
+		states = []
+		bus.subscribe(everything.append, name='everything')
+		bus.subscribe(lambda message: states.append(message.data['state']), events=[EVENTS.STATE_CHANGED], name='states')
+		failing = bus.subscribe(lambda message: 1 / 0, events=[EVENTS.FAULT], name='failing')
+
+		assert bus.subscribed(EVENTS.STATE_CHANGED) and bus.subscribed(EVENTS.TICK)
+		with pytest.raises(AssertionError):
+			bus.subscribe(everything.append, events=['exploded'])
+
+		bus.publish(EVENTS.STATE_CHANGED, 1.0, {'state': 'ramp'})
+		bus.publish(EVENTS.FAULT, 2.0)
+		bus.publish(EVENTS.FAULT, 3.0)
+		bus.publish(EVENTS.STATE_CHANGED, 4.0, {'state': 'soak'})
+		WaitForDelivery(bus)
+
+		assert [message.event for message in everything] == [EVENTS.STATE_CHANGED, EVENTS.FAULT, EVENTS.FAULT, EVENTS.STATE_CHANGED]
+		assert everything[1] == Message(EVENTS.FAULT, 2.0, {})
+		assert states == ['ramp', 'soak']
+		assert bus.stats['failing'] == {'delivered': 2, 'dropped': 0, 'pending': 0, 'errors': 2}
+
+		bus.unsubscribe(failing)
+		assert not failing.is_alive()
+		assert list(bus.stats) == ['everything', 'states']
+		# Still received by the catch-all subscriber
+		assert bus.subscribed(EVENTS.FAULT)
+	finally:
+		bus.close()
+	assert not bus.subscriptions and not bus.subscribed(EVENTS.TICK)
+
+
+def test_slowSubscriber():
+	"""
+	Test that a stuck subscriber neither delays publishing nor starves the others - its oldest messages are dropped
+	"""
+	bus = EventBus()
+	release = Event()
+	try:
+		received = []
+		stuck = bus.subscribe(lambda message: release.wait(), queueSize=10, name='stuck')
+		bus.subscribe(received.append, queueSize=1000, name='fast')
+
+		bus.publish(EVENTS.TICK, 0.0)
+		# Wait for the stuck subscriber to pick up the first message
+		end = time.monotonic() + 5.0
+		while stuck.pending and time.monotonic() < end:
+			time.sleep(0.001)
+
+		start = time.perf_counter()
+		for i in range(1, 501):
+			bus.publish(EVENTS.TICK, float(i))
+		assert time.perf_counter() - start < 0.5
+
+		assert bus.stats['stuck']['dropped'] == 490
+		assert bus.stats['stuck']['pending'] == 10
+		release.set()
+		WaitForDelivery(bus)
+		assert [message.timestamp for message in received] == [float(i) for i in range(501)]
+		assert bus.stats['fast']['dropped'] == 0
+		# The newest messages are kept
+		assert bus.stats['stuck']['delivered'] == 11
+	finally:
+		release.set()
+		bus.close()
+
+
+def test_stateMachine():
+	"""
+	Test the events of a simulated run
+	"""
+	simulator = OvenSimulator(OvenModel(gain=300.0), seed=1)
+	sm = ToastStateMachine(
+		GetBaseConfigurationFilePath(),
+		spiFactory=simulator.spiFactory,
+		relay=simulator.createRelay(),
+		clock=simulator.clock
+	)
+	messages = []
+	try:
+		sm.events.subscribe(messages.append, queueSize=100000)
+		sm.simulate(2000.0)
+		assert sm.running == STATES.COMPLETE
+		WaitForDelivery(sm.events)
+		assert sm.events.stats['append']['dropped'] == 0
+	finally:
+		sm.cleanup()
+
+	events = [message.event for message in messages]
+	assert [message.data['state'] for message in messages if message.event == EVENTS.STATE_CHANGED] == sm.states
+	assert events.count(EVENTS.SAMPLE) == len(sm.data)
+	assert events.count(EVENTS.COMPLETED) == 1
+	assert events.count(EVENTS.TICK) > len(sm.data)
+	samples = [message.data for message in messages if message.event == EVENTS.SAMPLE]
+	assert samples[-1]['State'] == sm.data[-1]['State']
+	assert samples[-1]['Temperature'] == sm.data[-1]['Temperature']
+
+
+def test_configReload():
+	"""
+	Test that subscriptions survive loading a new config, and end with cleanup
+	"""
+	sm = ToastStateMachine(GetBaseConfigurationFilePath())
+	try:
+		messages = []
+		subscription = sm.events.subscribe(messages.append, events=[EVENTS.STATE_CHANGED])
+		sm.config = GetBaseConfigurationFilePath()
+		assert sm.events.subscriptions == (subscription,)
+		assert subscription.is_alive()
+
+		sm.start()
+		WaitForDelivery(sm.events)
+		assert [message.data['state'] for message in messages] == [sm.states[0]]
+	finally:
+		sm.cleanup()
+	assert not sm.events.subscriptions
+	assert not subscription.is_alive()
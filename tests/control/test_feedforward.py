@@ -0,0 +1,81 @@
+from collections import OrderedDict
+
+import pytest
+
+from library.control.feedforward import FeedForward
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def GetProfile():
+	profile = OrderedDict()
+	profile['ramp'] = {'target': 150, 'duration': 250}
+	profile['soak'] = {'target': 150, 'duration': 60}
+	profile['spike'] = {'target': 235, 'duration': 10}
+	profile['cooling'] = {'target': 50, 'duration': 180}
+	return profile
+
+
+def test_power():
+	"""
+	Test the heater power needed to hold & ramp a first-order oven
+	"""
+	feedForward = FeedForward(gain=350.0, timeConstant=300.0, ambient=25.0)
+	# Holding at 200C takes (200 - 25) / 350 of full power
+	assert feedForward.power(200.0, 200.0, 60.0) == pytest.approx(0.5)
+	# Ramping 0.5C/s adds 300 * 0.5 / 350, evaluated at the middle of the ramp
+	assert feedForward.power(100.0, 200.0, 200.0) == pytest.approx((150.0 + 125.0) / 350.0)
+	# Clipped to what the heater can do
+	assert feedForward.power(100.0, 300.0, 10.0) == 1.0
+	assert feedForward.power(200.0, 50.0, 100.0) == 0.0
+	assert feedForward.power(100.0, 200.0, 0.0) == 1.0
+
+
+def test_plan():
+	"""
+	Test planning the term of each state, starting from ambient with the last state off
+	"""
+	feedForward = FeedForward(gain=350.0, timeConstant=300.0, ambient=25.0, outputScale=10.0)
+	assert feedForward.term(0) == 0.0
+
+	terms = feedForward.plan(GetProfile())
+	assert terms == feedForward.terms
+	assert len(terms) == 4
+	assert terms[0] == pytest.approx(10.0 * (300.0 * 0.5 + 87.5 - 25.0) / 350.0)
+	assert terms[1] == pytest.approx(10.0 * 125.0 / 350.0)
+	assert terms[2] == 10.0
+	assert terms[3] == 0.0
+	assert feedForward.term(1) == terms[1]
+	assert feedForward.term(4) == 0.0
+
+	# Same profile in fahrenheit plans the same terms
+	fahrenheit = OrderedDict(
+		(name, {'target': state['target'] * 9.0 / 5.0 + 32.0, 'duration': state['duration']})
+		for name, state in GetProfile().items()
+	)
+	assert feedForward.plan(fahrenheit, 'fahrenheit') == pytest.approx(terms)
+
+
+def test_FromConfig():
+	"""
+	Test creating a feed-forward stage from a partial config dict
+	"""
+	feedForward = FeedForward.FromConfig({'gain': 200.0})
+	assert feedForward.gain == 200.0
+	assert feedForward.timeConstant == FeedForward.BASE_CONFIG['timeConstant']
+	with pytest.raises(AssertionError):
+		FeedForward.FromConfig({'gain': 0.0})
@@ -0,0 +1,121 @@
+import os
+import sys
+import csv
+import json
+import subprocess
+from collections import OrderedDict
+
+import pytest
+
+from library.control.headless import LoadProfile, RunHeadless
+from library.control.stateMachine import STATES
+from library.other.config import ToasterConfig
+from library.other.run_logger import RecoverRunLog
+from definitions import ROOT_DIR, GetBaseConfigurationFilePath
+
+# Seconds allowed to import the headless stack, measured in a fresh interpreter. Well under a second on a Pi Zero
+IMPORT_TIME_BUDGET = 0.5
+
+# Modules the headless stack must not pull in
+GUI_MODULES = ['wx', 'matplotlib']
+
+IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import toasting
+import library.control.headless
+duration = time.perf_counter() - start
+print(duration, ",".join(sorted(set(name.split('.')[0] for name in sys.modules))))
+"""
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def test_importTimeBudget():
+	"""
+	Test that the headless entry point imports no GUI modules and fits the import time budget
+	"""
+	durations = []
+	for i in range(3):
+		result = subprocess.run(
+			[sys.executable, "-c", IMPORT_SCRIPT],
+			cwd=ROOT_DIR,
+			stdout=subprocess.PIPE,
+			check=True,
+			universal_newlines=True
+		)
+		duration, modules = result.stdout.strip().splitlines()[-1].split(" ")
+		for module in GUI_MODULES:
+			assert module not in modules.split(","), "{} imported by the headless stack".format(module)
+		durations.append(float(duration))
+	assert min(durations) < IMPORT_TIME_BUDGET
+
+
+def test_LoadProfile(tmp_path):
+	"""
+	Test loading a profile from a bare states file and from a full config
+	"""
+	assert LoadProfile(GetBaseConfigurationFilePath()) == ToasterConfig.ReadConfig(GetBaseConfigurationFilePath())['states']
+
+	states = OrderedDict([("soak", {"target": 100, "duration": 10}), ("cool", {"target": 50, "duration": 10})])
+	profilePath = str(tmp_path / "profile.json")
+	with open(profilePath, "w") as ouf:
+		json.dump(states, ouf)
+	assert list(LoadProfile(profilePath).items()) == list(states.items())
+
+	with open(profilePath, "w") as ouf:
+		json.dump({"units": "celsius"}, ouf)
+	with pytest.raises(Exception):
+		LoadProfile(profilePath)
+
+
+def test_RunHeadless(tmp_path):
+	"""
+	Test a short headless run against the mock thermocouple, which reads 0C, writing data & config
+	"""
+	config = ToasterConfig.ReadConfig(GetBaseConfigurationFilePath())
+	config['tuning']['timerPeriod'] = 0.05
+	configPath = str(tmp_path / "config.json")
+	with open(configPath, "w") as ouf:
+		json.dump(config, ouf)
+
+	# Ramp already reached, then two short soaks
+	states = OrderedDict([
+		("ramp", {"target": 1, "duration": 0}),
+		("soak", {"target": 1, "duration": 1.0}),
+		("cooling", {"target": 1, "duration": 0.5}),
+	])
+	profilePath = str(tmp_path / "profile.json")
+	with open(profilePath, "w") as ouf:
+		json.dump(states, ouf)
+
+	dataPath = str(tmp_path / "run.csv")
+	assert RunHeadless(configPath, profilePath=profilePath, dataPath=dataPath) == STATES.COMPLETE
+
+	with open(dataPath, "r") as inf:
+		rows = list(csv.DictReader(inf))
+	assert rows
+	assert {row['State'] for row in rows} <= {'soak', 'cooling'}
+	assert float(rows[-1]['Timestamp']) >= 1.0
+	with open(os.path.join(str(tmp_path), "run.json"), "r") as inf:
+		assert list(json.load(inf)['states']) == list(states)
+
+	# The run was streamed to a log next to the data, which recovers to the same CSV
+	recoveredPath = str(tmp_path / "recovered.csv")
+	assert RecoverRunLog(str(tmp_path / "run.log"), recoveredPath) == len(rows)
+	with open(recoveredPath, "r") as inf:
+		assert list(csv.DictReader(inf)) == rows
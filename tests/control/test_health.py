@@ -0,0 +1,102 @@
+import pytest
+
+from library.control.health import SensorHealthMonitor
+from library.sensors.sensor_thermocouple import TCNoTCError, TCGndShortError, TCError
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def test_window():
+	"""
+	Test that the rolling window counts each fault type and forgets reads as they fall out of it
+	"""
+	monitor = SensorHealthMonitor(window=4, maxErrors=3, staleTimeout=0.0)
+	assert monitor.check(0.0) is None
+	assert monitor.errorRate == 0.0
+
+	assert monitor.update(0.0, TCNoTCError('no thermocouple attached')) is None
+	assert monitor.update(1.0, IOError('spi')) is None
+	assert monitor.update(2.0) is None
+	assert monitor.recentErrors == 2
+	assert monitor.recentErrorCount('TCNoTCError') == 1
+	assert monitor.recentErrorCount('other') == 1
+	assert monitor.errorRate == pytest.approx(2.0 / 3.0)
+
+	assert monitor.update(3.0, TCGndShortError('short to ground')) == "3 of the last 4 thermocouple reads failed"
+	# The first fault falls out of the window
+	assert monitor.update(4.0) is None
+	assert monitor.recentErrors == 2
+	assert monitor.recentErrorCount('TCNoTCError') == 0
+	for i in range(4):
+		monitor.update(5.0 + i)
+	assert monitor.recentErrors == 0
+
+	stats = monitor.stats
+	assert stats['reads'] == 9
+	assert stats['errors'] == 3
+	assert stats['errorRate'] == pytest.approx(3.0 / 9.0)
+	assert stats['maxConsecutiveErrors'] == 2
+	assert stats['faults'] == {'TCNoTCError': 1, 'TCGndShortError': 1, 'TCVccShortError': 0, 'TCError': 0, 'other': 1}
+
+	monitor.trip("test")
+	assert monitor.tripped == "test" and monitor.trips == 1
+	monitor.reset()
+	assert monitor.reads == 0 and monitor.trips == 0 and monitor.tripped is None
+
+
+def test_limits():
+	"""
+	Test the per fault type limits and the config
+	"""
+	monitor = SensorHealthMonitor.FromConfig({'maxErrors': 0, 'faultLimits': {'TCError': 2}, 'staleTimeout': 0})
+	assert monitor.window == 10
+	assert monitor.faultLimits['TCError'] == 2 and monitor.faultLimits['TCNoTCError'] == 0
+
+	for i in range(5):
+		assert monitor.update(float(i), TCNoTCError('no thermocouple attached')) is None
+	assert monitor.update(5.0, TCError('dummy 0 bits missing')) is None
+	assert monitor.update(6.0, TCError('dummy 0 bits missing')) == "2 TCError errors in the last 7 thermocouple reads"
+
+	assert SensorHealthMonitor.FaultType(TCGndShortError('short to ground')) == 'TCGndShortError'
+	assert SensorHealthMonitor.FaultType(ValueError()) == 'other'
+	with pytest.raises(AssertionError):
+		SensorHealthMonitor(faultLimits={'TCMeltedError': 1})
+	with pytest.raises(AssertionError):
+		SensorHealthMonitor(window=5, maxErrors=6)
+
+
+def test_stale():
+	"""
+	Test that a reading older than the timeout is unhealthy - whether reads fail or a sampler stops refreshing
+	"""
+	monitor = SensorHealthMonitor(maxErrors=0, staleTimeout=2.0)
+	assert monitor.update(10.0) is None
+	assert monitor.update(11.0, TCNoTCError('no thermocouple attached')) is None
+	assert monitor.update(12.5, TCNoTCError('no thermocouple attached')) == "no fresh thermocouple reading for 2.5s"
+
+	# Good reads of a sample taken long ago
+	monitor = SensorHealthMonitor(maxErrors=0, staleTimeout=2.0)
+	assert monitor.update(10.0, readingTime=9.5) is None
+	assert monitor.update(11.0, readingTime=9.5) is None
+	assert monitor.update(12.0, readingTime=9.5) == "no fresh thermocouple reading for 2.5s"
+	assert monitor.readingAge(12.0) == 2.5
+
+	# No good reading yet - aged from the first read
+	monitor = SensorHealthMonitor(maxErrors=0, staleTimeout=2.0)
+	assert monitor.readingAge(100.0) == 0.0
+	monitor.update(100.0, TCError('dummy 0 bits missing'))
+	assert monitor.readingAge(103.0) == 3.0
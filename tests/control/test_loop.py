@@ -0,0 +1,129 @@
+import time
+
+import pytest
+
+from library.control.loop import ControlLoopRunner
+from library.control.stateMachine import ToastStateMachine
+from definitions import GetBaseConfigurationFilePath
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+class TickRecorder(object):
+	"""
+	Stands in for the state machine - records the elapsed time passed to each tick, taking tickDuration to run
+	"""
+	def __init__(self, timerPeriod, tickDuration=0.0, failEvery=0):
+		self.timerPeriod = timerPeriod
+		self.tickDuration = tickDuration
+		self.failEvery = failEvery
+		self.elapsed = []
+
+	def tick(self, testing=False, elapsed=None):
+		self.elapsed.append(elapsed)
+		time.sleep(self.tickDuration)
+		if self.failEvery and len(self.elapsed) % self.failEvery == 0:
+			raise Exception("Tick failed")
+
+
+def RunLoop(stateMachine, duration):
+	"""
+	Run a control loop for duration seconds
+	@return: the stopped runner
+	@rtype: ControlLoopRunner
+	"""
+	runner = ControlLoopRunner(stateMachine)
+	runner.start()
+	time.sleep(duration)
+	runner.stop()
+	assert not runner.is_alive()
+	return runner
+
+
+def test_deadlines():
+	"""
+	Test that ticks land on the timer period and the elapsed times add up to the clock time
+	"""
+	recorder = TickRecorder(0.05, tickDuration=0.0125)
+	runner = RunLoop(recorder, 0.5)
+
+	stats = runner.stats
+	assert stats['ticks'] == len(recorder.elapsed)
+	# Deadlines don't drift - about one tick per period despite each tick taking a quarter of it
+	assert stats['ticks'] == pytest.approx(10, abs=2)
+	assert stats['overruns'] == 0
+	assert stats['maxJitter'] < 0.05
+	assert sum(recorder.elapsed[1:]) == pytest.approx(0.05 * (stats['ticks'] - 1), abs=0.05)
+
+
+def test_overrun():
+	"""
+	Test that ticks slower than the period are counted as overruns, skip the missed deadlines, and still report the
+	real elapsed time
+	"""
+	recorder = TickRecorder(0.02, tickDuration=0.05)
+	start = time.monotonic()
+	runner = RunLoop(recorder, 0.5)
+	duration = time.monotonic() - start
+
+	stats = runner.stats
+	assert stats['overruns'] >= stats['ticks'] - 1 > 0
+	assert stats['skippedTicks'] >= stats['overruns']
+	# No burst of catch-up ticks
+	assert stats['ticks'] < duration / 0.05 + 2
+	assert sum(recorder.elapsed[1:]) == pytest.approx(duration, abs=0.1)
+	assert all(elapsed >= 0.05 for elapsed in recorder.elapsed[1:])
+
+	runner.resetStats()
+	assert runner.stats['ticks'] == 0
+	assert runner.stats['meanJitter'] == 0.0
+
+
+def test_failingTick():
+	"""
+	Test that an exception in a tick doesn't stop the loop
+	"""
+	recorder = TickRecorder(0.01, failEvery=2)
+	runner = RunLoop(recorder, 0.2)
+	assert runner.stats['ticks'] > 4
+
+
+def test_stateMachineTimestamp():
+	"""
+	Test that the state machine timestamp follows the clock when ticked by the loop, even with a slow sensor read
+	"""
+	sm = ToastStateMachine(GetBaseConfigurationFilePath())
+	try:
+		sm.timerPeriod = 0.02
+		read = sm.sensor.read
+
+		def SlowRead():
+			time.sleep(0.03)
+			return read()
+
+		sm.thermocouple.read = SlowRead
+		sm.start()
+		start = time.monotonic()
+		runner = RunLoop(sm, 0.5)
+		duration = time.monotonic() - start
+
+		assert runner.stats['overruns'] > 0
+		# Counting ticks would put the timestamp at 0.02 * ticks - well short of the time taken
+		assert sm.timestamp == pytest.approx(duration, abs=0.1)
+		assert sm.timestamp > 0.02 * runner.stats['ticks'] * 1.25
+	finally:
+		sm.cleanup()
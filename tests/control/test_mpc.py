@@ -0,0 +1,104 @@
+import pytest
+
+from library.control.mpc import ModelPredictiveController
+from library.simulation.oven import OvenModel
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def RunClosedLoop(controller, model, target, duration, period=1.0):
+	"""
+	Drive an oven model with the controller's relay decisions, returning the temperature each period
+	"""
+	controller.target = target
+	temperatures = []
+	t = 0.0
+	while t < duration:
+		controller.compute(t, model.temperature)
+		t += period
+		model.setPower(1.0 if controller.relayState else 0.0, t - period)
+		model.advanceTo(t)
+		temperatures.append(model.temperature)
+	return temperatures
+
+
+def test_holdsTarget():
+	"""
+	Test that with an exact model the MPC heats to the target, coasting in without overshoot, and holds it
+	"""
+	controller = ModelPredictiveController()
+	temperatures = RunClosedLoop(controller, OvenModel(), target=150.0, duration=400.0)
+	assert max(temperatures) < 151.0
+	assert min(temperatures[-100:]) > 148.5
+	# Heating at full power until it has to coast
+	assert controller.output in [0.0, controller.outputScale]
+	assert temperatures[60] > 80.0
+
+
+def test_deadTime():
+	"""
+	Test that decisions still in flight through the dead time are part of the prediction
+	"""
+	controller = ModelPredictiveController(deadTime=10.0)
+	assert len(controller.prediction) == 0
+	controller.target = 150.0
+	controller.compute(0.0, 25.0)
+	assert controller.relayState
+	assert len(controller.prediction) == 10 + 60
+	# Nothing changes until the dead time has passed
+	assert controller.prediction[9] == pytest.approx(25.0)
+	assert controller.prediction[10] > 25.0
+
+	# Right at the target with the relay on the whole dead time - heat is already on its way, so switch off
+	controller.reset()
+	controller._history.extend([1.0] * 10)
+	assert controller.compute(1.0, 150.0) == 0.0
+	assert controller.error == 0.0
+	assert controller.ierror == 0.0
+
+
+def test_units():
+	"""
+	Test that fahrenheit states & targets give the same decisions as celsius
+	"""
+	celsius = ModelPredictiveController()
+	fahrenheit = ModelPredictiveController(units='fahrenheit')
+	celsius.target = 150.0
+	fahrenheit.target = 302.0
+	for temperature in [25.0, 120.0, 148.0, 152.0]:
+		celsius.compute(0.0, temperature)
+		fahrenheit.compute(0.0, temperature * 9.0 / 5.0 + 32.0)
+		assert celsius.relayState == fahrenheit.relayState
+
+	with pytest.raises(Exception):
+		ModelPredictiveController().compute(0.0, 25.0)
+
+
+def test_FromConfig():
+	"""
+	Test creating a controller from a partial config dict, and getting its config back
+	"""
+	controller = ModelPredictiveController.FromConfig({'enabled': True, 'horizon': 30.0, 'deadTime': 4.0})
+	assert controller.horizon == 30.0
+	assert controller.gain == ModelPredictiveController.BASE_CONFIG['gain']
+	config = controller.getConfig()
+	assert list(config) == list(ModelPredictiveController.BASE_CONFIG)
+	assert config['deadTime'] == 4.0
+	assert ModelPredictiveController.FromConfig(config).getConfig() == config
+
+	with pytest.raises(AssertionError):
+		ModelPredictiveController(horizon=0.5)
@@ -0,0 +1,142 @@
+import json
+
+import pytest
+
+from library.control.optimizer import GainOptimizer, main
+from library.control.stateMachine import STATES, ToastStateMachine
+from library.other.config import ToasterConfig
+from library.simulation.oven import OvenSimulator, SimulateRun
+from definitions import GetBaseConfigurationFilePath
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def GetOptimizer(processes=1):
+	config = ToasterConfig(GetBaseConfigurationFilePath())
+	return GainOptimizer(
+		config.states,
+		pidConfig=config.pids.getConfig(),
+		timerPeriod=config.clockPeriod,
+		processes=processes,
+		seed=0
+	)
+
+
+def test_sampling():
+	"""
+	Test that candidates stay within the search ranges
+	"""
+	optimizer = GetOptimizer()
+	candidates = optimizer.sample(500)
+	for name, (low, high) in optimizer.ranges.items():
+		assert len(candidates[name]) == 500
+		assert low <= candidates[name].min() and candidates[name].max() <= high
+
+	refined = optimizer.refine(candidates, 200, spread=0.1)
+	for name, (low, high) in optimizer.ranges.items():
+		assert len(refined[name]) == 200
+		assert low <= refined[name].min() and refined[name].max() <= high
+
+	with pytest.raises(Exception):
+		GainOptimizer(None, ranges={'kP': (0.0, 1.0)})
+
+
+def test_parallelMatchesSerial():
+	"""
+	Test that splitting candidates across a process pool doesn't change the scores
+	"""
+	import multiprocessing
+
+	optimizer = GetOptimizer(processes=2)
+	candidates = optimizer.sample(40)
+	serial = optimizer.evaluate(candidates)
+	with multiprocessing.Pool(2) as pool:
+		parallel = optimizer.evaluate(candidates, pool)
+	for key in serial:
+		assert list(serial[key]) == list(parallel[key])
+
+
+def test_optimize():
+	"""
+	Test that the optimized gains improve on the configured ones and complete a full state machine run
+	"""
+	optimizer = GetOptimizer()
+	baseline = optimizer.evaluate({
+		name: [value] for name, value in optimizer.pidConfig.items() if name in optimizer.ranges
+	})
+
+	pidConfig, metrics = optimizer.optimize(candidates=128, rounds=2, eliteCount=8)
+	assert metrics['completed']
+	assert metrics['cost'] <= baseline['cost'][0]
+	# Limits are carried over from the config
+	assert pidConfig['min'] == optimizer.pidConfig['min']
+
+	sm = ToastStateMachine(GetBaseConfigurationFilePath())
+	try:
+		sm.pid.setConfig(pidConfig)
+		SimulateRun(sm, OvenSimulator())
+		assert sm.running == STATES.COMPLETE
+	finally:
+		sm.cleanup()
+
+
+def test_main(tmp_path):
+	"""
+	Test the command line writes the best gains back as the tuning.pid block
+	"""
+	outputPath = str(tmp_path / "tuned.json")
+	assert main([
+		GetBaseConfigurationFilePath(), "--output", outputPath, "--candidates", "32", "--rounds", "1", "--processes", "1", "--seed", "1"
+	]) == 0
+
+	with open(outputPath) as inf:
+		tuned = json.load(inf)
+	with open(GetBaseConfigurationFilePath()) as inf:
+		base = json.load(inf)
+	assert tuned['states'] == base['states']
+	assert tuned['tuning']['pid']['kP'] != base['tuning']['pid']['kP']
+	assert set(tuned['tuning']['pid']) == set(base['tuning']['pid'])
+
+
+def test_mainModelOnly(tmp_path):
+	"""
+	Test the command line can fit the oven model to a log and write it to the mpc & feedForward blocks only
+	"""
+	from library.simulation.oven import OvenModel
+
+	csvPath = str(tmp_path / "run.csv")
+	sm = ToastStateMachine(GetBaseConfigurationFilePath())
+	try:
+		SimulateRun(sm, OvenSimulator(model=OvenModel(gain=300.0, timeConstant=250.0, deadTime=6.0), seed=0))
+		assert sm.dumpDataToCsv(csvPath)
+	finally:
+		sm.cleanup()
+
+	outputPath = str(tmp_path / "fitted.json")
+	assert main([GetBaseConfigurationFilePath(), "--log", csvPath, "--output", outputPath, "--model-only"]) == 0
+
+	with open(outputPath) as inf:
+		fitted = json.load(inf)
+	with open(GetBaseConfigurationFilePath()) as inf:
+		base = json.load(inf)
+	assert fitted['tuning']['pid'] == base['tuning']['pid']
+	mpc = fitted['tuning']['mpc']
+	assert mpc['enabled'] == base['tuning']['mpc']['enabled']
+	assert mpc['gain'] == pytest.approx(300.0, rel=0.1)
+	assert mpc['timeConstant'] == pytest.approx(250.0, rel=0.1)
+	assert mpc['deadTime'] == pytest.approx(6.0, abs=1.0)
+	assert fitted['tuning']['feedForward']['gain'] == mpc['gain']
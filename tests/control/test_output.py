@@ -0,0 +1,173 @@
+import time
+
+import pytest
+
+from library.control.output import TimeProportionalOutput
+from library.simulation.oven import VirtualClock
+from library.sensors.sensor_relay import Relay
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+class RecordingRelay(Relay):
+	"""
+	Relay that records the clock time of every switch
+	"""
+	def __init__(self, clock):
+		self.clock = clock
+		self.switches = []
+		super(RecordingRelay, self).__init__(pin=21)
+
+	def enable(self):
+		super(RecordingRelay, self).enable()
+		self.switches.append((self.clock(), True))
+
+	def disable(self):
+		super(RecordingRelay, self).disable()
+		self.switches.append((self.clock(), False))
+
+
+def RunFor(output, clock, duration):
+	"""
+	Step the output at each scheduled switch until duration has passed
+	"""
+	end = clock() + duration
+	nextSwitch = output.step()
+	while nextSwitch < end:
+		clock.advance(nextSwitch - clock())
+		nextSwitch = output.step()
+	clock.advance(end - clock())
+
+
+def test_dutyCycle():
+	"""
+	Test that the relay is on for duty * window at the start of each window
+	"""
+	clock = VirtualClock()
+	relay = RecordingRelay(clock)
+	try:
+		output = TimeProportionalOutput(relay, window=2.0, minimumPulse=0.1, clock=clock)
+		output.setOutput(2.5)
+		assert output.duty == pytest.approx(0.25)
+		relay.switches = []
+
+		RunFor(output, clock, 6.0)
+		assert relay.switches == [(0.0, True), (0.5, False), (2.0, True), (2.5, False), (4.0, True), (4.5, False)]
+
+		# Outputs outside the range are clipped to 0% - 100%
+		output.setOutput(25.0)
+		assert output.duty == 1.0
+		output.setOutput(-5.0)
+		assert output.duty == 0.0
+	finally:
+		relay.cleanup()
+
+
+def test_minimumPulse():
+	"""
+	Test that pulses and gaps shorter than the minimum pulse are dropped
+	"""
+	clock = VirtualClock()
+	relay = RecordingRelay(clock)
+	try:
+		output = TimeProportionalOutput(relay, window=2.0, minimumPulse=0.2, clock=clock)
+		assert output.onTime(0.05) == 0.0
+		assert output.onTime(0.5) == 1.0
+		assert output.onTime(0.95) == 2.0
+
+		output.duty = 0.05
+		relay.switches = []
+		RunFor(output, clock, 4.0)
+		assert relay.switches == []
+
+		output.duty = 0.95
+		RunFor(output, clock, 4.0)
+		assert relay.switches == [(4.0, True)]
+		assert relay.state
+
+		with pytest.raises(AssertionError):
+			TimeProportionalOutput(relay, window=2.0, minimumPulse=1.0)
+	finally:
+		relay.cleanup()
+
+
+def test_dutyChange():
+	"""
+	Test that lowering the duty mid-window cuts the current pulse short, and off() turns the relay off at once
+	"""
+	clock = VirtualClock()
+	relay = RecordingRelay(clock)
+	try:
+		output = TimeProportionalOutput(relay, window=2.0, clock=clock)
+		output.duty = 0.75
+		relay.switches = []
+		RunFor(output, clock, 1.0)
+		assert relay.switches == [(0.0, True)]
+
+		output.duty = 0.25
+		RunFor(output, clock, 1.0)
+		assert relay.switches == [(0.0, True), (1.0, False)]
+
+		output.duty = 1.0
+		RunFor(output, clock, 2.5)
+		assert relay.state
+		output.off()
+		assert output.duty == 0.0
+		assert not relay.state
+		# Nothing left scheduled for the rest of the window
+		RunFor(output, clock, 2.0)
+		assert not relay.state
+	finally:
+		relay.cleanup()
+
+
+def test_FromConfig():
+	"""
+	Test creating an output from a partial config dict
+	"""
+	relay = Relay(pin=21)
+	try:
+		output = TimeProportionalOutput.FromConfig(relay, {'window': 4.0, 'outputMax': 2.0})
+		assert output.window == 4.0
+		assert output.minimumPulse == TimeProportionalOutput.BASE_CONFIG['minimumPulse']
+		output.setOutput(1.0)
+		assert output.duty == 0.5
+	finally:
+		relay.cleanup()
+
+
+def test_thread():
+	"""
+	Test that the scheduler thread switches the relay on the real clock, and stop() leaves it off
+	"""
+	relay = RecordingRelay(time.monotonic)
+	try:
+		output = TimeProportionalOutput(relay, window=0.2, minimumPulse=0.01)
+		relay.switches = []
+		output.start()
+		output.duty = 0.5
+		time.sleep(0.5)
+		output.stop()
+		assert not output.is_alive()
+		assert not relay.state
+
+		onTimes = [switchTime for switchTime, state in relay.switches if state]
+		assert len(onTimes) >= 2
+		# One window between pulses, give or take scheduler jitter
+		assert onTimes[1] - onTimes[0] == pytest.approx(0.2, abs=0.05)
+	finally:
+		relay.cleanup()
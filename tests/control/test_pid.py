@@ -161,3 +161,110 @@ def test_toString():
 	pid = GetPID()
 
 	print(pid.currentStateToString())
+
+
+def test_computeWithSlope():
+	"""
+	Test that a measured slope replaces the finite-difference derivative
+	"""
+	pid = GetPID()
+	pid.target = 100.0
+	pid.compute(0.0, 10.0)
+	pid.compute(1.0, 20.0, slope=2.0)
+	assert pid.derror == -2.0
+	assert pid.output == pid.kP * 80.0 + pid.kI * pid.ierror + pid.kD * -2.0
+
+	# State changes don't zero a measured slope - there's no derivative kick to suppress
+	pid.compute(2.0, 22.0, newState=True, slope=2.0)
+	assert pid.derror == -2.0
+
+	# Following a target moving at the same rate - no derivative action
+	pid.compute(3.0, 24.0, slope=2.0, targetSlope=2.0)
+	assert pid.derror == 0.0
+
+
+def test_applyGains():
+	"""
+	Test swapping compiled gains in & out without losing the integrated error
+	"""
+	pid = GetPID()
+	gains = pid.gains
+	assert gains == (1.0, 0.01, 10.0, None, None, 20.0)
+
+	soakGains = PID.CompileGains({'kP': "2.5", 'windupGuard': 5.0, 'max': 50}, pid.getConfig())
+	assert soakGains == (2.5, 0.01, 10.0, None, 50.0, 5.0)
+	with pytest.raises(ValueError):
+		PID.CompileGains({'kP': 'fast'})
+
+	pid.ierror = 15.0
+	pid.applyGains(soakGains)
+	assert pid.kP == 2.5
+	assert pid.max == 50.0
+	# Clamped to the new windup guard
+	assert pid.ierror == 5.0
+
+	pid.applyGains(gains)
+	assert pid.getConfig() == GetPID().getConfig()
+	assert pid.ierror == 5.0
+
+
+def test_updateGains():
+	"""
+	Test that live gain changes wait for the next compute and don't make the output jump
+	"""
+	pid = GetPID()
+	pid.target = 100.0
+	for t in range(10):
+		pid.compute(float(t), 60.0 + t)
+	lastOutput = pid.output
+
+	pidConfig = pid.updateGains({'kP': 3.0, 'kI': "0.02", 'windupGuard': ""})
+	assert pidConfig['kP'] == 3.0
+	assert pidConfig['windupGuard'] == ""
+	assert pidConfig['kD'] == pid.kD
+	# Queued changes build on each other
+	assert pid.updateGains({'kD': 5.0})['kP'] == 3.0
+	assert pid.kP == 1.0
+	with pytest.raises(ValueError):
+		pid.updateGains({'kI': 'lots'})
+
+	pid.compute(10.0, 70.0)
+	assert pid.pendingGains is None
+	assert (pid.kP, pid.kI, pid.kD) == (3.0, 0.02, 5.0)
+	# Picks up from the last output - only this step's change in error goes through the new gains
+	assert pid.output == pytest.approx(lastOutput - pid.kP * 1.0 + pid.kI * 30.0)
+
+	# A plain gain change jumps by the change in the proportional term
+	jumped = GetPID()
+	jumped.target = 100.0
+	for t in range(10):
+		jumped.compute(float(t), 60.0 + t)
+	jumped.setConfig({'kP': 3.0, 'kI': 0.02, 'kD': 5.0, 'windupGuard': ""})
+	jumped.compute(10.0, 70.0)
+	assert abs(jumped.output - lastOutput) > 10 * abs(pid.output - lastOutput)
+
+	# setConfig drops anything still queued
+	pid.updateGains({'kP': 9.0})
+	pid.setConfig({'kI': 0.01})
+	pid.compute(11.0, 71.0)
+	assert pid.kP == 3.0
+
+
+def test_transferGains():
+	"""
+	Test that transferring gains rescales the integrated error to keep the output
+	"""
+	pid = GetPID()
+	pid.target = 100.0
+	pid.compute(0.0, 50.0)
+	pid.compute(1.0, 55.0)
+	output = pid.kP * pid.error + pid.kI * pid.ierror + pid.kD * pid.derror
+
+	pid.windupGuard = None
+	pid.transferGains((2.0, 0.05, 4.0, None, None, None))
+	assert pid.kP * pid.error + pid.kI * pid.ierror + pid.kD * pid.derror == pytest.approx(output)
+
+	# Nothing to rescale without an integral gain
+	ierror = pid.ierror
+	pid.transferGains((2.0, 0.0, 4.0, None, None, None))
+	assert pid.ierror == ierror
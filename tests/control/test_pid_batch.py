@@ -0,0 +1,130 @@
+import random
+
+import numpy as np
+import pytest
+
+from library.control.pid import PID
+from library.control.pid_batch import BatchPID
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def GetConfigs(count, seed=0):
+	"""
+	Random PID configs covering unset limits & windup guards
+	"""
+	rng = random.Random(seed)
+	configs = []
+	for i in range(count):
+		configs.append({
+			"kP": rng.uniform(0.0, 2.0),
+			"kI": rng.uniform(0.0, 0.05),
+			"kD": rng.uniform(0.0, 20.0),
+			"min": rng.choice(["", -50.0, -5.0]),
+			"max": rng.choice(["", 5.0, 50.0]),
+			"windupGuard": rng.choice([None, 0.0, 5.0, 20.0]),
+		})
+	return configs
+
+
+def test_matchesPID():
+	"""
+	Test that every candidate matches a scalar PID exactly, including state changes, repeated timestamps and slopes
+	"""
+	configs = GetConfigs(50)
+	pids = [PID(config) for config in configs]
+	batch = BatchPID.FromConfigs(configs)
+
+	rng = random.Random(1)
+	currentTime = 0.0
+	for step in range(300):
+		target = 150.0 if step < 150 else 235.0
+		# Repeat a timestamp now and then to hit the deltaTime == 0 path
+		currentTime += 0.0 if step % 37 == 5 else rng.uniform(0.5, 1.5)
+		state = rng.uniform(20.0, 250.0)
+		newState = step in [0, 150]
+		slope = rng.uniform(-2.0, 2.0) if step % 11 == 0 else None
+
+		batch.target[:] = target
+		outputs = batch.compute(currentTime, state, newState, slope=slope)
+		for i, pid in enumerate(pids):
+			pid.target = target
+			assert pid.compute(currentTime, state, newState, slope=slope) == outputs[i]
+			assert pid.ierror == batch.ierror[i]
+			assert pid.derror == batch.derror[i]
+
+
+def test_run():
+	"""
+	Test running a recorded trace for every candidate
+	"""
+	configs = GetConfigs(10, seed=2)
+	batch = BatchPID.FromConfigs(configs)
+	times = np.arange(1.0, 101.0)
+	states = np.linspace(25.0, 200.0, 100)
+	targets = np.where(times < 50, 150.0, 235.0)
+	newStates = times == 50
+	outputs = batch.run(times, states, targets, newStates)
+	assert outputs.shape == (100, 10)
+
+	for i, config in enumerate(configs):
+		pid = PID(config)
+		for j in range(100):
+			pid.target = targets[j]
+			assert pid.compute(times[j], states[j], newStates[j]) == outputs[j, i]
+
+
+def test_configs():
+	"""
+	Test building batches and getting candidates back out
+	"""
+	configs = GetConfigs(5, seed=3)
+	batch = BatchPID.FromConfigs(configs)
+	assert len(batch) == 5
+	for i, config in enumerate(configs):
+		expected = PID(config).getConfig()
+		expected['windupGuard'] = expected['windupGuard'] or 0.0
+		assert batch.getConfig(i) == expected
+		assert batch.getPID(i).getConfig()['kD'] == config['kD']
+
+	batch = BatchPID.FromPIDs([PID(config) for config in configs])
+	assert list(batch.kP) == [config['kP'] for config in configs]
+
+	batch = BatchPID.Grid([1.0, 2.0], [0.0, 0.01, 0.02], [5.0], windupGuard=20.0, max=100.0)
+	assert len(batch) == 6
+	assert list(batch.kP) == [1.0, 1.0, 1.0, 2.0, 2.0, 2.0]
+	assert list(batch.kI) == [0.0, 0.01, 0.02] * 2
+	assert np.all(batch.windupGuard == 20.0)
+	assert np.all(batch.max == 100.0)
+	assert np.all(np.isneginf(batch.min))
+
+	with pytest.raises(Exception):
+		BatchPID([1.0, 2.0], 0.0, 0.0, min=10.0, max=5.0)
+
+
+def test_noTarget():
+	"""
+	Test that computing without a target raises like PID
+	"""
+	batch = BatchPID([1.0, 2.0], 0.0, 0.0)
+	with pytest.raises(Exception):
+		batch.compute(1.0, 20.0)
+	batch.target[:] = [100.0, 0.0]
+	with pytest.raises(Exception):
+		batch.compute(1.0, 20.0)
+	batch.target[:] = 100.0
+	assert list(batch.compute(1.0, 20.0)) == [80.0, 160.0]
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+
+import pytest
+
+from library.control.plan import ProfilePlan
+from library.other.config import ToasterConfig
+from definitions import GetBaseConfigurationFilePath
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def test_Compile():
+	"""
+	Test compiling a profile into its per-state tuples
+	"""
+	states = OrderedDict([
+		("ramp", {"target": "150", "duration": 90}),
+		("soak", {"target": 150, "duration": 60}),
+		("reflow", {"target": 235, "duration": 45}),
+		("cooling", {"target": 50, "duration": 120}),
+	])
+	plan = ProfilePlan.Compile(states)
+	assert plan.names == ("ramp", "soak", "reflow", "cooling")
+	assert plan.targets == (150.0, 150.0, 235.0, 50.0)
+	assert plan.durations == (90.0, 60.0, 45.0, 120.0)
+	assert plan.soaks == (False, True, False, False)
+	assert plan.ramps == (True, False, True, False)
+	assert plan.cools == (False, False, False, True)
+	assert plan.starts == (0.0, 90.0, 150.0, 195.0)
+	assert plan.lastIndex == 3
+	assert plan.totalDuration == 315.0
+
+	# Immutable
+	with pytest.raises(AttributeError):
+		plan.lastIndex = 2
+
+	empty = ProfilePlan.Compile(OrderedDict())
+	assert empty.lastIndex == -1 and empty.totalDuration == 0.0
+
+
+def test_ToasterConfig():
+	"""
+	Test that the config recompiles its plan when the states are set
+	"""
+	config = ToasterConfig(GetBaseConfigurationFilePath())
+	assert config.plan.names == tuple(config.states)
+
+	config.states = OrderedDict([("hold", {"target": 100, "duration": 10})])
+	assert config.plan.names == ("hold",) and config.plan.targets == (100.0,)
@@ -5,6 +5,8 @@ import json
 from collections import OrderedDict
 from threading import Thread
 
+import pytest
+
 from library.control.stateMachine import STATES, ToastStateMachine
 from definitions import GetConfigurationFilePath, GetBaseConfigurationFilePath, GetDataFilePath
 
@@ -135,6 +137,32 @@ def test_NextState():
 		sm.cleanup()
 
 
+def test_stateFlags(monkeypatch):
+	"""
+	Test that soaking & the direction to the target follow the compiled plan, and the first state ramps on every run
+	"""
+	# 10 degrees below every target - reached only when cooling
+	monkeypatch.setattr(ToastStateMachine, 'temperature', property(lambda self: self.targetState - 10.0))
+	sm = GetStateMachine()
+	try:
+		plan = sm.plan
+		for run in range(2):
+			sm.start()
+			for i in range(len(sm.states)):
+				assert sm.soaking == plan.soaks[i]
+				assert sm.checkStateAgainstTarget() == (not plan.ramps[i])
+				sm.nextState()
+			sm.stop()
+
+		assert sm.targetBuffer == 3.0
+		sm.units = 'fahrenheit'
+		assert sm.targetBuffer > 3.0
+		sm.units = 'celsius'
+		assert sm.targetBuffer == 3.0
+	finally:
+		sm.cleanup()
+
+
 def test_RunFree_PauseResume():
 	"""
 	Test that the state machine can run its full course
@@ -312,3 +340,489 @@ def test_setStateConfiguration():
 		assert sm.stateConfiguration['ramp2soak']['target'] == 125
 	finally:
 		sm.cleanup()
+
+
+def test_sampler():
+	"""
+	Test that enabling the background sampler routes temperature reads through it
+	"""
+	sm = GetStateMachine()
+	try:
+		assert sm.sampler is None
+		assert sm.sensor is sm.thermocouple
+
+		sm.config.sampler = {'enabled': True, 'period': 0.01}
+		sm.setupSampler()
+		assert sm.sensor is sm.sampler
+		assert sm.sampler.is_alive()
+
+		sm.start()
+		tickNTimes(sm, 5)
+		assert sm.data
+		assert sm.getRecentErrorCount() == 0
+		assert sm.temperature == 0.0
+
+		sampler = sm.sampler
+		sm.stopSampler()
+		assert not sampler.is_alive()
+		assert sm.sensor is sm.thermocouple
+	finally:
+		sm.cleanup()
+
+
+def test_thermocoupleArray(tmp_path):
+	"""
+	Test that configuring two SPI CS pins reads both probes and logs them
+	"""
+	with open(GetBaseConfigurationFilePath(), 'r') as inf:
+		tmpConfig = json.load(inf, object_pairs_hook=OrderedDict)
+	tmpConfig['pins']['SPI_CS'] = [0, 1]
+	tmpConfig['tuning']['fusion'] = 'max'
+	configPath = str(tmp_path / "arrayConfig.json")
+	with open(configPath, 'w') as ouf:
+		json.dump(tmpConfig, ouf)
+
+	sm = GetStateMachine(configFile=configPath)
+	try:
+		assert sm.thermocouple.csPins == [0, 1]
+		assert sm.thermocouple.fusion == 'max'
+
+		sm.start()
+		tickNTimes(sm, 4)
+		assert sm.data[-1]['Temperature CS0'] == 0.0
+		assert sm.data[-1]['Temperature CS1'] == 0.0
+
+		dumpPath = str(tmp_path / "arrayData.csv")
+		assert sm.dumpDataToCsv(dumpPath)
+		with open(dumpPath, 'r') as inf:
+			assert inf.readline().strip().endswith("Temperature CS0,Temperature CS1")
+
+		# Back to a single thermocouple
+		sm.config = GetBaseConfigurationFilePath()
+		assert sm.probeTemperatures == {}
+		assert sm.thermocouple.csPin == 0
+	finally:
+		sm.cleanup()
+
+
+def test_replayCapture(tmp_path):
+	"""
+	Test the full tick pipeline against a replayed thermocouple capture
+	"""
+	from library.sensors.spi_capture import SpiCaptureWriter, ReplaySpiFactory
+	from library.sensors.thermocouple_decoder import EncodeFrames, FramesToBytes
+
+	# Heat at 1C per tick from 25C up to 160C
+	capturePath = str(tmp_path / "ramp.spi")
+	raw = FramesToBytes(EncodeFrames([25.0 + i for i in range(136)], 25.0))
+	with SpiCaptureWriter(capturePath) as writer:
+		for i in range(len(raw) // 4):
+			writer.write(0, raw[i * 4:(i + 1) * 4])
+
+	global TOASTER
+	if TOASTER:
+		TOASTER.cleanup()
+	factory = ReplaySpiFactory(capturePath)
+	TOASTER = sm = ToastStateMachine(GetBaseConfigurationFilePath(), spiFactory=factory)
+	try:
+		sm.start()
+		# ramp2soak completes within 3C of its 150C target
+		tickNTimes(sm, 122)
+		assert sm.temperature == 146.0
+		assert sm.currentState == sm.states[0]
+		sm.tick()
+		assert sm.temperature == 147.0
+		assert sm.currentState == sm.states[1]
+		assert sm.getRecentErrorCount() == 0
+	finally:
+		sm.cleanup()
+		factory.close()
+
+
+def test_estimator():
+	"""
+	Test that enabling the estimator feeds its smoothed temperature & slope to the PID
+	"""
+	from library.simulation.oven import OvenSimulator, SimulateRun
+
+	sm = GetStateMachine()
+	try:
+		assert sm.estimator is None
+		sm.config.estimator = {'enabled': True}
+		sm.setupEstimator()
+		assert sm.estimator
+
+		data = SimulateRun(sm, OvenSimulator(noise=0.25, seed=2))
+		assert sm.running == STATES.COMPLETE
+		assert sm.estimator.initialized
+		# Derivative term is the negated estimated slope - heating for most of the ramp
+		assert min(record['PID DError'] for record in data[10:100]) < 0
+	finally:
+		sm.cleanup()
+
+
+def test_autoTune():
+	"""
+	Test a relay auto-tune experiment end to end against the simulated oven, then reflow with the proposed gains
+	"""
+	from library.simulation.oven import OvenSimulator, SimulateRun
+
+	sm = GetStateMachine()
+	try:
+		with pytest.raises(Exception):
+			sm.applyAutoTune()
+
+		simulator = OvenSimulator(noise=0.25, seed=3)
+		with simulator:
+			sm.startAutoTune(setpoint=150.0)
+			assert sm.running == STATES.TUNING
+			while sm.running == STATES.TUNING:
+				simulator.clock.advance(sm.timerPeriod)
+				sm.tick()
+
+		assert sm.running == STATES.STOPPED
+		assert sm.autoTuner.complete
+		assert not sm.relay.state
+		# One short session - well under a full reflow
+		assert sm.timestamp < 600.0
+		assert all(record['Target Temperature'] == 150.0 for record in sm.data)
+
+		oldConfig = sm.pid.getConfig()
+		pidConfig = sm.applyAutoTune()
+		assert sm.pid.kP == pidConfig['kP'] != oldConfig['kP']
+		assert sm.pid.windupGuard == oldConfig['windupGuard']
+		assert sm.config.config['tuning']['pid'] == sm.pid.getConfig()
+
+		SimulateRun(sm, OvenSimulator(seed=3))
+		assert sm.running == STATES.COMPLETE
+	finally:
+		sm.cleanup()
+
+
+def test_autoTuneOutputRange():
+	"""
+	Test that the auto-tuner steps over the controller output span the heater is driven with
+	"""
+	sm = GetStateMachine()
+	try:
+		assert sm.heaterOutputRange == (0.0, 1.0)
+		sm.config.feedForward = {'enabled': True, 'outputScale': 5.0}
+		sm.setupFeedForward()
+		assert sm.heaterOutputRange == (0.0, 5.0)
+		sm.config.output = {'mode': 'timeProportional', 'outputMin': 0.0, 'outputMax': 10.0}
+		sm.setupOutput()
+		assert sm.heaterOutputRange == (0.0, 10.0)
+
+		sm.startAutoTune(setpoint=150.0)
+		assert (sm.autoTuner.outputLow, sm.autoTuner.outputHigh) == (0.0, 10.0)
+		# Cold oven - full power
+		sm.tick()
+		assert sm.output.duty == 1.0
+		sm.stop()
+	finally:
+		sm.cleanup()
+
+
+def test_timeProportionalOutput():
+	"""
+	Test that time-proportioning the relay settles into the soak with less overshoot than bang-bang
+	"""
+	from library.simulation.oven import OvenSimulator, SimulateRun
+
+	def SoakPeak(data):
+		return max(record['Temperature'] for record in data if record['State'] == 'soak')
+
+	sm = GetStateMachine()
+	try:
+		assert sm.output is None
+		bangBangPeak = SoakPeak(SimulateRun(sm, OvenSimulator(seed=1)))
+		assert sm.running == STATES.COMPLETE
+
+		sm.config.output = {'mode': 'timeProportional'}
+		sm.config.pids = dict(sm.pid.getConfig(), kP=1.0, kI=0.02, windupGuard=400.0)
+		sm.setupOutput()
+		assert sm.output.is_alive()
+
+		data = SimulateRun(sm, OvenSimulator(seed=1))
+		assert sm.running == STATES.COMPLETE
+		assert SoakPeak(data) < bangBangPeak - 2.0
+		# Partial duty cycles were used, not just full on/off
+		assert any(0.0 < record['Heater Duty'] < 1.0 for record in data)
+		# A fresh scheduler thread is back on the real clock
+		assert sm.output.is_alive()
+		assert not sm.relay.state
+	finally:
+		sm.cleanup()
+	assert sm.output is None
+
+
+def test_feedForward():
+	"""
+	Test that the feed-forward term lets gentle gains follow the profile that they can't manage alone
+	"""
+	from library.simulation.oven import OvenSimulator, SimulateRun
+
+	def Run(feedForward):
+		sm = GetStateMachine()
+		try:
+			sm.config.output = {'mode': 'timeProportional'}
+			sm.setupOutput()
+			sm.config.pids = dict(sm.pid.getConfig(), kP=0.5, kI=0.01, windupGuard=400.0)
+			sm.config.feedForward = {'enabled': feedForward}
+			sm.setupFeedForward()
+			data = SimulateRun(sm, OvenSimulator(seed=1), maxDuration=1500.0)
+			return sm.running, sm.feedForward, data
+		finally:
+			sm.cleanup()
+
+	running, feedForward, data = Run(False)
+	assert feedForward is None
+	# Proportional-only power can't hold the reflow temperature
+	assert running == STATES.RUNNING
+	assert all(record['Feed Forward'] == 0.0 for record in data)
+
+	running, feedForward, data = Run(True)
+	assert running == STATES.COMPLETE
+	assert len(feedForward.terms) == 5
+	soak = [record for record in data if record['State'] == 'soak']
+	assert all(record['Feed Forward'] == feedForward.terms[1] for record in soak)
+	assert sum(abs(record['PID Error']) for record in soak) / len(soak) < 4.0
+
+
+def test_mpc():
+	"""
+	Test that enabling the MPC in the config swaps it in for the PID, and it soaks with less overshoot
+	"""
+	from library.simulation.oven import OvenSimulator, SimulateRun
+
+	def SoakPeak(data):
+		return max(record['Temperature'] for record in data if record['State'] == 'soak')
+
+	sm = GetStateMachine()
+	try:
+		assert sm.controller is sm.pid
+		pidPeak = SoakPeak(SimulateRun(sm, OvenSimulator(seed=1)))
+
+		sm.config.mpc = {'enabled': True}
+		sm.setupController()
+		assert sm.controller is sm.mpc
+
+		data = SimulateRun(sm, OvenSimulator(seed=1))
+		assert sm.running == STATES.COMPLETE
+		assert SoakPeak(data) < pidPeak - 3.0
+		assert set(record['PID Output'] for record in data) == {0.0, sm.mpc.outputScale}
+	finally:
+		sm.cleanup()
+
+
+def test_gainSchedule():
+	"""
+	Test that states with their own PID gains swap them in while running, and the global gains come back after
+	"""
+	sm = GetStateMachine()
+	try:
+		globalGains = sm.pid.gains
+		states = OrderedDict((name, dict(state)) for name, state in sm.stateConfiguration.items())
+		states['soak']['pid'] = {'kP': 4.0, 'kD': 0.0}
+		sm.stateConfiguration = states
+		assert sm.config.stateGains[1] == (4.0, globalGains[1], 0.0) + globalGains[3:]
+
+		sm.start()
+		assert sm.pid.gains == globalGains
+		sm.nextState()
+		assert sm.currentState == 'soak'
+		assert sm.pid.kP == 4.0
+		assert sm.pid.kD == 0.0
+		sm.nextState()
+		assert sm.pid.gains == globalGains
+
+		# Stopping mid-soak puts the global gains back
+		sm.start()
+		sm.nextState()
+		assert sm.pid.kP == 4.0
+		sm.stop()
+		assert sm.pid.gains == globalGains
+
+		# So does completing
+		sm.start()
+		for i in range(len(sm.states)):
+			sm.nextState()
+		assert sm.running == STATES.COMPLETE
+		assert sm.pid.gains == globalGains
+		# The gains stay in the states config
+		assert sm.config.config['states']['soak']['pid'] == {'kP': 4.0, 'kD': 0.0}
+	finally:
+		sm.cleanup()
+
+
+def test_updateGains():
+	"""
+	Test live gain changes - straight away when idle, at the next control step while running, and after the state
+	when the state has its own gains
+	"""
+	sm = GetStateMachine()
+	try:
+		sm.updateGains({'kP': 2.0})
+		assert sm.pid.kP == 2.0
+		assert sm.pidConfig['kP'] == 2.0
+		assert sm.config.config['tuning']['pid']['kP'] == 2.0
+
+		states = OrderedDict((name, dict(state)) for name, state in sm.stateConfiguration.items())
+		states['soak']['pid'] = {'kP': 4.0}
+		sm.stateConfiguration = states
+
+		sm.start()
+		sm.updateGains({'kP': 3.0})
+		assert sm.pid.kP == 2.0
+		assert sm.pid.pendingGains is not None
+		assert sm.pidConfig['kP'] == 3.0
+		sm.pid.target = 100.0
+		sm.pid.compute(1.0, 50.0)
+		assert sm.pid.kP == 3.0
+
+		# Soak runs on its own gains - global changes wait for it to end but still reach its schedule
+		sm.nextState()
+		assert sm.pid.kP == 4.0
+		sm.updateGains({'kI': 0.05})
+		assert sm.pid.kP == 4.0
+		assert sm.config.stateGains[1][1] == 0.05
+		sm.nextState()
+		assert (sm.pid.kP, sm.pid.kI) == (3.0, 0.05)
+		assert sm.config.config['tuning']['pid']['kI'] == 0.05
+	finally:
+		sm.cleanup()
+
+
+def test_trajectory():
+	"""
+	Test that following the setpoint trajectory tracks the ramps far closer than stepping to each target
+	"""
+	from library.simulation.oven import OvenSimulator, SimulateRun
+
+	def Run(trajectory):
+		sm = GetStateMachine()
+		try:
+			sm.config.trajectory = {'enabled': trajectory}
+			data = SimulateRun(sm, OvenSimulator(seed=1), maxDuration=1500.0)
+			return sm.running, sm.trajectory, data
+		finally:
+			sm.cleanup()
+
+	def RampError(data):
+		ramp = [record for record in data if record['State'] == 'ramp2soak']
+		return sum(abs(record['PID Error']) for record in ramp) / len(ramp)
+
+	running, trajectory, stepData = Run(False)
+	assert trajectory is None
+
+	running, trajectory, data = Run(True)
+	assert running == STATES.COMPLETE
+	assert trajectory.values[1:] == trajectory.plan.targets
+	# The logged target is still the state's
+	assert all(record['Target Temperature'] == 150.0 for record in data if record['State'] == 'ramp2soak')
+	assert RampError(data) < RampError(stepData) / 3.0
+
+
+def test_healthShutdown(tmp_path):
+	"""
+	Test that a thermocouple that starts failing mid-run stops the run with the heater off
+	"""
+	from library.sensors.spi_capture import SpiCaptureWriter, ReplaySpiFactory
+	from library.sensors.thermocouple_decoder import EncodeFrames, FramesToBytes, FAULT_NONE, FAULT_NO_TC
+	from library.control.events import EVENTS
+
+	# 20 good reads, then the thermocouple comes off
+	capturePath = str(tmp_path / "fault.spi")
+	raw = FramesToBytes(EncodeFrames([25.0] * 40, 25.0, [FAULT_NONE] * 20 + [FAULT_NO_TC] * 20))
+	with SpiCaptureWriter(capturePath) as writer:
+		for i in range(len(raw) // 4):
+			writer.write(0, raw[i * 4:(i + 1) * 4])
+
+	global TOASTER
+	if TOASTER:
+		TOASTER.cleanup()
+	factory = ReplaySpiFactory(capturePath)
+	TOASTER = sm = ToastStateMachine(GetBaseConfigurationFilePath(), spiFactory=factory)
+	faults = []
+	try:
+		sm.events.subscribe(faults.append, events=[EVENTS.FAULT])
+		sm.start()
+		tickNTimes(sm, 24)
+		assert sm.running == STATES.RUNNING
+		assert sm.relay.state
+		assert sm.getRecentErrorCount() == 4
+
+		sm.tick()
+		assert sm.running == STATES.STOPPED
+		assert not sm.relay.state
+		assert sm.health.tripped == "5 of the last 10 thermocouple reads failed"
+		assert sm.health.recentErrorCount('TCNoTCError') == 5
+
+		# Starting again clears the trip, but not the failing reads
+		sm.start()
+		assert sm.health.tripped is None
+		sm.tick()
+		assert sm.running == STATES.STOPPED
+		assert sm.health.trips == 2
+
+		end = time.time() + 5.0
+		while len(faults) < 6 and time.time() < end:
+			time.sleep(0.01)
+		assert [fault.data['shutdown'] is not None for fault in faults] == [False] * 4 + [True, True]
+		assert all(fault.data['faultType'] == 'TCNoTCError' for fault in faults)
+	finally:
+		sm.cleanup()
+		factory.close()
+
+
+def test_reloadWhileTicking():
+	"""
+	Test that config, units, state, timer & gain changes wait for a tick in progress on another thread, so the
+	hardware isn't torn down under it and the gain schedule isn't swapped mid-change
+	"""
+	sm = GetStateMachine()
+	try:
+		changes = [
+			lambda: setattr(sm, 'config', GetBaseConfigurationFilePath()),
+			lambda: setattr(sm, 'units', 'fahrenheit'),
+			lambda: setattr(sm, 'stateConfiguration', sm.stateConfiguration),
+			lambda: setattr(sm, 'timerPeriod', 0.5),
+			lambda: sm.updateGains({'kP': 1.0}),
+		]
+		for change in changes:
+			done = []
+			# Stands in for the control loop thread, mid-tick
+			with sm.lock:
+				changer = Thread(target=lambda: done.append(change()))
+				changer.start()
+				changer.join(0.2)
+				assert not done
+			changer.join(5.0)
+			assert done
+		assert sm.units == 'fahrenheit'
+		assert sm.pid.kP == 1.0
+		sm.tick()
+	finally:
+		sm.cleanup()
+
+
+def test_trajectoryWithEstimator():
+	"""
+	Test that the estimated slope's derivative term follows the trajectory's ramp instead of fighting it
+	"""
+	from library.simulation.oven import OvenSimulator, SimulateRun
+
+	sm = GetStateMachine()
+	try:
+		sm.config.trajectory = {'enabled': True}
+		sm.config.estimator = {'enabled': True}
+		sm.setupEstimator()
+		data = SimulateRun(sm, OvenSimulator(seed=1), maxDuration=1500.0)
+		assert sm.running == STATES.COMPLETE
+		assert sm.setpointSlope == 0.0
+	finally:
+		sm.cleanup()
+
+	# Middle of the 125C over 120s ramp - the oven keeps up, so d(error)/dt stays near 0 rather than -1C/s
+	ramp = [record for record in data if record['State'] == 'ramp2soak'][20:100]
+	assert abs(sum(record['PID DError'] for record in ramp) / len(ramp)) < 0.25
@@ -0,0 +1,99 @@
+from collections import OrderedDict
+
+import pytest
+
+from library.control.plan import ProfilePlan
+from library.control.trajectory import SetpointTrajectory
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def GetPlan():
+	return ProfilePlan.Compile(OrderedDict([
+		("ramp", {"target": 150, "duration": 100}),
+		("soak", {"target": 150, "duration": 60}),
+		("spike", {"target": 200, "duration": 0}),
+		("cooling", {"target": 50, "duration": 100}),
+	]))
+
+
+def test_linear():
+	"""
+	Test that linear segments ramp from the previous target over each state's duration, then hold
+	"""
+	trajectory = SetpointTrajectory(GetPlan(), startTemperature=25.0)
+	assert trajectory.times == (0.0, 100.0, 160.0, 160.0, 260.0)
+	assert trajectory.setpoint(0, 0.0) == 25.0
+	assert trajectory.setpoint(0, 40.0) == 75.0
+	assert trajectory.setpoint(0, 250.0) == 150.0
+	assert trajectory.setpoint(1, 30.0) == 150.0
+	# No duration - straight to the target
+	assert trajectory.setpoint(2, 0.0) == 200.0
+	assert trajectory.setpoint(3, 50.0) == 125.0
+	# Past the end of the profile
+	assert trajectory.setpoint(4, 0.0) == 50.0
+
+	# Looking up the nominal timeline gives the same setpoints
+	for timestamp in [0.0, 40.0, 100.0, 130.0, 160.0, 210.0, 300.0]:
+		index = trajectory.segmentIndex(timestamp)
+		assert trajectory.at(timestamp) == trajectory.setpoint(index, timestamp - trajectory.times[index])
+	assert trajectory.at(40.0) == 75.0
+	assert trajectory.at(210.0) == 125.0
+	assert trajectory.at(-5.0) == 25.0
+
+	assert trajectory.segment(0) == ([0.0, 100.0], [25.0, 150.0])
+	assert trajectory.segment(2) == ([160.0, 160.0], [150.0, 200.0])
+
+	assert trajectory.slope(0, 40.0) == 1.25
+	assert trajectory.slope(0, 100.0) == 0.0
+	assert trajectory.slope(1, 30.0) == 0.0
+	assert trajectory.slope(2, 0.0) == 0.0
+	assert trajectory.slope(3, 50.0) == -1.5
+	assert trajectory.slope(4, 0.0) == 0.0
+
+
+def test_spline():
+	"""
+	Test that spline segments meet the same knots, leave & arrive flat, and stay between their ends
+	"""
+	trajectory = SetpointTrajectory(GetPlan(), startTemperature=25.0, method=SetpointTrajectory.SPLINE)
+	assert trajectory.setpoint(0, 0.0) == 25.0
+	assert trajectory.setpoint(0, 50.0) == pytest.approx(87.5)
+	assert trajectory.setpoint(0, 100.0) == 150.0
+	assert trajectory.setpoint(0, 1.0) - 25.0 < (150.0 - 25.0) / 100.0
+
+	timestamps, setpoints = trajectory.segment(3)
+	assert len(timestamps) == SetpointTrajectory.CURVE_POINTS + 1
+	assert setpoints == sorted(setpoints, reverse=True)
+	assert setpoints[0] == 200.0 and setpoints[-1] == 50.0
+
+	# Flat at the ends, steepest in the middle
+	assert trajectory.slope(0, 0.0) == 0.0
+	assert trajectory.slope(0, 50.0) == pytest.approx(1.5 * 1.25)
+	assert trajectory.slope(0, 99.999) == pytest.approx(0.0, abs=1e-3)
+
+
+def test_FromConfig():
+	"""
+	Test the config's ambient start temperature is converted to the profile's units
+	"""
+	trajectory = SetpointTrajectory.FromConfig({'method': 'spline', 'ambient': 20.0}, GetPlan(), units='fahrenheit')
+	assert trajectory.method == SetpointTrajectory.SPLINE
+	assert trajectory.values[0] == 68.0
+
+	with pytest.raises(AssertionError):
+		SetpointTrajectory.FromConfig({'method': 'cubic'}, GetPlan())
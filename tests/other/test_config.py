@@ -76,6 +76,18 @@ def test_setters():
 	assert config.spiCsPin == 1
 	config.spiCsPin = 0
 	assert config.spiCsPin == 0
+	assert config.spiCsPins == [0]
+	config.spiCsPins = [0, 1]
+	assert config.spiCsPins == [0, 1]
+	assert config.spiCsPin == [0, 1]
+	config.spiCsPins = [1]
+	assert config.spiCsPin == 1
+
+	config.fusion = 'board'
+	assert config.fusion == 'board'
+	with pytest.raises(Exception):
+		# "Expected exception for invalid fusion method"
+		config.fusion = 'not a fusion method'
 
 	config.units = 'fahrenheit'
 	assert config.units == 'fahrenheit'
@@ -92,6 +104,37 @@ def test_setters():
 	config.clockPeriod = 0.25
 	assert config.clockPeriod == 0.25
 
+	assert config.sampler['enabled'] is False
+	config.sampler = {'enabled': True, 'period': 0.2}
+	assert config.sampler['enabled'] is True
+	assert config.sampler['period'] == 0.2
+	assert config.sampler['filterMethod'] == ToasterConfig.BASE_SAMPLER['filterMethod']
+	assert config.config['tuning']['sampler'] == config.sampler
+
+	config.autotune = {'setpoint': 180.0}
+	assert config.autotune['setpoint'] == 180.0
+	assert config.autotune['rule'] == ToasterConfig.BASE_AUTOTUNE['rule']
+	assert config.config['tuning']['autotune'] == config.autotune
+	with pytest.raises(Exception):
+		config.autotune = {'rule': 'guesswork'}
+
+	config.output = {'mode': 'timeProportional'}
+	assert config.output['mode'] == 'timeProportional'
+	assert config.output['window'] == ToasterConfig.BASE_OUTPUT['window']
+	assert config.config['tuning']['output'] == config.output
+	with pytest.raises(Exception):
+		config.output = {'mode': 'phaseAngle'}
+
+	config.feedForward = {'enabled': True, 'gain': 300.0}
+	assert config.feedForward['gain'] == 300.0
+	assert config.feedForward['outputScale'] == ToasterConfig.BASE_FEED_FORWARD['outputScale']
+	assert config.config['tuning']['feedForward'] == config.feedForward
+
+	config.mpc = {'enabled': True, 'horizon': 90.0}
+	assert config.mpc['horizon'] == 90.0
+	assert config.mpc['deadTime'] == ToasterConfig.BASE_MPC['deadTime']
+	assert config.config['tuning']['mpc'] == config.mpc
+
 	testStates = OrderedDict()
 	testStates['firstState'] = {
 		"target": 999,
@@ -99,6 +142,19 @@ def test_setters():
 	}
 	config.states = testStates
 	assert config.states['firstState']['target'] == 999
+	assert config.stateGains == [None]
+
+	# Per-state gains are compiled into the schedule, inheriting missing keys from the global gains
+	testStates['secondState'] = {
+		"target": 999,
+		"duration": 999,
+		"pid": {"kP": 3.0}
+	}
+	config.states = testStates
+	assert config.stateGains[0] is None
+	assert config.stateGains[1] == (3.0,) + config.pids.gains[1:]
+	config.pids = dict(config.pids.getConfig(), kI=0.5)
+	assert config.stateGains[1][1] == 0.5
 
 	with pytest.raises(Exception):
 		# "Expected exception for invalid states type"
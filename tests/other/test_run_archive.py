@@ -0,0 +1,151 @@
+import json
+
+import numpy as np
+import pytest
+
+from library.other.run_archive import (
+	RunArchive, RunArchiveError, WriteRunArchive, ArchiveToCsv, CsvToArchive, ReadDataCsv, HEADER, main
+)
+from library.other.run_store import RunStore
+from library.control.stateMachine import ToastStateMachine
+from library.simulation.oven import OvenModel, OvenSimulator
+from definitions import GetBaseConfigurationFilePath
+
+HEADER_NAMES = ['Timestamp', 'Temperature', 'State', 'Relay State', 'Temperature CS1']
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def GetStore(count=200):
+	store = RunStore.FromHeader(HEADER_NAMES)
+	for i in range(count):
+		store.append([i * 0.5, None if i == 7 else 25.0 + i * 0.3, 'ramp' if i < count // 2 else 'reflow', i % 2 == 0, 24.5 + i])
+	return store
+
+
+def test_WriteRead(tmp_path):
+	"""
+	Test that an archive reads back the records, state names & config it was written with
+	"""
+	archivePath = str(tmp_path / "run.toast")
+	store = GetStore()
+	WriteRunArchive(archivePath, store, {'units': 'celsius'})
+
+	with RunArchive(archivePath) as archive:
+		assert len(archive) == 200
+		assert archive.header == HEADER_NAMES
+		assert archive.states == ['ramp', 'reflow']
+		assert archive.config == {'units': 'celsius'}
+		assert archive.toStore() == store
+
+		# Columns are views of the mapped file
+		temperature = archive.column('Temperature')
+		assert not temperature.flags.owndata
+		assert np.isnan(temperature[7])
+		assert np.array_equal(temperature[8:], store.column('Temperature')[8:])
+		assert archive.column('Relay State').sum() == 100
+		assert archive.column('State')[-1] == 1
+		del temperature
+
+
+def test_corrupt(tmp_path):
+	"""
+	Test that files that aren't archives are rejected, and a partly written last record is ignored
+	"""
+	archivePath = str(tmp_path / "run.toast")
+	with open(archivePath, "wb") as ouf:
+		ouf.write(b"Timestamp,Temperature\n" * 4)
+	with pytest.raises(RunArchiveError):
+		RunArchive(archivePath)
+
+	WriteRunArchive(archivePath, GetStore(10))
+	with open(archivePath, "rb") as inf:
+		contents = inf.read()
+	with open(archivePath, "wb") as ouf:
+		ouf.write(contents[:-3])
+	with RunArchive(archivePath) as archive:
+		assert len(archive) == 9
+		assert archive.config is None
+
+	with open(archivePath, "wb") as ouf:
+		ouf.write(contents[:HEADER.size + 2])
+	with pytest.raises(RunArchiveError):
+		RunArchive(archivePath)
+
+
+def test_csv(tmp_path):
+	"""
+	Test that a simulated run converts between the archive & its CSV without changing a byte
+	"""
+	simulator = OvenSimulator(OvenModel(gain=300.0), noise=0.25, seed=1)
+	sm = ToastStateMachine(
+		GetBaseConfigurationFilePath(),
+		spiFactory=simulator.spiFactory,
+		relay=simulator.createRelay(),
+		clock=simulator.clock
+	)
+	try:
+		sm.simulate(2000.0)
+		assert sm.dumpDataToCsv(str(tmp_path / "run.csv"))
+		sm.dumpConfig(str(tmp_path / "run.json"))
+		assert sm.dumpDataToArchive(str(tmp_path / "run.toast"))
+	finally:
+		sm.cleanup()
+
+	assert ReadDataCsv(str(tmp_path / "run.csv")) == sm.data
+
+	assert ArchiveToCsv(str(tmp_path / "run.toast"), str(tmp_path / "exported.csv")) == len(sm.data)
+	with open(str(tmp_path / "run.csv"), "r") as original, open(str(tmp_path / "exported.csv"), "r") as exported:
+		assert exported.read() == original.read()
+	with open(str(tmp_path / "exported.json"), "r") as inf:
+		assert json.load(inf) == sm.config.config
+
+	assert main([str(tmp_path / "run.csv"), "--output", str(tmp_path / "imported.toast")]) == 0
+	with open(str(tmp_path / "run.toast"), "rb") as original, open(str(tmp_path / "imported.toast"), "rb") as imported:
+		assert imported.read() == original.read()
+
+
+def test_CsvToArchive(tmp_path):
+	"""
+	Test converting a data CSV to an archive - missing temperatures, relay states & the config JSON next to it
+	"""
+	import csv
+
+	store = GetStore(20)
+	csvPath = str(tmp_path / "run.csv")
+	with open(csvPath, "w", newline="") as ouf:
+		writer = csv.writer(ouf)
+		writer.writerow(store.fields)
+		writer.writerows(store.rows())
+	with open(str(tmp_path / "run.json"), "w") as ouf:
+		json.dump({'units': 'fahrenheit'}, ouf)
+
+	assert CsvToArchive(csvPath) == 20
+	with RunArchive(str(tmp_path / "run.toast")) as archive:
+		assert archive.config == {'units': 'fahrenheit'}
+		assert archive.toStore() == store
+		assert np.isnan(archive.column('Temperature')[7])
+		assert list(archive.rows())[7][1] is None
+		assert archive.column('Relay State').tolist() == [1, 0] * 10
+		assert archive.states == ['ramp', 'reflow']
+
+	# Without a config next to it, or with one elsewhere
+	otherPath = str(tmp_path / "other.toast")
+	assert CsvToArchive(csvPath, otherPath, configPath=str(tmp_path / "missing.json")) == 20
+	with RunArchive(otherPath) as archive:
+		assert archive.config is None
+		assert archive.toStore() == store
@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+from library.other.run_logger import RunLogWriter, ReadRunLog, RecoverRunLog, main
+from library.control.stateMachine import ToastStateMachine
+from library.simulation.oven import OvenModel, OvenSimulator
+from definitions import GetBaseConfigurationFilePath
+
+HEADER = ['Timestamp', 'Temperature', 'State', 'Relay State']
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def WriteLog(logPath, records, flushInterval=0.01):
+	runLog = RunLogWriter(logPath, HEADER, {'units': 'celsius'}, flushInterval=flushInterval)
+	runLog.start()
+	for record in records:
+		runLog.log(record)
+	runLog.close()
+	runLog.join(5.0)
+	assert not runLog.is_alive() and runLog.error is None
+	return runLog
+
+
+def test_RunLogWriter(tmp_path):
+	"""
+	Test that queued records are all written, with the config snapshot in the header
+	"""
+	logPath = str(tmp_path / "run.log")
+	records = [(i * 0.25, None if i == 3 else 20.0 + i, 'ramp', i % 2 == 0) for i in range(500)]
+	runLog = WriteLog(logPath, records)
+	assert runLog.recordsWritten == 500
+
+	config, header, rows = ReadRunLog(logPath)
+	assert config == {'units': 'celsius'}
+	assert header == HEADER
+	assert len(rows) == 500
+	assert rows[3] == ['0.75', '', 'ramp', 'False']
+
+	# Records logged after closing are dropped, not written to a closed file
+	assert runLog.closed
+	runLog.log(records[0])
+
+
+def test_RecoverRunLog(tmp_path):
+	"""
+	Test recovering a log cut off mid-record, as after a power cut
+	"""
+	logPath = str(tmp_path / "run.log")
+	WriteLog(logPath, [(float(i), 20.0 + i, 'ramp', True) for i in range(10)])
+	with open(logPath, "r") as inf:
+		contents = inf.read()
+	with open(logPath, "w") as ouf:
+		ouf.write(contents[:-4])
+
+	assert RecoverRunLog(logPath) == 9
+	with open(str(tmp_path / "run.csv"), "r") as inf:
+		lines = inf.read().splitlines()
+	assert lines[0] == ",".join(HEADER)
+	assert lines[-1] == "8.0,28.0,ramp,True"
+	with open(str(tmp_path / "run.json"), "r") as inf:
+		assert json.load(inf) == {'units': 'celsius'}
+
+	# Nothing but a partial title line
+	with open(logPath, "w") as ouf:
+		ouf.write("# Toast")
+	with pytest.raises(Exception):
+		ReadRunLog(logPath)
+
+
+def test_stateMachine(tmp_path):
+	"""
+	Test that a simulated run's log recovers to exactly the CSV the state machine dumps
+	"""
+	simulator = OvenSimulator(OvenModel(gain=300.0), noise=0.25, seed=1)
+	sm = ToastStateMachine(
+		GetBaseConfigurationFilePath(),
+		spiFactory=simulator.spiFactory,
+		relay=simulator.createRelay(),
+		clock=simulator.clock
+	)
+	logPath = str(tmp_path / "run.log")
+	try:
+		sm.simulate(2000.0, runLogPath=logPath)
+		# Completing the profile closes the log
+		assert sm.runLog.closed
+		sm.runLog.join(5.0)
+		assert sm.dumpDataToCsv(str(tmp_path / "dump.csv"))
+	finally:
+		sm.cleanup()
+
+	assert main([logPath, "--output", str(tmp_path / "recovered.csv")]) == 0
+	with open(str(tmp_path / "dump.csv"), "r") as dump, open(str(tmp_path / "recovered.csv"), "r") as recovered:
+		assert recovered.read() == dump.read()
@@ -0,0 +1,103 @@
+import sys
+from collections import OrderedDict
+
+import pytest
+
+from library.other.run_store import RunStore, FLOAT, BOOL, STATE
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def GetFields():
+	return OrderedDict([('Timestamp', FLOAT), ('Temperature', FLOAT), ('State', STATE), ('Relay State', BOOL)])
+
+
+def GetRecords(count):
+	states = ['ramp', 'soak', 'cooling']
+	return [
+		{
+			'Timestamp': i * 0.25,
+			'Temperature': None if i % 7 == 0 else 25.0 + i,
+			'State': states[i * len(states) // count],
+			'Relay State': i % 3 == 0,
+		}
+		for i in range(count)
+	]
+
+
+def test_append():
+	"""
+	Test that the store grows past its capacity and reads back the same dict records it was given
+	"""
+	records = GetRecords(100)
+	store = RunStore(GetFields(), capacity=8)
+	assert not store and store == []
+	for i, record in enumerate(records):
+		if i % 2:
+			store.append(record)
+		else:
+			store.append([record[key] for key in GetFields()])
+
+	assert len(store) == 100
+	assert store == records
+	assert list(store) == records
+	assert store[-1] == records[-1]
+	assert store[10:20] == records[10:20]
+	assert store[0]['Temperature'] is None
+	assert store[1]['Relay State'] is False
+	assert store.states == ['ramp', 'soak', 'cooling']
+	assert list(store.rows())[5] == tuple(records[5].values())
+	with pytest.raises(IndexError):
+		store[100]
+
+	store.clear()
+	assert len(store) == 0
+
+
+def test_column():
+	"""
+	Test the numpy views of each field
+	"""
+	np = pytest.importorskip("numpy")
+	records = GetRecords(50)
+	store = RunStore(GetFields(), capacity=64)
+	for record in records:
+		store.append(record)
+
+	temperature = store.column('Temperature')
+	assert temperature.dtype == np.float64 and len(temperature) == 50
+	assert np.isnan(temperature[0]) and temperature[1] == 26.0
+	assert store.column('Relay State').sum() == sum(record['Relay State'] for record in records)
+	assert [store.states[i] for i in store.column('State')] == [record['State'] for record in records]
+
+	# Views share the store's memory until it grows
+	store.append(records[1])
+	assert len(temperature) == 50
+	assert np.shares_memory(temperature, store.column('Temperature'))
+
+
+def test_nbytes():
+	"""
+	Test that the store is far smaller than the list of dicts it replaces
+	"""
+	records = GetRecords(4096)
+	store = RunStore(GetFields())
+	for record in records:
+		store.append(record)
+	dictBytes = sys.getsizeof(records) + sum(sys.getsizeof(record) for record in records)
+	assert store.nbytes == 4096 * (8 + 8 + 1 + 1)
+	assert store.nbytes * 10 < dictBytes
@@ -0,0 +1,115 @@
+import pytest
+
+from library.sensors.sensor_thermocouple import TCNoTCError, TCGndShortError
+from library.sensors.sensor_thermocouple_array import ThermocoupleArray
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def SetProbeReading(thermocouple, reading):
+	"""
+	Make a probe return a fixed reading (or raise a fixed exception)
+	"""
+	def read():
+		if isinstance(reading, Exception):
+			raise reading
+		thermocouple._temp = reading
+		thermocouple._refTemp = 25.0
+		return thermocouple.temperature
+	thermocouple.read = read
+
+
+def test_Fuse():
+	"""
+	Test each fusion method, including faulted probes
+	"""
+	assert ThermocoupleArray.Fuse([100.0, 200.0], 'average') == 150.0
+	assert ThermocoupleArray.Fuse([100.0, 200.0], 'max') == 200.0
+	assert ThermocoupleArray.Fuse([100.0, 200.0], 'board') == 100.0
+
+	assert ThermocoupleArray.Fuse([None, 200.0], 'average') == 200.0
+	assert ThermocoupleArray.Fuse([None, 200.0], 'max') == 200.0
+	assert ThermocoupleArray.Fuse([None, 200.0], 'board') == 200.0
+	assert ThermocoupleArray.Fuse([100.0, None], 'board') == 100.0
+
+
+def test_Read():
+	"""
+	Test reading both probes and tolerating a single faulted probe
+	"""
+	array = ThermocoupleArray(csPins=[0, 1], fusion='average')
+	try:
+		assert array.csPins == [0, 1]
+		assert array.csPin == 0
+
+		SetProbeReading(array.thermocouples[0], 100.0)
+		SetProbeReading(array.thermocouples[1], 110.0)
+		assert array.read() == 105.0
+		assert array.refTemperature == 25.0
+		assert array.getProbeData() == {'Temperature CS0': 100.0, 'Temperature CS1': 110.0}
+
+		array.fusion = 'max'
+		assert array.read() == 110.0
+
+		# One probe faulted - the other keeps feeding the loop
+		SetProbeReading(array.thermocouples[1], TCNoTCError('no thermocouple attached'))
+		assert array.read() == 100.0
+		assert array.probeTemperatures == [100.0, None]
+		assert isinstance(array.probeErrors[1], TCNoTCError)
+
+		# Both faulted - raise the primary probe's error
+		SetProbeReading(array.thermocouples[0], TCGndShortError('short to ground'))
+		with pytest.raises(TCGndShortError):
+			array.read()
+
+		with pytest.raises(Exception):
+			array.fusion = 'not a fusion method'
+	finally:
+		array.cleanup()
+
+
+def test_Units():
+	"""
+	Test that units apply to every probe and the fused values
+	"""
+	array = ThermocoupleArray(csPins=[0, 1])
+	try:
+		SetProbeReading(array.thermocouples[0], 100.0)
+		SetProbeReading(array.thermocouples[1], 100.0)
+		array.read()
+		array.units = 'fahrenheit'
+		assert array.temperature == 212.0
+		assert all(thermocouple.units == 'fahrenheit' for thermocouple in array.thermocouples)
+	finally:
+		array.cleanup()
+
+
+def test_csPins():
+	"""
+	Test pin validation and primary pin swapping
+	"""
+	array = ThermocoupleArray(csPins=[0, 1])
+	try:
+		array.csPin = 1
+		assert array.csPins == [1, 0]
+
+		with pytest.raises(Exception):
+			array.csPins = [0, 0]
+		with pytest.raises(Exception):
+			array.csPins = [0, 10]
+	finally:
+		array.cleanup()
@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+
+from library.sensors import mock_spidev
+from library.sensors.sensor_thermocouple import Thermocouple
+from library.sensors.thermocouple_decoder import EncodeFrames, FramesToBytes, DecodeFrames
+from library.sensors.spi_capture import (
+	SpiCaptureWriter, SpiCaptureReader, SpiCaptureError, CaptureSpiFactory, ReplaySpiFactory, HEADER, RECORD
+)
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def WriteCapture(path, temperatures, csPin=0):
+	"""
+	Write a capture file containing one frame per temperature
+	"""
+	raw = FramesToBytes(EncodeFrames(temperatures, 25.0))
+	with SpiCaptureWriter(path) as writer:
+		for i in range(len(temperatures)):
+			writer.write(csPin, raw[i * 4:(i + 1) * 4], timestamp=i * 0.1)
+
+
+def test_WriteRead(tmp_path):
+	"""
+	Test that frames written to a capture can be read back individually and as numpy columns
+	"""
+	path = str(tmp_path / "capture.spi")
+	temperatures = [20.0, 21.5, 23.25, 150.0]
+	WriteCapture(path, temperatures)
+
+	with SpiCaptureReader(path) as reader:
+		assert len(reader) == 4
+		timestamp, csPin, frame = reader.record(1)
+		assert timestamp == 0.1
+		assert csPin == 0
+		assert Thermocouple.CalculateThermocoupleTemperature(Thermocouple.ByteListToInteger(frame)) == 21.5
+		assert reader.indicesForPin(0) == [0, 1, 2, 3]
+		assert reader.indicesForPin(1) == []
+
+		records = reader.records()
+		decodedTemperatures, _, _ = DecodeFrames(records['frame'].astype(np.uint32))
+		assert list(decodedTemperatures) == temperatures
+		assert list(records['timestamp']) == [0.0, 0.1, 0.2, 0.30000000000000004]
+		del records
+
+		with pytest.raises(IndexError):
+			reader.record(4)
+
+
+def test_TruncatedAndInvalid(tmp_path):
+	"""
+	Test that a partial trailing record is ignored and non-captures are rejected
+	"""
+	path = str(tmp_path / "capture.spi")
+	WriteCapture(path, [20.0, 30.0])
+	with open(path, 'ab') as ouf:
+		ouf.write(b'\x00' * (RECORD.size - 1))
+
+	with SpiCaptureReader(path) as reader:
+		assert len(reader) == 2
+
+	badPath = str(tmp_path / "bad.spi")
+	with open(badPath, 'wb') as ouf:
+		ouf.write(b'\x00' * HEADER.size)
+	with pytest.raises(SpiCaptureError):
+		SpiCaptureReader(badPath)
+
+
+def test_Replay(tmp_path):
+	"""
+	Test that a thermocouple replays captured frames in order, then holds or loops
+	"""
+	path = str(tmp_path / "capture.spi")
+	WriteCapture(path, [20.0, 30.0, 40.0])
+
+	factory = ReplaySpiFactory(path)
+	tc = Thermocouple(spiFactory=factory)
+	try:
+		assert [tc.read() for _ in range(5)] == [20.0, 30.0, 40.0, 40.0, 40.0]
+		assert tc.spi.exhausted
+	finally:
+		tc.cleanup()
+
+	factory.loop = True
+	tc = Thermocouple(spiFactory=factory)
+	try:
+		assert [tc.read() for _ in range(4)] == [20.0, 30.0, 40.0, 20.0]
+	finally:
+		tc.cleanup()
+		factory.close()
+
+
+def test_Capture(tmp_path, monkeypatch):
+	"""
+	Test that capture mode records exactly what the device returned
+	"""
+	frames = iter([[0x09, 0x60, 0x19, 0x00], [0x0A, 0x00, 0x19, 0x00]])
+	monkeypatch.setattr(mock_spidev.SpiDev, 'xfer', lambda self, bytes: next(frames))
+
+	path = str(tmp_path / "capture.spi")
+	factory = CaptureSpiFactory(path)
+	tc = Thermocouple(csPin=1, spiFactory=factory)
+	try:
+		# Attributes pass through to the wrapped device
+		assert tc.spi.max_speed_hz == Thermocouple.SPI_CLK_FREQ
+		first = tc.read()
+		second = tc.read()
+	finally:
+		tc.cleanup()
+		factory.close()
+
+	with SpiCaptureReader(path) as reader:
+		assert len(reader) == 2
+		assert reader.indicesForPin(1) == [0, 1]
+
+	tc = Thermocouple(csPin=1, spiFactory=ReplaySpiFactory(path))
+	try:
+		assert [tc.read(), tc.read()] == [first, second]
+	finally:
+		tc.cleanup()
@@ -0,0 +1,135 @@
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+from library.sensors.sensor_thermocouple import Thermocouple, TCNoTCError, TCGndShortError, TCVccShortError, TCError
+from library.sensors import thermocouple_decoder as decoder
+
+EXCEPTION_TO_FAULT = {
+	TCNoTCError: decoder.FAULT_NO_TC,
+	TCGndShortError: decoder.FAULT_GND_SHORT,
+	TCVccShortError: decoder.FAULT_VCC_SHORT,
+	TCError: decoder.FAULT_DUMMY_BITS,
+}
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def ReferenceDecode(frame):
+	"""
+	Decode a single frame using the scalar Thermocouple static methods
+	"""
+	fault = decoder.FAULT_NONE
+	try:
+		Thermocouple.CheckSPIReadForErrors(frame)
+	except Exception as e:
+		fault = EXCEPTION_TO_FAULT[type(e)]
+	return (
+		Thermocouple.CalculateThermocoupleTemperature(frame),
+		Thermocouple.CalculateReferenceTemperature(frame),
+		fault
+	)
+
+
+def GetFrameClasses():
+	"""
+	Build a frame for every combination of fault/reserved bits and temperature sign/range class
+	"""
+	# D0-D2 fault flags, D3 reserved, D16 fault, D17 reserved
+	statusBits = [0x1, 0x2, 0x4, 0x8, 0x10000, 0x20000]
+	# 14 bit TC data: zero, +/- small, +/- full scale, sign bit boundary
+	tcValues = [0x0000, 0x0001, 0x0193, 0x1FFF, 0x2000, 0x3C18, 0x3FFF]
+	# 12 bit reference data: zero, +/- small, +/- full scale, sign bit boundary
+	refValues = [0x000, 0x001, 0x190, 0x7FF, 0x800, 0xC90, 0xFFF]
+
+	frames = []
+	for count in range(len(statusBits) + 1):
+		for combination in itertools.combinations(statusBits, count):
+			status = sum(combination)
+			for tc, ref in itertools.product(tcValues, refValues):
+				frames.append((tc << 18) | (ref << 4) | status)
+	return frames
+
+
+def test_DecodeFramesMatchesReference():
+	"""
+	Test that the vectorized decoder matches the scalar reference for every frame class
+	"""
+	frames = GetFrameClasses()
+	frames += [random.getrandbits(32) for _ in range(2000)]
+
+	temperatures, refTemperatures, faults = decoder.DecodeFrames(np.array(frames, dtype=np.uint32))
+	for i, frame in enumerate(frames):
+		expected = ReferenceDecode(frame)
+		actual = (temperatures[i], refTemperatures[i], faults[i])
+		assert actual == expected, "{}: expected {}, got {}".format(hex(frame), expected, actual)
+
+
+def test_FramesFromBytes():
+	"""
+	Test that raw SPI bytes convert to the same integers as ByteListToInteger
+	"""
+	byteLists = [[0, 0, 0, 0], [0, 0, 0, 16], [0, 0, 1, 255], [15, 15, 15, 15], [255, 128, 7, 1]]
+	expected = [Thermocouple.ByteListToInteger(byteList) for byteList in byteLists]
+
+	raw = bytes(itertools.chain.from_iterable(byteLists))
+	assert list(decoder.FramesFromBytes(raw)) == expected
+	assert list(decoder.FramesFromBytes(np.array(byteLists, dtype=np.uint8))) == expected
+	assert list(decoder.FramesFromBytes(np.frombuffer(raw, dtype=np.uint8))) == expected
+
+	with pytest.raises(ValueError):
+		decoder.FramesFromBytes(raw[:-1])
+
+	with pytest.raises(TypeError):
+		decoder.FramesFromBytes(np.zeros(4, dtype=np.float64))
+
+
+def test_EncodeFrames():
+	"""
+	Test that encoding then decoding returns the (quantised) input
+	"""
+	temperatures = np.array([-250.0, -0.25, 0.0, 25.0, 100.75, 235.5, 1600.0])
+	refTemperatures = np.array([-55.0, -0.0625, 0.0, 25.0, 100.5625, 127.0, 30.0])
+	faults = np.array([
+		decoder.FAULT_NONE,
+		decoder.FAULT_NO_TC,
+		decoder.FAULT_GND_SHORT,
+		decoder.FAULT_VCC_SHORT,
+		decoder.FAULT_DUMMY_BITS,
+		decoder.FAULT_NONE,
+		decoder.FAULT_NONE,
+	])
+
+	frames = decoder.EncodeFrames(temperatures, refTemperatures, faults)
+	decodedTemperatures, decodedRefTemperatures, decodedFaults = decoder.DecodeFrames(
+		decoder.FramesToBytes(frames)
+	)
+	assert np.array_equal(decodedTemperatures, temperatures)
+	assert np.array_equal(decodedRefTemperatures, refTemperatures)
+	assert np.array_equal(decodedFaults, faults)
+
+
+def test_ThermocoupleDecodeFrames():
+	"""
+	Test the Thermocouple convenience wrapper
+	"""
+	temperatures, refTemperatures, faults = Thermocouple.DecodeFrames(decoder.EncodeFrames([150.0, 20.25], 25.0))
+	assert list(temperatures) == [150.0, 20.25]
+	assert list(refTemperatures) == [25.0, 25.0]
+	assert list(faults) == [decoder.FAULT_NONE] * 2
@@ -0,0 +1,164 @@
+import time
+
+import pytest
+
+from library.sensors.sensor_thermocouple import Thermocouple, TCNoTCError
+from library.sensors.thermocouple_sampler import RingBuffer, ThermocoupleSampler
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+class ScriptedThermocouple(Thermocouple):
+	"""
+	Thermocouple returning a scripted sequence of readings (exceptions are raised)
+	"""
+	def __init__(self, readings):
+		super(ScriptedThermocouple, self).__init__()
+		self.readings = list(readings)
+		self.readCount = 0
+
+	def read(self):
+		reading = self.readings[min(self.readCount, len(self.readings) - 1)]
+		self.readCount += 1
+		if isinstance(reading, Exception):
+			raise reading
+		self._temp = reading
+		return self.temperature
+
+
+def test_RingBuffer():
+	"""
+	Test appending, wrapping and reading back from the ring buffer
+	"""
+	buffer = RingBuffer(4)
+	assert buffer.latest is None
+	assert buffer.history() == []
+
+	for i in range(3):
+		buffer.append(i)
+	assert len(buffer) == 3
+	assert buffer.latest == 2
+	assert buffer.history() == [0, 1, 2]
+
+	for i in range(3, 10):
+		buffer.append(i)
+	assert len(buffer) == 4
+	assert buffer.count == 10
+	assert buffer.latest == 9
+	assert buffer.history() == [6, 7, 8, 9]
+	assert buffer.last(2) == [8, 9]
+	assert buffer.last(100) == [6, 7, 8, 9]
+
+	buffer.clear()
+	assert buffer.latest is None
+
+	with pytest.raises(Exception):
+		RingBuffer(0)
+
+
+def test_Filtered():
+	"""
+	Test the mean & median filters, ignoring failed reads
+	"""
+	tc = ScriptedThermocouple([10.0, 20.0, TCNoTCError('no thermocouple attached'), 90.0, 30.0])
+	sampler = ThermocoupleSampler(tc, filterLength=4, filterMethod='median')
+	try:
+		for i in range(5):
+			sampler.sample()
+
+		assert sampler.latest.temperature == 30.0
+		assert [sample.temperature for sample in sampler.history()] == [10.0, 20.0, None, 90.0, 30.0]
+		assert isinstance(sampler.history()[2].error, TCNoTCError)
+
+		# Last 4 samples include the failed read - only 3 valid values
+		assert sampler.filtered() == 30.0
+		assert sampler.filtered(method='mean') == pytest.approx(140.0 / 3)
+		assert sampler.filtered(n=2) == 60.0
+		assert sampler.read() == 30.0
+	finally:
+		tc.cleanup()
+
+
+def test_ReadRaisesLatestError():
+	"""
+	Test that a failed latest sample raises from read() like Thermocouple.read() would
+	"""
+	tc = ScriptedThermocouple([50.0, TCNoTCError('no thermocouple attached')])
+	sampler = ThermocoupleSampler(tc)
+	try:
+		# Nothing sampled yet - read() falls back to a direct read
+		assert sampler.read() == 50.0
+		sampler.sample()
+		with pytest.raises(TCNoTCError):
+			sampler.read()
+		# The cached temperature is still available
+		assert sampler.temperature == 50.0
+	finally:
+		tc.cleanup()
+
+
+def test_Units():
+	"""
+	Test that changing units passes through and clears the history
+	"""
+	tc = ScriptedThermocouple([100.0])
+	sampler = ThermocoupleSampler(tc)
+	try:
+		sampler.sample()
+		sampler.units = 'fahrenheit'
+		assert sampler.units == 'fahrenheit'
+		assert sampler.latest is None
+		assert sampler.read() == 212.0
+		# Read directly - the buffer is left to the sampling thread
+		assert sampler.latest is None
+	finally:
+		tc.cleanup()
+
+
+def test_ThreadUnits():
+	"""
+	Test that a unit change while sampling is applied by the sampling thread, and reads never see the old units
+	"""
+	tc = ScriptedThermocouple([100.0])
+	sampler = ThermocoupleSampler(tc, period=0.005, historyLength=10)
+	try:
+		sampler.start()
+		assert sampler.read() == 100.0
+		sampler.units = 'fahrenheit'
+		assert sampler.units == 'fahrenheit'
+		assert sampler.read() == 212.0
+		assert all(sample.temperature == 212.0 for sample in sampler.history())
+	finally:
+		sampler.cleanup()
+
+
+def test_Thread():
+	"""
+	Test that the sampling thread fills the buffer and stops cleanly
+	"""
+	tc = ScriptedThermocouple([25.0])
+	sampler = ThermocoupleSampler(tc, period=0.005, historyLength=10)
+	try:
+		sampler.start()
+		timeout = time.monotonic() + 5.0
+		while sampler.buffer.count < 5 and time.monotonic() < timeout:
+			time.sleep(0.005)
+		assert sampler.buffer.count >= 5
+		assert sampler.read() == 25.0
+	finally:
+		sampler.cleanup()
+	assert not sampler.is_alive()
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from library.control.pid_batch import BatchPID
+from library.control.stateMachine import ToastStateMachine
+from library.simulation.batch import SimulateBatch
+from library.simulation.oven import OvenSimulator, SimulateRun
+from definitions import GetBaseConfigurationFilePath
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def test_SimulateBatch():
+	"""
+	Test that a batch run of the configured gains agrees with a full state machine simulation
+	"""
+	sm = ToastStateMachine(GetBaseConfigurationFilePath())
+	try:
+		batch = BatchPID.FromPIDs([sm.pid] * 3)
+		result = SimulateBatch(batch, sm.stateConfiguration, timerPeriod=sm.timerPeriod, recordTraces=True)
+
+		data = SimulateRun(sm, OvenSimulator())
+	finally:
+		sm.cleanup()
+
+	assert np.all(result.completed)
+	# Identical candidates give identical results
+	assert len(set(result.duration)) == 1
+	# The batch reads the model directly rather than 0.25C thermocouple frames, so allow a little drift
+	peak = max(record['Temperature'] for record in data)
+	assert result.peakTemperature[0] == pytest.approx(peak, abs=1.0)
+	assert result.duration[0] == pytest.approx(data[-1]['Timestamp'], abs=10.0)
+	assert result.temperatures.shape == (len(result.times), 3)
+	assert result.temperatures.max() == pytest.approx(result.peakTemperature[0])
+
+	# Time above liquidus matches the recorded trace, and soaks can't take longer than their duration to settle
+	aboveLiquidus = (result.temperatures[:, 0] > 217.0).sum() * sm.timerPeriod
+	assert result.timeAboveLiquidus[0] == aboveLiquidus > 0
+	assert 0 <= result.settlingTime[0] <= 60.0 + 30.0
+
+
+def test_SimulateBatchCost():
+	"""
+	Test that a candidate that never heats never completes and scores worst
+	"""
+	sm = ToastStateMachine(GetBaseConfigurationFilePath())
+	try:
+		states = sm.stateConfiguration
+	finally:
+		sm.cleanup()
+
+	batch = BatchPID([0.0, 0.6], [0.0, 0.005], [0.0, 7.0], windupGuard=20.0)
+	result = SimulateBatch(batch, states, maxDuration=1200.0)
+	assert list(result.completed) == [False, True]
+	assert result.duration[0] == 1200.0
+	assert result.switchCount[0] == 0
+	cost = result.cost()
+	assert cost[0] > cost[1]
+
+	# Only the weighted metrics count
+	onlySwitches = result.cost(weights={key: 0.0 for key in result.COST_WEIGHTS if key != 'switchCount'})
+	assert list(onlySwitches) == list(result.switchCount * result.COST_WEIGHTS['switchCount'])
+	liquidusCost = result.cost(weights={'timeAboveLiquidus': 1.0, 'absoluteError': 0.0, 'duration': 0.0, 'overshoot': 0.0, 'incomplete': 0.0})
+	assert liquidusCost[0] == 60.0
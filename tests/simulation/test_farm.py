@@ -0,0 +1,135 @@
+import csv
+import json
+from collections import OrderedDict
+
+from library.simulation.farm import SimulationFarm, SummarizeRun, MergeTuning, FormatTable, main
+from definitions import GetBaseConfigurationFilePath
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def GetProfiles():
+	base = OrderedDict([
+		("ramp2soak", {"target": 150, "duration": 120}),
+		("soak", {"target": 150, "duration": 60}),
+		("ramp2reflow", {"target": 235, "duration": 60}),
+		("reflow", {"target": 235, "duration": 30}),
+		("cooling", {"target": 50, "duration": 180}),
+	])
+	lowTemp = OrderedDict([
+		("preheat", {"target": 120, "duration": 90}),
+		("dwell", {"target": 120, "duration": 30}),
+		("peak", {"target": 190, "duration": 60}),
+		("cooling", {"target": 50, "duration": 180}),
+	])
+	return OrderedDict([("base", base), ("lowTemp", lowTemp)])
+
+
+def GetFarm(processes=1):
+	farm = SimulationFarm(GetBaseConfigurationFilePath(), noise=0.25, seed=1, processes=processes)
+	for name, states in GetProfiles().items():
+		farm.addProfile(name, states)
+	farm.addTuning("base", {})
+	farm.addTuning("timeProportional", {
+		"pid": {"kP": 1.0, "kI": 0.02, "windupGuard": 400.0},
+		"output": {"mode": "timeProportional"},
+	})
+	return farm
+
+
+def test_SummarizeRun():
+	"""
+	Test the run summary metrics on hand-made records
+	"""
+	states = OrderedDict([("ramp", {"target": 100, "duration": 0}), ("hold", {"target": 100, "duration": 2}), ("cooling", {"target": 50, "duration": 0})])
+	data = [
+		{'Timestamp': 1.0, 'Temperature': 90.0, 'State': 'ramp'},
+		{'Timestamp': 2.0, 'Temperature': 98.0, 'State': 'ramp'},
+		{'Timestamp': 3.0, 'Temperature': 104.0, 'State': 'hold'},
+		{'Timestamp': 4.0, 'Temperature': 101.0, 'State': 'hold'},
+		{'Timestamp': 5.0, 'Temperature': 80.0, 'State': 'cooling'},
+	]
+	summary = SummarizeRun(data, states, liquidus=100.0)
+	assert summary['duration'] == 5.0
+	assert summary['peakTemperature'] == 104.0
+	assert summary['timeAboveLiquidus'] == 2.0
+	assert summary['maxRampRate'] == 8.0
+	assert summary['overshoot ramp'] == 0.0
+	assert summary['overshoot hold'] == 4.0
+	assert 'overshoot cooling' not in summary
+
+	# States never reached have no overshoot
+	assert SummarizeRun(data[:2], states)['overshoot hold'] is None
+
+	# Failed reads are skipped
+	failed = data[:2] + [{'Timestamp': 2.5, 'Temperature': None, 'State': 'hold'}] + data[2:]
+	assert SummarizeRun(failed, states, liquidus=100.0) == summary
+	assert SummarizeRun(failed[2:3], states)['peakTemperature'] is None
+
+
+def test_MergeTuning():
+	"""
+	Test that tuning blocks only replace the keys they set
+	"""
+	config = {'tuning': {'pid': {'kP': 1.0, 'kI': 0.1}, 'timerPeriod': 0.5}}
+	MergeTuning(config, {'pid': {'kP': 2.0}, 'timerPeriod': 0.25, 'output': {'mode': 'timeProportional'}})
+	assert config['tuning'] == {'pid': {'kP': 2.0, 'kI': 0.1}, 'timerPeriod': 0.25, 'output': {'mode': 'timeProportional'}}
+
+
+def test_run():
+	"""
+	Test that every profile & tuning combination is simulated, the same in a process pool as serially
+	"""
+	rows = GetFarm(processes=1).run()
+	assert [(row['profile'], row['tuning']) for row in rows] == [
+		("base", "base"), ("base", "timeProportional"), ("lowTemp", "base"), ("lowTemp", "timeProportional")
+	]
+	assert all(row['completed'] for row in rows)
+	# The low temperature profile never reaches liquidus
+	assert rows[0]['timeAboveLiquidus'] > 0
+	assert rows[2]['timeAboveLiquidus'] == 0
+	assert 'overshoot dwell' in rows[2] and 'overshoot dwell' not in rows[0]
+	# Time-proportioning switches far more often, and overshoots the soak less
+	assert rows[1]['switchCount'] > rows[0]['switchCount']
+	assert rows[1]['overshoot soak'] < rows[0]['overshoot soak']
+
+	assert GetFarm(processes=2).run() == rows
+
+	table = FormatTable(rows).splitlines()
+	assert len(table) == len(rows) + 1
+	assert table[0].split()[:3] == ['profile', 'tuning', 'completed']
+
+
+def test_main(tmp_path):
+	"""
+	Test the command line reads profiles & tuning sets and writes the summary CSV
+	"""
+	profilePaths = []
+	for name, states in GetProfiles().items():
+		profilePaths += ["--profile", str(tmp_path / "{}.json".format(name))]
+		with open(profilePaths[-1], "w") as ouf:
+			json.dump(states, ouf)
+	tuningPath = str(tmp_path / "gentle.json")
+	with open(tuningPath, "w") as ouf:
+		json.dump({"tuning": {"pid": {"kD": 5.0}}}, ouf)
+
+	csvPath = str(tmp_path / "summary.csv")
+	assert main([GetBaseConfigurationFilePath(), "--tuning", tuningPath, "--processes", "2", "--csv", csvPath] + profilePaths) == 0
+	with open(csvPath) as inf:
+		rows = list(csv.DictReader(inf))
+	assert [(row['profile'], row['tuning']) for row in rows] == [("base", "gentle"), ("lowTemp", "gentle")]
+	assert rows[1]['overshoot ramp2soak'] == ""
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from library.control.stateMachine import ToastStateMachine
+from library.simulation.oven import OvenModel, OvenSimulator, SimulateRun
+from library.simulation.identification import RunLog, SimulateLog, FitOvenModel
+from definitions import GetBaseConfigurationFilePath
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def LogSimulatedRun(csvPath, model, seed):
+	"""
+	Run the base profile against a simulated oven and dump the data like the GUI does
+	"""
+	sm = ToastStateMachine(GetBaseConfigurationFilePath())
+	try:
+		SimulateRun(sm, OvenSimulator(model=model, noise=0.25, seed=seed))
+		assert sm.dumpDataToCsv(csvPath)
+	finally:
+		sm.cleanup()
+
+
+def test_RunLog(tmp_path):
+	"""
+	Test reading a data CSV and resampling it
+	"""
+	csvPath = str(tmp_path / "run.csv")
+	LogSimulatedRun(csvPath, OvenModel(), seed=0)
+	runLog = RunLog.FromCsv(csvPath)
+	assert len(runLog) > 900
+	assert set(np.unique(runLog.relayStates)) == {0.0, 1.0}
+
+	temperatures, relayStates = runLog.resample(2.0)
+	assert len(temperatures) == len(relayStates) == pytest.approx((runLog.times[-1] - runLog.times[0]) / 2.0 + 1, abs=1)
+	assert temperatures[0] == runLog.temperatures[0]
+
+	# Relay states are held, not interpolated
+	runLog = RunLog([0.0, 1.0, 2.0], [20.0, 22.0, 24.0], [True, False, True])
+	temperatures, relayStates = runLog.resample(0.5)
+	assert list(temperatures) == [20.0, 21.0, 22.0, 23.0, 24.0]
+	assert list(relayStates) == [1.0, 1.0, 0.0, 0.0, 1.0]
+
+
+def test_FitOvenModel(tmp_path):
+	"""
+	Test recovering the oven parameters from noisy logged runs
+	"""
+	actual = OvenModel(gain=300.0, timeConstant=250.0, deadTime=6.0, ambient=22.0)
+	csvPaths = [str(tmp_path / "run{}.csv".format(i)) for i in range(2)]
+	for seed, csvPath in enumerate(csvPaths):
+		LogSimulatedRun(csvPath, OvenModel.FromConfig(actual.getConfig()), seed)
+
+	model, rmsError = FitOvenModel([RunLog.FromCsv(csvPath) for csvPath in csvPaths])
+	assert model.gain == pytest.approx(actual.gain, rel=0.05)
+	assert model.timeConstant == pytest.approx(actual.timeConstant, rel=0.05)
+	assert model.deadTime == pytest.approx(actual.deadTime, abs=1.0)
+	assert model.ambient == pytest.approx(actual.ambient, abs=2.0)
+	assert rmsError < 1.0
+
+	# The fitted model reproduces the run open-loop
+	temperatures, relayStates = RunLog.FromCsv(csvPaths[0]).resample(1.0)
+	simulated = SimulateLog(model, temperatures, relayStates, 1.0)
+	assert np.max(np.abs(simulated - temperatures)) < 3.0
+
+
+def test_FitOvenModelFailure():
+	"""
+	Test that a log without any heating can't be fitted
+	"""
+	runLog = RunLog(np.arange(100.0), np.full(100, 25.0), np.zeros(100, dtype=bool))
+	with pytest.raises(Exception):
+		FitOvenModel([runLog])
@@ -0,0 +1,149 @@
+import math
+import time
+import logging
+
+import pytest
+
+import library.sensors.mock_gpio as mock_gpio
+import library.sensors.mock_spidev as mock_spidev
+from library.control.stateMachine import STATES, ToastStateMachine
+from library.sensors.sensor_relay import Relay
+from library.sensors.sensor_thermocouple import Thermocouple
+from library.simulation.oven import VirtualClock, OvenModel, OvenSimulator, SimulateRun, SimulateProfile
+from definitions import GetBaseConfigurationFilePath
+
+
+def setup_module(module):
+	return
+
+
+def teardown_module(module):
+	return
+
+
+def setup_function(function):
+	return
+
+
+def teardown_function(function):
+	return
+
+
+def test_VirtualClock():
+	"""
+	Test that the virtual clock only moves when told to
+	"""
+	clock = VirtualClock(10.0)
+	assert clock() == 10.0
+	clock.advance(2.5)
+	clock.sleep(0.5)
+	assert clock.now == 13.0
+	with pytest.raises(Exception):
+		clock.advance(-1)
+
+
+def test_OvenModel():
+	"""
+	Test heating, dead time, and cooling of the oven model
+	"""
+	model = OvenModel(gain=200.0, timeConstant=100.0, deadTime=5.0, ambient=20.0)
+	assert model.advanceTo(10.0) == 20.0
+
+	# Heater on at t=10 - nothing happens until the dead time expires
+	model.setPower(1.0, 10.0)
+	assert model.advanceTo(15.0) == 20.0
+
+	# Exact first order response afterwards, regardless of how it's stepped
+	expected = 220.0 - 200.0 * math.exp(-50.0 / 100.0)
+	for t in range(16, 66):
+		model.advanceTo(t)
+	assert model.temperature == pytest.approx(expected)
+
+	# Heater off - cools back toward ambient
+	model.setPower(0.0, 65.0)
+	hot = model.advanceTo(70.0)
+	assert model.advanceTo(500.0) < hot
+	assert model.temperature > 20.0
+
+	assert OvenModel.FromConfig({'gain': 123.0}).getConfig() == dict(OvenModel.BASE_PARAMETERS, gain=123.0)
+
+
+def test_OvenSimulatorMocks():
+	"""
+	Test that the simulator drives the mock SPI from the mock relay
+	"""
+	clock = VirtualClock()
+	simulator = OvenSimulator(OvenModel(deadTime=0.0), clock=clock)
+	tc = Thermocouple()
+	relay = Relay(pin=4)
+	try:
+		with simulator:
+			assert tc.read() == 25.0
+			relay.enable()
+			clock.advance(60.0)
+			heated = tc.read()
+			assert heated > 50.0
+			assert simulator.switchCount == 1
+		# Detached - back to the flat mock
+		assert mock_spidev.FRAME_SOURCE is None
+		assert not mock_gpio.OUTPUT_LISTENERS
+		assert tc.read() == 0.0
+	finally:
+		relay.cleanup()
+		tc.cleanup()
+
+
+def test_SimulateRun():
+	"""
+	Test that a full reflow of the base profile completes against the simulated oven, quickly
+	"""
+	sm = ToastStateMachine(GetBaseConfigurationFilePath(), debugLevel=logging.WARNING)
+	try:
+		start = time.perf_counter()
+		data = SimulateRun(sm, OvenSimulator(noise=0.25, seed=1))
+		elapsed = time.perf_counter() - start
+
+		assert sm.running == STATES.COMPLETE
+		assert elapsed < 5.0
+		assert [record['State'] for record in data][0] == sm.states[0]
+		assert data[-1]['State'] == sm.states[-1]
+
+		peak = max(record['Temperature'] for record in data)
+		assert 225.0 <= peak <= 260.0
+		assert not sm.relayState
+	finally:
+		sm.cleanup()
+
+
+def RaiseOnOutput(pin, value):
+	raise Exception("GPIO written during a simulation")
+
+
+def test_SimulateProfile():
+	"""
+	Test that a profile simulated through the injected relay, SPI & clock runs in well under a second, touches no mock
+	hardware, and gives the same records as a run through the mock GPIO/SPI libraries
+	"""
+	mock_gpio.addOutputListener(RaiseOnOutput)
+	try:
+		start = time.perf_counter()
+		status, data = SimulateProfile(simulator=OvenSimulator(noise=0.25, seed=4))
+		elapsed = time.perf_counter() - start
+	finally:
+		mock_gpio.removeOutputListener(RaiseOnOutput)
+	assert status == STATES.COMPLETE
+	assert elapsed < 1.0
+
+	sm = ToastStateMachine(GetBaseConfigurationFilePath(), debugLevel=logging.WARNING)
+	try:
+		assert SimulateRun(sm, OvenSimulator(noise=0.25, seed=4)) == data
+	finally:
+		sm.cleanup()
+
+	# Needs a virtual clock
+	sm = ToastStateMachine(GetBaseConfigurationFilePath(), debugLevel=logging.WARNING)
+	try:
+		with pytest.raises(AssertionError):
+			sm.simulate()
+	finally:
+		sm.cleanup()
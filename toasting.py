@@ -1,17 +1,85 @@
 #!/usr/bin/python3
-import wx
-from library.ui.ToastingGUI import ToastingGUI
+import sys
+import signal
+import argparse
+
 from definitions import GetBaseConfigurationFilePath
 
 
-if __name__ == "__main__":
+def parseArgs():
+	parser = argparse.ArgumentParser(description="Reflow soldering toaster oven controller")
+	parser.add_argument(
+		"--capture",
+		metavar="PATH",
+		help="record every raw thermocouple SPI frame to this capture file for later replay"
+	)
+	parser.add_argument(
+		"--headless",
+		action="store_true",
+		help="run the reflow profile straight away with no GUI - wxPython & matplotlib aren't imported"
+	)
+	parser.add_argument(
+		"--config",
+		metavar="PATH",
+		default=GetBaseConfigurationFilePath(),
+		help="JSON config to load (default: %(default)s)"
+	)
+	parser.add_argument(
+		"--profile",
+		metavar="PATH",
+		help="headless only - JSON reflow profile replacing the config's states"
+	)
+	parser.add_argument(
+		"--data",
+		metavar="PATH",
+		help="headless only - CSV to write the run's data to. The config is written next to it. Default: data dir"
+	)
+	return parser.parse_args()
+
+
+def runGui(args, spiFactory):
+	"""
+	Run the wxPython GUI
+	"""
+	import wx
+	from library.ui.ToastingGUI import ToastingGUI
+
 	# Create base app
 	app = wx.App()
 
 	# Create GUI frame
-	view = ToastingGUI(baseConfigurationPath=GetBaseConfigurationFilePath())
+	view = ToastingGUI(baseConfigurationPath=args.config, spiFactory=spiFactory)
 	view.Show()
 	app.SetTopWindow(view)
 
 	# Begin GUI main loop
 	app.MainLoop()
+	return 0
+
+
+def runHeadless(args, spiFactory):
+	"""
+	Run the reflow profile without the GUI stack
+	"""
+	from library.control.headless import RunHeadless
+	from library.control.stateMachine import STATES
+
+	# Stop cleanly, heater off, when a service manager stops us
+	signal.signal(signal.SIGTERM, signal.default_int_handler)
+	status = RunHeadless(args.config, profilePath=args.profile, dataPath=args.data, spiFactory=spiFactory)
+	return 0 if status == STATES.COMPLETE else 1
+
+
+if __name__ == "__main__":
+	args = parseArgs()
+	spiFactory = None
+	if args.capture:
+		from library.sensors.spi_capture import CaptureSpiFactory
+		spiFactory = CaptureSpiFactory(args.capture)
+
+	try:
+		exitCode = runHeadless(args, spiFactory) if args.headless else runGui(args, spiFactory)
+	finally:
+		if spiFactory:
+			spiFactory.close()
+	sys.exit(exitCode)